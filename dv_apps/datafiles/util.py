@@ -66,6 +66,39 @@ class DatafileUtil(object):
         #print 'dcategories', dcategories
         #print '-' * 40
 
+        return DatafileUtil.format_file_metadata(self.dsv.id, f_metadata_objects, dfiles)
+
+    @staticmethod
+    def as_json_many(dataset_version_ids):
+        """
+        Serialize the files of many Dataset Versions in 2 queries
+
+        Returns { DatasetVersion id : [file info, file info, etc] }
+        """
+        f_metadata_objects = FileMetadata.objects.select_related('datafile'\
+                                    ).filter(datasetversion__id__in=dataset_version_ids\
+                                    ).order_by('datasetversion__id', 'datafile__id')
+
+        dvobject_ids = [x.datafile.id for x in f_metadata_objects]
+        dfiles = DatafileUtil.get_datafile_dict(dvobject_ids)
+
+        # { DatasetVersion id : [FileMetadata, FileMetadata, etc] }
+        fmeta_lookup = {}
+        for fm in f_metadata_objects:
+            fmeta_lookup.setdefault(fm.datasetversion_id, []).append(fm)
+
+        files_lookup = {}
+        for dsv_id in dataset_version_ids:
+            files_lookup[dsv_id] = DatafileUtil.format_file_metadata(dsv_id,\
+                                        fmeta_lookup.get(dsv_id, []), dfiles)
+        return files_lookup
+
+    @staticmethod
+    def format_file_metadata(dataset_version_id, f_metadata_objects, dfiles):
+        """
+        Format FileMetadata objects with their related Datafile info
+            dfiles - see get_datafile_dict
+        """
         fmeta_attrs = ('label', 'description', 'vers')
         fmt_list = []
         for fm in f_metadata_objects:
@@ -77,7 +110,7 @@ class DatafileUtil(object):
 
             # FileMetadata info
             od['id'] = related_file['id']
-            od['datasetVersionId'] = self.dsv.id
+            od['datasetVersionId'] = dataset_version_id
             od['name'] = fm.label
             od['description'] = fm.description
 
@@ -102,7 +135,7 @@ class DatafileUtil(object):
 
             od['restricted'] = related_file['restricted']
             od['ingeststatus'] = related_file['ingeststatus']
-            od['file_access_url'] = '%s/%s' % (self.URL_FILE_ACCESS, related_file['id'])
+            od['file_access_url'] = '%s/%s' % (DatafileUtil.URL_FILE_ACCESS, related_file['id'])
             #DatafileUtil.get_file_access_url(datafile_id)
             od['timestamps'] = OrderedDict()
             od['timestamps']['createdate'] = fm.datafile.createdate.strftime(TIMESTAMP_MASK)
@@ -147,8 +180,8 @@ class DatafileUtil(object):
 
         return d
 
-
-    def get_datafile_dict(self, dvobject_ids):
+    @staticmethod
+    def get_datafile_dict(dvobject_ids):
         """
         Retrieve Datafile objects and return as a dict with key being the id
         """
@@ -1,12 +1,18 @@
 from django.contrib import admin
 
 # Register your models here.
-from dv_apps.dataset_docs.models import DatasetDoc
+from dv_apps.dataset_docs.models import DatasetDoc, DatasetDocWatermark
 
 
 class DatasetDocAdmin(admin.ModelAdmin ):
     save_on_top = True
-    list_display = ('name', 'semantic_version', 'dataset_version_id', 'created',  'modified', )
+    list_display = ('name', 'semantic_version', 'dataset_id', 'dataset_version_id', 'source_modificationtime', 'modified', )
+    search_fields = ('name',)
+    readonly_fields = ('created', 'modified', 'content_hash')
+
+class DatasetDocWatermarkAdmin(admin.ModelAdmin):
+    list_display = ('last_dataset_id', 'last_modificationtime', 'modified', )
     readonly_fields = ('created', 'modified')
 
 admin.site.register(DatasetDoc, DatasetDocAdmin)
+admin.site.register(DatasetDocWatermark, DatasetDocWatermarkAdmin)
@@ -0,0 +1,247 @@
+"""
+Stored JSON documents for published Datasets.
+
+One DatasetDoc per Dataset holds the DatasetSerializer output for its
+latest published DatasetVersion, along with the Dataset's
+"modificationtime" when it was serialized.
+
+    - Reads (e.g. the "datasets/by-id" API) use the doc if its
+        modificationtime still matches the Dataset's.  Otherwise the
+        version is serialized live and the doc is replaced
+    - "python manage.py refresh_dataset_docs" serializes, in batches,
+        the published Datasets modified since the last refresh.  The
+        modificationtime it reached is kept in the DatasetDocWatermark,
+        which docs saved on reads don't move
+
+Notes:
+    - Changes which don't touch the Dataset's "modificationtime", e.g. a
+        renamed parent Dataverse, are picked up with "--rebuild"
+    - Turn off with "USE_DATASET_DOCS = False"
+"""
+from __future__ import print_function
+
+from django.conf import settings
+from django.db import router, transaction, IntegrityError
+from django.utils.text import slugify
+
+from dv_apps.dataset_docs.models import DatasetDoc, DatasetDocWatermark,\
+    get_content_hash
+from dv_apps.datasets.models import Dataset
+from dv_apps.datasets.serializer import DatasetSerializer
+from dv_apps.datasets.util import get_latest_dataset_version_ids
+from dv_apps.utils import query_helper
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def is_dataset_doc_enabled():
+    """Allow the stored docs to be switched off via settings"""
+    return getattr(settings, 'USE_DATASET_DOCS', True)
+
+
+def is_serialized(dataset_as_json):
+    """DatasetSerializer.as_json() returns (False, error dict) on failure"""
+    return isinstance(dataset_as_json, dict)
+
+
+def build_dataset_doc(dataset_id, dataset_version_id, dataset_as_json, modificationtime):
+    """
+    Return an unsaved DatasetDoc.  Fields set on save() are also
+    filled in, so it may be used with bulk_create
+    """
+    name = dataset_as_json['title'][:255]
+    semantic_version = dataset_as_json['semanticVersionInfo']['semantic_version']
+
+    return DatasetDoc(name=name,\
+                slug=slugify('%s-%s' % (name, semantic_version))[:255],\
+                semantic_version=semantic_version,\
+                dataset_id=dataset_id,\
+                dataset_version_id=dataset_version_id,\
+                content_hash=get_content_hash(dataset_as_json),\
+                source_modificationtime=modificationtime,\
+                doc=dataset_as_json)
+
+
+class DatasetDocUtil(object):
+    """Read, save and refresh DatasetDocs"""
+
+    def __init__(self, **kwargs):
+        self.batch_size = kwargs.get('batch_size', DEFAULT_BATCH_SIZE)
+        self.verbose = kwargs.get('verbose', False)
+
+    def msg(self, m):
+        if self.verbose:
+            print(m)
+
+    # ----------------------------
+    #  Read
+    # ----------------------------
+    def get_dataset_json(self, dataset_version):
+        """
+        Return the serialized DatasetVersion, same as
+        DatasetSerializer(dataset_version).as_json()
+
+        Uses the stored doc, if fresh.  On a miss, the version is
+        serialized and saved
+        """
+        if not is_dataset_doc_enabled():
+            return DatasetSerializer(dataset_version).as_json()
+
+        dvobject = dataset_version.dataset.dvobject
+
+        dataset_doc = DatasetDoc.objects.filter(\
+                            dataset_version_id=dataset_version.id).first()
+        if dataset_doc is not None and\
+            dataset_doc.source_modificationtime == dvobject.modificationtime:
+            return dataset_doc.doc
+
+        dataset_as_json = DatasetSerializer(dataset_version).as_json()
+        if is_serialized(dataset_as_json):
+            self.save_dataset_doc(build_dataset_doc(dvobject.id,\
+                                        dataset_version.id,\
+                                        dataset_as_json,\
+                                        dvobject.modificationtime))
+
+        return dataset_as_json
+
+    # ----------------------------
+    #  Save
+    # ----------------------------
+    def save_dataset_doc(self, dataset_doc):
+        """
+        Replace the Dataset's doc, e.g. one for an older version.
+        Not saved if the Dataset has a doc for a newer version
+        """
+        dataset_docs = DatasetDoc.objects.filter(dataset_id=dataset_doc.dataset_id)
+        try:
+            with transaction.atomic(using=router.db_for_write(DatasetDoc)):
+                if dataset_docs.filter(\
+                    dataset_version_id__gt=dataset_doc.dataset_version_id).exists():
+                    return
+                dataset_docs.delete()
+                dataset_doc.save()
+        except IntegrityError:
+            # saved by another request
+            pass
+
+    # ----------------------------
+    #  Refresh
+    # ----------------------------
+    def get_watermark(self):
+        """The Dataset modificationtime the last refresh reached--or None"""
+        watermark = DatasetDocWatermark.objects.first()
+        if watermark is None:
+            return None
+        return watermark.last_modificationtime
+
+    def get_datasets_to_refresh(self, rebuild=False):
+        """
+        Return [(Dataset id, modificationtime), ...] of published Datasets
+        modified since the watermark, oldest first.
+
+        Datasets at the watermark are included: ones with the same
+        modificationtime may span two batches
+        """
+        filters = query_helper.get_is_published_filter_param()
+
+        watermark = None if rebuild else self.get_watermark()
+        if watermark is not None:
+            filters['dvobject__modificationtime__gte'] = watermark
+
+        return list(Dataset.objects.filter(**filters\
+                        ).values_list('dvobject__id', 'dvobject__modificationtime'\
+                        ).order_by('dvobject__modificationtime', 'dvobject__id'))
+
+    def refresh_batch(self, dataset_modtimes):
+        """
+        Serialize the latest published versions of a batch of Datasets
+        and save the docs which changed.
+            dataset_modtimes - [(Dataset id, modificationtime), ...]
+
+        Returns the number of docs saved
+        """
+        modtime_lookup = dict(dataset_modtimes)
+
+        version_id_lookup = get_latest_dataset_version_ids(modtime_lookup.keys())
+        serialized = DatasetSerializer.serialize_many(version_id_lookup.values())
+
+        # { DatasetVersion id : content hash }
+        stored_hashes = dict(DatasetDoc.objects.filter(\
+                                dataset_id__in=modtime_lookup.keys()\
+                            ).values_list('dataset_version_id', 'content_hash'))
+
+        new_docs = []
+        unchanged_docs = []
+        for ds_id, dsv_id in version_id_lookup.items():
+            dataset_as_json = serialized.get(dsv_id)
+            if not is_serialized(dataset_as_json):
+                self.msg('Not serialized. Dataset id %s: %s' % (ds_id, dataset_as_json))
+                continue
+
+            dataset_doc = build_dataset_doc(ds_id, dsv_id, dataset_as_json,\
+                                            modtime_lookup[ds_id])
+            if stored_hashes.get(dsv_id) == dataset_doc.content_hash:
+                unchanged_docs.append(dataset_doc)
+            else:
+                new_docs.append(dataset_doc)
+
+        db_alias = router.db_for_write(DatasetDoc)
+        try:
+            with transaction.atomic(using=db_alias):
+                DatasetDoc.objects.filter(\
+                    dataset_id__in=[x.dataset_id for x in new_docs]).delete()
+                DatasetDoc.objects.bulk_create(new_docs)
+        except IntegrityError:
+            # a read saved one of the versions meanwhile: one at a time
+            for dataset_doc in new_docs:
+                self.save_dataset_doc(dataset_doc)
+
+        with transaction.atomic(using=db_alias):
+            # same content: only move the modificationtime up
+            for dataset_doc in unchanged_docs:
+                DatasetDoc.objects.filter(dataset_version_id=dataset_doc.dataset_version_id\
+                    ).update(source_modificationtime=dataset_doc.source_modificationtime)
+
+        return len(new_docs)
+
+    def refresh(self, rebuild=False):
+        """
+        Save docs for the published Datasets modified since the last
+        refresh.  Batches are committed, in modificationtime order, along
+        with the watermark so an interrupted refresh resumes where it stopped.
+
+        Returns the number of docs saved
+        """
+        db_alias = router.db_for_write(DatasetDoc)
+        if rebuild:
+            with transaction.atomic(using=db_alias):
+                DatasetDoc.objects.all().delete()
+                DatasetDocWatermark.objects.all().delete()
+
+        dataset_modtimes = self.get_datasets_to_refresh(rebuild)
+        if len(dataset_modtimes) == 0:
+            self.msg('Nothing to refresh. (watermark: %s)' % self.get_watermark())
+            return 0
+
+        watermark = DatasetDocWatermark.objects.first()
+        if watermark is None:
+            watermark = DatasetDocWatermark()
+
+        num_saved = 0
+        for start_idx in range(0, len(dataset_modtimes), self.batch_size):
+            batch = dataset_modtimes[start_idx:start_idx + self.batch_size]
+
+            with transaction.atomic(using=db_alias):
+                num_batch_saved = self.refresh_batch(batch)
+
+                last_id, last_modtime = batch[-1]
+                if last_modtime is not None:
+                    watermark.last_dataset_id = last_id
+                    watermark.last_modificationtime = last_modtime
+                    watermark.save()
+
+            num_saved += num_batch_saved
+            self.msg('Datasets %s to %s of %s: %s docs saved' %\
+                (start_idx+1, start_idx+len(batch), len(dataset_modtimes), num_batch_saved))
+
+        return num_saved
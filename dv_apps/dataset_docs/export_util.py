@@ -0,0 +1,338 @@
+"""
+Export the JSON docs of all published Datasets as gzipped NDJSON
+(one JSON doc per line), in parallel and resumable.
+
+    python manage.py export_dataset_docs --output-dir /data/export
+
+The published Dataset ids are split into contiguous id ranges, or
+"shards".  A process pool exports the shards, each to its own file:
+
+    manifest.json                     - the shard plan
+    datasets-00000.ndjson.gz          - a shard's docs, in Dataset id order
+    datasets-00000.checkpoint.json    - last Dataset id and file size written
+
+Each batch of Datasets is appended to the shard file as its own gzip
+member (gzip readers, e.g. "zcat", read the members as one stream), and
+the checkpoint is then updated.  A rerun reuses the manifest, truncates
+each shard file to its checkpointed size--dropping a batch that was
+partly written--and continues after the checkpointed Dataset id.
+
+Docs come from the DatasetDoc store when fresh.  Otherwise they're
+serialized with DatasetSerializer.serialize_many.
+
+Notes:
+    - The shard plan is fixed when the manifest is created.  Datasets
+        published later are exported only if their ids fall inside a
+        shard's range.  Use "--restart" for a new plan
+    - Datasets which can't be serialized (e.g. no title) are counted
+        as skipped
+"""
+from __future__ import print_function
+
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+from multiprocessing import Pool
+from os.path import isdir, isfile, join
+
+from django.db import connections
+
+from dv_apps.dataset_docs.doc_util import is_dataset_doc_enabled, is_serialized
+from dv_apps.dataset_docs.models import DatasetDoc
+from dv_apps.datasets.models import Dataset
+from dv_apps.datasets.serializer import DatasetSerializer
+from dv_apps.datasets.util import get_latest_dataset_version_ids
+from dv_apps.utils import query_helper
+from dv_apps.utils.date_helper import TIMESTAMP_MASK
+
+MANIFEST_NAME = 'manifest.json'
+SHARD_FILE_NAME = 'datasets-%05d.ndjson.gz'
+CHECKPOINT_FILE_NAME = 'datasets-%05d.checkpoint.json'
+
+DEFAULT_NUM_SHARDS = 16
+DEFAULT_PROCESSES = 4
+DEFAULT_BATCH_SIZE = 500
+
+
+class ExportError(Exception):
+    """The output directory can't be used for the export"""
+    pass
+
+
+def read_json_file(fname):
+    """Return the contents of a JSON file"""
+    with open(fname, 'r') as json_file:
+        return json.load(json_file)
+
+
+def write_json_file(fname, data):
+    """Write a JSON file in one step: a reader never sees half of it"""
+    tmp_fname = '%s.tmp' % fname
+    with open(tmp_fname, 'w') as json_file:
+        json.dump(data, json_file, indent=4)
+        json_file.flush()
+        os.fsync(json_file.fileno())
+    os.rename(tmp_fname, fname)
+
+
+def get_published_dataset_filters():
+    """Filter parameters for published Datasets"""
+    return query_helper.get_is_published_filter_param()
+
+
+def export_shard(shard_args):
+    """
+    Export one shard.  Called in the process pool, so it's a module
+    level function
+
+        shard_args - (output dir, shard info from the manifest, batch size)
+    """
+    output_dir, shard, batch_size = shard_args
+
+    return ShardExporter(output_dir, shard, batch_size).export()
+
+
+class ShardExporter(object):
+    """Export the Datasets of one shard, starting after its checkpoint"""
+
+    def __init__(self, output_dir, shard, batch_size=DEFAULT_BATCH_SIZE):
+        """
+            shard - dict with "shard", "first_id" and "last_id"
+        """
+        self.shard = shard
+        self.batch_size = batch_size
+
+        self.shard_fname = join(output_dir, SHARD_FILE_NAME % shard['shard'])
+        self.checkpoint_fname = join(output_dir, CHECKPOINT_FILE_NAME % shard['shard'])
+
+    def get_checkpoint(self):
+        """Return the checkpoint, starting the shard over if it doesn't match the file"""
+        new_checkpoint = dict(last_id=None, num_bytes=0,\
+                              num_written=0, num_skipped=0, done=False)
+
+        if not isfile(self.checkpoint_fname):
+            return new_checkpoint
+
+        checkpoint = read_json_file(self.checkpoint_fname)
+
+        # The file is missing or shorter than checkpointed
+        if checkpoint['num_bytes'] > 0 and\
+            (not isfile(self.shard_fname) or\
+             os.path.getsize(self.shard_fname) < checkpoint['num_bytes']):
+            return new_checkpoint
+
+        return checkpoint
+
+    def get_next_batch(self, last_id):
+        """
+        Return [(Dataset id, modificationtime), ...] for the next batch
+        of published Datasets in the shard, after "last_id"
+        """
+        filters = get_published_dataset_filters()
+        filters['dvobject__id__lte'] = self.shard['last_id']
+        if last_id is None:
+            filters['dvobject__id__gte'] = self.shard['first_id']
+        else:
+            filters['dvobject__id__gt'] = last_id
+
+        return list(Dataset.objects.filter(**filters\
+                        ).values_list('dvobject__id', 'dvobject__modificationtime'\
+                        ).order_by('dvobject__id')[:self.batch_size])
+
+    def get_json_lines(self, dataset_modtimes):
+        """
+        Return (JSON lines, number skipped) for a batch of Datasets
+            dataset_modtimes - [(Dataset id, modificationtime), ...]
+        """
+        modtime_lookup = dict(dataset_modtimes)
+        version_id_lookup = get_latest_dataset_version_ids(modtime_lookup.keys())
+
+        # { DatasetVersion id : doc }, fresh DatasetDocs first
+        docs = {}
+        if is_dataset_doc_enabled():
+            dataset_docs = DatasetDoc.objects.filter(\
+                                dataset_version_id__in=version_id_lookup.values())
+            for dataset_doc in dataset_docs:
+                if dataset_doc.source_modificationtime ==\
+                    modtime_lookup.get(dataset_doc.dataset_id):
+                    docs[dataset_doc.dataset_version_id] = dataset_doc.doc
+
+        docs.update(DatasetSerializer.serialize_many(\
+                        [x for x in version_id_lookup.values() if x not in docs]))
+
+        json_lines = []
+        num_skipped = 0
+        for ds_id, modtime in dataset_modtimes:
+            doc = docs.get(version_id_lookup.get(ds_id))
+            if is_serialized(doc):
+                json_lines.append(json.dumps(doc))
+            else:
+                num_skipped += 1
+
+        return json_lines, num_skipped
+
+    def append_json_lines(self, json_lines, num_bytes):
+        """
+        Truncate the shard file to "num_bytes", the last checkpoint, and
+        append the lines as a new gzip member.
+
+        Returns the new file size
+        """
+        with open(self.shard_fname, 'ab') as shard_file:
+            shard_file.truncate(num_bytes)
+
+            gz_file = gzip.GzipFile(fileobj=shard_file, mode='wb')
+            for json_line in json_lines:
+                gz_file.write(json_line)
+                gz_file.write('\n')
+            gz_file.close()
+
+            shard_file.flush()
+            os.fsync(shard_file.fileno())
+            return os.fstat(shard_file.fileno()).st_size
+
+    def export(self):
+        """
+        Export the shard's Datasets after the checkpoint, a batch at a time.
+
+        Returns the shard's stats for this run
+        """
+        start_time = time.time()
+        checkpoint = self.get_checkpoint()
+
+        num_written = 0
+        while not checkpoint['done']:
+            dataset_modtimes = self.get_next_batch(checkpoint['last_id'])
+            if len(dataset_modtimes) == 0:
+                # drop anything written after the last checkpoint
+                if isfile(self.shard_fname):
+                    with open(self.shard_fname, 'ab') as shard_file:
+                        shard_file.truncate(checkpoint['num_bytes'])
+                checkpoint['done'] = True
+                write_json_file(self.checkpoint_fname, checkpoint)
+                break
+
+            json_lines, num_skipped = self.get_json_lines(dataset_modtimes)
+            if len(json_lines) > 0:
+                checkpoint['num_bytes'] = self.append_json_lines(json_lines,\
+                                                checkpoint['num_bytes'])
+
+            checkpoint['last_id'] = dataset_modtimes[-1][0]
+            checkpoint['num_written'] += len(json_lines)
+            checkpoint['num_skipped'] += num_skipped
+            write_json_file(self.checkpoint_fname, checkpoint)
+
+            num_written += len(json_lines)
+
+        return dict(shard=self.shard['shard'],\
+                    num_written=num_written,\
+                    seconds=time.time() - start_time,\
+                    checkpoint=checkpoint)
+
+
+class DatasetExporter(object):
+    """Plan the shards and export them with a process pool"""
+
+    def __init__(self, output_dir, **kwargs):
+        """
+            num_shards - used when a new manifest is made
+            processes - 1 = export in this process
+        """
+        self.output_dir = output_dir
+        self.num_shards = kwargs.get('num_shards', DEFAULT_NUM_SHARDS)
+        self.processes = kwargs.get('processes', DEFAULT_PROCESSES)
+        self.batch_size = kwargs.get('batch_size', DEFAULT_BATCH_SIZE)
+
+        self.manifest_fname = join(output_dir, MANIFEST_NAME)
+
+    # ----------------------------
+    #  Manifest
+    # ----------------------------
+    def make_manifest(self):
+        """Split the published Dataset ids into contiguous shards"""
+        ds_ids = list(Dataset.objects.filter(**get_published_dataset_filters()\
+                        ).values_list('dvobject__id', flat=True\
+                        ).order_by('dvobject__id'))
+
+        shard_size = max(1, -(-len(ds_ids) // self.num_shards))  # ceiling
+
+        shards = []
+        for start_idx in range(0, len(ds_ids), shard_size):
+            shard_ids = ds_ids[start_idx:start_idx + shard_size]
+            shard_num = len(shards)
+            shards.append(dict(shard=shard_num,\
+                               first_id=shard_ids[0],\
+                               last_id=shard_ids[-1],\
+                               num_datasets=len(shard_ids),\
+                               file_name=SHARD_FILE_NAME % shard_num,\
+                               checkpoint_name=CHECKPOINT_FILE_NAME % shard_num))
+
+        return dict(created=datetime.now().strftime(TIMESTAMP_MASK),\
+                    completed=None,\
+                    num_datasets=len(ds_ids),\
+                    shards=shards)
+
+    def get_manifest(self, restart=False):
+        """
+        Return the existing manifest--or make and save a new one.
+            restart - delete the shard files and make a new manifest
+        """
+        if not isdir(self.output_dir):
+            raise ExportError('Output directory does not exist: %s' % self.output_dir)
+
+        if isfile(self.manifest_fname) and not restart:
+            return read_json_file(self.manifest_fname)
+
+        if restart and isfile(self.manifest_fname):
+            for shard in read_json_file(self.manifest_fname)['shards']:
+                for fname in (shard['file_name'], shard['checkpoint_name']):
+                    if isfile(join(self.output_dir, fname)):
+                        os.remove(join(self.output_dir, fname))
+
+        manifest = self.make_manifest()
+        write_json_file(self.manifest_fname, manifest)
+        return manifest
+
+    # ----------------------------
+    #  Export
+    # ----------------------------
+    def export(self, restart=False, result_callback=None):
+        """
+        Export the unfinished shards.
+
+            result_callback - called with each shard's stats as it finishes
+
+        Returns the shard stats, in the order they finished
+        """
+        manifest = self.get_manifest(restart)
+
+        shard_args = [(self.output_dir, shard, self.batch_size)\
+                        for shard in manifest['shards']]
+
+        results = []
+        if self.processes <= 1 or len(shard_args) <= 1:
+            shard_results = (export_shard(x) for x in shard_args)
+            pool = None
+        else:
+            # Each process opens its own db connections
+            connections.close_all()
+            pool = Pool(min(self.processes, len(shard_args)))
+            shard_results = pool.imap_unordered(export_shard, shard_args)
+
+        try:
+            for shard_result in shard_results:
+                results.append(shard_result)
+                if result_callback:
+                    result_callback(shard_result)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if all([r['checkpoint']['done'] for r in results]):
+            manifest['completed'] = datetime.now().strftime(TIMESTAMP_MASK)
+            write_json_file(self.manifest_fname, manifest)
+
+        return results
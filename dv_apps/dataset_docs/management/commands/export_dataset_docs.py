@@ -0,0 +1,92 @@
+"""
+Export the JSON docs of all published Datasets as gzipped NDJSON shards.
+
+python manage.py export_dataset_docs --output-dir /data/export
+python manage.py export_dataset_docs --output-dir /data/export --processes 8 --shards 32
+
+Rerun with the same output directory to resume.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dv_apps.dataset_docs.export_util import DatasetExporter, ExportError,\
+    DEFAULT_NUM_SHARDS, DEFAULT_PROCESSES, DEFAULT_BATCH_SIZE
+from miniverse.db_routers.db_dataverse_router import analytics_reads
+
+
+def format_rate(num_docs, seconds):
+    """e.g. "120.5 docs/s" """
+    if seconds <= 0:
+        return 'n/a docs/s'
+    return '%.1f docs/s' % (num_docs / seconds)
+
+
+class Command(BaseCommand):
+    help = ('Export the JSON docs of published Datasets to gzipped NDJSON shards'
+            ' using a process pool.  Resumes from the checkpoints in the output directory.')
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--output-dir',
+                            dest='output_dir',
+                            required=True,
+                            help='Directory for the manifest, shard and checkpoint files.')
+
+        parser.add_argument('--processes',
+                            type=int,
+                            dest='processes',
+                            default=DEFAULT_PROCESSES,
+                            help='Number of shards exported at once. (default: %s)' % DEFAULT_PROCESSES)
+
+        parser.add_argument('--shards',
+                            type=int,
+                            dest='num_shards',
+                            default=DEFAULT_NUM_SHARDS,
+                            help=('Number of Dataset id ranges for a new export.'
+                                  ' (default: %s)' % DEFAULT_NUM_SHARDS))
+
+        parser.add_argument('--batch-size',
+                            type=int,
+                            dest='batch_size',
+                            default=DEFAULT_BATCH_SIZE,
+                            help='Datasets serialized and checkpointed together. (default: %s)' % DEFAULT_BATCH_SIZE)
+
+        parser.add_argument('--restart',
+                            action='store_true',
+                            dest='restart',
+                            default=False,
+                            help='Delete the shard files and start a new export.')
+
+    def handle(self, *args, **options):
+
+        exporter = DatasetExporter(options['output_dir'],
+                                   num_shards=options['num_shards'],
+                                   processes=options['processes'],
+                                   batch_size=options['batch_size'])
+
+        def write_result(shard_result):
+            checkpoint = shard_result['checkpoint']
+            self.stdout.write('shard %s: %s docs in %.2fs (%s)  total: %s docs, %.1f MB%s' %\
+                (shard_result['shard'],
+                 shard_result['num_written'],
+                 shard_result['seconds'],
+                 format_rate(shard_result['num_written'], shard_result['seconds']),
+                 checkpoint['num_written'],
+                 checkpoint['num_bytes'] / (1024.0 * 1024),
+                 '' if checkpoint['done'] else '  NOT DONE'))
+
+        start_time = time.time()
+        try:
+            with analytics_reads():
+                results = exporter.export(restart=options['restart'],
+                                          result_callback=write_result)
+        except ExportError as ex_obj:
+            raise CommandError(str(ex_obj))
+
+        seconds = time.time() - start_time
+        num_written = sum([r['num_written'] for r in results])
+        self.stdout.write('Exported %s docs in %.2fs (%s)' %\
+            (num_written, seconds, format_rate(num_written, seconds)))
+        self.stdout.write('Skipped (not serialized): %s' %\
+            sum([r['checkpoint']['num_skipped'] for r in results]))
@@ -0,0 +1,42 @@
+"""
+Store JSON docs for the published Datasets modified since the last refresh.
+
+python manage.py refresh_dataset_docs
+python manage.py refresh_dataset_docs --rebuild
+"""
+from django.core.management.base import BaseCommand
+
+from dv_apps.dataset_docs.doc_util import DatasetDocUtil, DEFAULT_BATCH_SIZE
+from miniverse.db_routers.db_dataverse_router import analytics_reads
+
+
+class Command(BaseCommand):
+    help = ('Serialize the latest published version of each Dataset'
+            ' modified since the last refresh and store it as a DatasetDoc.')
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--rebuild',
+                            action='store_true',
+                            dest='rebuild',
+                            default=False,
+                            help=('Delete the docs and serialize every published Dataset.'
+                                  ' Picks up changes, e.g. to a parent Dataverse,'
+                                  ' that leave the Dataset modificationtime as is.'))
+
+        parser.add_argument('--batch-size',
+                            type=int,
+                            dest='batch_size',
+                            default=DEFAULT_BATCH_SIZE,
+                            help='Number of Datasets serialized together. (default: %s)' % DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+
+        doc_util = DatasetDocUtil(batch_size=options['batch_size'],
+                                  verbose=options['verbosity'] > 1)
+
+        with analytics_reads():
+            num_saved = doc_util.refresh(rebuild=options['rebuild'])
+
+        self.stdout.write('Dataset docs saved: %s' % num_saved)
+        self.stdout.write('Watermark: %s' % doc_util.get_watermark())
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-18 19:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import jsonfield.fields
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+    """
+    Reference the DatasetVersion by id, not a ForeignKey: the docs live in
+    the Miniverse database.  Nothing could be saved before (save() raised),
+    so the table is recreated
+    """
+
+    dependencies = [
+        ('dataset_docs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='DatasetDoc',
+        ),
+        migrations.CreateModel(
+            name='DatasetDoc',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('name', models.CharField(help_text='Name of the dataset version', max_length=255)),
+                ('slug', models.SlugField(help_text='Auto-filld on save.', max_length=255)),
+                ('semantic_version', models.CharField(help_text='Canonical version number.  e.g. 1.0, 1.5, 2.0, 2.4, etc', max_length=20)),
+                ('dataset_id', models.IntegerField(db_index=True, help_text='DvObject id of the Dataset')),
+                ('dataset_version_id', models.IntegerField(unique=True)),
+                ('content_hash', models.CharField(help_text='Auto-filled on save.  md5 of the doc', max_length=32)),
+                ('source_modificationtime', models.DateTimeField(blank=True, help_text='Modification time of the Dataset when serialized. A newer one means the doc is stale', null=True)),
+                ('doc', jsonfield.fields.JSONField()),
+            ],
+            options={
+                'ordering': ('dataset_id',),
+            },
+        ),
+    ]
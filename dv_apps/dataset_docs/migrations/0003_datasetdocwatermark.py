@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-18 23:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+    """
+    The refresh watermark moves out of the metrics RollupWatermark table.
+    The next refresh starts over, re-saving only the docs which changed
+    """
+
+    dependencies = [
+        ('dataset_docs', '0002_datasetdoc_by_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetDocWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('last_dataset_id', models.IntegerField(default=0, help_text='DvObject id of the Dataset')),
+                ('last_modificationtime', models.DateTimeField(blank=True, help_text='Modification time of the Dataset', null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -18,29 +18,49 @@ May (potentially) be used to:
 from __future__ import unicode_literals
 
 from collections import OrderedDict
+import hashlib
 import json
 
 from django.db import models
+from django.utils.encoding import python_2_unicode_compatible
 from django.utils.text import slugify
 
-from dv_apps.datasets.models import Dataset, DatasetVersion
-
 from model_utils.models import TimeStampedModel
 from jsonfield import JSONField
 
+
+def get_content_hash(doc):
+    """md5 of the serialized document"""
+    return hashlib.md5(json.dumps(doc)).hexdigest()
+
+
+@python_2_unicode_compatible
 class DatasetDoc(TimeStampedModel):
-    """Store a JSON representation of a Dataset"""
+    """
+    Store a JSON representation of a Dataset: the serialized latest
+    published DatasetVersion.  See dv_apps.dataset_docs.doc_util
+
+    Lives in the Miniverse ("default") database, so the Dataset and
+    DatasetVersion are referenced by id
+    """
 
     name = models.CharField(max_length=255, help_text='Name of the dataset version')
 
     slug = models.SlugField(max_length=255, help_text='Auto-filld on save.')
 
-    semantic_version = models.CharField(max_length=20, help_text='Auto-filled on save.  Canonical version number.  e.g. 1.0, 1.5, 2.0, 2.4, etc')
+    semantic_version = models.CharField(max_length=20, help_text='Canonical version number.  e.g. 1.0, 1.5, 2.0, 2.4, etc')
+
+    dataset_id = models.IntegerField(db_index=True,\
+                    help_text='DvObject id of the Dataset')
 
-    dataset_version = models.ForeignKey(DatasetVersion)
+    dataset_version_id = models.IntegerField(unique=True)
 
-    dset_version_id = models.IntegerField(help_text='Auto-filled on save.'\
-        , blank=True, null=True)
+    content_hash = models.CharField(max_length=32,\
+                    help_text='Auto-filled on save.  md5 of the doc')
+
+    source_modificationtime = models.DateTimeField(blank=True, null=True,\
+                    help_text='Modification time of the Dataset when serialized.'
+                              ' A newer one means the doc is stale')
 
     doc = JSONField(load_kwargs={'object_pairs_hook': OrderedDict})
 
@@ -49,18 +69,32 @@ class DatasetDoc(TimeStampedModel):
         return self.name
 
     class Meta:
-        pass
-        #unique_together = ('schema', 'datafile_id', 'version')
-        #ordering = ('schema', '-version',)
+        ordering = ('dataset_id',)
         #verbose_name = 'File metadata'
         #verbose_name_plural = 'File metadata'
 
     def save(self, *args, **kwargs):
-        assert self.dataset_version.id is not None,\
-            "The Dataset Version MUST be saved before using this object"
+        assert self.dataset_version_id is not None,\
+            "The Dataset Version id MUST be set before saving this object"
+
+        self.slug = slugify('%s-%s' % (self.name, self.semantic_version))[:255]
+        self.content_hash = get_content_hash(self.doc)
+
+        super(DatasetDoc, self).save(*args, **kwargs)
 
-        self.semantic_version = self.dataset_version.get_semantic_version()
-        self.dset_version_id = self.dataset_version.id
-        self.slug = slugify('%s-%s' % (self.name, self.semantic_version))
 
-        super(DataverseDoc, self).save(*args, **kwargs)
+@python_2_unicode_compatible
+class DatasetDocWatermark(TimeStampedModel):
+    """
+    How far "refresh_dataset_docs" has got: the last Dataset of its last
+    committed batch.  Only the refresh moves it--not docs saved on reads.
+    One row
+    """
+    last_dataset_id = models.IntegerField(default=0,\
+                    help_text='DvObject id of the Dataset')
+
+    last_modificationtime = models.DateTimeField(blank=True, null=True,\
+                    help_text='Modification time of the Dataset')
+
+    def __str__(self):
+        return 'last modificationtime: %s' % self.last_modificationtime
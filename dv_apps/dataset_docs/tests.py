@@ -1,3 +1,218 @@
-from django.test import TestCase
+"""
+Tests for the DatasetDoc store and the NDJSON export.
+Note: This loads the metrics test fixture, 10,000+ objects
 
-# Create your tests here.
+Example of calling a single test:
+python manage.py test dv_apps.dataset_docs.tests.DatasetDocTests.test_01_dataset_docs
+
+"""
+from __future__ import print_function
+
+from collections import OrderedDict
+from datetime import datetime
+import gzip
+import json
+from os.path import isfile, join
+import shutil
+from StringIO import StringIO
+import tempfile
+
+from django.core import management
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+
+from dv_apps.dvobjects.models import DvObject
+from dv_apps.datasets.models import Dataset
+from dv_apps.datasetfields.models import MetadataBlock, DatasetFieldType,\
+    DatasetField, DatasetFieldValue
+from dv_apps.datasets.serializer import DatasetSerializer
+from dv_apps.datasets.util import get_latest_dataset_version_ids
+from dv_apps.dataset_docs.models import DatasetDoc, DatasetDocWatermark
+from dv_apps.dataset_docs.doc_util import DatasetDocUtil, build_dataset_doc
+from dv_apps.dataset_docs.export_util import DatasetExporter, ShardExporter
+from dv_apps.metrics.metrics_test_base import MetricsTestBase
+
+
+class DatasetDocTests(MetricsTestBase):
+    """Dataset JSON docs"""
+
+    def test_01_dataset_docs(self):
+        """01 - Dataset JSON served from DatasetDocs, refreshed by modificationtime"""
+        print (self.test_01_dataset_docs.__doc__)
+
+        mblock = MetadataBlock.objects.create(name='citation', displayname='Citation')
+        title_type = DatasetFieldType.objects.create(name='title', required=True,\
+                        fieldtype='TEXT', metadatablock=mblock,\
+                        advancedsearchfieldtype=False, allowcontrolledvocabulary=False,\
+                        allowmultiples=False, displayoncreate=True, facetable=False)
+
+        # titles for 3 published Datasets; the others can't be serialized
+        ds_ids = list(Dataset.objects.filter(dvobject__publicationdate__isnull=False\
+                        ).order_by('dvobject__id').values_list('dvobject__id', flat=True)[:3])
+        version_id_lookup = get_latest_dataset_version_ids(ds_ids)
+        self.assertEqual(len(version_id_lookup), 3)
+        for ds_id, dsv_id in version_id_lookup.items():
+            title_field = DatasetField.objects.create(datasetfieldtype=title_type,\
+                                                      datasetversion_id=dsv_id)
+            DatasetFieldValue.objects.create(datasetfield=title_field,\
+                                             value='Title %s' % ds_id, displayorder=0)
+
+        # refresh in batches
+        doc_util = DatasetDocUtil(batch_size=2)
+        self.assertEqual(doc_util.refresh(), 3)
+        self.assertEqual(sorted(DatasetDoc.objects.values_list('dataset_id', flat=True)),\
+                         sorted(ds_ids))
+        serialized = DatasetSerializer.serialize_many(version_id_lookup.values())
+        ds_id = ds_ids[0]
+        dataset_doc = DatasetDoc.objects.get(dataset_id=ds_id)
+        self.assertEqual(dataset_doc.dataset_version_id, version_id_lookup[ds_id])
+        self.assertEqual(json.dumps(dataset_doc.doc),\
+                         json.dumps(serialized[version_id_lookup[ds_id]]))
+        self.assertEqual(len(dataset_doc.content_hash), 32)
+
+        # nothing changed
+        watermark = doc_util.get_watermark()
+        self.assertEqual(watermark, max(Dataset.objects.filter(\
+                            dvobject__publicationdate__isnull=False\
+                            ).values_list('dvobject__modificationtime', flat=True)))
+        self.assertEqual(doc_util.refresh(), 0)
+        self.assertEqual(DatasetDoc.objects.count(), 3)
+
+        ds_url = reverse('view_dataset_by_id_api', kwargs=dict(ds_id=ds_id))
+        cache.clear()
+        with self.settings(DEBUG=True):
+            # served from the doc
+            stored_doc = OrderedDict(dataset_doc.doc, title='Stored title')
+            DatasetDoc.objects.filter(dataset_id=ds_id).update(doc=stored_doc)
+            resp = self.client.get(ds_url)
+            self.assertEqual(resp.json()['data']['title'], 'Stored title')
+
+            # the Dataset changed: serialized live and saved
+            cache.clear()
+            DvObject.objects.filter(id=ds_id).update(modificationtime=datetime.now())
+            resp = self.client.get(ds_url)
+            self.assertEqual(resp.json()['data']['title'], 'Title %s' % ds_id)
+            self.assertEqual(DatasetDoc.objects.get(dataset_id=ds_id).doc['title'],\
+                             'Title %s' % ds_id)
+
+            # a read doesn't move the watermark past Datasets edited earlier
+            earlier_modtime = datetime.now()
+            DvObject.objects.filter(id=ds_ids[1]).update(modificationtime=earlier_modtime)
+            cache.clear()
+            DvObject.objects.filter(id=ds_id).update(modificationtime=datetime.now())
+            self.client.get(ds_url)
+            self.assertEqual(doc_util.get_watermark(), watermark)
+            doc_util.refresh()
+            self.assertEqual(DatasetDoc.objects.get(dataset_id=ds_ids[1]).source_modificationtime,\
+                             earlier_modtime)
+            self.assertEqual(doc_util.get_watermark(),\
+                             DvObject.objects.get(id=ds_id).modificationtime)
+
+            # a miss
+            cache.clear()
+            DatasetDoc.objects.all().delete()
+            resp = self.client.get(ds_url)
+            self.assertEqual(resp.json()['data']['title'], 'Title %s' % ds_id)
+            self.assertEqual(DatasetDoc.objects.count(), 1)
+
+            # the dataset page
+            resp = self.client.get(reverse('view_single_dataset',\
+                                    kwargs=dict(dataset_id=ds_id)))
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(('Title %s' % ds_id) in resp.content)
+
+            # not stored when switched off
+            cache.clear()
+            with self.settings(USE_DATASET_DOCS=False):
+                resp = self.client.get(reverse('view_dataset_by_id_api',\
+                                        kwargs=dict(ds_id=ds_ids[1])))
+                self.assertEqual(resp.json()['data']['title'], 'Title %s' % ds_ids[1])
+            self.assertEqual(DatasetDoc.objects.count(), 1)
+        cache.clear()
+
+        # the watermark is the dataset_docs app's own row
+        self.assertEqual(DatasetDocWatermark.objects.count(), 1)
+
+        # a doc saved by a read during the refresh doesn't stop the batch
+        DatasetDoc.objects.all().delete()
+        conflict_dsv_id = version_id_lookup[ds_ids[2]]
+        build_dataset_doc(-1, conflict_dsv_id, serialized[conflict_dsv_id], None).save()
+        dataset_modtimes = doc_util.get_datasets_to_refresh(rebuild=True)
+        self.assertEqual(doc_util.refresh_batch(dataset_modtimes), 3)
+        self.assertEqual(sorted(DatasetDoc.objects.values_list('dataset_id', flat=True)),\
+                         sorted([-1, ds_ids[0], ds_ids[1]]))
+
+    def test_02_export_dataset_docs(self):
+        """02 - Export NDJSON shards and resume an interrupted shard"""
+        print (self.test_02_export_dataset_docs.__doc__)
+
+        mblock = MetadataBlock.objects.create(name='citation', displayname='Citation')
+        title_type = DatasetFieldType.objects.create(name='title', required=True,\
+                        fieldtype='TEXT', metadatablock=mblock,\
+                        advancedsearchfieldtype=False, allowcontrolledvocabulary=False,\
+                        allowmultiples=False, displayoncreate=True, facetable=False)
+
+        # titles for 5 published Datasets; the others are skipped
+        published_ds_ids = list(Dataset.objects.filter(dvobject__publicationdate__isnull=False\
+                        ).order_by('dvobject__id').values_list('dvobject__id', flat=True))
+        ds_ids = published_ds_ids[:5]
+        version_id_lookup = get_latest_dataset_version_ids(ds_ids)
+        for ds_id, dsv_id in version_id_lookup.items():
+            title_field = DatasetField.objects.create(datasetfieldtype=title_type,\
+                                                      datasetversion_id=dsv_id)
+            DatasetFieldValue.objects.create(datasetfield=title_field,\
+                                             value='Title %s' % ds_id, displayorder=0)
+        serialized = DatasetSerializer.serialize_many(\
+                        [version_id_lookup[x] for x in ds_ids])
+
+        output_dir = tempfile.mkdtemp()
+        try:
+            exporter = DatasetExporter(output_dir, num_shards=3, processes=1, batch_size=100)
+            manifest = exporter.get_manifest()
+            self.assertEqual(len(manifest['shards']), 3)
+            self.assertEqual(manifest['num_datasets'], len(published_ds_ids))
+            self.assertEqual(manifest['shards'][0]['first_id'], ds_ids[0])
+
+            # shard 0 stops after 1 batch, partway through writing the next
+            shard_exporter = ShardExporter(output_dir, manifest['shards'][0], batch_size=2)
+            dataset_modtimes = shard_exporter.get_next_batch(None)
+            json_lines, num_skipped = shard_exporter.get_json_lines(dataset_modtimes)
+            num_bytes = shard_exporter.append_json_lines(json_lines, 0)
+            checkpoint = dict(last_id=dataset_modtimes[-1][0], num_bytes=num_bytes,\
+                              num_written=len(json_lines), num_skipped=0, done=False)
+            with open(shard_exporter.checkpoint_fname, 'w') as checkpoint_file:
+                json.dump(checkpoint, checkpoint_file)
+            with open(shard_exporter.shard_fname, 'ab') as shard_file:
+                shard_file.write('partial batch')
+
+            # resume
+            shard_results = []
+            results = exporter.export(result_callback=shard_results.append)
+            self.assertEqual(len(shard_results), 3)
+            self.assertEqual(sum([r['num_written'] for r in results]), 3)
+            self.assertEqual(sum([r['checkpoint']['num_skipped'] for r in results]),\
+                             len(published_ds_ids) - 5)
+            self.assertTrue(json.load(open(join(output_dir, 'manifest.json')))['completed'])
+
+            # each doc once, in id order
+            docs = []
+            for shard in manifest['shards']:
+                shard_fname = join(output_dir, shard['file_name'])
+                if isfile(shard_fname):
+                    docs += [json.loads(line, object_pairs_hook=OrderedDict)\
+                             for line in gzip.open(shard_fname)]
+            self.assertEqual([doc['id'] for doc in docs], ds_ids)
+            self.assertEqual(json.dumps(docs[4]),\
+                             json.dumps(serialized[version_id_lookup[ds_ids[4]]]))
+
+            # nothing left
+            results = exporter.export()
+            self.assertEqual(sum([r['num_written'] for r in results]), 0)
+
+            # start over
+            stdout = StringIO()
+            management.call_command('export_dataset_docs', '--output-dir', output_dir,\
+                                    processes=1, restart=True, stdout=stdout)
+            self.assertTrue('Exported 5 docs' in stdout.getvalue())
+        finally:
+            shutil.rmtree(output_dir)
@@ -16,24 +16,28 @@ class DatasetValue(object):
         return '%s' % (self.value)
 
 
-class MetadataFormatter(object):
+class DatasetFieldLookup(object):
     """
-    Look for a rational way to query metadata in order to switch
-    to document structure.  (schema.org, JSON schema, etc)
+    Query the DatasetFields and values for one or more DatasetVersions.
 
-    (1) Get datasetfield based on DatasetVersion
-        (1a) Get related datasetfieldtype
-    (2)
+    The queries are by set (e.g. "datasetversion__id__in"), so the
+    query count is the same for 1 or 500 DatasetVersions
     """
-    def __init__(self, dataset_version):
-        self.dataset_version = dataset_version
+    def __init__(self, dataset_version_ids):
+        self.dataset_version_ids = dataset_version_ids
 
-        self.metadata_blocks = OrderedDict()
-        self.metadata_fields = []  #
+        # { DatasetVersion id : [primary DatasetField, ...] }
+        self.primary_fields_lookup = {}
 
-        self.gatherMetadata()
+        # {primary DatasetField id  : [Secondary DatasetField, ...] }
+        self.primary_secondary_lookup = {}
 
-    def gatherMetadata(self):
+        self.value_lookup = {}
+        self.controlled_vocab_lookup = {}
+
+        self.gatherFields()
+
+    def gatherFields(self):
         """
         Traverse the convolution!!
         """
@@ -42,11 +46,14 @@ class MetadataFormatter(object):
         primary_ds_fields = DatasetField.objects.select_related(\
                             'datasetfieldtype',
                             'datasetfieldtype__metadatablock'\
-                            ).filter(datasetversion=self.dataset_version)
+                            ).filter(datasetversion__id__in=self.dataset_version_ids\
+                            ).order_by('datasetversion__id', 'id')
 
         ds_field_ids = []  # For looking up compound vals
         for ds_field in primary_ds_fields:
             ds_field_ids.append(ds_field.id)
+            self.primary_fields_lookup.setdefault(ds_field.datasetversion_id, []\
+                ).append(ds_field)
 
         # -------------------------------------------
         # (2) Query the dataset compound value table to get the PKs
@@ -60,7 +67,7 @@ class MetadataFormatter(object):
                             'parentdatasetfield'\
                             ).filter(**kwargs\
                             ).order_by('displayorder')
-
+        compound_lookup = dict(compound_id_pairs)
 
         # -------------------------------------------
         # (3) Get the "Secondary" DatasetFields objects
@@ -69,16 +76,7 @@ class MetadataFormatter(object):
         #   Primary DatasetField id -> DatasetFieldCompoundValue.parentdatasetfield.id
         #       -> DatasetFieldCompoundValue.id -> Secondary DatasetField parentdatasetfieldcompoundvalue.id
         # -------------------------------------------
-
-        # -------------------------------------------
-        # (3a) Get the Compound value keys from (2)
-        # -------------------------------------------
-        ds_compound_ids = [compound_key for compound_key, primary_ds_id in compound_id_pairs]
-
-        # -------------------------------------------
-        # (3b) Pull the Secondary DatasetField objects
-        # -------------------------------------------
-        kwargs2 = dict(parentdatasetfieldcompoundvalue__id__in=ds_compound_ids)
+        kwargs2 = dict(parentdatasetfieldcompoundvalue__id__in=compound_lookup.keys())
         secondary_ds_fields = DatasetField.objects.select_related(\
                             'datasetfieldtype',
                             'parentdatasetfieldcompoundvalue'\
@@ -88,37 +86,119 @@ class MetadataFormatter(object):
                             'datasetfieldtype__displayorder')
 
         # -------------------------------------------
-        # (3c) Map the Primary DatasetField objects to
+        # (3a) Map the Primary DatasetField objects to
         #    the Secondary DatasetField objects
         # -------------------------------------------
-
-        # {primary DatasetField id  : [Secondary DatasetField, ...] }
-        primary_secondary_lookup = {}
-
-        # Iterate through the secondary fields, creating a lookup
-        #
         for secondary_ds in secondary_ds_fields:
-            # Check the DatasetFieldCompoundValue crosswalk to match
-            #   with a primary DatasetField
-            for compound_key, primary_ds_id in compound_id_pairs:
-                if compound_key == secondary_ds.parentdatasetfieldcompoundvalue.id:
-                    # A match!  Add it to the lookup
-                    primary_secondary_lookup.setdefault(primary_ds_id, []).append(secondary_ds)
+            primary_ds_id = compound_lookup.get(secondary_ds.parentdatasetfieldcompoundvalue_id)
+            if primary_ds_id is not None:
+                self.primary_secondary_lookup.setdefault(primary_ds_id, []).append(secondary_ds)
 
         # -------------------------------------------
         # (4) Gather the values for all of the fields
         # -------------------------------------------
         ds_field_ids += [ds.id for ds in secondary_ds_fields]
 
-        value_lookup = self.get_value_lookup(ds_field_ids)
+        self.value_lookup = self.get_value_lookup(ds_field_ids)
+
+        self.controlled_vocab_lookup = self.get_controlled_vocab_lookup(ds_field_ids)
+
+    def get_primary_fields(self, dataset_version_id):
+        """Return the primary DatasetFields of a DatasetVersion"""
+        return self.primary_fields_lookup.get(dataset_version_id, [])
+
+    def get_value_lookup(self, dataset_field_ids):
+
+        value_lookup = {}
+
+        # ----------------------
+        # Flat values
+        # ----------------------
+        ds_values = DatasetFieldValue.objects.values_list(\
+                    'id',
+                    'displayorder',
+                    'value',
+                    'datasetfield__id'\
+                    ).filter(\
+                        datasetfield__id__in=dataset_field_ids\
+                    ).order_by('displayorder')
+
+        for ds_val in ds_values:
+            datasetValue = DatasetValue(ds_val)
+            value_lookup[datasetValue.ds_field_id] = datasetValue
+
+        #for key, val in value_lookup.items():
+        #    msg('%s -> [%s]' % (key, val.value))
+        return value_lookup
+
+
+    def get_controlled_vocab_lookup(self, dataset_field_ids):
+        """
+        Given a list of DatasetField Ids:
+            - Retrieve any controlled vocabulary
+            - Return a dict of { dataset id : [DatasetValue, DatasetValue, etc]}
+        """
+        vocab_lookup = {}
+
+        # ----------------------
+        # Controlled Vocab values
+        # ----------------------
+        ds_vocab_values = DatasetFieldControlledVocabularyValue.objects.select_related(\
+                'controlledvocabularyvalues', 'datasetfield').filter(\
+                datasetfield__id__in=dataset_field_ids)
+
+        for vocab_value in ds_vocab_values:
+            vocab_val_list = (vocab_value.controlledvocabularyvalues.id,\
+                    vocab_value.controlledvocabularyvalues.displayorder,\
+                    vocab_value.controlledvocabularyvalues.strvalue,\
+                    vocab_value.datasetfield.id)
+            datasetValue = DatasetValue(vocab_val_list)
+
+            vocab_lookup.setdefault(vocab_value.datasetfield.id, []\
+                ).append(datasetValue)
+
+        #for key, val in vocab_lookup.items():
+        #    msg('%s -> [%s]' % (key, val))
+        return vocab_lookup
+
+
+class MetadataFormatter(object):
+    """
+    Look for a rational way to query metadata in order to switch
+    to document structure.  (schema.org, JSON schema, etc)
+
+    (1) Get datasetfield based on DatasetVersion
+        (1a) Get related datasetfieldtype
+    (2)
+    """
+    def __init__(self, dataset_version, field_lookup=None):
+        """
+            field_lookup - DatasetFieldLookup already holding this
+                DatasetVersion, e.g. from DatasetSerializer.serialize_many
+        """
+        self.dataset_version = dataset_version
+
+        if field_lookup is None:
+            field_lookup = DatasetFieldLookup([dataset_version.id])
+        self.field_lookup = field_lookup
+
+        self.metadata_blocks = OrderedDict()
+        self.metadata_fields = []  #
 
-        controlled_vocab_lookup = self.get_controlled_vocab_lookup(ds_field_ids)
+        self.gatherMetadata()
 
+    def gatherMetadata(self):
+        """
+        Put the queried fields and values together
+        """
+        primary_ds_fields = self.field_lookup.get_primary_fields(self.dataset_version.id)
+        primary_secondary_lookup = self.field_lookup.primary_secondary_lookup
+        value_lookup = self.field_lookup.value_lookup
+        controlled_vocab_lookup = self.field_lookup.controlled_vocab_lookup
 
         # -------------------------------------------
         # (5) Put this mess together
         # -------------------------------------------
-
         # -------------------------------------------
         # (5a) Go through primary field list, adding values as needed
         # -------------------------------------------
@@ -184,60 +264,6 @@ class MetadataFormatter(object):
 
         return False
 
-    def get_value_lookup(self, dataset_field_ids):
-
-        value_lookup = {}
-
-        # ----------------------
-        # Flat values
-        # ----------------------
-        ds_values = DatasetFieldValue.objects.values_list(\
-                    'id',
-                    'displayorder',
-                    'value',
-                    'datasetfield__id'\
-                    ).filter(\
-                        datasetfield__id__in=dataset_field_ids\
-                    ).order_by('displayorder')
-
-        for ds_val in ds_values:
-            datasetValue = DatasetValue(ds_val)
-            value_lookup[datasetValue.ds_field_id] = datasetValue
-
-        #for key, val in value_lookup.items():
-        #    msg('%s -> [%s]' % (key, val.value))
-        return value_lookup
-
-
-    def get_controlled_vocab_lookup(self, dataset_field_ids):
-        """
-        Given a list of DatasetField Ids:
-            - Retrieve any controlled vocabulary
-            - Return a dict of { dataset id : [DatasetValue, DatasetValue, etc]}
-        """
-        vocab_lookup = {}
-
-        # ----------------------
-        # Controlled Vocab values
-        # ----------------------
-        ds_vocab_values = DatasetFieldControlledVocabularyValue.objects.select_related(\
-                'controlledvocabularyvalues', 'datasetfield').filter(\
-                datasetfield__id__in=dataset_field_ids)
-
-        for vocab_value in ds_vocab_values:
-            vocab_val_list = (vocab_value.controlledvocabularyvalues.id,\
-                    vocab_value.controlledvocabularyvalues.displayorder,\
-                    vocab_value.controlledvocabularyvalues.strvalue,\
-                    vocab_value.datasetfield.id)
-            datasetValue = DatasetValue(vocab_val_list)
-
-            vocab_lookup.setdefault(vocab_value.datasetfield.id, []\
-                ).append(datasetValue)
-
-        #for key, val in vocab_lookup.items():
-        #    msg('%s -> [%s]' % (key, val))
-        return vocab_lookup
-
     def as_json(self, as_dict=False):
         """Return as a JSON string"""
         d = OrderedDict()
@@ -46,3 +46,62 @@ def get_dataset_title(dataset_version):
         return True, ds_value.value
 
     return False, 'No value found for DatasetFieldValue: %s (id:%s)' % (ds_field, ds_field.id)
+
+
+def get_dataset_titles(field_lookup):
+    """
+    Retrieve the titles for the DatasetVersions in a DatasetFieldLookup.
+    Same results as get_dataset_title but 2 queries for the whole set
+
+    Returns { DatasetVersion id : (True, title) or (False, error message) }
+    """
+    search_attrs = dict(name='title',\
+                        required=True,\
+                        metadatablock__name='citation')
+    # -----------------------------
+    # Get the DatasetFieldType
+    # -----------------------------
+    try:
+        ds_field_type = DatasetFieldType.objects.get(**search_attrs)
+    except DatasetFieldType.DoesNotExist:
+        err_msg = 'DatasetFieldType for Citation title not found.  (kwargs: %s)' % search_attrs
+        return dict([(dsv_id, (False, err_msg))\
+                    for dsv_id in field_lookup.dataset_version_ids])
+
+    # -----------------------------
+    # Get the DatasetFields, already queried.
+    #   { DatasetVersion id : first title DatasetField }
+    # -----------------------------
+    title_fields = {}
+    for dsv_id in field_lookup.dataset_version_ids:
+        for ds_field in field_lookup.get_primary_fields(dsv_id):
+            if ds_field.datasetfieldtype_id == ds_field_type.id:
+                title_fields[dsv_id] = ds_field
+                break
+
+    # -----------------------------
+    # Get the DatasetFieldValues
+    #   { DatasetField id : first value }
+    # -----------------------------
+    ds_values = DatasetFieldValue.objects.filter(\
+                    datasetfield__id__in=[x.id for x in title_fields.values()]\
+                    ).values_list('datasetfield__id', 'value'\
+                    ).order_by('id')
+
+    value_lookup = {}
+    for ds_field_id, value in ds_values:
+        value_lookup.setdefault(ds_field_id, value)
+
+    titles = {}
+    for dsv_id in field_lookup.dataset_version_ids:
+        ds_field = title_fields.get(dsv_id)
+        if ds_field is None:
+            search_attrs2 = dict(datasetversion__id=dsv_id,\
+                            datasetfieldtype__id=ds_field_type.id)
+            titles[dsv_id] = (False, 'No value found for Dataset Field. (kwargs: %s)' % (search_attrs2))
+        elif ds_field.id in value_lookup:
+            titles[dsv_id] = (True, value_lookup[ds_field.id])
+        else:
+            titles[dsv_id] = (False, 'No value found for DatasetFieldValue: %s (id:%s)' % (ds_field, ds_field.id))
+
+    return titles
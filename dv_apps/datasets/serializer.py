@@ -10,8 +10,9 @@ from django.conf import settings
 
 from dv_apps.dataverses.serializer import DataverseSerializer
 from dv_apps.datasets.models import DatasetVersion
-from dv_apps.datasetfields.utils import get_dataset_title
-from dv_apps.datasetfields.metadata_formatter import MetadataFormatter
+from dv_apps.datasetfields.utils import get_dataset_title, get_dataset_titles
+from dv_apps.datasetfields.metadata_formatter import MetadataFormatter,\
+    DatasetFieldLookup
 from dv_apps.utils.date_helper import TIMESTAMP_MASK
 
 from dv_apps.datafiles.util import DatafileUtil
@@ -48,11 +49,71 @@ class DatasetSerializer(object):
             return False, \
                 dict(error_message='Could not find Dataset title. %s' % dataset_title_or_err)
 
+        # -----------------------------------
+        # Format the metadata blocks -- the heavy lift...
+        # -----------------------------------
+        mdf = MetadataFormatter(self.dsv)
+
+        return self.format_dataset(dataset_title_or_err,\
+                    DataverseSerializer.get_short_dataverse_info(self.dvobject.owner),\
+                    mdf.as_dict().get('metadata_blocks', {}),\
+                    self.datafile_util.as_json())
+
+    @staticmethod
+    def serialize_many(version_ids):
+        """
+        Serialize many Dataset Versions, e.g. a batch of 500, with the
+        same number of queries as a single one
+
+        Returns an OrderedDict of { DatasetVersion id : as_json() result }
+            in the order of "version_ids".  Ids not found are left out
+        """
+        dsv_lookup = DatasetVersion.objects.select_related(\
+                                'dataset', 'dataset__dvobject'\
+                            ).in_bulk(version_ids)
+        version_ids = [x for x in version_ids if x in dsv_lookup]
+
+        # -----------------------------------
+        # Query for the whole set
+        # -----------------------------------
+        field_lookup = DatasetFieldLookup(version_ids)
+
+        titles = get_dataset_titles(field_lookup)
+
+        owner_ids = set([dsv_lookup[x].dataset.dvobject.owner_id for x in version_ids])
+        owner_info_lookup = DataverseSerializer.get_short_dataverse_info_many(owner_ids)
+
+        files_lookup = DatafileUtil.as_json_many(version_ids)
+
+        # -----------------------------------
+        # Put the documents together
+        # -----------------------------------
+        serialized = OrderedDict()
+        for dsv_id in version_ids:
+            success, dataset_title_or_err = titles[dsv_id]
+            if not success:
+                serialized[dsv_id] = (False,\
+                    dict(error_message='Could not find Dataset title. %s' % dataset_title_or_err))
+                continue
+
+            serializer = DatasetSerializer(dsv_lookup[dsv_id])
+            mdf = MetadataFormatter(serializer.dsv, field_lookup)
+
+            serialized[dsv_id] = serializer.format_dataset(dataset_title_or_err,\
+                    OrderedDict(owner_info_lookup[serializer.dvobject.owner_id]),\
+                    mdf.as_dict().get('metadata_blocks', {}),\
+                    files_lookup[dsv_id])
+
+        return serialized
+
+    def format_dataset(self, dataset_title, owner_info, metadata_blocks, files):
+        """Format the Dataset Version info along with its related parts"""
+
         # -----------------------------------
         # Hold the Dataset info, starting with title
         # -----------------------------------
         dsv_metadata = OrderedDict()
-        dsv_metadata['title'] = dataset_title_or_err
+        dsv_metadata['title'] = dataset_title
         dsv_metadata['id'] = self.dvobject.id
 
         # -----------------------------------
@@ -95,7 +156,7 @@ class DatasetSerializer(object):
         # -----------------------------------
         # Owning Dataverse info
         # -----------------------------------
-        dsv_metadata['ownerInfo'] = DataverseSerializer.get_short_dataverse_info(self.dvobject.owner)
+        dsv_metadata['ownerInfo'] = owner_info
         """
         if self.dvobject.owner:
             dsv_metadata['ownerInfo']['ownerId'] = self.dvobject.owner.id
@@ -106,17 +167,12 @@ class DatasetSerializer(object):
             dsv_metadata['ownerInfo']['isRootDataverse'] = True
         """
 
-        # -----------------------------------
-        # Format the metadata blocks -- the heavy lift...
-        # -----------------------------------
-        mdf = MetadataFormatter(self.dsv)
-        dsv_metadata['metadata_blocks'] = mdf.as_dict().get('metadata_blocks', {})
-
+        dsv_metadata['metadata_blocks'] = metadata_blocks
 
         # -----------------------------------
         # Add the file information
         # -----------------------------------
-        dsv_metadata['files'] = self.datafile_util.as_json()
+        dsv_metadata['files'] = files
 
         return dsv_metadata
 
@@ -1,3 +1,102 @@
-from django.test import TestCase
+"""
+Tests for the Dataset serializer.
+Note: This loads the metrics test fixture, 10,000+ objects
 
-# Create your tests here.
+Example of calling a single test:
+python manage.py test dv_apps.datasets.tests.DatasetSerializerTests.test_01_serialize_many
+
+"""
+from __future__ import print_function
+
+import json
+
+from django.db import connections
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+
+from dv_apps.datasets.models import DatasetVersion
+from dv_apps.datasetfields.models import MetadataBlock, DatasetFieldType,\
+    DatasetField, ControlledVocabularyValue, DatasetFieldControlledVocabularyValue,\
+    DatasetFieldCompoundValue, DatasetFieldValue
+from dv_apps.datasets.serializer import DatasetSerializer
+from dv_apps.metrics.metrics_test_base import MetricsTestBase
+
+
+class DatasetSerializerTests(MetricsTestBase):
+    """DatasetSerializer documents"""
+
+    def test_01_serialize_many(self):
+        """01 - DatasetSerializer.serialize_many matches as_json with a constant query count"""
+        print (self.test_01_serialize_many.__doc__)
+
+        mblock = MetadataBlock.objects.create(name='citation', displayname='Citation')
+        type_kwargs = dict(fieldtype='TEXT', metadatablock=mblock,\
+                        advancedsearchfieldtype=False, allowcontrolledvocabulary=False,\
+                        displayoncreate=True, facetable=False)
+        title_type = DatasetFieldType.objects.create(name='title', required=True,\
+                        allowmultiples=False, displayorder=0, **type_kwargs)
+        author_type = DatasetFieldType.objects.create(name='author', required=False,\
+                        allowmultiples=True, displayorder=1, **type_kwargs)
+        author_name_type = DatasetFieldType.objects.create(name='authorName', required=False,\
+                        allowmultiples=False, displayorder=2,\
+                        parentdatasetfieldtype=author_type, **type_kwargs)
+        subject_type = DatasetFieldType.objects.create(name='subject', required=False,\
+                        allowmultiples=True, displayorder=3, **type_kwargs)
+        vocab_values = [ControlledVocabularyValue.objects.create(strvalue=subject,\
+                            datasetfieldtype=subject_type, displayorder=idx)\
+                        for idx, subject in enumerate(['Chemistry', 'Law'])]
+
+        # released versions with files
+        version_ids = list(DatasetVersion.objects.filter(versionstate='RELEASED'\
+                            ).annotate(num_files=Count('filemetadata')\
+                            ).filter(num_files__gt=0\
+                            ).order_by('id').values_list('id', flat=True)[:4])
+        self.assertEqual(len(version_ids), 4)
+
+        # metadata for all but the last version: no title, an error
+        for cnt, dsv_id in enumerate(version_ids[:-1]):
+            title_field = DatasetField.objects.create(datasetfieldtype=title_type,\
+                                                      datasetversion_id=dsv_id)
+            DatasetFieldValue.objects.create(datasetfield=title_field,\
+                                             value='Title %s' % dsv_id, displayorder=0)
+
+            author_field = DatasetField.objects.create(datasetfieldtype=author_type,\
+                                                       datasetversion_id=dsv_id)
+            for idx in range(cnt + 1):
+                compound_value = DatasetFieldCompoundValue.objects.create(\
+                                        parentdatasetfield=author_field, displayorder=idx)
+                name_field = DatasetField.objects.create(datasetfieldtype=author_name_type,\
+                                        parentdatasetfieldcompoundvalue=compound_value)
+                DatasetFieldValue.objects.create(datasetfield=name_field,\
+                                        value='Author %s-%s' % (dsv_id, idx), displayorder=0)
+
+            subject_field = DatasetField.objects.create(datasetfieldtype=subject_type,\
+                                                        datasetversion_id=dsv_id)
+            DatasetFieldControlledVocabularyValue.objects.bulk_create(\
+                [DatasetFieldControlledVocabularyValue(datasetfield=subject_field,\
+                                controlledvocabularyvalues=vocab_values[cnt % 2])])
+
+        # same documents as one at a time, in the order given
+        serialized = DatasetSerializer.serialize_many(list(reversed(version_ids)) + [-1])
+        self.assertEqual(serialized.keys(), list(reversed(version_ids)))
+        for dsv_id in version_ids:
+            single = DatasetSerializer(DatasetVersion.objects.get(id=dsv_id)).as_json()
+            self.assertEqual(json.dumps(serialized[dsv_id]), json.dumps(single))
+
+        doc = serialized[version_ids[1]]
+        self.assertEqual(doc['title'], 'Title %s' % version_ids[1])
+        self.assertEqual(doc['metadata_blocks']['citation']['author'],\
+                         [{'authorName' : 'Author %s-%s' % (version_ids[1], idx)}\
+                          for idx in range(2)])
+        self.assertEqual(doc['metadata_blocks']['citation']['subject'], ['Law'])
+        self.assertTrue(len(doc['files']) > 0)
+        self.assertTrue(len(doc['ownerInfo']['alias']) > 0)
+        self.assertEqual(serialized[version_ids[-1]][0], False)
+
+        # the query count doesn't grow with the number of versions
+        query_counts = []
+        for id_list in (version_ids[:1], version_ids):
+            with CaptureQueriesContext(connections[DatasetVersion.objects.db]) as queries:
+                DatasetSerializer.serialize_many(id_list)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
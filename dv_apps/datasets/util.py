@@ -1,4 +1,6 @@
 from dv_apps.datasets.models import Dataset, DatasetVersion, VERSION_STATE_RELEASED
+from django.db.models import Max
+
 from dv_apps.utils import query_helper
 
 def get_latest_dataset_version(dataset_id):
@@ -14,9 +16,30 @@ def get_latest_dataset_version(dataset_id):
 
     # Get the latest version
     dataset_version = DatasetVersion.objects\
-            .select_related('dataset')\
+            .select_related('dataset', 'dataset__dvobject')\
             .filter(dataset=dataset,\
                 versionstate=VERSION_STATE_RELEASED)\
             .order_by('-id').first()
 
     return dataset_version
+
+
+def get_latest_dataset_version_ids(dataset_ids):
+    """
+    Given dataset ids, retrieve the ids of the latest *published*
+    DatasetVersions in one query.  See get_latest_dataset_version
+
+    Returns { dataset id : DatasetVersion id }.  Datasets without a
+        published version are left out
+    """
+    filters = query_helper.get_is_published_filter_param('dataset__dvobject')
+
+    version_ids = DatasetVersion.objects.filter(**filters\
+            ).filter(dataset__dvobject__id__in=dataset_ids,\
+                versionstate=VERSION_STATE_RELEASED\
+            ).values('dataset'\
+            ).annotate(latest_id=Max('id')\
+            ).values_list('dataset', 'latest_id'\
+            ).order_by()
+
+    return dict(version_ids)
@@ -0,0 +1,124 @@
+"""
+In-process cache of Dataverse API key lookups.
+
+Each metrics API request checks its API key against the Dataverse
+"apitoken" table--and, for superuser endpoints, "authenticateduser".
+This keeps a bounded, least-recently-used cache of those lookups:
+
+    - Known keys are cached for METRICS_APIKEY_CACHE_TIME seconds.
+        The token's "expiretime" is still checked on every request.
+    - Unknown keys are cached for METRICS_APIKEY_NEGATIVE_CACHE_TIME
+        seconds, so a new key is accepted soon after it's created.
+
+Call "flush_apikey_cache()" to clear the cache, e.g. after disabling a
+key.  Saving an ApiToken or AuthenticatedUser (e.g. via the admin) also
+clears it.  The cache is per process.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from dv_apps.dataverse_auth.models import ApiToken, AuthenticatedUser
+
+DEFAULT_CACHE_SIZE = 1000
+DEFAULT_CACHE_TIME = 60 * 5     # seconds
+DEFAULT_NEGATIVE_CACHE_TIME = 60    # seconds
+
+
+class ApiKeyInfo(object):
+    """The parts of an ApiToken needed to check a key"""
+
+    def __init__(self, expiretime, disabled, is_superuser):
+        self.expiretime = expiretime
+        self.disabled = disabled
+        self.is_superuser = is_superuser
+
+    def is_expired(self):
+        return datetime.now() > self.expiretime
+
+
+def load_apikey_info(apikey):
+    """
+    Retrieve the ApiKeyInfo from the database, in one query.
+    Returns None if the key doesn't exist.
+    """
+    try:
+        api_token = ApiToken.objects.select_related('authenticateduser'\
+                        ).get(tokenstring=apikey)
+    except ApiToken.DoesNotExist:
+        return None
+
+    return ApiKeyInfo(api_token.expiretime,\
+                      api_token.disabled,\
+                      api_token.authenticateduser.is_superuser())
+
+
+class ApiKeyCache(object):
+    """Bounded LRU cache of { api key : (cache expiration, ApiKeyInfo or None) }"""
+
+    def __init__(self, max_size, cache_time, negative_cache_time):
+        self.max_size = max_size
+        self.cache_time = cache_time
+        self.negative_cache_time = negative_cache_time
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_apikey_info(self, apikey, load_func=load_apikey_info):
+        """Return the ApiKeyInfo, from the cache if possible, or None"""
+        now = time.time()
+
+        with self.lock:
+            entry = self.entries.pop(apikey, None)
+            if entry is not None and entry[0] > now:
+                self.entries[apikey] = entry    # most recently used
+                return entry[1]
+
+        apikey_info = load_func(apikey)
+
+        if apikey_info is None:
+            cache_time = self.negative_cache_time
+        else:
+            cache_time = self.cache_time
+
+        if cache_time > 0 and self.max_size > 0:
+            with self.lock:
+                self.entries[apikey] = (now + cache_time, apikey_info)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)  # least recently used
+
+        return apikey_info
+
+    def flush(self):
+        with self.lock:
+            self.entries.clear()
+
+
+APIKEY_CACHE = ApiKeyCache(\
+        getattr(settings, 'METRICS_APIKEY_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+        getattr(settings, 'METRICS_APIKEY_CACHE_TIME', DEFAULT_CACHE_TIME),
+        getattr(settings, 'METRICS_APIKEY_NEGATIVE_CACHE_TIME', DEFAULT_NEGATIVE_CACHE_TIME))
+
+
+def get_apikey_info(apikey):
+    """Return the ApiKeyInfo for the key or None if it doesn't exist"""
+    return APIKEY_CACHE.get_apikey_info(apikey)
+
+
+def flush_apikey_cache():
+    """Clear the cached API keys for this process"""
+    APIKEY_CACHE.flush()
+
+
+@receiver(post_save, sender=ApiToken)
+@receiver(post_delete, sender=ApiToken)
+@receiver(post_save, sender=AuthenticatedUser)
+@receiver(post_delete, sender=AuthenticatedUser)
+def flush_apikey_cache_on_change(sender, **kwargs):
+    """A changed token or user (e.g. no longer a superuser) clears the cache"""
+    flush_apikey_cache()
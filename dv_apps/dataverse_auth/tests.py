@@ -1,3 +1,78 @@
-from django.test import TestCase
+from datetime import datetime, timedelta
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from dv_apps.dataverse_auth.apikey_cache import ApiKeyCache, ApiKeyInfo,\
+    APIKEY_CACHE, flush_apikey_cache
+from dv_apps.dataverse_auth.util import get_valid_apikey_info
+
+
+class ApiKeyCacheTests(SimpleTestCase):
+    """Test the in-process cache of API key lookups"""
+
+    def setUp(self):
+        self.load_count = 0
+        self.known_keys = {'key-1' : ApiKeyInfo(datetime.now() + timedelta(days=1), False, False),
+                           'key-2' : ApiKeyInfo(datetime.now() + timedelta(days=1), False, True),
+                           'key-3' : ApiKeyInfo(datetime.now() + timedelta(days=1), False, False)}
+
+    def tearDown(self):
+        flush_apikey_cache()
+
+    def load_apikey_info(self, apikey):
+        self.load_count += 1
+        return self.known_keys.get(apikey, None)
+
+    def test_01_cached_lookups(self):
+        """01 - Known and unknown keys are loaded once"""
+        apikey_cache = ApiKeyCache(10, 60, 60)
+
+        for _ in range(3):
+            self.assertTrue(apikey_cache.get_apikey_info('key-2', self.load_apikey_info).is_superuser)
+            self.assertEqual(apikey_cache.get_apikey_info('no-such-key', self.load_apikey_info), None)
+        self.assertEqual(self.load_count, 2)
+
+        apikey_cache.flush()
+        apikey_cache.get_apikey_info('key-2', self.load_apikey_info)
+        self.assertEqual(self.load_count, 3)
+
+    def test_02_cache_time(self):
+        """02 - Entries are reloaded after the cache time"""
+        apikey_cache = ApiKeyCache(10, 60, 0)
+
+        apikey_cache.get_apikey_info('no-such-key', self.load_apikey_info)
+        apikey_cache.get_apikey_info('no-such-key', self.load_apikey_info)
+        self.assertEqual(self.load_count, 2)    # negative caching is off
+
+        apikey_cache.get_apikey_info('key-1', self.load_apikey_info)
+        apikey_cache.entries['key-1'] = (0, apikey_cache.entries['key-1'][1])
+        apikey_cache.get_apikey_info('key-1', self.load_apikey_info)
+        self.assertEqual(self.load_count, 4)
+
+    def test_03_least_recently_used(self):
+        """03 - The least recently used key is dropped"""
+        apikey_cache = ApiKeyCache(2, 60, 60)
+
+        apikey_cache.get_apikey_info('key-1', self.load_apikey_info)
+        apikey_cache.get_apikey_info('key-2', self.load_apikey_info)
+        apikey_cache.get_apikey_info('key-1', self.load_apikey_info)
+        apikey_cache.get_apikey_info('key-3', self.load_apikey_info)
+
+        self.assertEqual(list(apikey_cache.entries.keys()), ['key-1', 'key-3'])
+
+    def test_04_expiretime(self):
+        """04 - A cached key still expires at its expiretime"""
+        self.assertFalse(self.known_keys['key-1'].is_expired())
+        self.assertTrue(ApiKeyInfo(datetime.now() - timedelta(seconds=1), False, False).is_expired())
+
+        # cached on an earlier request, then the key reaches its expiretime
+        flush_apikey_cache()
+        api_info = APIKEY_CACHE.get_apikey_info('key-1', self.load_apikey_info)
+        self.assertEqual(get_valid_apikey_info('key-1'), (api_info, None))
+
+        api_info.expiretime = datetime.now() - timedelta(seconds=1)
+
+        cached_info, err_msg = get_valid_apikey_info('key-1')
+        self.assertEqual(cached_info, None)
+        self.assertTrue(err_msg.find('expired') > -1)
+        self.assertEqual(self.load_count, 1)    # still served from the cache
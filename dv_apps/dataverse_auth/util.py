@@ -2,7 +2,7 @@
 
 import bcrypt
 from dv_apps.dataverse_auth.models import BuiltInUser
-from dv_apps.dataverse_auth.models import ApiToken
+from dv_apps.dataverse_auth.apikey_cache import get_apikey_info
 
 
 def is_valid_builtinuser_password(username, attempted_password):
@@ -28,51 +28,47 @@ def is_valid_builtinuser_password(username, attempted_password):
         return False
 
 
-def is_apikey_valid(apikey):
-    """Check if an apikey is valid"""
-
+def get_valid_apikey_info(apikey):
+    """
+    Return (ApiKeyInfo, None) for a usable apikey
+    or (None, error message)
+    """
     if not apikey:
-        return False, "The API key cannot be blank."
+        return None, "The API key cannot be blank."
 
-    # Is this an actual api token?
-    try:
-        api_info = ApiToken.objects.get(tokenstring=apikey)
-    except ApiToken.DoesNotExist:
-        return False, "That API key does not exist."
+    # Is this an actual api token?  (cached lookup)
+    api_info = get_apikey_info(apikey)
+    if api_info is None:
+        return None, "That API key does not exist."
 
     # Has it expired?
     if api_info.is_expired():
-        return False, "Sorry! Your API key is expired. "
+        return None, "Sorry! Your API key is expired. "
 
     if api_info.disabled is True:
-        return False, "Your API key is disabled."
-
+        return None, "Your API key is disabled."
 
-    return True, None
+    return api_info, None
 
 
-def is_apikey_valid_superuser(apikey):
+def is_apikey_valid(apikey):
     """Check if an apikey is valid"""
 
-    if not apikey:
-        return False, "The API key cannot be blank."
+    api_info, err_msg_or_none = get_valid_apikey_info(apikey)
+    if api_info is None:
+        return False, err_msg_or_none
 
-    # Is this an actual api token?
-    try:
-        api_info = ApiToken.objects.get(tokenstring=apikey)
-    except ApiToken.DoesNotExist:
-        return False, "That API key does not exist."
+    return True, None
 
 
-    # Has it expired?
-    if api_info.is_expired():
-        return False, "Sorry! Your API key is expired. "
+def is_apikey_valid_superuser(apikey):
+    """Check if an apikey is valid"""
 
-    if api_info.disabled is True:
-        return False, "Your API key is disabled."
+    api_info, err_msg_or_none = get_valid_apikey_info(apikey)
+    if api_info is None:
+        return False, err_msg_or_none
 
-    if api_info.authenticateduser:
-        if api_info.authenticateduser.is_superuser():
-            return True, None
+    if api_info.is_superuser:
+        return True, None
 
     return False, "You need superuser privileges for this task."
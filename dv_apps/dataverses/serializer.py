@@ -118,13 +118,37 @@ class DataverseSerializer(object):
         """
         assert owner_dvobject is not None, "The DvObject (owner_dvobject) cannot be None"
 
-        fmt_dict = OrderedDict()
         try:
             owner = Dataverse.objects.get(dvobject__id=owner_dvobject.id)
         except Dataverse.DoesNotExist:
-            return fmt_dict
+            return OrderedDict()
+
+        return DataverseSerializer.format_short_dataverse_info(owner_dvobject.id, owner)
+
+    @staticmethod
+    def get_short_dataverse_info_many(owner_ids):
+        """
+        Get parent dataverse information for many owners in one query
+
+        Returns { owner id : OrderedDict }, see get_short_dataverse_info
+        """
+        owners = Dataverse.objects.filter(dvobject__id__in=owner_ids)
+
+        info_lookup = dict([(owner_id, OrderedDict()) for owner_id in owner_ids])
+        for owner in owners:
+            info_lookup[owner.dvobject_id] = DataverseSerializer.format_short_dataverse_info(\
+                                                owner.dvobject_id, owner)
+        return info_lookup
 
-        fmt_dict['id'] = owner_dvobject.id
+    @staticmethod
+    def format_short_dataverse_info(owner_id, owner):
+        """
+        Format the parent dataverse information
+            owner_id - DvObject id of the Dataverse
+            owner - Dataverse object
+        """
+        fmt_dict = OrderedDict()
+        fmt_dict['id'] = owner_id
         fmt_dict['name'] = owner.name
         fmt_dict['alias'] = owner.alias
         fmt_dict['dv_link'] = DataverseUtil.get_dataverse_link(fmt_dict['alias'])
@@ -4,7 +4,7 @@ from dv_apps.metrics.stats_view_base import StatsViewSwagger
 from dv_apps.metrics.stats_result import StatsResult
 from dv_apps.datasets.models import Dataset, DatasetVersion, VERSION_STATE_RELEASED
 from dv_apps.datasets.util import get_latest_dataset_version
-from dv_apps.datasets.serializer import DatasetSerializer
+from dv_apps.dataset_docs.doc_util import DatasetDocUtil
 
 
 #from dv_apps.metrics.stats_util_datasets import StatsMakerDatasets
@@ -42,7 +42,7 @@ class DatasetByIdView(StatsViewSwagger):
         if dataset_version is None:
             return StatsResult.build_error_result('No published Dataset with id: %s' % dv_id, 404)
 
-        dataset_as_json = DatasetSerializer(dataset_version).as_json()
+        dataset_as_json = DatasetDocUtil().get_dataset_json(dataset_version)
 
         return StatsResult.build_success_result(dataset_as_json)
 
@@ -85,6 +85,6 @@ class DatasetByPersistentIdView(StatsViewSwagger):
         if dataset_version is None:
             return StatsResult.build_error_result(err_404, 404)
 
-        dataset_as_json = DatasetSerializer(dataset_version).as_json()
+        dataset_as_json = DatasetDocUtil().get_dataset_json(dataset_version)
 
         return StatsResult.build_success_result(dataset_as_json)
@@ -11,7 +11,7 @@ from dv_apps.dataverses.models import Dataverse
 from dv_apps.dataverses.serializer import DataverseSerializer
 from django.views.decorators.cache import cache_page
 
-from dv_apps.datasets.serializer import DatasetSerializer
+from dv_apps.dataset_docs.doc_util import DatasetDocUtil
 
 @cache_page(settings.METRICS_CACHE_VIEW_TIME)
 def view_dataset_by_persistent_id(request):
@@ -51,7 +51,7 @@ def view_get_slack_dataset_info(dataset_id, **kwargs):
     if dsv is None:
         return "Sorry, no Dataset found for id: %s" % dataset_id
 
-    dataset_dict = DatasetSerializer(dsv).as_json()
+    dataset_dict = DatasetDocUtil().get_dataset_json(dsv)
 
     ref_url = '%s/dataset.xhtml?id=%s' % (\
                     settings.DATAVERSE_INSTALLATION_URL,
@@ -83,13 +83,13 @@ def view_dataset_by_version(request, dataset_version_id):
     """Dataset view test.  Given dataset version id, render HTML"""
 
     try:
-        dsv = DatasetVersion.objects.select_related('dataset')\
+        dsv = DatasetVersion.objects.select_related('dataset', 'dataset__dvobject')\
             .get(pk=dataset_version_id,
                 versionstate=VERSION_STATE_RELEASED)
     except DatasetVersion.DoesNotExist:
         raise Http404
 
-    dataset_dict = DatasetSerializer(dsv).as_json()
+    dataset_dict = DatasetDocUtil().get_dataset_json(dsv)
     citation_block=dataset_dict.get('metadata_blocks', {}).get('citation')
 
     dataverse_id = dataset_dict['ownerInfo']['id']
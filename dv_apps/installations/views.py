@@ -9,30 +9,56 @@ from django.views.decorators.clickjacking import xframe_options_exempt
 from dv_apps.installations.models import Installation, Institution
 from dv_apps.utils.metrics_cache_time import get_metrics_cache_time
 
-from dv_apps.metrics.stats_count_util import get_total_published_counts
+from dv_apps.metrics.stats_count_util import get_total_published_counts_cached
+from dv_apps.metrics.view_data_cache import get_cached_view_data
+
+# Name of the cached map data
+INSTALLATION_MAP_DATA = 'installation_map'
 
-@cache_page(get_metrics_cache_time())
-def view_map(request):
-    """Show Dataverse map with affiliated Institutions"""
+
+def compute_installation_map_data():
+    """Return (map data, is_complete) for the view data cache"""
 
     # Retrieve the installations
-    install_list = Installation.objects.filter(is_active=True)
+    install_list = list(Installation.objects.filter(is_active=True))
     arr = []
 
     # For each Installation, add the affiliated Institutions
     for i  in install_list:
-        lists = Institution.objects.filter(host__name=i.name)
+        lists = list(Institution.objects.filter(host__name=i.name))
         arr.append(lists)
 
     d = dict(
         install_list = install_list,
         arr = arr,
-        installation_count=install_list.count()
+        installation_count=len(install_list)
     )
 
-    d.update(get_total_published_counts())
+    return d, True
+
 
-    return render(request, 'installations/map2.html', d)
+def get_installation_map_data(refresh=False):
+    """
+    Installation map data, with the total published counts, from the cache.
+        - refresh - recompute the cached map data.  The counts are
+            warmed as "total_published_counts"
+    Returns a copy, which the caller may update
+    """
+    d = dict(get_cached_view_data(INSTALLATION_MAP_DATA,\
+                                  compute_installation_map_data,\
+                                  refresh=refresh))
+
+    d.update(get_total_published_counts_cached())
+
+    return d
+
+
+def view_map(request):
+    """
+    Show Dataverse map with affiliated Institutions.
+    The map data is cached and may be refreshed by "manage.py warm_metrics"
+    """
+    return render(request, 'installations/map2.html', get_installation_map_data())
 
 
 @cache_page(get_metrics_cache_time())
@@ -64,17 +90,18 @@ def view_installations_json(request, pretty=False):
 
 
 @xframe_options_exempt
-@cache_page(get_metrics_cache_time())
 def view_homepage_counts_dataverse_org(request):
-
-    d = get_total_published_counts()
+    """
+    Total published counts, for an iframe on dataverse.org.
+    The counts are cached and may be refreshed by "manage.py warm_metrics"
+    """
+    d = get_total_published_counts_cached()
     d['installation_count'] = Installation.objects.filter(is_active=True).count()
 
     return render(request, 'installations/homepage_counts.html', d)
 
 
 @xframe_options_exempt
-@cache_page(get_metrics_cache_time())
 def view_map_dataverse_org(request):
     """
     Return map visualization page
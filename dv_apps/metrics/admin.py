@@ -1,3 +1,36 @@
 from django.contrib import admin
 
 # Register your models here.
+from .models import DownloadMonthRollup, RollupWatermark, DatafileExtension,\
+    MonthlySnapshotSet, MonthlySnapshot
+
+class DownloadMonthRollupAdmin(admin.ModelAdmin):
+    list_display = ['yyyy_mm', 'dataverse_id', 'is_published', 'downloadtype', 'count']
+    list_filter = ['is_published', 'downloadtype']
+    search_fields = ['dataverse_id']
+
+class RollupWatermarkAdmin(admin.ModelAdmin):
+    list_display = ['name', 'last_id', 'last_timestamp', 'modified']
+    readonly_fields = ('created', 'modified')
+
+class DatafileExtensionAdmin(admin.ModelAdmin):
+    list_display = ['datafile_id', 'label', 'extension', 'contenttype', 'filesize']
+    list_filter = ['contenttype']
+    search_fields = ['label', 'extension', 'contenttype']
+
+class MonthlySnapshotSetAdmin(admin.ModelAdmin):
+    list_display = ['metric', 'filter_signature', 'frozen_before', 'start_point_count', 'modified']
+    list_filter = ['metric']
+    search_fields = ['filter_signature']
+    readonly_fields = ('created', 'modified')
+
+class MonthlySnapshotAdmin(admin.ModelAdmin):
+    list_display = ['metric', 'filter_signature', 'yyyy_mm', 'count', 'extra_values']
+    list_filter = ['metric']
+    search_fields = ['filter_signature']
+
+admin.site.register(DownloadMonthRollup, DownloadMonthRollupAdmin)
+admin.site.register(RollupWatermark, RollupWatermarkAdmin)
+admin.site.register(DatafileExtension, DatafileExtensionAdmin)
+admin.site.register(MonthlySnapshotSet, MonthlySnapshotSetAdmin)
+admin.site.register(MonthlySnapshot, MonthlySnapshotAdmin)
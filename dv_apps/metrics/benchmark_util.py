@@ -0,0 +1,278 @@
+"""
+Time each metrics API endpoint against the current database.
+
+Every view in "VIEW_CLASSES_FOR_SPEC" is run with its default params,
+and with "pub_state=all" where it takes a publication state.  Each run
+calls the view's "get_stats_result" directly, so the result cache and
+API key checks are skipped and every run does the full computation.
+
+The JSON report records, per endpoint:
+
+    min_ms, median_ms, max_ms - over "repeat" runs
+    query_count, db_ms - from the last run
+    record_count
+
+along with the table row counts, so that reports from the same
+synthetic database (see "synthetic_data_util") can be compared:
+
+    python manage.py benchmark_metrics --output before.json
+    python manage.py benchmark_metrics --output after.json --compare before.json
+"""
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from urllib import urlencode
+
+from django.http import HttpRequest, QueryDict
+
+from dv_apps.dvobjects.models import DvObject
+from dv_apps.dataverses.models import Dataverse
+from dv_apps.datasets.models import Dataset, DatasetVersion
+from dv_apps.datafiles.models import Datafile, FileMetadata
+from dv_apps.datasetfields.models import DatasetField
+from dv_apps.guestbook.models import GuestBookResponse
+from dv_apps.metrics.stats_timing import QueryTimer, get_ms
+from dv_apps.metrics.stats_util_batch import BATCH_METRICS, MAX_BATCH_METRICS
+from dv_apps.metrics.views_swagger_spec import VIEW_CLASSES_FOR_SPEC
+
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+STATUS_SKIPPED = 'skipped'
+
+DEFAULT_REPEAT = 3
+
+COUNTED_MODELS = [DvObject, Dataverse, Dataset, DatasetVersion, Datafile,\
+                  FileMetadata, DatasetField, GuestBookResponse]
+
+
+def get_median(values):
+    """Median of a non-empty list"""
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2 == 1:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+class MetricsBenchmark(object):
+    """Run and time each metrics endpoint"""
+
+    def __init__(self, view_classes=None, repeat=DEFAULT_REPEAT, verbose=False):
+        if view_classes is None:
+            view_classes = VIEW_CLASSES_FOR_SPEC
+
+        self.view_classes = view_classes
+        self.repeat = max(1, repeat)
+        self.verbose = verbose
+
+        self.sample_values = None
+
+    def msg(self, m):
+        if self.verbose:
+            print(m)
+
+    def get_sample_values(self):
+        """
+        Ids and names for endpoints about a single object:
+        the first published Dataverse and Dataset
+        """
+        if self.sample_values is not None:
+            return self.sample_values
+
+        d = {}
+        dv = Dataverse.objects.select_related('dvobject'\
+                ).filter(dvobject__publicationdate__isnull=False,\
+                         dvobject__owner__isnull=False\
+                ).order_by('dvobject__id').first()
+        if dv is not None:
+            d['dv_id'] = dv.dvobject.id
+            d['alias'] = dv.alias
+
+        ds = Dataset.objects.filter(dvobject__publicationdate__isnull=False\
+                ).order_by('dvobject__id').first()
+        if ds is not None:
+            d['ds_id'] = ds.dvobject_id
+            d['persistentId'] = '%s:%s/%s' % (ds.protocol, ds.authority, ds.identifier)
+
+        self.sample_values = d
+        return d
+
+    def get_param_variants(self, view_class):
+        """
+        Returns a list of (params, url kwargs)--or None if the
+        database lacks an object the endpoint needs
+        """
+        param_names = view_class.param_names
+        samples = self.get_sample_values()
+
+        params = OrderedDict()
+        url_kwargs = {}
+
+        for param_name, key, is_url_kwarg in [\
+                    ('dataverseObjectId', 'dv_id', True),
+                    ('dataverseAlias', 'alias', True),
+                    ('datasetId', 'ds_id', True),
+                    ('persistentId', 'persistentId', False)]:
+            if not param_name in param_names:
+                continue
+            if not key in samples:
+                return None
+            if is_url_kwarg:
+                url_kwargs[key] = str(samples[key])
+            else:
+                params[key] = samples[key]
+
+        if 'metricNamesParam' in param_names:
+            params['metrics'] = ','.join(BATCH_METRICS.keys()[:MAX_BATCH_METRICS])
+
+        variants = [(params, url_kwargs)]
+        if 'publicationStateParam' in param_names:
+            all_params = OrderedDict(params)
+            all_params['pub_state'] = 'all'
+            variants.append((all_params, url_kwargs))
+
+        return variants
+
+    def run_view(self, view_class, params, url_kwargs):
+        """
+        Run the view's "get_stats_result" once.
+        Returns (StatsResult, QueryTimer, seconds)
+        """
+        request = HttpRequest()
+        request.method = 'GET'
+        request.GET = QueryDict(urlencode(params.items()))
+
+        view = view_class()
+        view.request = request
+        view.args = ()
+        view.kwargs = url_kwargs
+
+        query_timer = QueryTimer().start()
+        start_time = time.time()
+        try:
+            stats_result = view.get_stats_result(request)
+        finally:
+            seconds = time.time() - start_time
+            query_timer.stop()
+
+        return stats_result, query_timer, seconds
+
+    def benchmark_view(self, view_class, params, url_kwargs):
+        """Time "repeat" runs of a view.  Returns an OrderedDict"""
+        d = OrderedDict(endpoint=view_class.__name__)
+        d['api_path'] = view_class.api_path
+        d['params'] = OrderedDict(sorted(params.items()))
+        d['url_kwargs'] = OrderedDict(sorted(url_kwargs.items()))
+        d['status'] = STATUS_OK
+        d['error_message'] = None
+
+        runs_ms = []
+        for _ in range(self.repeat):
+            try:
+                stats_result, query_timer, seconds = self.run_view(\
+                                                view_class, params, url_kwargs)
+            except Exception as ex_obj:
+                d['status'] = STATUS_ERROR
+                d['error_message'] = '%s: %s' % (ex_obj.__class__.__name__, ex_obj)
+                return d
+
+            if stats_result is None or stats_result.has_error():
+                d['status'] = STATUS_ERROR
+                d['error_message'] = stats_result.error_message\
+                                    if stats_result is not None else 'No result'
+                return d
+
+            runs_ms.append(get_ms(seconds))
+
+        d['runs_ms'] = runs_ms
+        d['min_ms'] = min(runs_ms)
+        d['median_ms'] = get_median(runs_ms)
+        d['max_ms'] = max(runs_ms)
+        d['query_count'] = query_timer.query_count
+        d['db_ms'] = get_ms(query_timer.db_seconds)
+
+        records = None
+        if stats_result.has_records():
+            records = stats_result.get_records()
+        d['record_count'] = len(records) if isinstance(records, list) else None
+
+        return d
+
+    def get_row_counts(self):
+        """{ table name : row count }"""
+        return OrderedDict([(model._meta.db_table, model.objects.count())\
+                            for model in COUNTED_MODELS])
+
+    def run(self):
+        """Benchmark every view.  Returns the report as an OrderedDict"""
+        report = OrderedDict(generated=datetime.now().isoformat())
+        report['repeat'] = self.repeat
+        report['row_counts'] = self.get_row_counts()
+
+        results = []
+        for view_class in self.view_classes:
+            variants = self.get_param_variants(view_class)
+            if variants is None:
+                d = OrderedDict(endpoint=view_class.__name__)
+                d['api_path'] = view_class.api_path
+                d['status'] = STATUS_SKIPPED
+                d['error_message'] = 'No published object to request'
+                results.append(d)
+                continue
+
+            for params, url_kwargs in variants:
+                d = self.benchmark_view(view_class, params, url_kwargs)
+                self.msg('%10s ms  %s %s' % (d.get('median_ms', d['status']),\
+                                             d['api_path'], urlencode(params.items())))
+                results.append(d)
+
+        report['results'] = results
+        return report
+
+
+def get_result_key(result):
+    """Identify an endpoint run across reports"""
+    return (result['endpoint'],
+            urlencode(sorted(result.get('params', {}).items())))
+
+
+def write_report(report, fname):
+    """Save the report as JSON"""
+    with open(fname, 'w') as f:
+        json.dump(report, f, indent=4, sort_keys=True)
+
+
+def load_report(fname):
+    """Read a report saved by "write_report" """
+    with open(fname, 'r') as f:
+        return json.load(f)
+
+
+def compare_reports(old_report, new_report):
+    """
+    Compare median times.  Returns a list of
+    (endpoint, params, old median_ms, new median_ms, percent change)
+    for endpoints that ran in both reports
+    """
+    old_medians = dict([(get_result_key(r), r['median_ms'])\
+                        for r in old_report['results']\
+                        if r['status'] == STATUS_OK])
+
+    comparisons = []
+    for result in new_report['results']:
+        if result['status'] != STATUS_OK:
+            continue
+        key = get_result_key(result)
+        if not key in old_medians:
+            continue
+
+        old_ms = old_medians[key]
+        new_ms = result['median_ms']
+        if old_ms > 0:
+            pct_change = round((new_ms - old_ms) * 100.0 / old_ms, 1)
+        else:
+            pct_change = None
+        comparisons.append((key[0], key[1], old_ms, new_ms, pct_change))
+
+    return comparisons
@@ -1,8 +1,11 @@
 import json
+import threading
 from collections import OrderedDict
 
-from django.db.models import F
+from django.db.models import F, Max, Count, IntegerField
+from django.db.models.expressions import RawSQL
 
+from dv_apps.dvobjects.models import DvObject, DTYPE_DATAVERSE
 from dv_apps.dataverses.models import Dataverse
 
 """
@@ -12,21 +15,193 @@ from dv_apps.metrics.dataverse_tree_util import *
 get_selected_dataverse_ids(['Handwashing'])
 """
 
+# Process-wide DataverseTreeIndex, rebuilt when the Dataverses change
+#
+_TREE_INDEX_CACHE = {}
+_TREE_INDEX_LOCK = threading.Lock()
+
+
+# Ids of the selected Dataverses and all of their child Dataverses.
+#   Placeholders: the dvobject table, the selected ids and the Dataverse dtype
+#
+SUBTREE_SQL = """WITH RECURSIVE dv_subtree(id) AS (
+    SELECT dvo.id FROM %(dvobject)s dvo WHERE dvo.id IN (%(id_placeholders)s)
+    UNION
+    SELECT child.id FROM %(dvobject)s child
+        INNER JOIN dv_subtree ON child.owner_id = dv_subtree.id
+        WHERE child.dtype = %%s
+    ) SELECT dv_subtree.id FROM dv_subtree"""
+
+
+class DataverseSubtree(RawSQL):
+    """
+    Subquery for the selected Dataverses and their child Dataverses.
+
+    Compiles to a recursive CTE over "dvobject.owner_id" instead of a
+    list of every id in the subtree.  Use it with "__in":
+
+        Dataset.objects.filter(dvobject__owner__in=DataverseSubtree([1, 2]))
+    """
+    def __init__(self, dv_ids):
+        self.dv_ids = list(dv_ids)
+
+        sql = SUBTREE_SQL % dict(dvobject=DvObject._meta.db_table,\
+                        id_placeholders=', '.join(['%s'] * len(self.dv_ids)))
+
+        super(DataverseSubtree, self).__init__(sql,\
+                        self.dv_ids + [DTYPE_DATAVERSE],\
+                        output_field=IntegerField())
+
+    def _prepare(self, field):
+        """Keep the subquery when used as a lookup value, e.g. "owner__in" """
+        return self
+
+    def get_id_list(self):
+        """
+        The subtree ids, from the cached DataverseTreeIndex.
+        e.g. to filter tables in another database
+        """
+        return DataverseTreeUtil().get_tree_index().get_subtree_ids_for_list(self.dv_ids)
+
+
+class DataverseTreeIndex(object):
+    """
+    The Dataverse parent/child tree, built with a single query.
+
+    Holds a parent -> children adjacency list and an Euler tour: the
+    Dataverse ids in depth-first order.  Each Dataverse's subtree is a
+    contiguous slice of the tour, giving:
+        - O(1) "is descendant" checks
+        - O(k) subtree id lists, for a subtree of k Dataverses
+    """
+    def __init__(self, dv_rows):
+        """
+        dv_rows = dicts with 'id', 'parent_id', 'name', 'alias',
+                    ordered by name
+        """
+        self.dv_info = OrderedDict()    # { id : row }
+        self.child_ids = {}     # { parent id : [child id, child id, ...] }
+        self.root_id = None
+
+        for dv_info in dv_rows:
+            self.dv_info[dv_info['id']] = dv_info
+            if dv_info['parent_id'] is None:
+                self.root_id = dv_info['id']
+            else:
+                self.child_ids.setdefault(dv_info['parent_id'], []).append(dv_info['id'])
+
+        self.tour = []          # ids in depth-first order
+        self.tour_start = {}    # { id : position of the id in the tour }
+        self.tour_end = {}      # { id : position after its last descendant }
+        self.depth = {}         # { id : depth below the root }
+        self.build_tour()
+
+        self.tree_dicts = {}    # { skip_flat_dataverses : tree dict }
+
+    def build_tour(self):
+        """Walk the tree from the root, without recursion"""
+        if self.root_id is None:
+            return
+
+        self.depth[self.root_id] = 0
+        stack = [(self.root_id, False)]
+        while stack:
+            dv_id, is_exit = stack.pop()
+            if is_exit:
+                self.tour_end[dv_id] = len(self.tour)
+                continue
+
+            self.tour_start[dv_id] = len(self.tour)
+            self.tour.append(dv_id)
+
+            stack.append((dv_id, True))
+            for child_id in reversed(self.child_ids.get(dv_id, [])):
+                if not child_id in self.tour_start:     # guard against cycles
+                    self.depth[child_id] = self.depth[dv_id] + 1
+                    stack.append((child_id, False))
+
+    def is_descendant(self, dv_id, ancestor_id):
+        """Is "dv_id" in the subtree of "ancestor_id"?  (Including itself)"""
+        if not (dv_id in self.tour_start and ancestor_id in self.tour_start):
+            return False
+
+        return self.tour_start[ancestor_id] <= self.tour_start[dv_id] <\
+            self.tour_end[ancestor_id]
+
+    def get_subtree_ids(self, dv_id):
+        """Return the id and the ids of all child Dataverses"""
+        if not dv_id in self.tour_start:
+            return []
+
+        return self.tour[self.tour_start[dv_id]:self.tour_end[dv_id]]
+
+    def get_subtree_ids_for_list(self, dv_ids):
+        """Return the ids and child ids for several Dataverses, without duplicates"""
+        start_positions = sorted([self.tour_start[x] for x in set(dv_ids)\
+                                    if x in self.tour_start])
+        id_list = []
+        covered_until = 0
+        for start_pos in start_positions:
+            if start_pos < covered_until:
+                continue    # already inside a selected subtree
+            dv_id = self.tour[start_pos]
+            id_list += self.tour[start_pos:self.tour_end[dv_id]]
+            covered_until = self.tour_end[dv_id]
+
+        return id_list
+
+    def get_tree_dict(self, skip_flat_dataverses=True):
+        """
+        Return the tree as nested OrderedDicts:
+            { "name" :  , "alias" : , "id" : , "depth" : , "children" : [...] }
+        By default, don't show Dataverses that don't have any child Dataverses
+        """
+        if skip_flat_dataverses in self.tree_dicts:
+            return self.tree_dicts[skip_flat_dataverses]
+
+        if self.root_id is None:
+            return OrderedDict()
+
+        # Build the nodes in reverse tour order so children exist first
+        nodes = {}
+        for dv_id in reversed(self.tour):
+            dv_info = self.dv_info[dv_id]
+            fmt_d = OrderedDict()
+            fmt_d['name'] = dv_info['name']
+            fmt_d['alias'] = dv_info['alias']
+            fmt_d['id'] = dv_id
+            fmt_d['depth'] = self.depth[dv_id]
+
+            child_ids = [x for x in self.child_ids.get(dv_id, []) if x in nodes]
+            if child_ids:
+                fmt_d['children'] = [nodes.pop(x) for x in child_ids]
+            nodes[dv_id] = fmt_d
+
+        full_tree = nodes[self.root_id]
+
+        fmt_list = []
+        for info in full_tree.get('children', []):
+            if skip_flat_dataverses:
+                if info.has_key('children'):
+                    fmt_list.append(info)
+            else:
+                fmt_list.append(info)
+
+        full_tree['children'] = fmt_list
+
+        self.tree_dicts[skip_flat_dataverses] = full_tree
+        return full_tree
+
+
 class DataverseTreeUtil(object):
 
     def __init__(self):
         pass
 
-    def get_selected_dataverse_ids(self, dv_alias_list, include_child_dvs=True):
-        """Based on the aliases passed into "selected_dvs",
-        find the "id" values for these Dataverses
-            - Additional, add sub Dataverses if "include_child_dvs" is True
+    def get_first_cut_ids(self, dv_alias_list):
+        """Retrieve the id and owner id of each selected Dataverse.
+        Returns (success, list of dicts or error message)
         """
-        if dv_alias_list is None or len(dv_alias_list)==0:
-            return True, None # Look across all Dataverses
-
-        # Retrieve ids of the selected Dataverses
-        #
         first_cut_ids = Dataverse.objects.select_related('dvobject'\
                     ).annotate(id=F('dvobject'), owner_id=F('dvobject__owner__id')\
                     ).filter(alias__in=dv_alias_list\
@@ -40,9 +215,24 @@ class DataverseTreeUtil(object):
                 emsg = "These Dataverse aliases were not found: %s" % ', '.join(fmt_alias_list)
             return False, emsg
 
+        return True, list(first_cut_ids)
+
+    def get_selected_dataverse_ids(self, dv_alias_list, include_child_dvs=True):
+        """Based on the aliases passed into "selected_dvs",
+        find the "id" values for these Dataverses
+            - Additional, add sub Dataverses if "include_child_dvs" is True
+        """
+        if dv_alias_list is None or len(dv_alias_list)==0:
+            return True, None # Look across all Dataverses
+
+        # Retrieve ids of the selected Dataverses
+        #
+        success, first_cut_ids = self.get_first_cut_ids(dv_alias_list)
+        if not success:
+            return False, first_cut_ids
+
         first_cut_id_list = [x['id'] for x in first_cut_ids]
 
-        print 'first_cut_id_list', len(first_cut_id_list), first_cut_id_list
         # Include child dvs?
         #
         if not include_child_dvs:
@@ -56,127 +246,73 @@ class DataverseTreeUtil(object):
             # Yes! # Look across all Dataverses
             return True, None
 
-        # Nope, need to look at the full Dataversetree
-        full_tree = self.get_dataverse_tree_dict()
+        # Nope, add the child ids from the Dataverse tree
+        subtree_ids = self.get_tree_index().get_subtree_ids_for_list(first_cut_id_list)
 
-        # Check through tree, looking
-        additional_ids = self.get_subtree_child_ids(full_tree, first_cut_id_list)
-        print 'additional_ids', len(additional_ids), additional_ids
-
-        all_ids = first_cut_id_list + additional_ids
+        first_cut_id_set = set(first_cut_id_list)
+        all_ids = first_cut_id_list + [x for x in subtree_ids\
+                                        if not x in first_cut_id_set]
 
         return True, all_ids
 
-
-    def get_subtree_child_ids(self, tree_info, selected_ids, id_list=None, gather_all=False):
-        """
-        For any subtree, recursively return all of the "id"s and child "id"s
-            {
-                "name": "Malawi (2015) SIFPO formative study",
-                "id": 2668913,
-                "depth": 11,
-                "children": [
-                    {
-                        "name": "Malawi (2015) Mosquito net durability study",
-                        "id": 2668914,
-                        "depth": 12,
-                        "children": [
-                            {
-                                "depth": 13,
-                                "id": 2668915,
-                                "name": "Malawi (2015) Mystery client and client exit study"
-                            }
-                        ]
-                    }
-                ]
-            }
+    def get_selected_dataverse_subtree(self, dv_alias_list):
+        """Like "get_selected_dataverse_ids" with "include_child_dvs" but
+        the child Dataverses are left to the database.
+        Returns (success, DataverseSubtree, None for all Dataverses, or error message)
         """
-        #print 'get_subtree_child_ids. current:', tree_info['id'], 'selected:', selected_ids, id_list, gather_all
-        if id_list is None:
-            id_list = []
-
-        # Is the tree's id in selected_ids?
-        if tree_info['id'] in selected_ids or gather_all:
-            # Yes, get that id
-            id_list.append(tree_info['id'])
-
-            # And get all child ids
-            for child_tree in tree_info.get('children', []):
-                self.get_subtree_child_ids(child_tree, selected_ids, id_list, gather_all=True)
-        else:
-            # Nope, just keep checking
-            for child_tree in tree_info.get('children', []):
-                self.get_subtree_child_ids(child_tree, selected_ids, id_list)
+        if dv_alias_list is None or len(dv_alias_list)==0:
+            return True, None # Look across all Dataverses
 
-        return id_list
+        success, first_cut_ids = self.get_first_cut_ids(dv_alias_list)
+        if not success:
+            return False, first_cut_ids
 
+        # Is the root included?  Look across all Dataverses
+        if len([x for x in first_cut_ids if x['owner_id'] is None]) > 0:
+            return True, None
 
+        return True, DataverseSubtree([x['id'] for x in first_cut_ids])
 
-    def get_dataverse_tree_dict(self, skip_flat_dataverses=True):
-        """Return JSON with the Datavese "tree" -- e.g. parent/child relations
-        By default, don't show Dataverses that don't have any child Dataverses
+
+    def get_tree_version(self):
         """
+        Changes when a Dataverse is added, edited, moved or deleted.
+        (max modificationtime plus the count, for deletes)
+        """
+        info = Dataverse.objects.aggregate(\
+                    max_modtime=Max('dvobject__modificationtime'),
+                    cnt=Count('dvobject'))
 
-        # Note: "F(..) allows aliasing of a field.  e.g. SELECT dvobject as id,...
-        dvs = Dataverse.objects.select_related('dvobject'\
-                ).annotate(id=F('dvobject'), parent_id=F('dvobject__owner__id')\
-                ).values('id', 'parent_id', 'name', 'alias'
-                ).all(\
-                ).order_by('name')
+        return (info['max_modtime'], info['cnt'])
 
-        parent_child_lists = {} #{ parent_id : [ info, info, info ]}
-        root_node = None
-        for dv_info in dvs:
-            if dv_info['parent_id'] is None:
-                root_node = dv_info
-            else:
-                parent_child_lists.setdefault(dv_info['parent_id'], []).append(dv_info)
+    def get_tree_index(self):
+        """Return the cached DataverseTreeIndex, rebuilding it if needed"""
 
-        #print parent_child_lists
-        #print 'root_node', root_node
+        version = self.get_tree_version()
+        tree_index = _TREE_INDEX_CACHE.get(version, None)
+        if tree_index is not None:
+            return tree_index
 
-        full_tree = self.get_child_nodes(root_node, parent_child_lists)
+        with _TREE_INDEX_LOCK:
+            tree_index = _TREE_INDEX_CACHE.get(version, None)
+            if tree_index is None:
+                # Note: "F(..) allows aliasing of a field.  e.g. SELECT dvobject as id,...
+                dvs = Dataverse.objects.select_related('dvobject'\
+                        ).annotate(id=F('dvobject'), parent_id=F('dvobject__owner__id')\
+                        ).values('id', 'parent_id', 'name', 'alias'
+                        ).all(\
+                        ).order_by('name')
 
-        fmt_list = []
-        for info in full_tree.get('children'):
-            if skip_flat_dataverses:
-                if info.has_key('children'):
-                    fmt_list.append(info)
-            else:
-                fmt_list.append(info)
+                tree_index = DataverseTreeIndex(dvs)
 
-        full_tree['children'] = fmt_list
+                _TREE_INDEX_CACHE.clear()
+                _TREE_INDEX_CACHE[version] = tree_index
 
-        return full_tree
+        return tree_index
 
 
-    def get_child_nodes(self, root_node, parent_child_lists, depth=0):
-        """
-        Used to recursively organize the Dataverse parent/child tree
-        into a python OrderedDict
+    def get_dataverse_tree_dict(self, skip_flat_dataverses=True):
+        """Return JSON with the Datavese "tree" -- e.g. parent/child relations
+        By default, don't show Dataverses that don't have any child Dataverses
         """
-        child_nodes = parent_child_lists.get(root_node['id'], None)
-
-        # Are there child nodes?
-        if not child_nodes:
-            return OrderedDict(name=root_node['name'],\
-                                alias=root_node['alias'],
-                                id=root_node['id'],\
-                                depth=depth)
-            #return OrderedDict(name=root_node['name'], value=randint(400, 500), depth=depth)
-        else:
-            child_list = [] # create child list
-            for cn in child_nodes:
-                child_tree = self.get_child_nodes(cn, parent_child_lists, depth=depth+1)
-
-                # limit to dataverses with sub dataverses
-                if child_tree and len(child_tree) > 0:
-                    child_list.append(child_tree)
-
-            fmt_d = OrderedDict()
-            fmt_d['name'] = root_node['name']
-            fmt_d['alias'] = root_node['alias']
-            fmt_d['id'] = root_node['id']
-            fmt_d['depth'] = depth
-            fmt_d['children'] = child_list
-            return fmt_d
+        return self.get_tree_index().get_tree_dict(skip_flat_dataverses)
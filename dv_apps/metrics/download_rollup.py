@@ -0,0 +1,285 @@
+"""
+Monthly rollup of GuestBookResponse (file download) counts.
+
+The "guestbookresponse" table may hold tens of millions of rows, making
+a "date_trunc('month', responsetime)" GROUP BY expensive.  This utility:
+
+    (1) Incrementally copies monthly counts into the Miniverse-managed
+        DownloadMonthRollup table, starting from the last GuestBookResponse
+        id recorded in a RollupWatermark
+    (2) Translates StatsMakerFiles filters into rollup filters so that
+        closed months are read from the rollup and only the current
+        (partial) month is queried live
+
+Refresh from cron:
+    python manage.py refresh_download_rollup
+
+Notes:
+    - The datafile publication state is recorded at the time of the rollup.
+        Run with "--rebuild" to pick up files published after their downloads
+        were rolled up.
+"""
+from __future__ import print_function
+
+from datetime import datetime
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Case, When, Value, Max, Sum
+
+from dv_apps.guestbook.models import GuestBookResponse
+from dv_apps.metrics.models import DownloadMonthRollup, RollupWatermark
+from dv_apps.metrics.stats_util_base import TruncYearMonth
+from dv_apps.metrics.dataverse_tree_util import DataverseSubtree
+
+WATERMARK_GUESTBOOK_RESPONSE = 'guestbookresponse'
+DEFAULT_BATCH_SIZE = 250000
+
+# GuestBookResponse filter name -> DownloadMonthRollup filter name
+#   (filters needing conversion are handled in get_rollup_filters)
+ROLLUP_DIRECT_FILTERS = {'dataset__owner__in' : 'dataverse_id__in',
+                         'downloadtype' : 'downloadtype',
+                         'responsetime__year' : 'yyyy_mm__year',
+                         'responsetime__year__lt' : 'yyyy_mm__year__lt'}
+
+
+def get_month_start(dt):
+    """Return a datetime for the 1st day of the month"""
+    return datetime(dt.year, dt.month, 1)
+
+
+def is_month_start(dt):
+    """Does the date fall exactly at the beginning of a month?"""
+    if dt.day != 1:
+        return False
+    if isinstance(dt, datetime):
+        return (dt.hour, dt.minute, dt.second, dt.microsecond) == (0, 0, 0, 0)
+    return True
+
+
+def is_download_rollup_enabled():
+    """Allow the rollup to be switched off via settings"""
+    return getattr(settings, 'METRICS_USE_DOWNLOAD_ROLLUP', True)
+
+
+class DownloadRollupUtil(object):
+    """Maintain and read the DownloadMonthRollup table"""
+
+    def __init__(self, **kwargs):
+        self.batch_size = kwargs.get('batch_size', DEFAULT_BATCH_SIZE)
+        self.verbose = kwargs.get('verbose', False)
+
+    def msg(self, m):
+        if self.verbose:
+            print(m)
+
+    # ----------------------------
+    #  Watermark
+    # ----------------------------
+    def get_watermark(self):
+        """Return the RollupWatermark or None if the rollup has not been run"""
+        return RollupWatermark.objects.filter(\
+                    name=WATERMARK_GUESTBOOK_RESPONSE).first()
+
+    def get_live_cutoff(self, watermark=None):
+        """
+        Return the datetime from which downloads must be counted live.
+
+        This is the 1st day of the current month or, if the rollup has
+        fallen behind, the 1st day of the month of the last rolled-up response.
+        Returns None if the rollup cannot be used.
+        """
+        if not is_download_rollup_enabled():
+            return None
+
+        if watermark is None:
+            watermark = self.get_watermark()
+        if watermark is None or watermark.last_timestamp is None:
+            return None
+
+        current_month = get_month_start(datetime.now())
+        watermark_month = get_month_start(watermark.last_timestamp)
+
+        return min(current_month, watermark_month)
+
+    # ----------------------------
+    #  Refresh
+    # ----------------------------
+    def get_response_aggregate_query(self, start_id, end_id):
+        """Monthly counts for GuestBookResponse ids in (start_id, end_id]"""
+
+        is_published = Case(\
+            When(datafile__publicationdate__isnull=False, then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField())
+
+        return GuestBookResponse.objects.filter(\
+                    id__gt=start_id, id__lte=end_id\
+                    ).annotate(yyyy_mm=TruncYearMonth('responsetime'),\
+                        dv_id=F('dataset__owner__id'),\
+                        is_published=is_published\
+                    ).values('yyyy_mm', 'dv_id', 'is_published', 'downloadtype'\
+                    ).annotate(count=models.Count('id')\
+                    ).order_by()
+
+    def add_rollup_count(self, yyyy_mm, dv_id, is_published, downloadtype, cnt):
+        """Add "cnt" to an existing rollup row or create a new one"""
+
+        if isinstance(yyyy_mm, datetime):
+            yyyy_mm = yyyy_mm.date()
+
+        rollup, created = DownloadMonthRollup.objects.get_or_create(\
+                            yyyy_mm=yyyy_mm,
+                            dataverse_id=dv_id,
+                            is_published=is_published,
+                            downloadtype=downloadtype,
+                            defaults=dict(count=cnt))
+        if not created:
+            DownloadMonthRollup.objects.filter(id=rollup.id\
+                ).update(count=F('count') + cnt)
+
+    def refresh(self, rebuild=False):
+        """
+        Roll up GuestBookResponse rows added since the last refresh.
+        Each batch is committed along with the watermark so an interrupted
+        refresh resumes where it stopped.
+
+        Returns the number of GuestBookResponse rows rolled up
+        """
+        if rebuild:
+            with transaction.atomic():
+                DownloadMonthRollup.objects.all().delete()
+                RollupWatermark.objects.filter(\
+                    name=WATERMARK_GUESTBOOK_RESPONSE).delete()
+
+        watermark, created = RollupWatermark.objects.get_or_create(\
+                                name=WATERMARK_GUESTBOOK_RESPONSE)
+
+        max_id = GuestBookResponse.objects.aggregate(max_id=Max('id'))['max_id']
+        if max_id is None or max_id <= watermark.last_id:
+            self.msg('Nothing to roll up. (last id: %s)' % watermark.last_id)
+            return 0
+
+        num_rolled_up = 0
+        start_id = watermark.last_id
+        while start_id < max_id:
+            end_id = min(start_id + self.batch_size, max_id)
+
+            batch_info = GuestBookResponse.objects.filter(\
+                            id__gt=start_id, id__lte=end_id\
+                            ).aggregate(cnt=models.Count('id'),\
+                                last_timestamp=Max('responsetime'))
+
+            with transaction.atomic():
+                for rec in self.get_response_aggregate_query(start_id, end_id):
+                    self.add_rollup_count(rec['yyyy_mm'], rec['dv_id'],\
+                            rec['is_published'], rec['downloadtype'], rec['count'])
+
+                watermark.last_id = end_id
+                if batch_info['last_timestamp'] is not None:
+                    if watermark.last_timestamp is None or\
+                        batch_info['last_timestamp'] > watermark.last_timestamp:
+                        watermark.last_timestamp = batch_info['last_timestamp']
+                watermark.save()
+
+            num_rolled_up += batch_info['cnt']
+            self.msg('ids %s to %s: %s responses' % (start_id+1, end_id, batch_info['cnt']))
+            start_id = end_id
+
+        return num_rolled_up
+
+    # ----------------------------
+    #  Read
+    # ----------------------------
+    def get_rollup_filters(self, guestbook_filters, cutoff):
+        """
+        Convert GuestBookResponse filters into DownloadMonthRollup filters.
+
+        Returns None if a filter cannot be answered by monthly counts.
+            e.g. a start date in the middle of a month
+        """
+        if cutoff is None:
+            return None
+
+        rollup_filters = dict(yyyy_mm__lt=cutoff.date())
+
+        for k, v in guestbook_filters.items():
+            if k == 'responsetime__year__lt' and\
+                datetime(int(v), 1, 1) > cutoff:
+                # months between the cutoff and the year are live
+                return None
+
+            if k in ROLLUP_DIRECT_FILTERS:
+                if isinstance(v, DataverseSubtree):
+                    # the rollup may be in another database
+                    v = v.get_id_list()
+                rollup_filters[ROLLUP_DIRECT_FILTERS[k]] = v
+
+            elif k == 'datafile__publicationdate__isnull':
+                rollup_filters['is_published'] = not v
+
+            elif k in ('responsetime__gte', 'responsetime__lt'):
+                # only whole months, not yet live
+                if not is_month_start(v) or v > cutoff:
+                    return None
+                if k == 'responsetime__gte':
+                    rollup_filters['yyyy_mm__gte'] = v.date()
+                else:
+                    rollup_filters['yyyy_mm__lt'] = v.date()
+
+            elif k == 'responsetime__lte':
+                # handled by moving the cutoff
+                continue
+
+            else:
+                return None
+
+        return rollup_filters
+
+    def get_cutoff_for_filters(self, guestbook_filters, cutoff):
+        """An end date inside a closed month moves the live cutoff back"""
+        if cutoff is None:
+            return None
+
+        end_date = guestbook_filters.get('responsetime__lte', None)
+        if end_date is not None:
+            return min(cutoff, get_month_start(end_date))
+        return cutoff
+
+    def get_monthly_counts(self, rollup_filters):
+        """Return a list of dicts: [{'yyyy_mm' : date, 'count' : n}, ...]"""
+
+        return list(DownloadMonthRollup.objects.filter(**rollup_filters\
+                    ).exclude(yyyy_mm__isnull=True\
+                    ).values('yyyy_mm'\
+                    ).annotate(count=Sum('count')\
+                    ).values('yyyy_mm', 'count'\
+                    ).order_by('yyyy_mm'))
+
+    def get_total_count(self, rollup_filters, include_undated=False):
+        """
+        Return the sum of download counts.
+
+        "include_undated" adds pre-Dataverse 4.0 responses--unless
+        date filters are present, which exclude them.
+        """
+        total = DownloadMonthRollup.objects.filter(**rollup_filters\
+                    ).aggregate(cnt=Sum('count'))['cnt'] or 0
+
+        if include_undated:
+            date_keys = [k for k in rollup_filters.keys()\
+                            if k.startswith('yyyy_mm') and k != 'yyyy_mm__lt']
+            if len(date_keys) == 0:
+                undated_filters = dict((k, v) for k, v in rollup_filters.items()\
+                                        if not k.startswith('yyyy_mm'))
+                total += DownloadMonthRollup.objects.filter(\
+                            yyyy_mm__isnull=True, **undated_filters\
+                            ).aggregate(cnt=Sum('count'))['cnt'] or 0
+
+        return total
+
+    def get_undated_count(self):
+        """Count of pre-Dataverse 4.0 responses (no responsetime)"""
+
+        return DownloadMonthRollup.objects.filter(yyyy_mm__isnull=True\
+                    ).aggregate(cnt=Sum('count'))['cnt'] or 0
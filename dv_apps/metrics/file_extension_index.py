@@ -0,0 +1,209 @@
+"""
+Index of file extensions: one DatafileExtension row per distinct
+(Datafile, label) pair, the same labels the live extension counts use.
+
+Counting extensions from the "filemetadata" table scans every label of
+every file version.  This utility:
+
+    (1) Copies each Datafile's labels, their extensions, its content
+        type and size into the Miniverse-managed DatafileExtension table.
+        Each refresh compares the index with the Dataverse tables, a
+        range of DvObject ids at a time, and rewrites the rows of the
+        Datafiles which were added, removed, relabeled or given a new
+        content type--e.g. after following the instructions on the
+        "fix-extension" page
+    (2) Counts extensions from the index with a grouped query
+
+Refresh from cron:
+    python manage.py refresh_extension_index
+
+Notes:
+    - The index is read once a refresh has run to the end.  An
+        interrupted refresh resumes from the id range recorded in a
+        RollupWatermark
+"""
+from __future__ import print_function
+
+from datetime import datetime
+
+from django.db import models, transaction
+from django.db.models import Max
+
+from dv_apps.datafiles.models import Datafile, FileMetadata
+from dv_apps.metrics.models import DatafileExtension, RollupWatermark
+from dv_apps.metrics.file_extension_util import FileExtension
+
+WATERMARK_DATAFILE_EXTENSION = 'datafile_extension'
+DEFAULT_BATCH_SIZE = 50000
+
+
+def get_index_row_key(datafile_extension):
+    """Values compared to find the Datafiles which changed"""
+    return (datafile_extension.label,\
+            datafile_extension.extension,\
+            datafile_extension.contenttype,\
+            datafile_extension.filesize)
+
+
+def get_index_rows_by_datafile(datafile_extensions):
+    """Return { Datafile id : set of row keys }"""
+    rows_by_datafile = {}
+    for datafile_extension in datafile_extensions:
+        rows_by_datafile.setdefault(datafile_extension.datafile_id, set()\
+                            ).add(get_index_row_key(datafile_extension))
+    return rows_by_datafile
+
+
+class FileExtensionIndexUtil(object):
+    """Maintain and read the DatafileExtension table"""
+
+    def __init__(self, **kwargs):
+        self.batch_size = kwargs.get('batch_size', DEFAULT_BATCH_SIZE)
+        self.verbose = kwargs.get('verbose', False)
+
+    def msg(self, m):
+        if self.verbose:
+            print(m)
+
+    # ----------------------------
+    #  Watermark
+    # ----------------------------
+    def get_watermark(self):
+        """
+        Return the RollupWatermark or None if the index has not been built.
+            last_id - last DvObject id checked by an unfinished refresh
+            last_timestamp - when the last refresh finished
+        """
+        return RollupWatermark.objects.filter(\
+                    name=WATERMARK_DATAFILE_EXTENSION).first()
+
+    def is_index_available(self):
+        """Has a refresh run to the end?"""
+        watermark = self.get_watermark()
+        return watermark is not None and watermark.last_timestamp is not None
+
+    # ----------------------------
+    #  Refresh
+    # ----------------------------
+    def get_datafile_extensions(self, start_id, end_id):
+        """
+        Return DatafileExtension objects for Datafile ids in (start_id, end_id]:
+        one per distinct (Datafile, label)
+        """
+        labels = FileMetadata.objects.filter(\
+                            datafile__id__gt=start_id, datafile__id__lte=end_id\
+                            ).annotate(extension=FileExtension('label')\
+                            ).values_list('datafile__id', 'label', 'extension'\
+                            ).order_by('datafile__id', 'label'\
+                            ).distinct()
+
+        datafile_lookup = dict([(df_id, (contenttype, filesize))\
+                            for df_id, contenttype, filesize in\
+                            Datafile.objects.filter(\
+                                dvobject__id__gt=start_id, dvobject__id__lte=end_id\
+                            ).values_list('dvobject__id', 'contenttype', 'filesize')])
+
+        datafile_extensions = []
+        for df_id, label, extension in labels:
+            if not df_id in datafile_lookup:
+                continue
+            contenttype, filesize = datafile_lookup[df_id]
+            datafile_extensions.append(DatafileExtension(datafile_id=df_id,\
+                                            label=label,\
+                                            extension=extension,\
+                                            contenttype=contenttype,\
+                                            filesize=filesize))
+        return datafile_extensions
+
+    def refresh_batch(self, start_id, end_id):
+        """
+        Rewrite the index rows of Datafile ids in (start_id, end_id]
+        which don't match the Dataverse tables.
+
+        Returns the number of Datafiles (re)indexed
+        """
+        datafile_extensions = self.get_datafile_extensions(start_id, end_id)
+        indexed = DatafileExtension.objects.filter(\
+                            datafile_id__gt=start_id, datafile_id__lte=end_id)
+
+        live_rows = get_index_rows_by_datafile(datafile_extensions)
+        indexed_rows = get_index_rows_by_datafile(indexed)
+
+        changed_ids = set([df_id for df_id in set(live_rows) | set(indexed_rows)\
+                           if live_rows.get(df_id) != indexed_rows.get(df_id)])
+        if len(changed_ids) == 0:
+            return 0
+
+        indexed.filter(datafile_id__in=changed_ids).delete()
+        DatafileExtension.objects.bulk_create([x for x in datafile_extensions\
+                                               if x.datafile_id in changed_ids])
+        return len(changed_ids)
+
+    def refresh(self, rebuild=False):
+        """
+        Bring the index up to date with the Dataverse tables.
+        Each batch is committed along with the watermark so an interrupted
+        refresh resumes where it stopped.
+
+        Returns the number of Datafiles (re)indexed
+        """
+        if rebuild:
+            with transaction.atomic():
+                DatafileExtension.objects.all().delete()
+                RollupWatermark.objects.filter(\
+                    name=WATERMARK_DATAFILE_EXTENSION).delete()
+
+        watermark, created = RollupWatermark.objects.get_or_create(\
+                                name=WATERMARK_DATAFILE_EXTENSION)
+
+        # Include indexed ids: their Datafiles may have been deleted
+        max_id = max([Datafile.objects.aggregate(max_id=Max('dvobject__id'))['max_id'],\
+                      DatafileExtension.objects.aggregate(max_id=Max('datafile_id'))['max_id']])
+
+        num_indexed = 0
+        start_id = watermark.last_id
+        while max_id is not None and start_id < max_id:
+            end_id = min(start_id + self.batch_size, max_id)
+
+            with transaction.atomic():
+                num_batch_indexed = self.refresh_batch(start_id, end_id)
+
+                watermark.last_id = end_id
+                watermark.save()
+
+            num_indexed += num_batch_indexed
+            self.msg('ids %s to %s: %s files' % (start_id+1, end_id, num_batch_indexed))
+            start_id = end_id
+
+        # Finished: the next refresh starts from the first id
+        watermark.last_id = 0
+        watermark.last_timestamp = datetime.now()
+        watermark.save()
+
+        return num_indexed
+
+    # ----------------------------
+    #  Read
+    # ----------------------------
+    def get_extension_counts(self, contenttype=None, max_extensions=None):
+        """
+        Count the extensions of indexed labels, highest count first.
+        Same counts and format as file_extension_util.get_extension_counts
+        """
+        datafile_extensions = DatafileExtension.objects.all()
+        if contenttype is not None:
+            datafile_extensions = datafile_extensions.filter(contenttype=contenttype)
+
+        # One row per extension
+        counts = datafile_extensions.values('extension'\
+                    ).annotate(count=models.Count('id')\
+                    ).values_list('extension', 'count'\
+                    ).order_by('-count', 'extension')
+
+        extension_counts = list(counts)
+        total_count = sum([cnt for ext, cnt in extension_counts])
+
+        return dict(extension_counts=extension_counts[:max_extensions],
+                    number_unique_extensions=len(extension_counts),
+                    total_count=total_count,
+                    sql_query=str(counts.query))
@@ -0,0 +1,83 @@
+"""
+Count file extensions within the database.
+
+The extension is taken from FileMetadata.label with a regular expression
+matching python's "os.path.splitext":
+
+    "data.tar.gz" -> ".gz"
+    "README" -> ""
+    ".bashrc" -> ""     (leading dots don't start an extension)
+    "notes." -> "."
+
+Only the extension counts--optionally the top "max_extensions"--are
+returned, not the file labels.
+"""
+from decimal import Decimal
+
+from django.db import models, connections
+
+# Leading dots are skipped, then the last "." and the chars after it
+#
+FILE_EXTENSION_REGEX = r'(?:^|/)\.*[^/.][^/]*(\.[^./]*)$'
+
+
+class FileExtension(models.Func):
+    """The file extension of a label, e.g. ".csv", or "" """
+    function = 'substring'
+    template = "COALESCE(%%(function)s(%%(expressions)s from '%s'), '')"\
+                % FILE_EXTENSION_REGEX
+    output_field = models.CharField()
+
+
+def get_extension_counts(filemetadata_qs, distinct_labels=True, max_extensions=None):
+    """
+    Count the extensions of the FileMetadata labels, highest count first.
+
+        distinct_labels - count each (datafile, label) pair once, rather
+            than once per DatasetVersion
+        max_extensions - only return the top extensions.  The totals
+            still include all of them
+
+    Returns a dict:
+        extension_counts - list of (extension, count)
+        number_unique_extensions
+        total_count - number of labels
+        sql_query
+    """
+    labels = filemetadata_qs.annotate(extension=FileExtension('label'))
+    if distinct_labels:
+        labels = labels.values('datafile__id', 'label', 'extension').distinct()
+    else:
+        labels = labels.values('extension')
+
+    inner_sql, params = labels.order_by().query.sql_with_params()
+    sql = ('SELECT labels.extension, COUNT(*) AS count,'
+           ' COUNT(*) OVER () AS number_unique_extensions,'
+           ' SUM(COUNT(*)) OVER () AS total_count'
+           ' FROM (%s) labels'
+           ' GROUP BY labels.extension'
+           ' ORDER BY count DESC, labels.extension') % inner_sql
+    if max_extensions is not None:
+        sql += ' LIMIT %d' % max_extensions
+
+    cursor = connections[labels.db].cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    extension_counts = [(ext, cnt) for ext, cnt, _, _ in rows]
+    if len(rows) > 0:
+        number_unique_extensions = rows[0][2]
+        total_count = rows[0][3]
+        if isinstance(total_count, Decimal):
+            total_count = int(total_count)
+    else:
+        number_unique_extensions = 0
+        total_count = 0
+
+    return dict(extension_counts=extension_counts,
+                number_unique_extensions=number_unique_extensions,
+                total_count=total_count,
+                sql_query=sql % tuple(params))
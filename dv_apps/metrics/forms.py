@@ -28,7 +28,7 @@ class FixContentTypeForm(forms.Form):
                 _('The file extension cannot have whitepspace, single quotes or double quotes.  Extension was: "%s"' % ext_str)
                 )
 
-        if FileMetadata.objects.filter(label__endswith=ext_str).count() == 0:
+        if not FileMetadata.objects.filter(label__endswith=ext_str).exists():
             raise forms.ValidationError(
                 _('There are no files with extension: "%s"' % ext_str )
                 )
@@ -0,0 +1,192 @@
+"""
+Histogram binning in the database.
+
+Stats such as "How many datasets have 'x' number of files?" start with
+one aggregated value per dataset.  Rather than fetching a row per dataset,
+the per-dataset query is wrapped so that Postgres assigns each value to a
+bin and returns only the bin counts.
+
+Bins are right-inclusive, e.g. (0, 20], (20, 40], etc.  Three kinds:
+
+    - fixed: bins of "bin_size", starting at 0
+    - log: (0, 1], (1, base], (base, base^2], etc.
+    - custom: bins between a list of increasing edges, e.g. [0, 10, 100, 1000]
+
+Values at or below the first edge (e.g. datasets with 0 bytes) are not
+placed in a bin.  With custom edges, values above the last edge aren't
+either.
+
+Example:
+    bin_spec = HistogramBinSpec(bin_size=20)
+    bin_info = HistogramBinUtil(bin_spec).get_bin_counts(per_dataset_qs, 'cnt')
+"""
+from decimal import Decimal
+
+from django.db import connections
+
+BIN_TYPE_FIXED = 'fixed'
+BIN_TYPE_LOG = 'log'
+BIN_TYPE_CUSTOM = 'custom'
+
+
+def to_int_if_whole(val):
+    """Sums of integers arrive from the cursor as Decimals"""
+    if isinstance(val, Decimal) and val == val.to_integral_value():
+        return int(val)
+    return val
+
+
+class HistogramBinSpec(object):
+    """
+    How values are assigned to bins.  Use one of:
+        bin_size = width of each bin
+        log_base = integer of 2 or more
+        edges = list of increasing numbers
+    """
+    def __init__(self, bin_size=None, log_base=None, edges=None):
+
+        if edges is not None:
+            assert len(edges) >= 2, "edges must have at least 2 numbers"
+            assert list(edges) == sorted(set(edges)), "edges must be increasing"
+            self.bin_type = BIN_TYPE_CUSTOM
+        elif log_base is not None:
+            assert log_base >= 2, "log_base must be at least 2"
+            self.bin_type = BIN_TYPE_LOG
+        else:
+            assert bin_size > 0, "bin_size must greater than 0"
+            self.bin_type = BIN_TYPE_FIXED
+
+        self.bin_size = bin_size
+        self.log_base = log_base
+        self.edges = list(edges) if edges is not None else None
+
+    def get_lowest_edge(self):
+        """Values must be greater than this to be placed in a bin"""
+        if self.bin_type == BIN_TYPE_CUSTOM:
+            return self.edges[0]
+        return 0
+
+    def get_bin_index_sql(self, value_sql):
+        """
+        Return (sql, params) giving the 0-based bin index of a value
+        greater than the lowest edge.
+        """
+        numeric_value = 'CAST(%s AS numeric)' % value_sql
+
+        if self.bin_type == BIN_TYPE_FIXED:
+            # (0, size] -> 0, (size, 2*size] -> 1, etc
+            return 'CEIL(%s / CAST(%%s AS numeric)) - 1' % numeric_value,\
+                    [self.bin_size]
+
+        if self.bin_type == BIN_TYPE_LOG:
+            # (0, 1] -> 0, (1, base] -> 1, (base, base^2] -> 2, etc
+            return ('CASE WHEN %(val)s <= 1 THEN 0'
+                    ' ELSE CEIL(LOG(CAST(%%s AS numeric), %(val)s)) END')\
+                    % dict(val=numeric_value), [self.log_base]
+
+        # "width_bucket" counts the thresholds <= the operand, giving
+        # left-inclusive bins.  Negating the value and the edges gives
+        # the number of edges >= the value, from which the
+        # right-inclusive bin follows.
+        negated_edges = [-x for x in reversed(self.edges)]
+        return '%s - width_bucket(-%s, CAST(%%s AS numeric[]))'\
+                % (len(self.edges) - 1, numeric_value), [negated_edges]
+
+    def get_num_bins(self, max_value, max_bin_index):
+        """
+        Number of bins to show, including empty ones.
+
+            max_value - highest value, in a bin or not
+            max_bin_index - highest bin index found, or None
+        """
+        if self.bin_type == BIN_TYPE_CUSTOM:
+            return len(self.edges) - 1
+
+        if self.bin_type == BIN_TYPE_LOG:
+            if max_bin_index is None:
+                return 0
+            return max_bin_index + 1
+
+        # Fixed bins run past the highest value--as with the previous
+        # bin list of 0 to (max value + 2 * bin_size)
+        if max_value is None:
+            return 0
+        return int(max_value // self.bin_size) + 2
+
+    def get_bin_edges(self, bin_index):
+        """Return (start, end) for the bin, e.g. (20, 40) for (20, 40]"""
+        if self.bin_type == BIN_TYPE_FIXED:
+            return (bin_index * self.bin_size, (bin_index + 1) * self.bin_size)
+
+        if self.bin_type == BIN_TYPE_LOG:
+            if bin_index == 0:
+                return (0, 1)
+            return (self.log_base ** (bin_index - 1), self.log_base ** bin_index)
+
+        return (self.edges[bin_index], self.edges[bin_index + 1])
+
+
+class HistogramBinUtil(object):
+    """Count the values of an aggregate query by bin, within the database"""
+
+    def __init__(self, bin_spec):
+        self.bin_spec = bin_spec
+
+    def get_bin_counts(self, queryset, value_name, skip_empty_bins=False):
+        """
+        queryset - values() query with one row per item, e.g. per dataset
+        value_name - name of the value to bin, e.g. 'cnt'
+
+        Returns a dict:
+            bins - list of (bin start, bin end, count), sorted by bin start
+            total_value - sum of all values, including those not in a bin
+            sql_query - the query used
+        """
+        value_sql = 'per_item.%s' % connections[queryset.db].ops.quote_name(value_name)
+        bin_index_sql, bin_index_params = self.bin_spec.get_bin_index_sql(value_sql)
+
+        # Values not in a bin get a null index but still add to the total
+        #
+        inner_sql, inner_params = queryset.order_by().query.sql_with_params()
+        sql = ('SELECT binned.bin_index, COUNT(*) AS count,'
+               ' MAX(binned.val) AS max_value, SUM(binned.val) AS total_value'
+               ' FROM (SELECT %(val)s AS val,'
+               ' CASE WHEN %(val)s > %%s THEN %(bin_index)s END AS bin_index'
+               ' FROM (%(inner_sql)s) per_item) binned'
+               ' GROUP BY binned.bin_index') %\
+                dict(val=value_sql, bin_index=bin_index_sql, inner_sql=inner_sql)
+        params = [self.bin_spec.get_lowest_edge()] + bin_index_params\
+                    + list(inner_params)
+
+        cursor = connections[queryset.db].cursor()
+        try:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        counts_by_index = {}
+        max_value = None
+        total_value = 0
+        for bin_index, cnt, row_max, row_total in rows:
+            if row_max is not None and (max_value is None or row_max > max_value):
+                max_value = row_max
+            if row_total is not None:
+                total_value += row_total
+            if bin_index is not None:
+                counts_by_index[int(bin_index)] = cnt
+
+        max_bin_index = max(counts_by_index.keys()) if counts_by_index else None
+        num_bins = self.bin_spec.get_num_bins(max_value, max_bin_index)
+
+        bins = []
+        for bin_index in range(num_bins):
+            cnt = counts_by_index.get(bin_index, 0)
+            if skip_empty_bins and cnt == 0:
+                continue
+            bin_start, bin_end = self.bin_spec.get_bin_edges(bin_index)
+            bins.append((bin_start, bin_end, cnt))
+
+        return dict(bins=bins,
+                    total_value=to_int_if_whole(total_value),
+                    sql_query=sql % tuple(params))
@@ -0,0 +1,51 @@
+"""
+Resolve the latest DatasetVersion of each Dataset in SQL.
+
+Used as a subquery, e.g.
+
+    latest_versions = LatestVersionIndex().get_latest_version_ids()
+    FileMetadata.objects.filter(datasetversion__in=latest_versions)
+
+Runs as:
+    ... WHERE datasetversion_id IN (SELECT DISTINCT ON (dataset_id) id
+                                    FROM datasetversion
+                                    ORDER BY dataset_id, id DESC, ...)
+
+(instead of pulling every DatasetVersion row into python)
+"""
+from dv_apps.datasets.models import Dataset, DatasetVersion
+
+
+class LatestVersionIndex(object):
+    """Latest DatasetVersion ids, via Postgres DISTINCT ON"""
+
+    # The first row for each Dataset is the latest version
+    LATEST_VERSION_ORDERING = ('dataset_id', '-id',\
+                               '-versionnumber', '-minorversionnumber')
+
+    def get_dataset_ids(self, **dataset_filters):
+        """Dataset ids as a subquery.  e.g. published Datasets"""
+
+        return Dataset.objects.select_related('dvobject'\
+                    ).filter(**dataset_filters\
+                    ).values_list('dvobject__id', flat=True)
+
+    def get_latest_versions(self, **dataset_filters):
+        """
+        DatasetVersion queryset with the latest version of each Dataset
+            - "dataset_filters" narrow the Datasets, e.g. by publication state
+        """
+        dsv_query = DatasetVersion.objects.all()
+
+        if dataset_filters:
+            dsv_query = dsv_query.filter(\
+                            dataset__in=self.get_dataset_ids(**dataset_filters))
+
+        return dsv_query.order_by(*self.LATEST_VERSION_ORDERING\
+                        ).distinct('dataset_id')
+
+    def get_latest_version_ids(self, **dataset_filters):
+        """Latest DatasetVersion ids, to use as a subquery"""
+
+        return self.get_latest_versions(**dataset_filters\
+                    ).values_list('id', flat=True)
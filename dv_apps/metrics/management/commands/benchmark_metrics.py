@@ -0,0 +1,71 @@
+"""
+Time each metrics API endpoint and save a JSON report.
+
+python manage.py benchmark_metrics --output before.json
+python manage.py benchmark_metrics --output after.json --compare before.json
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from dv_apps.metrics.benchmark_util import MetricsBenchmark, STATUS_OK, STATUS_ERROR,\
+    DEFAULT_REPEAT, write_report, load_report, compare_reports
+from miniverse.db_routers.db_dataverse_router import analytics_reads
+
+
+class Command(BaseCommand):
+    help = ('Run each endpoint in the swagger spec against the current'
+            ' database, without the cache, and report its timing.')
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--repeat',
+                            type=int,
+                            dest='repeat',
+                            default=DEFAULT_REPEAT,
+                            help='Runs per endpoint. (default: %s)' % DEFAULT_REPEAT)
+
+        parser.add_argument('--output',
+                            dest='output',
+                            default=None,
+                            help='Save the report to this JSON file.')
+
+        parser.add_argument('--compare',
+                            dest='compare',
+                            default=None,
+                            help='Earlier report to compare median times with.')
+
+    def handle(self, *args, **options):
+
+        old_report = None
+        if options['compare']:
+            try:
+                old_report = load_report(options['compare'])
+            except (IOError, ValueError) as ex_obj:
+                raise CommandError('Could not read report "%s": %s' %\
+                                   (options['compare'], ex_obj))
+
+        benchmark = MetricsBenchmark(repeat=options['repeat'])
+        with analytics_reads():
+            report = benchmark.run()
+
+        for result in report['results']:
+            if result['status'] == STATUS_OK:
+                self.stdout.write('%10.1f ms  %3s queries  %s %s' %\
+                    (result['median_ms'], result['query_count'],
+                     result['endpoint'], result['params'].get('pub_state', '')))
+            else:
+                self.stderr.write('%10s     %s  %s' %\
+                    (result['status'], result['endpoint'], result['error_message']))
+
+        if options['output']:
+            write_report(report, options['output'])
+            self.stdout.write('Report saved: %s' % options['output'])
+
+        if old_report is not None:
+            self.stdout.write('\nMedian ms: before -> after')
+            for endpoint, params, old_ms, new_ms, pct_change in\
+                    compare_reports(old_report, report):
+                self.stdout.write('%10.1f -> %10.1f  %7s%%  %s %s' %\
+                    (old_ms, new_ms, pct_change, endpoint, params))
+
+        if len([r for r in report['results'] if r['status'] == STATUS_ERROR]) > 0:
+            raise CommandError('Some endpoints returned errors.')
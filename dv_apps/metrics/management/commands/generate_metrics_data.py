@@ -0,0 +1,99 @@
+"""
+Fill an empty Dataverse database with synthetic data for benchmarking.
+The same --files and --seed always write the same rows.
+
+python manage.py generate_metrics_data --database benchmark --files 10000
+python manage.py generate_metrics_data --database benchmark --files 10000000 --seed 2
+
+The Dataverse database alias is refused unless ALLOW_SYNTHETIC_DATA = True
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dv_apps.dvobjects.models import DvObject
+from dv_apps.metrics.synthetic_data_util import SyntheticDataGenerator,\
+    SyntheticDataError, check_synthetic_data_alias, DEFAULT_SEED, DEFAULT_BATCH_SIZE, DEFAULT_START_DATE, DEFAULT_END_DATE
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+class Command(BaseCommand):
+    help = ('Write synthetic Dataverses, Datasets, versions, Datafiles,'
+            ' subjects and downloads, skewed like a production installation.')
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--database',
+                            dest='database',
+                            required=True,
+                            help='DATABASES alias to write to, e.g. a benchmark database.')
+
+        parser.add_argument('--files',
+                            type=int,
+                            dest='num_files',
+                            default=10000,
+                            help='Number of Datafiles, which sets the scale. (default: 10000)')
+
+        parser.add_argument('--seed',
+                            type=int,
+                            dest='seed',
+                            default=DEFAULT_SEED,
+                            help='Random seed. (default: %s)' % DEFAULT_SEED)
+
+        parser.add_argument('--start-date',
+                            dest='start_date',
+                            default=DEFAULT_START_DATE.strftime(DATE_FORMAT),
+                            help='First create date, YYYY-MM-DD. (default: %(default)s)')
+
+        parser.add_argument('--end-date',
+                            dest='end_date',
+                            default=DEFAULT_END_DATE.strftime(DATE_FORMAT),
+                            help='Last create date, YYYY-MM-DD. (default: %(default)s)')
+
+        parser.add_argument('--batch-size',
+                            type=int,
+                            dest='batch_size',
+                            default=DEFAULT_BATCH_SIZE,
+                            help='Rows per table per insert batch. (default: %s)' % DEFAULT_BATCH_SIZE)
+
+        parser.add_argument('--append',
+                            action='store_true',
+                            dest='append',
+                            default=False,
+                            help='Add to a database that already has DvObjects.')
+
+    def handle(self, *args, **options):
+
+        try:
+            start_date = datetime.strptime(options['start_date'], DATE_FORMAT)
+            end_date = datetime.strptime(options['end_date'], DATE_FORMAT)
+        except ValueError:
+            raise CommandError('Dates must be in the format YYYY-MM-DD')
+
+        if start_date >= end_date:
+            raise CommandError('The start date must be before the end date')
+
+        if options['num_files'] < 1:
+            raise CommandError('Please specify one or more --files')
+
+        db_alias = options['database']
+        try:
+            check_synthetic_data_alias(db_alias)
+        except SyntheticDataError as ex_obj:
+            raise CommandError(str(ex_obj))
+
+        if not options['append'] and DvObject.objects.using(db_alias).exists():
+            raise CommandError(('The database already has DvObjects.'
+                                ' Use --append to add to them.'))
+
+        generator = SyntheticDataGenerator(options['num_files'],
+                                           db_alias,
+                                           seed=options['seed'],
+                                           start_date=start_date,
+                                           end_date=end_date,
+                                           batch_size=options['batch_size'],
+                                           verbose=options['verbosity'] > 1)
+
+        for model, row_count in generator.generate():
+            self.stdout.write('%s: %s' % (model._meta.db_table, row_count))
@@ -0,0 +1,43 @@
+"""
+Incrementally refresh the monthly file download rollup table.
+
+python manage.py refresh_download_rollup
+python manage.py refresh_download_rollup --rebuild
+"""
+from django.core.management.base import BaseCommand
+
+from dv_apps.metrics.download_rollup import DownloadRollupUtil, DEFAULT_BATCH_SIZE
+from miniverse.db_routers.db_dataverse_router import analytics_reads
+
+
+class Command(BaseCommand):
+    help = ('Roll up GuestBookResponse counts by month, Dataverse,'
+            ' publication state and download type.')
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--rebuild',
+                            action='store_true',
+                            dest='rebuild',
+                            default=False,
+                            help='Delete the rollup and rebuild it from the first response.')
+
+        parser.add_argument('--batch-size',
+                            type=int,
+                            dest='batch_size',
+                            default=DEFAULT_BATCH_SIZE,
+                            help='Number of GuestBookResponse ids per batch. (default: %s)' % DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+
+        rollup_util = DownloadRollupUtil(batch_size=options['batch_size'],
+                                         verbose=options['verbosity'] > 1)
+
+        with analytics_reads():
+            num_rolled_up = rollup_util.refresh(rebuild=options['rebuild'])
+
+        watermark = rollup_util.get_watermark()
+        self.stdout.write('Responses rolled up: %s' % num_rolled_up)
+        if watermark:
+            self.stdout.write('Watermark: id %s, responsetime %s' %\
+                (watermark.last_id, watermark.last_timestamp))
@@ -0,0 +1,43 @@
+"""
+Refresh the file extension index table: rewrite the rows of added,
+removed, relabeled or retyped Datafiles.
+
+python manage.py refresh_extension_index
+python manage.py refresh_extension_index --rebuild
+"""
+from django.core.management.base import BaseCommand
+
+from dv_apps.metrics.file_extension_index import FileExtensionIndexUtil, DEFAULT_BATCH_SIZE
+from miniverse.db_routers.db_dataverse_router import analytics_reads
+
+
+class Command(BaseCommand):
+    help = ('Index the labels, extensions and content type of Datafiles'
+            ' which were added or changed since the last refresh.')
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--rebuild',
+                            action='store_true',
+                            dest='rebuild',
+                            default=False,
+                            help='Delete the index and rebuild it from the first Datafile.')
+
+        parser.add_argument('--batch-size',
+                            type=int,
+                            dest='batch_size',
+                            default=DEFAULT_BATCH_SIZE,
+                            help='Number of DvObject ids per batch. (default: %s)' % DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+
+        index_util = FileExtensionIndexUtil(batch_size=options['batch_size'],
+                                            verbose=options['verbosity'] > 1)
+
+        with analytics_reads():
+            num_indexed = index_util.refresh(rebuild=options['rebuild'])
+
+        watermark = index_util.get_watermark()
+        self.stdout.write('Datafiles indexed: %s' % num_indexed)
+        if watermark:
+            self.stdout.write('Last refreshed: %s' % watermark.last_timestamp)
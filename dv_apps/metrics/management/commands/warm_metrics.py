@@ -0,0 +1,61 @@
+"""
+Recompute cached metrics ahead of expiry.  Run from cron.
+
+python manage.py warm_metrics
+python manage.py warm_metrics --item total_published_counts
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from dv_apps.metrics.metrics_warmer import MetricsWarmer, WarmLockError
+from dv_apps.utils.metrics_cache_time import get_metrics_cache_time
+from miniverse.db_routers.db_dataverse_router import analytics_reads
+
+
+class Command(BaseCommand):
+    help = ('Recompute the metrics listed in METRICS_WARM_ITEMS'
+            ' into the cache and report the time for each.')
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--item',
+                            action='append',
+                            dest='items',
+                            default=None,
+                            help=('Name of page data to warm, instead of METRICS_WARM_ITEMS.'
+                                  ' May be repeated.'))
+
+        parser.add_argument('--lock-file',
+                            dest='lock_file',
+                            default=None,
+                            help='Lock file that keeps runs from overlapping.')
+
+    def handle(self, *args, **options):
+
+        if get_metrics_cache_time() <= 0:
+            self.stdout.write('Nothing to warm: caching is off.  (METRICS_CACHE_VIEW)')
+            return
+
+        warmer = MetricsWarmer(items=options['items'],
+                               lock_file_name=options['lock_file'])
+
+        def write_result(item_result):
+            if item_result.is_ok():
+                self.stdout.write('%.2fs  %s' % (item_result.seconds, item_result.name))
+            else:
+                self.stderr.write('%.2fs  %s  ERROR: %s' %\
+                    (item_result.seconds, item_result.name, item_result.error_message))
+
+        try:
+            with analytics_reads():
+                results = warmer.warm(result_callback=write_result)
+        except WarmLockError as ex_obj:
+            self.stderr.write(str(ex_obj))
+            return
+
+        self.stdout.write('Warmed %s of %s items in %.2fs' %\
+            (len([r for r in results if r.is_ok()]),
+             len(results),
+             sum([r.seconds for r in results])))
+
+        if len([r for r in results if not r.is_ok()]) > 0:
+            raise CommandError('Some items were not warmed.')
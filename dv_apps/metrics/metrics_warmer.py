@@ -0,0 +1,167 @@
+"""
+Recompute cached metrics ahead of expiry.
+
+Items are listed in the "METRICS_WARM_ITEMS" setting:
+
+    - the name of cached page data, e.g. "public_visualizations_last12"
+    - an API call: (url name, params) or (url name, params, url kwargs)
+        e.g. ('view_dataset_counts_by_month', dict(pub_state='published'))
+
+Run from cron:
+    python manage.py warm_metrics
+
+A lock file keeps runs from overlapping.
+"""
+import fcntl
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from urllib import urlencode
+
+from django.conf import settings
+from django.core.urlresolvers import reverse, resolve
+from django.http import HttpRequest, QueryDict
+
+from dv_apps.installations.views import get_installation_map_data
+from dv_apps.metrics.stats_count_util import get_total_published_counts_cached
+from dv_apps.metrics.views_public_metrics import get_public_visualizations_last12_data
+
+DEFAULT_LOCK_FILE_NAME = 'miniverse_warm_metrics.lock'
+
+# { name : function(refresh=True) }
+PAGE_DATA_FUNCTIONS = OrderedDict([\
+        ('public_visualizations_last12', get_public_visualizations_last12_data),
+        ('total_published_counts', get_total_published_counts_cached),
+        ('installation_map', get_installation_map_data),
+        ])
+
+
+class WarmLockError(Exception):
+    """Another run holds the lock file"""
+    pass
+
+
+class WarmItemResult(object):
+    """Outcome of warming one item"""
+
+    def __init__(self, name, seconds, error_message=None):
+        self.name = name
+        self.seconds = seconds
+        self.error_message = error_message
+
+    def is_ok(self):
+        return self.error_message is None
+
+
+def get_warm_items():
+    """The items to warm, from settings"""
+    return getattr(settings, 'METRICS_WARM_ITEMS', list(PAGE_DATA_FUNCTIONS.keys()))
+
+
+def get_lock_file_name():
+    """The lock file, from settings or in the temp directory"""
+    lock_file_name = getattr(settings, 'METRICS_WARM_LOCK_FILE', None)
+    if lock_file_name:
+        return lock_file_name
+    return os.path.join(tempfile.gettempdir(), DEFAULT_LOCK_FILE_NAME)
+
+
+class MetricsWarmer(object):
+    """Recompute each item into the cache, timing it"""
+
+    def __init__(self, items=None, lock_file_name=None):
+        if items is None:
+            items = get_warm_items()
+        if lock_file_name is None:
+            lock_file_name = get_lock_file_name()
+
+        self.items = items
+        self.lock_file_name = lock_file_name
+
+    def get_item_name(self, item):
+        """e.g. "total_published_counts" or "view_dataset_counts_by_month?pub_state=published" """
+        if isinstance(item, basestring):
+            return item
+
+        if item[1]:
+            return '%s?%s' % (item[0], urlencode(sorted(item[1].items())))
+        return item[0]
+
+    def warm_page_data(self, name):
+        """Recompute cached page data"""
+        if not name in PAGE_DATA_FUNCTIONS:
+            return 'Unknown page data: "%s".  Choices: %s' %\
+                    (name, ', '.join(PAGE_DATA_FUNCTIONS.keys()))
+
+        PAGE_DATA_FUNCTIONS[name](refresh=True)
+        return None
+
+    def warm_api_result(self, url_name, params, url_kwargs=None):
+        """Recompute the cached StatsResult of an API view"""
+        if url_kwargs is None:
+            url_kwargs = {}
+
+        url_path = reverse(url_name, kwargs=url_kwargs)
+        view_class = getattr(resolve(url_path).func, 'view_class', None)
+        if view_class is None or not hasattr(view_class, 'get_stats_result_with_cache'):
+            return 'Not a metrics API view: "%s"' % url_name
+
+        request = HttpRequest()
+        request.method = 'GET'
+        request.path = url_path
+        request.GET = QueryDict(urlencode(params))
+
+        view = view_class()
+        view.request = request
+        view.args = ()
+        view.kwargs = url_kwargs
+
+        stats_result, generation_time = view.get_stats_result_with_cache(\
+                                            request, refresh=True)
+        if stats_result is None:
+            return 'No result'
+        if stats_result.has_error():
+            return stats_result.error_message
+        return None
+
+    def warm_item(self, item):
+        """Warm one item and return a WarmItemResult"""
+        name = self.get_item_name(item)
+
+        start_time = time.time()
+        try:
+            if isinstance(item, basestring):
+                error_message = self.warm_page_data(item)
+            else:
+                error_message = self.warm_api_result(*item)
+        except Exception as ex_obj:
+            error_message = '%s: %s' % (ex_obj.__class__.__name__, ex_obj)
+
+        return WarmItemResult(name, time.time() - start_time, error_message)
+
+    def warm(self, result_callback=None):
+        """
+        Warm every item while holding the lock file.
+        Raises WarmLockError if another run holds the lock.
+
+            result_callback - called with each WarmItemResult
+
+        Returns a list of WarmItemResult objects
+        """
+        with open(self.lock_file_name, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                raise WarmLockError('Already running.  (lock file: %s)' %\
+                                    self.lock_file_name)
+            try:
+                results = []
+                for item in self.items:
+                    item_result = self.warm_item(item)
+                    results.append(item_result)
+                    if result_callback is not None:
+                        result_callback(item_result)
+                return results
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
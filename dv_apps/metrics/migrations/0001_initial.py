@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-18 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadMonthRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('yyyy_mm', models.DateField(blank=True, db_index=True, null=True)),
+                ('dataverse_id', models.IntegerField(blank=True, db_index=True, help_text='DvObject id of the Dataset owner', null=True)),
+                ('is_published', models.BooleanField(help_text='Datafile publication state at the time of the rollup')),
+                ('downloadtype', models.CharField(blank=True, max_length=255, null=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('yyyy_mm', 'dataverse_id'),
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('last_timestamp', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ('name',),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='downloadmonthrollup',
+            unique_together=set([('yyyy_mm', 'dataverse_id', 'is_published', 'downloadtype')]),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-18 19:17
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatafileExtension',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datafile_id', models.IntegerField(help_text='DvObject id of the Datafile', unique=True)),
+                ('extension', models.CharField(blank=True, db_index=True, help_text='e.g. ".csv" or "" for no extension', max_length=255)),
+                ('contenttype', models.CharField(db_index=True, max_length=255)),
+                ('filesize', models.BigIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ('datafile_id',),
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='datafileextension',
+            index_together=set([('contenttype', 'extension')]),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-18 19:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0002_datafileextension'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlySnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=100)),
+                ('filter_signature', models.CharField(max_length=32)),
+                ('yyyy_mm', models.DateField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('extra_values', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ('metric', 'filter_signature', 'yyyy_mm'),
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlySnapshotSet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('metric', models.CharField(max_length=100)),
+                ('filter_signature', models.CharField(help_text='md5 of the monthly count query', max_length=32)),
+                ('frozen_before', models.DateField(help_text='1st day of the first live month')),
+                ('start_point_count', models.BigIntegerField(default=0)),
+                ('query', models.TextField(blank=True, help_text='for reference')),
+            ],
+            options={
+                'ordering': ('metric', 'filter_signature'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlysnapshotset',
+            unique_together=set([('metric', 'filter_signature')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlysnapshot',
+            unique_together=set([('metric', 'filter_signature', 'yyyy_mm')]),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-18 21:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def clear_extension_index(apps, schema_editor):
+    """The rows had one label per Datafile: refresh_extension_index rebuilds them"""
+    apps.get_model('metrics', 'DatafileExtension').objects.all().delete()
+    apps.get_model('metrics', 'RollupWatermark').objects.filter(\
+        name='datafile_extension').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0003_monthlysnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_extension_index, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='datafileextension',
+            name='label',
+            field=models.CharField(default='', help_text='FileMetadata label', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='datafileextension',
+            name='datafile_id',
+            field=models.IntegerField(db_index=True, help_text='DvObject id of the Datafile'),
+        ),
+        migrations.AlterModelOptions(
+            name='datafileextension',
+            options={'ordering': ('datafile_id', 'label')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='datafileextension',
+            unique_together=set([('datafile_id', 'label')]),
+        ),
+    ]
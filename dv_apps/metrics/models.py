@@ -1,5 +1,131 @@
+"""
+Miniverse-managed tables used to speed up metrics queries.
+
+These live in the Miniverse ("default") database, not the Dataverse database.
+See "MINIVERSE_APP_NAMES" in miniverse.db_routers.db_dataverse_router
+"""
 from __future__ import unicode_literals
 
 from django.db import models
+from django.utils.encoding import python_2_unicode_compatible
+
+from model_utils.models import TimeStampedModel
+
+
+@python_2_unicode_compatible
+class DownloadMonthRollup(models.Model):
+    """
+    Pre-aggregated GuestBookResponse counts.  One row per:
+        (month, dataset owner Dataverse, datafile publication state, downloadtype)
+
+    "yyyy_mm" is the first day of the month.  It is null for
+    pre-Dataverse 4.0 responses which don't have a "responsetime"
+
+    Populated by: python manage.py refresh_download_rollup
+    """
+    yyyy_mm = models.DateField(blank=True, null=True, db_index=True)
+    dataverse_id = models.IntegerField(blank=True, null=True, db_index=True,\
+                    help_text='DvObject id of the Dataset owner')
+    is_published = models.BooleanField(help_text='Datafile publication state'\
+                    ' at the time of the rollup')
+    downloadtype = models.CharField(max_length=255, blank=True, null=True)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return '%s (dv: %s) %s' % (self.yyyy_mm, self.dataverse_id, self.count)
+
+    class Meta:
+        ordering = ('yyyy_mm', 'dataverse_id')
+        unique_together = ('yyyy_mm', 'dataverse_id', 'is_published', 'downloadtype')
+
+
+@python_2_unicode_compatible
+class RollupWatermark(TimeStampedModel):
+    """
+    Records how far an incremental rollup has progressed.
+        e.g. the last GuestBookResponse id and responsetime included
+        in DownloadMonthRollup
+    """
+    name = models.CharField(max_length=100, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    last_timestamp = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return '%s (last id: %s)' % (self.name, self.last_id)
+
+    class Meta:
+        ordering = ('name',)
+
+
+@python_2_unicode_compatible
+class DatafileExtension(models.Model):
+    """
+    One row per distinct (Datafile, FileMetadata label) with the label's
+    extension.  Used for grouped file extension counts without scanning
+    the "filemetadata" table.
+
+    Populated by: python manage.py refresh_extension_index
+    """
+    datafile_id = models.IntegerField(db_index=True,\
+                    help_text='DvObject id of the Datafile')
+    label = models.CharField(max_length=255,\
+                    help_text='FileMetadata label')
+    extension = models.CharField(max_length=255, blank=True, db_index=True,\
+                    help_text='e.g. ".csv" or "" for no extension')
+    contenttype = models.CharField(max_length=255, db_index=True)
+    filesize = models.BigIntegerField(blank=True, null=True)
+
+    def __str__(self):
+        return '%s: "%s" (%s)' % (self.datafile_id, self.label, self.contenttype)
+
+    class Meta:
+        ordering = ('datafile_id', 'label')
+        unique_together = ('datafile_id', 'label')
+        index_together = [('contenttype', 'extension')]
+
+
+@python_2_unicode_compatible
+class MonthlySnapshotSet(TimeStampedModel):
+    """
+    Frozen monthly counts for one metric and filter signature.
+    Months before "frozen_before" are in MonthlySnapshot.
+
+    "start_point_count" is the frozen running total start point,
+    e.g. the count of objects created before the start date
+    """
+    metric = models.CharField(max_length=100)
+    filter_signature = models.CharField(max_length=32,\
+                    help_text='md5 of the monthly count query')
+    frozen_before = models.DateField(help_text='1st day of the first live month')
+    start_point_count = models.BigIntegerField(default=0)
+    query = models.TextField(blank=True, help_text='for reference')
+
+    def __str__(self):
+        return '%s %s (before %s)' % (self.metric, self.filter_signature, self.frozen_before)
+
+    class Meta:
+        ordering = ('metric', 'filter_signature')
+        unique_together = ('metric', 'filter_signature')
+
+
+@python_2_unicode_compatible
+class MonthlySnapshot(models.Model):
+    """
+    One frozen month of a monthly count.  Never updated once written.
+
+    "yyyy_mm" is the first day of the month.  "extra_values" holds other
+    aggregates as JSON, e.g. {"bytes": 1024}
+    """
+    metric = models.CharField(max_length=100)
+    filter_signature = models.CharField(max_length=32)
+    yyyy_mm = models.DateField()
+    count = models.BigIntegerField(default=0)
+    extra_values = models.TextField(blank=True)
+
+    def __str__(self):
+        return '%s %s %s: %s' % (self.metric, self.filter_signature, self.yyyy_mm, self.count)
+
+    class Meta:
+        ordering = ('metric', 'filter_signature', 'yyyy_mm')
+        unique_together = ('metric', 'filter_signature', 'yyyy_mm')
 
-# Create your models here.
@@ -0,0 +1,56 @@
+"""
+Format monthly counts one column at a time.
+
+The monthly endpoints share a record layout:
+
+    yyyy_mm, count, [extra columns], running_total,
+    year_num, month_num, month_name, month_name_short
+
+MonthColumns builds a list for each column--the month strings and names
+come from lookup tables, not per row string formatting.  The StatsResult
+keeps only the columns: they're sent as is for "?format=columnar" and
+made into row records only for the JSON "records" or an export.
+See StatsResult.get_result_data
+"""
+from collections import OrderedDict
+
+from dv_apps.utils.date_helper import get_month_name_abbreviation,\
+    get_month_name
+
+# { month number : name }, e.g. { 1 : 'January' } and { 1 : 'Jan' }
+#
+MONTH_NAMES = dict([(m, get_month_name(m)[1]) for m in range(1, 13)])
+MONTH_NAMES_SHORT = dict([(m, get_month_name_abbreviation(m)[1]) for m in range(1, 13)])
+
+
+class MonthColumns(object):
+    """Monthly counts as { column name : list of values }"""
+
+    def __init__(self, month_rows, extra_columns=None, running_totals=None):
+        """
+            month_rows - dicts with a "yyyy_mm" datetime, a "count" and,
+                        without "running_totals", a "running_total"
+            extra_columns - OrderedDict of { column name : list of values }
+                        placed after "count", e.g. "bytes"
+            running_totals - list of running totals, if not in the rows
+        """
+        year_nums = [d['yyyy_mm'].year for d in month_rows]
+        month_nums = [d['yyyy_mm'].month for d in month_rows]
+
+        if running_totals is None:
+            running_totals = [d['running_total'] for d in month_rows]
+
+        self.columns = OrderedDict()
+        self.columns['yyyy_mm'] = ['%04d-%02d' % year_month\
+                                    for year_month in zip(year_nums, month_nums)]
+        self.columns['count'] = [d['count'] for d in month_rows]
+        if extra_columns:
+            self.columns.update(extra_columns)
+        self.columns['running_total'] = running_totals
+        self.columns['year_num'] = year_nums
+        self.columns['month_num'] = month_nums
+        self.columns['month_name'] = [MONTH_NAMES[m] for m in month_nums]
+        self.columns['month_name_short'] = [MONTH_NAMES_SHORT[m] for m in month_nums]
+
+    def __len__(self):
+        return len(self.columns['yyyy_mm'])
@@ -0,0 +1,142 @@
+"""
+Frozen monthly counts, so that closed months aren't recomputed.
+
+Monthly metrics, e.g. "datasets/count/monthly", are keyed by:
+
+    (metric, filter signature, yyyy_mm)
+
+The filter signature is the md5 of the full monthly count query, so
+each combination of params (publication state, start date, etc.) has
+its own snapshots.
+
+    - The first request runs the full query and freezes the months
+        before the cutoff, along with the running total start point
+    - Later requests read the frozen months and query only the months
+        from "frozen_before" on.  Months which have since settled are
+        frozen as they pass the cutoff
+
+The cutoff is the 1st day of the month METRICS_SNAPSHOT_SETTLE_MONTHS
+before the current month.  e.g. With 2, in October, months through
+July are frozen and August onward is counted live.
+
+Notes:
+    - Frozen months don't change.  e.g. An old Dataset published today
+        isn't added to its create month's published count.  Delete the
+        snapshots (e.g. in the admin) to recompute them
+    - Only used when the running total start point is also settled,
+        e.g. no start date or a start date before the cutoff
+"""
+import hashlib
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db import router, transaction, IntegrityError
+
+from dv_apps.metrics.models import MonthlySnapshotSet, MonthlySnapshot
+
+DEFAULT_SETTLE_MONTHS = 2
+
+
+def is_monthly_snapshot_enabled():
+    """Allow the snapshots to be switched off via settings"""
+    return getattr(settings, 'METRICS_USE_MONTHLY_SNAPSHOTS', True)
+
+
+def get_settle_months():
+    """Number of recent months, besides the current one, counted live"""
+    return getattr(settings, 'METRICS_SNAPSHOT_SETTLE_MONTHS', DEFAULT_SETTLE_MONTHS)
+
+
+def get_snapshot_cutoff(now=None):
+    """Return a date: the 1st day of the oldest month counted live"""
+    if now is None:
+        now = datetime.now()
+
+    month_index = now.year * 12 + (now.month - 1) - get_settle_months()
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def get_month_key(dt):
+    """(year, month) -- compares dates, naive and aware datetimes"""
+    return (dt.year, dt.month)
+
+
+class MonthlySnapshotUtil(object):
+    """Read and write the frozen months of one monthly count query"""
+
+    def __init__(self, metric, query_key, now=None):
+        """
+            metric - e.g. "datasets/count/monthly"
+            query_key - the full monthly count query, e.g. repr((sql, params))
+        """
+        self.metric = metric
+        self.query_key = query_key
+        self.filter_signature = hashlib.md5(query_key).hexdigest()
+        self.cutoff = get_snapshot_cutoff(now)
+
+    def get_snapshot_set(self):
+        """Return the MonthlySnapshotSet--or None if nothing is frozen yet"""
+        return MonthlySnapshotSet.objects.filter(metric=self.metric,\
+                        filter_signature=self.filter_signature).first()
+
+    def get_frozen_rows(self, snapshot_set):
+        """
+        Frozen months as dicts with "yyyy_mm" (a datetime), "count"
+        and any extra aggregates
+        """
+        snapshots = MonthlySnapshot.objects.filter(metric=self.metric,\
+                        filter_signature=self.filter_signature,\
+                        yyyy_mm__lt=snapshot_set.frozen_before)
+
+        rows = []
+        for snapshot in snapshots:
+            row = dict(yyyy_mm=datetime(snapshot.yyyy_mm.year, snapshot.yyyy_mm.month, 1),\
+                       count=snapshot.count)
+            if snapshot.extra_values:
+                row.update(json.loads(snapshot.extra_values))
+            rows.append(row)
+
+        return rows
+
+    def is_freeze_needed(self, snapshot_set):
+        """Have more months settled since the last freeze?"""
+        return snapshot_set is None or snapshot_set.frozen_before < self.cutoff
+
+    def freeze(self, month_rows, extra_names=(), start_point_count=0, snapshot_set=None):
+        """
+        Save the rows for months before the cutoff and move "frozen_before"
+        up to the cutoff.
+            month_rows - must hold every month from the last freeze on
+            start_point_count - for the first freeze
+        """
+        if not self.is_freeze_needed(snapshot_set):
+            return
+
+        cutoff_key = get_month_key(self.cutoff)
+        snapshots = []
+        for row in month_rows:
+            if get_month_key(row['yyyy_mm']) >= cutoff_key:
+                continue
+            extra_values = dict([(name, row[name]) for name in extra_names])
+            snapshots.append(MonthlySnapshot(metric=self.metric,\
+                                filter_signature=self.filter_signature,\
+                                yyyy_mm=date(row['yyyy_mm'].year, row['yyyy_mm'].month, 1),\
+                                count=row['count'],\
+                                extra_values=json.dumps(extra_values) if extra_values else ''))
+
+        try:
+            with transaction.atomic(using=router.db_for_write(MonthlySnapshot)):
+                MonthlySnapshot.objects.bulk_create(snapshots)
+                if snapshot_set is None:
+                    MonthlySnapshotSet.objects.create(metric=self.metric,\
+                                filter_signature=self.filter_signature,\
+                                frozen_before=self.cutoff,\
+                                start_point_count=start_point_count,\
+                                query=self.query_key)
+                else:
+                    MonthlySnapshotSet.objects.filter(id=snapshot_set.id\
+                                ).update(frozen_before=self.cutoff)
+        except IntegrityError:
+            # frozen by another request
+            pass
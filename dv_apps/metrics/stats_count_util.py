@@ -3,6 +3,10 @@
 from dv_apps.metrics.stats_util_dataverses import StatsMakerDataverses
 from dv_apps.metrics.stats_util_datasets import StatsMakerDatasets
 from dv_apps.metrics.stats_util_files import StatsMakerFiles
+from dv_apps.metrics.view_data_cache import get_cached_view_data
+
+# Name of the cached counts
+TOTAL_PUBLISHED_COUNTS_DATA = 'total_published_counts'
 
 
 def get_total_published_counts():
@@ -21,3 +25,20 @@ def get_total_published_counts():
             )
 
     return d
+
+
+def compute_total_published_counts():
+    """Return (counts, is_complete) for the view data cache"""
+    return get_total_published_counts(), True
+
+
+def get_total_published_counts_cached(refresh=False):
+    """
+    Total published counts, from the cache.
+        - refresh - recompute the cached counts
+    Returns a copy, which the caller may update
+    """
+    counts = get_cached_view_data(TOTAL_PUBLISHED_COUNTS_DATA,\
+                                  compute_total_published_counts,\
+                                  refresh=refresh)
+    return dict(counts)
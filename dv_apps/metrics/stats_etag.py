@@ -0,0 +1,150 @@
+"""
+ETags and conditional GETs for the metrics API views.
+
+Before running a statistic, a cheap "data watermark" is read:
+
+    dvobjects - max id, count and max modificationtime of "dvobject"
+    downloads - max id (and its responsetime) of "guestbookresponse"
+
+The ETag is the md5 of the watermark, the view, its URL arguments and
+the params--sorted, with the API key removed.  A request with a
+matching "If-None-Match" gets a 304 and the statistic isn't computed.
+
+No "Last-Modified" is sent and "If-Modified-Since" is ignored: a deleted
+DvObject changes the watermark's count, but no timestamp.
+
+Cached StatsResults record their watermark and are recomputed when it
+changes, so a cached result is never sent with the ETag of newer data.
+
+Each view lists the watermarks it depends on in "etag_watermarks".
+Turn off with "METRICS_USE_ETAGS = False".
+
+Notes:
+    - Watermarks are cached for "METRICS_ETAG_WATERMARK_TIME" seconds,
+        so many pollers share one read
+    - Changes which don't touch these tables, e.g. an edit made directly
+        in the database without updating "modificationtime", aren't seen
+    - Of the deleted GuestBookResponses, only the newest is seen
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.http import quote_etag
+
+from dv_apps.dataverse_auth.decorator import PARAM_NAME_KEY
+from dv_apps.dvobjects.models import DvObject
+from dv_apps.guestbook.models import GuestBookResponse
+
+WATERMARK_DVOBJECTS = 'dvobjects'
+WATERMARK_DOWNLOADS = 'downloads'
+
+WATERMARK_CACHE_PREFIX = 'metrics_data_watermark'
+DEFAULT_WATERMARK_CACHE_TIME = 10
+
+
+def is_etag_enabled():
+    """Allow ETags to be switched off via settings"""
+    return getattr(settings, 'METRICS_USE_ETAGS', True)
+
+
+def get_watermark_cache_time():
+    """Seconds to reuse a watermark.  0 = read it for every request"""
+    return getattr(settings, 'METRICS_ETAG_WATERMARK_TIME', DEFAULT_WATERMARK_CACHE_TIME)
+
+
+def get_dvobject_watermark():
+    """(max id, count, max modificationtime) of the DvObjects"""
+    info = DvObject.objects.aggregate(max_id=Max('id'),\
+                                      cnt=Count('id'),\
+                                      max_modtime=Max('modificationtime'))
+
+    return (info['max_id'], info['cnt'], info['max_modtime'])
+
+
+def get_download_watermark():
+    """(max id, its responsetime) of the GuestBookResponses.  Uses the pk index"""
+    info = GuestBookResponse.objects.order_by('-id'\
+                ).values('id', 'responsetime').first()
+    if info is None:
+        return (None, None)
+
+    return (info['id'], info['responsetime'])
+
+
+WATERMARK_FUNCTIONS = {WATERMARK_DVOBJECTS : get_dvobject_watermark,
+                       WATERMARK_DOWNLOADS : get_download_watermark}
+
+
+def get_watermark_value(name):
+    """Read a watermark, e.g. WATERMARK_DVOBJECTS, or reuse a cached one"""
+    cache_time = get_watermark_cache_time()
+    if cache_time <= 0:
+        return WATERMARK_FUNCTIONS[name]()
+
+    cache_key = '%s:%s' % (WATERMARK_CACHE_PREFIX, name)
+    value = cache.get(cache_key)
+    if value is None:
+        value = WATERMARK_FUNCTIONS[name]()
+        cache.set(cache_key, value, cache_time)
+    return value
+
+
+class DataWatermark(object):
+    """The watermarks for a view, read once per request"""
+
+    def __init__(self, watermark_names):
+        self.values = [(name, get_watermark_value(name))\
+                        for name in sorted(watermark_names)]
+
+    def get_key(self):
+        """Short key for the watermark values, e.g. for a cache key"""
+        return hashlib.md5(repr(self.values)).hexdigest()
+
+    def get_etag(self, view_name, url_kwargs, query_dict):
+        """
+        Return the ETag for the view's response.
+
+            view_name - e.g. "dv_apps.metrics.stats_views_files.FileTotalCountsView"
+            url_kwargs - args from the URL path, e.g. {"ds_id" : "1"}
+            query_dict - request.GET
+        """
+        params = []
+        for param_name, values in query_dict.lists():
+            if param_name == PARAM_NAME_KEY:
+                continue
+            params.append((param_name, sorted([x.strip() for x in values])))
+        params.sort()
+
+        key_info = repr((view_name, sorted(url_kwargs.items()), params, self.values))
+
+        return hashlib.md5(key_info).hexdigest()
+
+
+def get_if_none_match_etags(request):
+    """ETags in the "If-None-Match" header, without quotes or "W/" """
+    header = request.META.get('HTTP_IF_NONE_MATCH', None)
+    if not header:
+        return []
+
+    etags = []
+    for etag in header.split(','):
+        etag = etag.strip()
+        if etag.startswith('W/'):
+            etag = etag[2:]
+        etags.append(etag.strip('"'))
+    return etags
+
+
+def is_not_modified(request, etag):
+    """Does the request already have this version of the response?"""
+    if_none_match = get_if_none_match_etags(request)
+
+    return etag in if_none_match or '*' in if_none_match
+
+
+def add_etag_headers(response, etag):
+    """Set the "ETag" header"""
+    response['ETag'] = quote_etag(etag)
+    return response
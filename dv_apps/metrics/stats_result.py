@@ -1,11 +1,31 @@
-import StringIO
-import pandas as pd
 """
 Holds the results of metrics queries from:
     StatsMakerDataverses
     StatsMakerDatasets
     StatsMakerFiles
 """
+import csv
+import itertools
+import StringIO
+from collections import OrderedDict
+
+import xlsxwriter
+
+
+class EchoBuffer(object):
+    """File-like object for csv.writer that returns each line, unbuffered"""
+
+    def write(self, value):
+        return value
+
+
+def encode_csv_value(val):
+    """The python 2 csv module needs byte strings"""
+    if isinstance(val, unicode):
+        return val.encode('utf-8')
+    return val
+
+
 class StatsResult(object):
 
     def __init__(self, **kwargs):
@@ -13,12 +33,20 @@ class StatsResult(object):
         self.error_found = kwargs.get('error_found', False)
         self.error_message = kwargs.get('error_message', False)
         self.bad_http_status_code = kwargs.get('bad_http_status_code', None)
+        self.retry_after_seconds = kwargs.get('retry_after_seconds', None)
 
         self.result_data = kwargs.get('result_data', None)
         if self.result_data:
             self.error_found = False
         self.sql_query = kwargs.get('sql_query', None)
 
+        # key of the DataWatermark when computed, for the result cache
+        self.watermark_key = kwargs.get('watermark_key', None)
+
+        # the records as { column name : list of values }, if built that way.
+        # "result_data" then has no "records" list: see get_result_data
+        self.record_columns = kwargs.get('record_columns', None)
+
 
     def was_succcess(self):
         if not self.error_found:
@@ -32,81 +60,170 @@ class StatsResult(object):
         self.error_found = True
         self.error_message = err_msg
 
-    def get_excel_workbook(self):
+    def get_stored_columns(self):
         """
-        Convert data records to an excel notebook
+        Return the "record_columns" the result was built with--or None.
+        These results have no "records" list in "result_data"
+        """
+        return getattr(self, 'record_columns', None)    # e.g. cached before
+
+    def has_records(self):
+        """Does the result have records, as a list or as columns?"""
+        if not isinstance(self.result_data, dict):
+            return False
+        return 'records' in self.result_data or self.get_stored_columns() is not None
+
+    def iter_records(self):
+        """
+        Iterate through the data records.  For a result built with
+        "record_columns", each record's OrderedDict is made as it's read
         """
         if self.has_error():
             raise Exception("Error Found.  Call 'has_error()' before attempting this method.")
 
         assert self.result_data is not None, "result_data cannot be None"
+
+        record_columns = self.get_stored_columns()
+        if record_columns is not None:
+            col_names = record_columns.keys()
+            return (OrderedDict(zip(col_names, values))\
+                    for values in itertools.izip(*record_columns.values()))
+
         assert self.result_data.has_key('records'), "result_data must have a list of 'records'"
 
         records = self.result_data.get('records', None)
         assert records is not None, "records cannot be None"
 
-        if len(records) == 0:
-            return ''
+        return iter(records)
 
-        col_names = [ k for k, v in records[0].items()]
+    def get_records(self):
+        """Return the records as a list, e.g. for the JSON "records" """
+        if self.get_stored_columns() is None:
+            return self.result_data['records']
+        return list(self.iter_records())
 
-        excel_string_io = StringIO.StringIO()
-        df = pd.DataFrame(self.result_data['records'])
-        pd_writer = pd.ExcelWriter(excel_string_io, engine='xlsxwriter')
+    def get_result_data(self):
+        """
+        Return the result data with the "records" list, e.g. for JSON.
+        Records of a result built with "record_columns" are made here
+        """
+        if self.get_stored_columns() is None or not isinstance(self.result_data, dict):
+            return self.result_data
 
-        df.to_excel(pd_writer, index=False, sheet_name='metrics', columns=col_names)
-        pd_writer.save()
+        data = OrderedDict(self.result_data)
+        data['records'] = self.get_records()
+        return data
 
-        excel_string_io.seek(0)
-        workbook = excel_string_io.getvalue()
+    def iter_rows(self):
+        """
+        Yield a list of column names and then a list of values for each
+        record.  The column names come from the first record.
+        Yields nothing if there are no records.
+        """
+        record_columns = self.get_stored_columns()
+        if record_columns is not None:
+            # rows straight from the columns
+            rows = itertools.izip(*record_columns.values())
+            first_row = next(rows, None)
+            if first_row is None:
+                return
 
-        return workbook
+            yield record_columns.keys()
+            for row in itertools.chain([first_row], rows):
+                yield list(row)
+            return
 
+        records = self.iter_records()
 
-    def get_csv_content(self):
+        first_record = next(records, None)
+        if first_record is None:
+            return
+
+        col_names = [k for k, v in first_record.items()]
+        yield col_names
+
+        for rec in itertools.chain([first_record], records):
+            yield [rec.get(col_name) for col_name in col_names]
+
+    def get_record_columns(self):
         """
-        Lots of assertions here.  We want to blow up for now--until test cases made
-        or discovered
+        Return the records as an OrderedDict of { column name : list of values },
+        e.g. for "?format=columnar".  Column names come from the first record
         """
-        if self.has_error():
-            raise Exception("Error Found.  Call 'has_error()' before attempting this method.")
+        record_columns = self.get_stored_columns()
+        if record_columns is not None:
+            return record_columns
 
-        assert self.result_data is not None, "result_data cannot be None"
-        assert self.result_data.has_key('records'), "result_data must have a list of 'records'"
+        rows = self.iter_rows()
+        col_names = next(rows, None)
+        if col_names is None:
+            return OrderedDict()
 
-        records = self.result_data.get('records', None)
-        assert records is not None, "records cannot be None"
+        return OrderedDict(zip(col_names, [list(x) for x in zip(*rows)]))
+
+    def iter_csv_lines(self):
+        """Yield the records as lines of CSV, starting with the column names"""
+        csv_writer = csv.writer(EchoBuffer(), lineterminator='\n')
+        for row in self.iter_rows():
+            yield csv_writer.writerow([encode_csv_value(x) for x in row])
+
+    def write_excel_workbook(self, output_file):
+        """
+        Write the records to an Excel workbook.  "constant_memory" mode
+        flushes each row to a temp file, rather than holding the worksheet.
+        """
+        workbook = xlsxwriter.Workbook(output_file, {'constant_memory' : True})
+        worksheet = workbook.add_worksheet('metrics')
+        header_format = workbook.add_format({'bold' : True})
+
+        for row_num, row in enumerate(self.iter_rows()):
+            if row_num == 0:
+                worksheet.write_row(row_num, 0, row, header_format)
+            else:
+                worksheet.write_row(row_num, 0, row)
 
-        if len(records) == 0:
-            return ''
+        workbook.close()
+
+    def get_excel_workbook(self):
+        """
+        Convert data records to an excel notebook
+        """
+        excel_string_io = StringIO.StringIO()
+        self.write_excel_workbook(excel_string_io)
 
-        col_names = [ k for k, v in records[0].items()]
+        return excel_string_io.getvalue()
 
-        df = pd.DataFrame(self.result_data['records'])
 
-        return df.to_csv(orient='records', index=False, columns=col_names)
+    def get_csv_content(self):
+        """
+        Return the records as a CSV string
+        """
+        return ''.join(self.iter_csv_lines())
 
 
     @staticmethod
-    def build_error_result(error_message, bad_http_status_code=None):
+    def build_error_result(error_message, bad_http_status_code=None, retry_after_seconds=None):
         """
-        Return an error result with an error message
-        and optional http status code
+        Return an error result with an error message,
+        optional http status code and optional retry hint
         """
         d = dict(error_found=True,\
                 error_message=error_message,\
-                bad_http_status_code=bad_http_status_code)
+                bad_http_status_code=bad_http_status_code,\
+                retry_after_seconds=retry_after_seconds)
         sr = StatsResult(**d)
         return sr
 
     @staticmethod
-    def build_success_result(metrics_records, sql_query=None):
+    def build_success_result(metrics_records, sql_query=None, record_columns=None):
         """
         Return a successful result with data and
-        optioanl sql query string
+        optioanl sql query string and record columns.
+        With record columns, leave "records" out of the data
         """
         #import ipdb; ipdb.set_trace()
         d = { 'result_data' : metrics_records,\
-                'sql_query' : sql_query}
+                'sql_query' : sql_query,\
+                'record_columns' : record_columns}
         sr = StatsResult(**d)
         return sr
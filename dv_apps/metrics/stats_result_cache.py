@@ -0,0 +1,67 @@
+"""
+Cache StatsResult objects for the metrics API views.
+
+The cache key is built from the view, its URL arguments and the metric
+params--sorted, with the API key and output format params removed.
+Users with different API keys, params in a different order and the
+JSON, "pretty", CSV and Excel renderings all share one cache entry.
+
+The cache time is "METRICS_CACHE_API_TIME".  Nothing is cached when
+"METRICS_CACHE_VIEW" is False.
+"""
+import hashlib
+
+from django.core.cache import cache
+
+from dv_apps.dataverse_auth.decorator import PARAM_NAME_KEY
+from dv_apps.utils.metrics_cache_time import get_metrics_api_cache_time
+
+STATS_RESULT_CACHE_PREFIX = 'metrics_stats_result'
+
+# Params for authentication or the output format, not the statistic
+#
+IGNORED_PARAM_NAMES = (PARAM_NAME_KEY, 'pretty', 'as_csv', 'as_excel', 'timing', 'format')
+
+
+def get_stats_result_cache_key(view_name, url_kwargs, query_dict):
+    """
+    Return a cache key for the statistic.
+
+        view_name - e.g. "dv_apps.metrics.stats_views_files.FileTotalCountsView"
+        url_kwargs - args from the URL path, e.g. {"dv_id" : "1"}
+        query_dict - request.GET
+    """
+    params = []
+    for param_name, values in query_dict.lists():
+        if param_name in IGNORED_PARAM_NAMES:
+            continue
+        params.append((param_name, sorted([x.strip() for x in values])))
+    params.sort()
+
+    key_info = repr((view_name, sorted(url_kwargs.items()), params))
+
+    return '%s:%s' % (STATS_RESULT_CACHE_PREFIX,
+                      hashlib.md5(key_info).hexdigest())
+
+
+def get_cached_stats_result(cache_key):
+    """Return (StatsResult, generation time) or None"""
+    if get_metrics_api_cache_time() <= 0:
+        return None
+
+    return cache.get(cache_key)
+
+
+def set_cached_stats_result(cache_key, stats_result, generation_time):
+    """
+    Cache a successful StatsResult.  Errors, such as a bad param or
+    a timeout, are not cached.
+    """
+    cache_time = get_metrics_api_cache_time()
+    if cache_time <= 0:
+        return
+
+    if stats_result is None or stats_result.has_error():
+        return
+
+    cache.set(cache_key, (stats_result, generation_time), cache_time)
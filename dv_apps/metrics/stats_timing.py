@@ -0,0 +1,150 @@
+"""
+Query counts and timing for metrics API requests.
+
+Each API request records:
+
+    cache - "hit", "miss" or "off"
+    query_count, db_ms - queries run by this thread
+    stats_ms - time to build the StatsResult
+    python_ms - time outside of the database
+    format_ms - time to build the response
+    total_ms
+
+Shown in the "info" section with "?timing=1" and logged as one line
+per request to the "dv_apps.metrics.timing" logger, e.g.
+
+    metrics_timing endpoint=DatasetCountByMonthView status=200 cache=miss
+        query_count=3 db_ms=41.2 stats_ms=52.0 python_ms=14.3 ...
+
+Notes:
+    - Queries are captured with Django's debug cursor, which also keeps
+        their SQL until the next request
+    - Queries run in other threads, e.g. by the batch endpoint,
+        are not counted
+"""
+import logging
+import time
+from collections import OrderedDict
+
+from django.db import connections
+
+TIMING_LOGGER_NAME = 'dv_apps.metrics.timing'
+TIMING_PARAM_NAME = 'timing'
+
+CACHE_HIT = 'hit'
+CACHE_MISS = 'miss'
+CACHE_OFF = 'off'
+
+logger = logging.getLogger(TIMING_LOGGER_NAME)
+
+
+def is_timing_requested(query_dict):
+    """e.g. "?timing=1" or "?timing=true" """
+    return query_dict.get(TIMING_PARAM_NAME, None) in ('1', 'true', 'True')
+
+
+class QueryTimer(object):
+    """Count the queries and database time on this thread's connections"""
+
+    def __init__(self):
+        self.log_starts = {}    # { db alias : (force_debug_cursor, queries_log length) }
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.is_running = False
+
+    def start(self):
+        for conn in connections.all():
+            self.log_starts[conn.alias] = (conn.force_debug_cursor,\
+                                           len(conn.queries_log))
+            conn.force_debug_cursor = True
+        self.is_running = True
+        return self
+
+    def get_new_queries(self):
+        """Queries logged since "start", for each connection"""
+        for conn in connections.all():
+            if not conn.alias in self.log_starts:
+                continue
+            log_start = self.log_starts[conn.alias][1]
+            queries = list(conn.queries_log)
+            for query in queries[min(log_start, len(queries)):]:
+                yield query
+
+    def update(self):
+        """Refresh "query_count" and "db_seconds" while running"""
+        if not self.is_running:
+            return
+        query_count = 0
+        db_seconds = 0.0
+        for query in self.get_new_queries():
+            query_count += 1
+            db_seconds += float(query.get('time') or 0)
+        self.query_count = query_count
+        self.db_seconds = db_seconds
+
+    def stop(self):
+        self.update()
+        for conn in connections.all():
+            if conn.alias in self.log_starts:
+                conn.force_debug_cursor = self.log_starts[conn.alias][0]
+        self.is_running = False
+        return self
+
+
+def get_ms(seconds):
+    """Seconds as milliseconds, for display"""
+    if seconds is None:
+        return None
+    return round(seconds * 1000, 1)
+
+
+class StatsTiming(object):
+    """Timing for one metrics API request"""
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.cache_status = CACHE_OFF
+        self.stats_seconds = 0.0
+        self.format_seconds = None
+        self.total_seconds = None
+
+        self.query_timer = QueryTimer().start()
+
+    def get_total_seconds(self):
+        if self.total_seconds is not None:
+            return self.total_seconds
+        return time.time() - self.start_time
+
+    def as_dict(self):
+        """The timing so far, in milliseconds"""
+        self.query_timer.update()
+
+        total_seconds = self.get_total_seconds()
+
+        d = OrderedDict(cache=self.cache_status)
+        d['query_count'] = self.query_timer.query_count
+        d['db_ms'] = get_ms(self.query_timer.db_seconds)
+        d['stats_ms'] = get_ms(self.stats_seconds)
+        d['python_ms'] = get_ms(max(total_seconds - self.query_timer.db_seconds, 0))
+        d['format_ms'] = get_ms(self.format_seconds)
+        d['total_ms'] = get_ms(total_seconds)
+        return d
+
+    def finish(self, format_start_time=None):
+        """
+        Stop timing.  "format_start_time" is when the response was
+        started--or None if there was an error before that
+        """
+        now = time.time()
+        if format_start_time is not None:
+            self.format_seconds = now - format_start_time
+        self.total_seconds = now - self.start_time
+        self.query_timer.stop()
+
+    def log(self, endpoint, status_code):
+        """One "key=value" line per request, to aggregate by endpoint"""
+        fields = [('endpoint', endpoint), ('status', status_code)]
+        fields += self.as_dict().items()
+
+        logger.info('metrics_timing %s' %\
+            ' '.join(['%s=%s' % (k, v) for k, v in fields]))
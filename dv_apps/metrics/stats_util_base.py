@@ -3,14 +3,33 @@ Create metrics for Datasets.
 This may be used for APIs, views with visualizations, etc.
 """
 #from django.db.models.functions import TruncMonth  # 1.10
-from django.db import models
+import logging
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import models, connections, router, transaction, OperationalError
+from django.db.models import Q
 
 from dv_apps.utils.date_helper import format_yyyy_mm_dd
 from dv_apps.utils import query_helper
 
-from dv_apps.dvobjects.models import DVOBJECT_CREATEDATE_ATTR
+from dv_apps.dvobjects.models import DvObject, DVOBJECT_CREATEDATE_ATTR
 from dv_apps.metrics.stats_result import StatsResult
+from dv_apps.metrics.stats_result_cache import IGNORED_PARAM_NAMES
 from dv_apps.metrics.dataverse_tree_util import DataverseTreeUtil
+from dv_apps.metrics.histogram_bin_util import HistogramBinSpec
+from dv_apps.metrics.monthly_snapshot_util import MonthlySnapshotUtil,\
+    is_monthly_snapshot_enabled, get_month_key
+from miniverse.db_routers.db_dataverse_router import pin_reads
+
+QUERY_TIMEOUT_LOGGER_NAME = 'dv_apps.metrics.query_timeout'
+QUERY_CANCELED_PGCODE = '57014'     # e.g. statement_timeout
+
+DEFAULT_QUERY_TIMEOUT = 60          # seconds
+DEFAULT_QUERY_RETRY_AFTER = 60 * 5  # seconds
+
+timeout_logger = logging.getLogger(QUERY_TIMEOUT_LOGGER_NAME)
 
 class TruncMonth(models.Func):
     function = 'EXTRACT'
@@ -62,12 +81,15 @@ class StatsMakerBase(object):
         # Next 3 are currently only for file downloads
         self.selected_dvs = None    # Narrow by dataverse aliases
         self.include_child_dvs  = None
+        self.selected_dataverse_id_info = None  # (success, ids or err msg)
 
         # Used for binning stats
         self.bin_size = 20      # default setting
         self.bin_size_bytes = 10**6*50
         self.num_bins = None    # optional setting
         self.skip_empty_bins = False
+        self.bin_log_base = None    # optional, instead of a bin size
+        self.bin_edges = None       # optional, instead of a bin size
 
         # load dates
         self.load_dates_from_kwargs(**kwargs)
@@ -108,6 +130,74 @@ class StatsMakerBase(object):
         return StatsResult.build_error_result(self.error_message,\
             self.bad_http_status_code)
 
+    # ----------------------------
+    #  Query budget
+    # ----------------------------
+    @staticmethod
+    def get_query_timeout(metric_name):
+        """
+        Seconds a metric's queries may run: METRICS_QUERY_TIMEOUTS[metric_name],
+        else METRICS_QUERY_TIMEOUT.  None = no limit
+        """
+        metric_timeouts = getattr(settings, 'METRICS_QUERY_TIMEOUTS', {})
+        if metric_name in metric_timeouts:
+            return metric_timeouts[metric_name]
+        return getattr(settings, 'METRICS_QUERY_TIMEOUT', DEFAULT_QUERY_TIMEOUT)
+
+    @staticmethod
+    def is_query_canceled(ex_obj):
+        """Was the query stopped by "statement_timeout"?"""
+        db_error = getattr(ex_obj, '__cause__', None) or ex_obj
+        return getattr(db_error, 'pgcode', None) == QUERY_CANCELED_PGCODE
+
+    @staticmethod
+    def run_with_query_budget(metric_name, stats_func, params=None):
+        """
+        Call "stats_func" (no args) in a Dataverse db transaction with
+        "statement_timeout" set to the metric's budget.
+
+        If a query runs out of time, the metric and params are logged and
+        a 503 StatsResult, with "retry_after_seconds", is returned.
+        """
+        timeout_seconds = StatsMakerBase.get_query_timeout(metric_name)
+        if not timeout_seconds:
+            return stats_func()
+
+        db_alias = router.db_for_read(DvObject)
+        if connections[db_alias].vendor != 'postgresql':
+            return stats_func()
+
+        try:
+            # Keep every read on the connection with the timeout
+            with pin_reads(db_alias), transaction.atomic(using=db_alias):
+                cursor = connections[db_alias].cursor()
+                try:
+                    cursor.execute('SET LOCAL statement_timeout = %s',\
+                                   [int(timeout_seconds * 1000)])
+                finally:
+                    cursor.close()
+
+                return stats_func()
+
+        except OperationalError as ex_obj:
+            if not StatsMakerBase.is_query_canceled(ex_obj):
+                raise
+
+        # Log the metric params, not the API key
+        metric_params = sorted([(k, v) for k, v in (params or {}).items()\
+                                if not k in IGNORED_PARAM_NAMES])
+        timeout_logger.warning('metrics_query_timeout metric=%s timeout_seconds=%s params=%s' %\
+            (metric_name, timeout_seconds,\
+             '&'.join(['%s=%s' % (k, v) for k, v in metric_params])))
+
+        retry_after = getattr(settings, 'METRICS_QUERY_RETRY_AFTER', DEFAULT_QUERY_RETRY_AFTER)
+        return StatsResult.build_error_result(\
+            ('This metric took longer than %s seconds and was stopped.'
+             ' Please try again in %s seconds or narrow the request,'
+             ' e.g. with a date range or fewer Dataverses.') %\
+             (timeout_seconds, retry_after),\
+            503, retry_after_seconds=retry_after)
+
 
     def load_dates_from_kwargs(self, **kwargs):
         """
@@ -215,6 +305,16 @@ class StatsMakerBase(object):
         self.bin_size_bytes = kwargs.get('bin_size_bytes', self.DEFAULT_BIN_SIZE_BYTES)
         self.bin_size_bytes = self.check_param_that_must_be_integer('bin_size_bytes', self.bin_size_bytes, none_ok=True)
 
+        # ----------------------------------------
+        # Log scale or custom bins, used instead of a bin size
+        # ----------------------------------------
+        self.bin_log_base = kwargs.get('bin_log_base', None)
+        self.bin_log_base = self.check_param_that_must_be_integer('bin_log_base', self.bin_log_base, none_ok=True)
+        if self.bin_log_base is not None and self.bin_log_base < 2:
+            self.add_error('The "bin_log_base" must be 2 or greater.', 400)
+
+        self.load_bin_edges(kwargs.get('bin_edges', None))
+
         # ----------------------------------------
         # Number of bins
         # ----------------------------------------
@@ -226,6 +326,35 @@ class StatsMakerBase(object):
         # ----------------------------------------
         self.skip_empty_bins = self.get_param_true_false_value_via_kwargs(kwargs, 'skip_empty_bins')
 
+    def load_bin_edges(self, bin_edges_str):
+        """
+        Custom bin edges as comma separated numbers, e.g. "0,10,100,1000"
+        """
+        if not bin_edges_str:
+            return
+
+        edges = [x.strip() for x in bin_edges_str.split(',') if x.strip()]
+        if not all([x.isdigit() for x in edges]):
+            self.add_error('The "bin_edges" must be numbers separated by commas.', 400)
+            return
+
+        edges = [int(x) for x in edges]
+        if len(edges) < 2 or edges != sorted(set(edges)):
+            self.add_error('The "bin_edges" must be at least 2 numbers,'
+                           ' in increasing order.', 400)
+            return
+
+        self.bin_edges = edges
+
+    def get_histogram_bin_spec(self, bin_size):
+        """
+        Return a HistogramBinSpec using the custom edges or log base, if
+        specified.  Otherwise use bins of "bin_size"
+        """
+        return HistogramBinSpec(bin_size=bin_size,\
+                                log_base=self.bin_log_base,\
+                                edges=self.bin_edges)
+
     def get_param_true_false_value_via_kwargs(self, kwarg_dict, param_name):
         assert kwarg_dict is not None, "kwarg_dict cannot be None"
 
@@ -278,20 +407,38 @@ class StatsMakerBase(object):
         return int(param_value)
         # OK, keep going
 
+    def resolve_selected_dataverse_ids(self):
+        """
+        Look up the ids for the selected dataverse aliases--once.
+        Returns (success, ids or error message)
+        """
+        if self.selected_dataverse_id_info is not None:
+            return self.selected_dataverse_id_info
+
+        if self.include_child_dvs is True:
+            # include child dvs, as a recursive subquery
+            self.selected_dataverse_id_info = DataverseTreeUtil().get_selected_dataverse_subtree(\
+                                    self.selected_dvs)
+        else:
+            # don't include child dvs
+            self.selected_dataverse_id_info = DataverseTreeUtil().get_selected_dataverse_ids(\
+                                    self.selected_dvs, include_child_dvs=False)
+
+        return self.selected_dataverse_id_info
+
+    def share_selected_dataverse_ids(self, other_stats_maker):
+        """Reuse dataverse ids already looked up by another StatsMaker.
+        e.g. for a batch of stats with the same params"""
+        if self.selected_dvs == other_stats_maker.selected_dvs and\
+            self.include_child_dvs == other_stats_maker.include_child_dvs:
+            self.selected_dataverse_id_info = other_stats_maker.selected_dataverse_id_info
+
     def get_selected_dataverse_ids(self):
         """From a list of aliases, return a list of dataverse ids"""
         if self.selected_dvs is None:
             return True, None
 
-        if self.include_child_dvs is True:
-            # don't include child dvs
-            success, ids_or_msg = DataverseTreeUtil().get_selected_dataverse_ids(self.selected_dvs,\
-                                    include_child_dvs=True)
-
-        else:
-            # include child dvs
-            success, ids_or_msg = DataverseTreeUtil().get_selected_dataverse_ids(self.selected_dvs,\
-                                    include_child_dvs=False)
+        success, ids_or_msg = self.resolve_selected_dataverse_ids()
 
         if not success:
             self.add_error(ids_or_msg)
@@ -299,6 +446,21 @@ class StatsMakerBase(object):
 
         return success, ids_or_msg
 
+    def get_selected_dataverse_filter_params(self, owner_param):
+        """
+        Filter params narrowing to the selected Dataverses.
+            owner_param - the path to the owning Dataverse, e.g. "dataset__owner"
+
+        With "include_child_dvs", the child Dataverses are found by a
+        recursive subquery (DataverseSubtree), not a list of ids.
+        Returns {} to look across all Dataverses--or if there was an error
+        """
+        success, dataverse_ids_or_msg = self.get_selected_dataverse_ids()
+        if not success or dataverse_ids_or_msg is None:
+            return {}
+
+        return {'%s__in' % owner_param : dataverse_ids_or_msg}
+
     def get_running_total_base_date_filters(self, date_var_name=DVOBJECT_CREATEDATE_ATTR):
         """If we have a running total, get the start point filters"""
         filter_params = {}
@@ -347,3 +509,168 @@ class StatsMakerBase(object):
         that it has NOT been published
         """
         return query_helper.get_is_NOT_published_filter_param(dvobject_var_name)
+
+
+    # ----------------------------
+    #  Monthly counts with a running total
+    # ----------------------------
+    def get_running_total_start_point_q(self, date_var_name=DVOBJECT_CREATEDATE_ATTR, **extra_filters):
+        """
+        Q object matching records counted in the running total start point,
+        e.g. created before the start date.  Returns None if there are no
+        start point date filters
+        """
+        start_point_filters = self.get_running_total_base_date_filters(date_var_name)
+        if start_point_filters is None:
+            return None
+
+        if extra_filters:
+            for k, v in extra_filters.items():
+                start_point_filters[k] = v
+
+        return Q(**start_point_filters)
+
+
+    def get_counts_by_month_query(self, queryset, date_param, period_q, start_point_q=None, count_field='dvobject_id', **extra_aggregates):
+        """
+        GROUP BY month query.  Records matching "start_point_q" are grouped
+        into a single row with a null "yyyy_mm"
+        """
+        if start_point_q is None:
+            counts_by_month = queryset.filter(period_q)
+            yyyy_mm = TruncYearMonth('%s' % date_param)
+        else:
+            counts_by_month = queryset.filter(period_q | start_point_q)
+            yyyy_mm = models.Case(\
+                        models.When(period_q, then=TruncYearMonth('%s' % date_param)),
+                        default=models.Value(None),
+                        output_field=models.DateTimeField())
+
+        return counts_by_month.annotate(yyyy_mm=yyyy_mm\
+            ).values('yyyy_mm'\
+            ).annotate(count=models.Count(count_field), **extra_aggregates\
+            ).values('yyyy_mm', 'count', *extra_aggregates.keys()\
+            ).order_by()
+
+
+    def is_running_total_start_settled(self, cutoff):
+        """
+        Is everything in the running total start point older than the
+        snapshot cutoff?  e.g. there's no start date or it's before the cutoff
+        """
+        if self.start_date is not None:
+            start_boundary = self.start_date
+        elif self.selected_year:
+            start_boundary = datetime(int(self.selected_year), 1, 1)
+        else:
+            return True
+
+        return (start_boundary.year, start_boundary.month, start_boundary.day) <=\
+               (cutoff.year, cutoff.month, cutoff.day)
+
+
+    def get_counts_by_month_with_running_total(self, queryset, date_param, period_q, start_point_q=None, count_field='dvobject_id', snapshot_metric=None, **extra_aggregates):
+        """
+        Count records by month and compute the running total in the same query.
+
+        Records matching "start_point_q" (e.g. created before the start date)
+        are grouped into a single row with a null "yyyy_mm".  A window function
+        adds this start point to the monthly counts, in "time_sort" order.
+
+        With a "snapshot_metric", e.g. "datasets/count/monthly", closed months
+        are frozen and later read back.  See monthly_snapshot_util.
+
+        Returns: (list of dicts with "yyyy_mm", "count", "running_total" and
+                    any extra aggregates, running total start point, sql query)
+        """
+        counts_by_month = self.get_counts_by_month_query(queryset, date_param,\
+                            period_q, start_point_q, count_field, **extra_aggregates)
+        inner_sql, params = counts_by_month.query.sql_with_params()
+
+        # Closed months may be read from frozen snapshots
+        #
+        snapshot_util = None
+        if snapshot_metric is not None and is_monthly_snapshot_enabled():
+            snapshot_util = MonthlySnapshotUtil(snapshot_metric, repr((inner_sql, params)))
+            if not self.is_running_total_start_settled(snapshot_util.cutoff):
+                snapshot_util = None
+
+        if snapshot_util is not None:
+            snapshot_set = snapshot_util.get_snapshot_set()
+            if snapshot_set is not None:
+                return self.get_counts_by_month_via_snapshots(snapshot_util, snapshot_set,\
+                            queryset, date_param, period_q, count_field, **extra_aggregates)
+
+        # Wrap the GROUP BY query, adding the running total
+        #
+        sort_direction = 'DESC' if self.time_sort == '-' else 'ASC'
+        sql = ('SELECT monthly.*, SUM(monthly.count) OVER'
+               ' (ORDER BY monthly.yyyy_mm %(sort)s NULLS FIRST) AS running_total'
+               ' FROM (%(inner_sql)s) monthly'
+               ' ORDER BY monthly.yyyy_mm %(sort)s NULLS FIRST') %\
+                dict(sort=sort_direction, inner_sql=inner_sql)
+
+        cursor = connections[counts_by_month.db].cursor()
+        try:
+            cursor.execute(sql, params)
+            col_names = [col[0] for col in cursor.description]
+            rows = [dict(zip(col_names, row)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+        start_point = 0
+        month_counts = []
+        for row in rows:
+            row['running_total'] = int(row['running_total'])
+            for agg_name in extra_aggregates.keys():
+                # e.g. a Sum of integers arrives as a Decimal
+                if isinstance(row[agg_name], Decimal):
+                    row[agg_name] = int(row[agg_name])
+            if row['yyyy_mm'] is None:
+                start_point = row['count']
+            else:
+                month_counts.append(row)
+
+        if snapshot_util is not None:
+            snapshot_util.freeze(month_counts, extra_aggregates.keys(), start_point)
+
+        sql_query = sql % tuple(params)
+
+        return month_counts, start_point, sql_query
+
+
+    def get_counts_by_month_via_snapshots(self, snapshot_util, snapshot_set, queryset, date_param, period_q, count_field='dvobject_id', **extra_aggregates):
+        """
+        Read frozen months and query the months from "frozen_before" on.
+        The running total is added here, in "time_sort" order.
+
+        Returns: same as get_counts_by_month_with_running_total
+        """
+        frozen_before = datetime(snapshot_set.frozen_before.year,\
+                                 snapshot_set.frozen_before.month, 1)
+        live_q = period_q & Q(**{'%s__gte' % date_param : frozen_before})
+        live_counts = self.get_counts_by_month_query(queryset, date_param,\
+                            live_q, None, count_field, **extra_aggregates)
+
+        live_rows = list(live_counts)
+        for row in live_rows:
+            for agg_name in extra_aggregates.keys():
+                if isinstance(row[agg_name], Decimal):
+                    row[agg_name] = int(row[agg_name])
+
+        snapshot_util.freeze(live_rows, extra_aggregates.keys(), snapshot_set=snapshot_set)
+
+        month_counts = snapshot_util.get_frozen_rows(snapshot_set) + live_rows
+        month_counts.sort(key=lambda row: get_month_key(row['yyyy_mm']),\
+                          reverse=(self.time_sort == '-'))
+
+        start_point = snapshot_set.start_point_count
+        running_total = start_point
+        for row in month_counts:
+            running_total += row['count']
+            row['running_total'] = running_total
+
+        inner_sql, params = live_counts.query.sql_with_params()
+        sql_query = inner_sql % tuple(params)
+
+        return month_counts, start_point, sql_query
@@ -0,0 +1,205 @@
+"""
+Evaluate several metrics in one request, sharing the same params.
+
+Dates, the publication state and selected dataverse aliases are checked
+once.  The metrics queries are independent and run concurrently.
+
+Example:
+    /metrics/v1/batch?metrics=datasets/count,files/count/monthly&start_date=2016-01-01
+"""
+from collections import OrderedDict
+from functools import partial
+
+from dv_apps.metrics.stats_util_base import StatsMakerBase
+from dv_apps.metrics.stats_util_dataverses import StatsMakerDataverses
+from dv_apps.metrics.stats_util_datasets import StatsMakerDatasets
+from dv_apps.metrics.stats_util_files import StatsMakerFiles
+from dv_apps.metrics.stats_result import StatsResult
+from dv_apps.utils.thread_pool_helper import run_in_thread_pool,\
+    get_metrics_call_timeout
+
+PUB_STATE_PUBLISHED = 'published'
+PUB_STATE_UNPUBLISHED = 'unpublished'
+PUB_STATE_ALL = 'all'
+
+# Metric name (same as the API path) ->
+#   (StatsMaker class, { pub_state : method name })
+#
+BATCH_METRICS = OrderedDict([\
+    ('dataverses/count', (StatsMakerDataverses, {\
+            PUB_STATE_PUBLISHED : 'get_dataverse_count_published',
+            PUB_STATE_UNPUBLISHED : 'get_dataverse_count_unpublished',
+            PUB_STATE_ALL : 'get_dataverse_count'})),
+    ('dataverses/count/monthly', (StatsMakerDataverses, {\
+            PUB_STATE_PUBLISHED : 'get_dataverse_counts_by_month_published',
+            PUB_STATE_UNPUBLISHED : 'get_dataverse_counts_by_month_unpublished',
+            PUB_STATE_ALL : 'get_dataverse_counts_by_month'})),
+    ('dataverses/count/by-affiliation', (StatsMakerDataverses, {\
+            PUB_STATE_PUBLISHED : 'get_dataverse_affiliation_counts_published',
+            PUB_STATE_UNPUBLISHED : 'get_dataverse_affiliation_counts_unpublished',
+            PUB_STATE_ALL : 'get_dataverse_affiliation_counts'})),
+    ('dataverses/count/by-type', (StatsMakerDataverses, {\
+            PUB_STATE_PUBLISHED : 'get_dataverse_counts_by_type_published',
+            PUB_STATE_UNPUBLISHED : 'get_dataverse_counts_by_type_unpublished',
+            PUB_STATE_ALL : 'get_dataverse_counts_by_type'})),
+    ('datasets/count', (StatsMakerDatasets, {\
+            PUB_STATE_PUBLISHED : 'get_dataset_count_published',
+            PUB_STATE_UNPUBLISHED : 'get_dataset_count_unpublished',
+            PUB_STATE_ALL : 'get_dataset_count'})),
+    ('datasets/count/monthly', (StatsMakerDatasets, {\
+            PUB_STATE_PUBLISHED : 'get_dataset_counts_by_create_date_published',
+            PUB_STATE_UNPUBLISHED : 'get_dataset_counts_by_create_date_unpublished',
+            PUB_STATE_ALL : 'get_dataset_counts_by_create_date'})),
+    ('datasets/count/by-subject', (StatsMakerDatasets, {\
+            PUB_STATE_PUBLISHED : 'get_dataset_subject_counts_published',
+            PUB_STATE_UNPUBLISHED : 'get_dataset_subject_counts_unpublished',
+            PUB_STATE_ALL : 'get_dataset_subject_counts'})),
+    ('files/count', (StatsMakerFiles, {\
+            PUB_STATE_PUBLISHED : 'get_datafile_count_published',
+            PUB_STATE_UNPUBLISHED : 'get_datafile_count_unpublished',
+            PUB_STATE_ALL : 'get_datafile_count'})),
+    ('files/count/monthly', (StatsMakerFiles, {\
+            PUB_STATE_PUBLISHED : 'get_file_count_by_month_published',
+            PUB_STATE_UNPUBLISHED : 'get_file_count_by_month_unpublished',
+            PUB_STATE_ALL : 'get_file_count_by_month'})),
+    ('files/count/by-type', (StatsMakerFiles, {\
+            PUB_STATE_PUBLISHED : 'get_datafile_content_type_counts_published',
+            PUB_STATE_UNPUBLISHED : 'get_datafile_content_type_counts_unpublished',
+            PUB_STATE_ALL : 'get_datafile_content_type_counts'})),
+    ('files/downloads/count/monthly', (StatsMakerFiles, {\
+            PUB_STATE_PUBLISHED : 'get_file_downloads_by_month_published',
+            PUB_STATE_UNPUBLISHED : 'get_file_downloads_by_month_unpublished',
+            PUB_STATE_ALL : 'get_file_downloads_by_month'})),
+    ])
+
+# Metrics requiring a superuser API key
+#
+SUPERUSER_METRICS = ['files/downloads/count/monthly']
+
+# Limit the work done by one request
+#
+MAX_BATCH_METRICS = 20
+
+
+class StatsMakerBatch(StatsMakerBase):
+    """
+    Run several StatsMaker methods with one set of params
+    """
+    def __init__(self, **kwargs):
+        """
+        metrics = comma separated metric names.  e.g. "datasets/count,files/count"
+        pub_state = "published" (default), "unpublished" or "all"
+
+        Other params are passed to each StatsMaker
+        """
+        super(StatsMakerBatch, self).__init__(**kwargs)
+
+        self.stats_kwargs = kwargs
+
+        self.metric_names = []
+        self.pub_state = None
+        self.exclude_uncategorized = True
+        self.load_batch_params(**kwargs)
+
+    def load_batch_params(self, **kwargs):
+        """Check the metric names and publication state"""
+        if self.was_error_found():
+            return
+
+        metrics_str = kwargs.get('metrics', None)
+        if metrics_str is not None:
+            for name in metrics_str.split(','):
+                name = name.strip().strip('/')
+                if name and not name in self.metric_names:
+                    self.metric_names.append(name)
+
+        if len(self.metric_names) == 0:
+            self.add_error('Please specify one or more "metrics".'
+                ' Choices: %s' % ', '.join(BATCH_METRICS.keys()), 400)
+            return
+
+        if len(self.metric_names) > MAX_BATCH_METRICS:
+            self.add_error('A batch may not have more than %d metrics.'\
+                % MAX_BATCH_METRICS, 400)
+            return
+
+        unknown_names = [x for x in self.metric_names if not x in BATCH_METRICS]
+        if len(unknown_names) > 0:
+            self.add_error('Unknown metric(s): %s.  Choices: %s' %\
+                (', '.join(unknown_names), ', '.join(BATCH_METRICS.keys())), 400)
+            return
+
+        self.pub_state = kwargs.get('pub_state', PUB_STATE_PUBLISHED)
+        if not self.pub_state in (PUB_STATE_PUBLISHED, PUB_STATE_UNPUBLISHED, PUB_STATE_ALL):
+            self.add_error('The "pub_state" must be "%s", "%s" or "%s".' %\
+                (PUB_STATE_PUBLISHED, PUB_STATE_UNPUBLISHED, PUB_STATE_ALL), 400)
+            return
+
+        # For "dataverses/count/by-type"
+        if self.is_param_value_true(kwargs.get('show_uncategorized', False)):
+            self.exclude_uncategorized = False
+
+    def has_superuser_metrics(self):
+        """Are any of the requested metrics limited to superusers?"""
+        for name in self.metric_names:
+            if name in SUPERUSER_METRICS:
+                return True
+        return False
+
+    def get_stats_function(self, metric_name):
+        """
+        Return a function, without args, that returns the StatsResult.
+        Each metric gets its own StatsMaker so that errors aren't shared,
+        and its own query budget.
+        """
+        stats_maker_class, method_names = BATCH_METRICS[metric_name]
+
+        stats_maker = stats_maker_class(**self.stats_kwargs)
+        stats_maker.share_selected_dataverse_ids(self)
+
+        stats_function = getattr(stats_maker, method_names[self.pub_state])
+        if metric_name == 'dataverses/count/by-type':
+            stats_function = partial(stats_function, self.exclude_uncategorized)
+
+        return partial(StatsMakerBase.run_with_query_budget,\
+                       metric_name, stats_function, self.stats_kwargs)
+
+    def get_batch_results(self):
+        """
+        Run each metric and return a StatsResult with a dict of:
+            { metric name : { "status" : "OK", "data" : (result data) }, ... }
+        """
+        if self.was_error_found():
+            return self.get_error_msg_return()
+
+        # Look up the selected dataverse ids once, for all metrics
+        #
+        if self.selected_dvs is not None:
+            self.resolve_selected_dataverse_ids()
+
+        stats_functions = OrderedDict()
+        for name in self.metric_names:
+            stats_functions[name] = self.get_stats_function(name)
+
+        stats_results = run_in_thread_pool(stats_functions,\
+                            timeout=get_metrics_call_timeout())
+
+        data_dict = OrderedDict()
+        sql_queries = []
+        for name, stats_result in stats_results.items():
+            metric_dict = OrderedDict()
+            if stats_result is None:
+                metric_dict['status'] = 'ERROR'
+                metric_dict['message'] = 'This metric timed out.'
+            elif stats_result.has_error():
+                metric_dict['status'] = 'ERROR'
+                metric_dict['message'] = stats_result.error_message
+            else:
+                metric_dict['status'] = 'OK'
+                metric_dict['data'] = stats_result.get_result_data()
+                if stats_result.sql_query:
+                    sql_queries.append('-- %s\n%s' % (name, stats_result.sql_query))
+
+            data_dict[name] = metric_dict
+
+        return StatsResult.build_success_result(data_dict, '\n\n'.join(sql_queries))
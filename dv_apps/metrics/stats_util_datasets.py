@@ -11,24 +11,20 @@ from django.db.models import Q
 
 from django.utils.encoding import python_2_unicode_compatible
 
-from dv_apps.utils.date_helper import get_month_name_abbreviation,\
-    get_month_name,\
-    month_year_iterator,\
+from dv_apps.utils.date_helper import month_year_iterator,\
     TIMESTAMP_MASK
 
-from dv_apps.datasets.models import Dataset, DatasetVersion, DatasetLinkingDataverse
+from dv_apps.datasets.models import Dataset, DatasetLinkingDataverse
 from dv_apps.dataverses.models import Dataverse, DataverseLinkingDataverse
 
-from dv_apps.datasetfields.models import DatasetField,\
-    DatasetFieldValue, DatasetFieldType,\
-    DatasetFieldControlledVocabularyValue,\
-    ControlledVocabularyValue
-
-from dv_apps.metrics.stats_util_base import StatsMakerBase, TruncYearMonth
+from dv_apps.metrics.stats_util_base import StatsMakerBase
+from dv_apps.metrics.subject_count_util import get_subject_counts,\
+    get_subject_field_type_id, SUBJECT_FIELD_TYPE_ATTRS
 from dv_apps.dvobjects.models import DvObject\
     , DTYPE_DATASET, DTYPE_DATAVERSE\
     , DVOBJECT_CREATEDATE_ATTR
 from dv_apps.metrics.stats_result import StatsResult
+from dv_apps.metrics.month_columns import MonthColumns
 
 
 class StatsMakerDatasets(StatsMakerBase):
@@ -129,20 +125,6 @@ class StatsMakerDatasets(StatsMakerBase):
         return self.get_dataset_count_by_month(date_param='dvobject__modificationtime')
 
 
-    def get_dataset_count_start_point(self, **extra_filters):
-        """Get the startpoint when keeping a running total of file downloads"""
-
-        start_point_filters = self.get_running_total_base_date_filters()
-        if start_point_filters is None:
-            return 0
-
-        if extra_filters:
-            for k, v in extra_filters.items():
-                start_point_filters[k] = v
-
-        return Dataset.objects.select_related('dvobject').filter(**start_point_filters).count()
-
-
     def get_dataset_count_by_month(self, date_param=DVOBJECT_CREATEDATE_ATTR, **extra_filters):
         """
         Return dataset counts by month
@@ -174,66 +156,27 @@ class StatsMakerDatasets(StatsMakerBase):
                 filter_params[k] = v
 
         # -----------------------------------
-        # (2) Construct query
+        # (2) Run query
+        #   - counts by month and running total in a single query
         # -----------------------------------
-
-        # add exclude filters date filters
-        #
-        ds_counts_by_month = Dataset.objects.select_related('dvobject'\
-                            ).exclude(**exclude_params\
-                            ).filter(**filter_params)
-
-        # annotate query adding "month_year" and "cnt"
-        #
-        ds_counts_by_month = ds_counts_by_month.annotate(\
-            yyyy_mm=TruncYearMonth('%s' % date_param)\
-            ).values('yyyy_mm'\
-            ).annotate(count=models.Count('dvobject_id')\
-            ).values('yyyy_mm', 'count'\
-            ).order_by('%syyyy_mm' % self.time_sort)
-
-        # store query string
-        sql_query = str(ds_counts_by_month.query)
+        ds_counts_by_month, running_total, sql_query =\
+            self.get_counts_by_month_with_running_total(\
+                    Dataset.objects.select_related('dvobject'),
+                    date_param,
+                    Q(**filter_params) & ~Q(**exclude_params),
+                    self.get_running_total_start_point_q(**extra_filters),
+                    snapshot_metric='datasets/count/monthly')
 
         # -----------------------------------
         # (3) Format results
         # -----------------------------------
-        # hold the running total count
-        running_total = self.get_dataset_count_start_point(**extra_filters)
-        formatted_records = []  # move from a queryset to a []
-
-        for d in ds_counts_by_month:
-            fmt_dict = OrderedDict()
-            fmt_dict['yyyy_mm'] = d['yyyy_mm'].strftime('%Y-%m')
-            fmt_dict['count'] = d['count']
-
-            # running total
-            running_total += d['count']
-            fmt_dict['running_total'] = running_total
-            # d['month_year'] = d['yyyy_mm'].strftime('%Y-%m')
-
-            # Add year and month numbers
-            fmt_dict['year_num'] = d['yyyy_mm'].year
-            fmt_dict['month_num'] = d['yyyy_mm'].month
-
-            # Add month name
-            month_name_found, month_name_short = get_month_name_abbreviation(d['yyyy_mm'].month)
-
-            if month_name_found:
-                assume_month_name_found, fmt_dict['month_name'] = get_month_name(d['yyyy_mm'].month)
-                fmt_dict['month_name_short'] = month_name_short
-            else:
-                # Log it!!!!!!
-                pass
-
-            # Add formatted record
-            formatted_records.append(fmt_dict)
+        month_columns = MonthColumns(ds_counts_by_month)
 
         data_dict = OrderedDict()
-        data_dict['record_count'] = len(formatted_records)
-        data_dict['records'] = formatted_records
+        data_dict['record_count'] = len(month_columns)
 
-        return StatsResult.build_success_result(data_dict, sql_query)
+        return StatsResult.build_success_result(data_dict, sql_query,\
+                        record_columns=month_columns.columns)
 
 
     def get_dataset_subject_counts_published(self):
@@ -358,81 +301,36 @@ class StatsMakerDatasets(StatsMakerBase):
 
         # -----------------------------
         # Get the DatasetFieldType for subject
+        #   - the id is cached
         # -----------------------------
-        search_attrs = dict(name='subject',\
-                            required=True,\
-                            metadatablock__name='citation')
-        try:
-            ds_field_type = DatasetFieldType.objects.get(**search_attrs)
-        except DatasetFieldType.DoesNotExist:
-            return False, 'DatasetFieldType for Citation title not found.  (kwargs: %s)' % search_attrs
-
-        # -----------------------------
-        # Retrieve Dataset ids by time and published/unpublished
-        # -----------------------------
-        dataset_ids = Dataset.objects.select_related('dvobject'\
-                        ).filter(**filter_params\
-                        ).values_list('dvobject__id', flat=True)
-
-
-
-        # -----------------------------
-        # Get latest DatasetVersion ids
-        # -----------------------------
-        id_info_list = DatasetVersion.objects.filter(\
-            dataset__in=dataset_ids\
-            ).values('id', 'dataset_id', 'versionnumber', 'minorversionnumber'\
-            ).order_by('dataset_id', '-id', '-versionnumber', '-minorversionnumber')
+        ds_field_type_id = get_subject_field_type_id()
+        if ds_field_type_id is None:
+            return StatsResult.build_error_result(\
+                'DatasetFieldType for Citation subject not found.  (kwargs: %s)' % SUBJECT_FIELD_TYPE_ATTRS)
 
         # -----------------------------
-        # Iterate through and get the DatasetVersion id
-        #        of the latest version
+        # Count the ControlledVocabularyValues of the
+        #   latest DatasetVersions in one query
         # -----------------------------
-        dsv_ids = []
-        last_dataset_id = None
-        for idx, info in enumerate(id_info_list):
-            if idx == 0 or info['dataset_id'] != last_dataset_id:
-                dsv_ids.append(info['id'])
-
-            last_dataset_id = info['dataset_id']
-
-        # -----------------------------
-        # Get the DatasetField ids
-        # -----------------------------
-        search_attrs2 = dict(datasetversion__id__in=dsv_ids,\
-                        datasetfieldtype__id=ds_field_type.id)
-        ds_field_ids = DatasetField.objects.select_related('datasetfieldtype').filter(**search_attrs2).values_list('id', flat=True)
-
-        # -----------------------------
-        # Finally, get the ControlledVocabularyValues
-        # -----------------------------
-        ds_values = DatasetFieldControlledVocabularyValue.objects.select_related('controlledvocabularyvalues'\
-            ).filter(datasetfield__in=ds_field_ids\
-            ).annotate(subject=F('controlledvocabularyvalues__strvalue')
-            ).values('subject'\
-            ).annotate(cnt=models.Count('controlledvocabularyvalues__id')\
-            ).values('subject', 'cnt'\
-            ).order_by('-cnt')
-
+        subject_info = get_subject_counts(ds_field_type_id, **filter_params)
 
         # -----------------------------
         # Iterate through the vocab values,
         # process the totals, calculate percentage
         # -----------------------------
-        running_total = 0
-        formatted_records = []  # move from a queryset to a []
-        total_count = sum([rec['cnt'] for rec in ds_values]) + 0.00
+        formatted_records = []
+        total_count = subject_info['total_count'] + 0.00
 
-        for info in ds_values:
+        for subject, cnt in subject_info['subject_counts']:
             rec = OrderedDict()
-            rec['subject'] = info['subject']
+            rec['subject'] = subject
 
             # count
-            rec['count'] = info['cnt']
+            rec['count'] = cnt
             rec['total_count'] = int(total_count)
 
             # percent
-            float_percent = info['cnt'] / total_count
+            float_percent = cnt / total_count
             rec['percent_string'] = '{0:.1%}'.format(float_percent)
             rec['percent_number'] = float("%.3f" %(float_percent))
 
@@ -444,7 +342,7 @@ class StatsMakerDatasets(StatsMakerBase):
         data_dict['record_count'] = len(formatted_records)
         data_dict['records'] = formatted_records
 
-        return StatsResult.build_success_result(data_dict)
+        return StatsResult.build_success_result(data_dict, subject_info['sql_query'])
 
 
 
@@ -5,12 +5,12 @@ This may be used for APIs, views with visualizations, etc.
 from collections import OrderedDict
 
 from django.db import models
+from django.db.models import Q
 
-from dv_apps.utils.date_helper import get_month_name_abbreviation,\
-    get_month_name
 from dv_apps.dataverses.models import Dataverse, DATAVERSE_TYPE_UNCATEGORIZED
-from dv_apps.metrics.stats_util_base import StatsMakerBase, TruncYearMonth
+from dv_apps.metrics.stats_util_base import StatsMakerBase
 from dv_apps.metrics.stats_result import StatsResult
+from dv_apps.metrics.month_columns import MonthColumns
 from dv_apps.dvobjects.models import DVOBJECT_CREATEDATE_ATTR
 from dv_apps.harvesting.models import HarvestingDataverseConfig
 
@@ -94,23 +94,6 @@ class StatsMakerDataverses(StatsMakerBase):
         return self.get_dataverse_counts_by_month(**self.get_is_published_filter_param())
 
 
-    def get_dataverse_count_start_point(self, **extra_filters):
-        """Get the startpoint when keeping a running total of file downloads"""
-
-        start_point_filters = self.get_running_total_base_date_filters()
-        if start_point_filters is None:
-            return 0
-
-        if extra_filters:
-            for k, v in extra_filters.items():
-                start_point_filters[k] = v
-
-        exclude_params = {}
-        if self.include_harvested:
-            exclude_params['dvobject__id__in'] = self.get_harvested_dataverse_ids()
-
-        return Dataverse.objects.select_related('dvobject').filter(**start_point_filters).exclude(**exclude_params).count()
-
     def get_harvested_dataverse_ids(self):
         """Return the ids of harvested Dataverses"""
 
@@ -147,72 +130,38 @@ class StatsMakerDataverses(StatsMakerBase):
             for k, v in extra_filters.items():
                 filter_params[k] = v
 
-        # -----------------------------------
-        # (2) Construct query
-        # -----------------------------------
-
-        # add exclude filters date filters
+        # Running total start point filters
         #
-        dv_counts_by_month = Dataverse.objects.select_related('dvobject'\
-                            ).exclude(**exclude_params\
-                            ).filter(**filter_params)
-
-        # annotate query adding "month_year" and "count"
-        #
-        dv_counts_by_month = dv_counts_by_month.annotate(\
-            yyyy_mm=TruncYearMonth('%s' % date_param)\
-            ).values('yyyy_mm'\
-            ).annotate(count=models.Count('dvobject_id')\
-            ).values('yyyy_mm', 'count'\
-            ).order_by('%syyyy_mm' % self.time_sort)
-
+        start_point_q = self.get_running_total_start_point_q(**extra_filters)
+        if start_point_q is not None and self.include_harvested:
+            start_point_q &= ~Q(dvobject__id__in=self.get_harvested_dataverse_ids())
 
         # -----------------------------------
-        # (2a) Get SQL query string
+        # (2) Run query
+        #   - counts by month and running total in a single query
         # -----------------------------------
-        sql_query = str(dv_counts_by_month.query)
+        dv_counts_by_month, running_total, sql_query =\
+            self.get_counts_by_month_with_running_total(\
+                    Dataverse.objects.select_related('dvobject'),
+                    date_param,
+                    Q(**filter_params) & ~Q(**exclude_params),
+                    start_point_q,
+                    snapshot_metric='dataverses/count/monthly')
 
         # -----------------------------------
         # (3) Format results
         # -----------------------------------
-        # hold the running total count
-        running_total = self.get_dataverse_count_start_point(**extra_filters)
-        formatted_records = []  # move from a queryset to a []
-
-        for d in dv_counts_by_month:
-            rec_fmt = OrderedDict()
-
-            # change the datetime object to a string
-            rec_fmt['yyyy_mm'] = d['yyyy_mm'].strftime('%Y-%m')
-            rec_fmt['count'] = d['count']
-
-            # running total
-            running_total += d['count']
-            rec_fmt['running_total'] = running_total
-            # d['month_year'] = d['yyyy_mm'].strftime('%Y-%m')
-
-            # Add year and month numbers
-            rec_fmt['year_num'] = d['yyyy_mm'].year
-            rec_fmt['month_num'] = d['yyyy_mm'].month
-
-            # Add month name
-            month_name_found, month_name_short = get_month_name_abbreviation(d['yyyy_mm'].month)
-            if month_name_found:
-                assume_month_name_found, rec_fmt['month_name'] = get_month_name(d['yyyy_mm'].month)
-                rec_fmt['month_name_short'] = month_name_short
-            else:
-                # Log it!!!!!!
-                pass
+        month_columns = MonthColumns(dv_counts_by_month)
 
-            # Add formatted record
-            formatted_records.append(rec_fmt)
+        # total count: the start point plus all monthly counts
+        running_total += sum([d['count'] for d in dv_counts_by_month])
 
         data_dict = OrderedDict()
-        data_dict['record_count'] = len(formatted_records)
+        data_dict['record_count'] = len(month_columns)
         data_dict['total_count'] = running_total
-        data_dict['records'] = formatted_records
 
-        return StatsResult.build_success_result(data_dict, sql_query)
+        return StatsResult.build_success_result(data_dict, sql_query,\
+                        record_columns=month_columns.columns)
 
 
     def get_dataverse_counts_by_type_published(self, exclude_uncategorized=True):
@@ -2,19 +2,20 @@
 Create metrics for Datasets.
 This may be used for APIs, views with visualizations, etc.
 """
-from os.path import splitext
 from collections import OrderedDict
 
 from django.db import models
-from django.db.models import Sum
+from django.db.models import Sum, Q
 
-from dv_apps.utils.date_helper import get_month_name_abbreviation,\
-    get_month_name
 from dv_apps.dvobjects.models import DvObject, DTYPE_DATAFILE
 from dv_apps.datafiles.models import Datafile, FileMetadata
 from dv_apps.guestbook.models import GuestBookResponse, RESPONSE_TYPE_DOWNLOAD
 from dv_apps.metrics.stats_util_base import StatsMakerBase, TruncYearMonth
 from dv_apps.metrics.stats_result import StatsResult
+from dv_apps.metrics.month_columns import MonthColumns
+from dv_apps.metrics.download_rollup import DownloadRollupUtil
+from dv_apps.metrics.file_extension_util import get_extension_counts
+from dv_apps.metrics.file_extension_index import FileExtensionIndexUtil
 from dv_apps.dvobjects.models import DVOBJECT_CREATEDATE_ATTR
 
 from dv_apps.utils.byte_size import sizeof_fmt, comma_sep_number
@@ -37,17 +38,7 @@ class StatsMakerFiles(StatsMakerBase):
     def get_dataverse_params_for_guestbook(self):
         """Allow narrowing of file download stats to specific Dataverses"""
 
-        success, dataverse_ids_or_msg = self.get_selected_dataverse_ids()
-        if not success:
-            self.add_error(dataverse_ids_or_msg)
-            return {}
-
-        if dataverse_ids_or_msg is None or len(dataverse_ids_or_msg)==0:
-            return {}
-
-        dv_params = {}
-        dv_params['dataset__owner__in'] = dataverse_ids_or_msg
-        return dv_params
+        return self.get_selected_dataverse_filter_params('dataset__owner')
 
     # ----------------------------
     #  Datafile counts - single number
@@ -130,13 +121,40 @@ class StatsMakerFiles(StatsMakerBase):
 
         sql_query = str(q.query)
 
+        # Closed months may be read from the rollup table
+        download_count = self.get_total_file_downloads_via_rollup(\
+                                filter_params, count_pre_dv4_downloads)
+        if download_count is None:
+            download_count = q.count()
+
         data_dict = OrderedDict()
-        data_dict['count'] = q.count()
+        data_dict['count'] = download_count
         data_dict['count_string'] = "{:,}".format(data_dict['count'])
 
         return StatsResult.build_success_result(data_dict, sql_query)
 
 
+    def get_total_file_downloads_via_rollup(self, filter_params, count_pre_dv4_downloads=False):
+        """
+        Count closed months from the DownloadMonthRollup table and
+        the open month(s) live.  Returns None if the rollup can't be used.
+        """
+        rollup_util = DownloadRollupUtil()
+        cutoff = rollup_util.get_cutoff_for_filters(filter_params,\
+                                    rollup_util.get_live_cutoff())
+        rollup_filters = rollup_util.get_rollup_filters(filter_params, cutoff)
+        if rollup_filters is None:
+            return None
+
+        rollup_count = rollup_util.get_total_count(rollup_filters,\
+                                include_undated=count_pre_dv4_downloads)
+
+        live_count = GuestBookResponse.objects.filter(**filter_params\
+                        ).filter(responsetime__gte=cutoff\
+                        ).count()
+
+        return rollup_count + live_count
+
     """
 exit()
 python manage.py shell
@@ -166,42 +184,6 @@ print stats_files.get_total_file_downloads().result_data
         return self.get_file_downloads_by_month(**params)
 
 
-    def get_file_download_start_point(self, **extra_filters):
-        """Get the startpoint when keeping a running total of file downloads"""
-
-        start_point_filters = self.get_running_total_base_date_filters(date_var_name='responsetime')
-        if start_point_filters is None:
-            return 0
-
-        start_point_filters.update(self.get_download_type_filter())
-
-        # Narrow down to specific Dataverses
-        start_point_filters.update(self.get_dataverse_params_for_guestbook())
-
-        if extra_filters:
-            for k, v in extra_filters.items():
-                start_point_filters[k] = v
-
-        q = GuestBookResponse.objects.filter(**start_point_filters)
-        sql_query = str(q.query)
-
-        return q.count()
-
-    def get_file_download_start_point_include_undated(self, **extra_filters):
-        """
-        This start point also includes pre-4.0 GuestBookResponse objects
-        which have a null responsetime
-        """
-
-        initial_count = self.get_file_download_start_point(**extra_filters)
-
-        pre_dv4_count = GuestBookResponse.objects.filter(\
-                            responsetime__isnull=True).count()
-
-        print 'pre_dv4_count', pre_dv4_count
-        return initial_count + pre_dv4_count
-
-
     def get_download_type_filter(self):
         return {}
         #return dict(downloadtype=RESPONSE_TYPE_DOWNLOAD)
@@ -239,7 +221,33 @@ print stats_files.get_total_file_downloads().result_data
                 else:
                     filter_params[k] = v
 
-        file_counts_by_month = GuestBookResponse.objects.exclude(\
+        # Closed months may be read from the rollup table
+        #
+        rollup_info = self.get_file_downloads_by_month_via_rollup(\
+                            filter_params, count_pre_dv4_downloads)
+
+        if rollup_info is not None:
+            file_counts_by_month, file_running_total, sql_query = rollup_info
+        else:
+            file_counts_by_month, file_running_total, sql_query =\
+                self.get_file_downloads_by_month_with_running_total(\
+                        filter_params, count_pre_dv4_downloads)
+
+        month_columns, file_running_total = self.format_download_month_records(\
+                                    file_counts_by_month, file_running_total)
+
+        data_dict = OrderedDict()
+        data_dict['total_downloads'] = file_running_total
+        data_dict['record_count'] = len(month_columns)
+
+        return StatsResult.build_success_result(data_dict, sql_query,\
+                        record_columns=month_columns.columns)
+
+
+    def get_file_downloads_by_month_query(self, filter_params):
+        """Monthly GuestBookResponse counts, run against the Dataverse db"""
+
+        return GuestBookResponse.objects.exclude(\
             responsetime__isnull=True\
             ).filter(**filter_params\
             ).annotate(yyyy_mm=TruncYearMonth('responsetime')\
@@ -248,51 +256,105 @@ print stats_files.get_total_file_downloads().result_data
             ).values('yyyy_mm', 'count'\
             ).order_by('%syyyy_mm' % self.time_sort)
 
-        #print 'file_counts_by_month.query', file_counts_by_month.query
-        sql_query = str(file_counts_by_month.query)
 
-        formatted_records = []  # move from a queryset to a []
+    def get_file_downloads_by_month_with_running_total(self, filter_params, count_pre_dv4_downloads=False):
+        """
+        Monthly GuestBookResponse counts and the running total start point
+        from a single query against the Dataverse db
 
+        Returns: (list of monthly counts, running total start point, sql query)
+        """
+        # Start point: same filters, but before the start date/selected year
+        #
+        start_point_q = None
+        start_point_filters = self.get_running_total_base_date_filters(date_var_name='responsetime')
+        if start_point_filters is not None:
+            for k, v in filter_params.items():
+                if not k.startswith('responsetime'):
+                    start_point_filters[k] = v
+            start_point_q = Q(**start_point_filters)
+
+        # Pre-4.0 GuestBookResponse objects have a null responsetime
+        #
         if count_pre_dv4_downloads:
-            file_running_total = self.get_file_download_start_point_include_undated(**extra_filters)
-        else:
-            file_running_total = self.get_file_download_start_point(**extra_filters)
+            pre_dv4_q = Q(responsetime__isnull=True)
+            if start_point_q is None:
+                start_point_q = pre_dv4_q
+            else:
+                start_point_q |= pre_dv4_q
 
+        return self.get_counts_by_month_with_running_total(\
+                    GuestBookResponse.objects.all(),
+                    'responsetime',
+                    Q(**filter_params) & ~Q(responsetime__isnull=True),
+                    start_point_q,
+                    count_field='id',
+                    snapshot_metric='files/downloads/count/monthly')
 
-        for d in file_counts_by_month:
-            fmt_rec = OrderedDict()
-            fmt_rec['yyyy_mm'] = d['yyyy_mm'].strftime('%Y-%m')
-            fmt_rec['count'] = d['count']
 
-            file_running_total += d['count']
-            fmt_rec['running_total'] = file_running_total
+    def get_file_downloads_by_month_via_rollup(self, filter_params, count_pre_dv4_downloads=False):
+        """
+        Read closed months from the DownloadMonthRollup table and query
+        the open month(s) live.  Returns None if the rollup can't be used.
+
+        Returns: (list of monthly counts, running total start point, sql query)
+        """
+        rollup_util = DownloadRollupUtil()
+        cutoff = rollup_util.get_cutoff_for_filters(filter_params,\
+                                    rollup_util.get_live_cutoff())
+        rollup_filters = rollup_util.get_rollup_filters(filter_params, cutoff)
+        if rollup_filters is None:
+            return None
+
+        # Running total start point, also from the rollup
+        #
+        running_total = 0
+        start_point_filters = self.get_running_total_base_date_filters(date_var_name='responsetime')
+        if start_point_filters is not None:
+            for k, v in filter_params.items():
+                if not k.startswith('responsetime'):
+                    start_point_filters[k] = v
 
-            # d['month_year'] = d['yyyy_mm'].strftime('%Y-%m')
+            start_point_rollup_filters = rollup_util.get_rollup_filters(\
+                                            start_point_filters, cutoff)
+            if start_point_rollup_filters is None:
+                return None
+            running_total = rollup_util.get_total_count(start_point_rollup_filters)
 
-            # Add year and month numbers
-            fmt_rec['year_num'] = d['yyyy_mm'].year
-            fmt_rec['month_num'] = d['yyyy_mm'].month
+        if count_pre_dv4_downloads:
+            running_total += rollup_util.get_undated_count()
 
-            # Add month name
-            month_name_found, month_name_short = get_month_name_abbreviation( d['yyyy_mm'].month)
-            if month_name_found:
-                assume_month_name_found, fmt_rec['month_name'] = get_month_name(d['yyyy_mm'].month)
-                fmt_rec['month_name_short'] = month_name_short
-            else:
-                # Log it!!!!!!
-                pass
+        # Open month(s): live query
+        #
+        live_filters = dict(filter_params)
+        live_filters['responsetime__gte'] = cutoff
+        live_counts = self.get_file_downloads_by_month_query(live_filters\
+                            ).order_by('yyyy_mm')
+        sql_query = str(live_counts.query)
 
-            formatted_records.append(fmt_rec)
+        # Rollup months are all before the cutoff
+        #
+        month_counts = rollup_util.get_monthly_counts(rollup_filters) + list(live_counts)
+        if self.time_sort == '-':
+            month_counts.reverse()
 
-        data_dict = OrderedDict()
-        data_dict['total_downloads'] = file_running_total
-        data_dict['record_count'] = len(formatted_records)
-        data_dict['records'] = formatted_records
+        return month_counts, running_total, sql_query
 
-        return StatsResult.build_success_result(data_dict, sql_query)
 
+    def format_download_month_records(self, file_counts_by_month, file_running_total=0):
+        """
+        Format monthly download counts, adding a running total and month names
+
+        Returns: (MonthColumns, final running total)
+        """
+        running_totals = []
+        for d in file_counts_by_month:
+            file_running_total += d['count']
+            running_totals.append(file_running_total)
 
-        #return True, formatted_records
+        month_columns = MonthColumns(file_counts_by_month, running_totals=running_totals)
+
+        return month_columns, file_running_total
 
 
     # ----------------------------
@@ -314,20 +376,6 @@ print stats_files.get_total_file_downloads().result_data
         #return self.get_file_downloads_by_month(**self.get_is_NOT_published_filter_param())
 
 
-    def get_file_count_start_point(self, **extra_filters):
-        """Get the startpoint when keeping a running total of file downloads"""
-
-        start_point_filters = self.get_running_total_base_date_filters()
-        if start_point_filters is None:
-            return 0
-
-        if extra_filters:
-            for k, v in extra_filters.items():
-                start_point_filters[k] = v
-
-        return Datafile.objects.select_related('dvobject').filter(**start_point_filters).count()
-
-
     def get_file_count_by_month(self, date_param=DVOBJECT_CREATEDATE_ATTR, **extra_filters):
         """
         File counts by month
@@ -359,72 +407,36 @@ print stats_files.get_total_file_downloads().result_data
                 filter_params[k] = v
 
         # -----------------------------------
-        # (2) Construct query
+        # (2) Run query
+        #   - counts by month and running total in a single query
         # -----------------------------------
-
-        # add exclude filters date filters
-        #
-        file_counts_by_month = Datafile.objects.select_related('dvobject'\
-                            ).exclude(**exclude_params\
-                            ).filter(**filter_params)
-
-        # annotate query adding "month_year" and "cnt"
-        #
-        file_counts_by_month = file_counts_by_month.annotate(\
-            yyyy_mm=TruncYearMonth('%s' % date_param)\
-            ).values('yyyy_mm'\
-            ).annotate(count=models.Count('dvobject_id')\
-            ).annotate(bytes=models.Sum('filesize')\
-            ).values('yyyy_mm', 'count', 'bytes'\
-            ).order_by('%syyyy_mm' % self.time_sort)
-
-        sql_query = str(file_counts_by_month.query)
+        file_counts_by_month, running_total, sql_query =\
+            self.get_counts_by_month_with_running_total(\
+                    Datafile.objects.select_related('dvobject'),
+                    date_param,
+                    Q(**filter_params) & ~Q(**exclude_params),
+                    self.get_running_total_start_point_q(**extra_filters),
+                    snapshot_metric='files/count/monthly',
+                    bytes=models.Sum('filesize'))
 
         # -----------------------------------
         # (3) Format results
         # -----------------------------------
-        running_total = self.get_file_count_start_point(**extra_filters)   # hold the running total count
-        total_bytes = 0
-        formatted_records = []  # move from a queryset to a []
-
-        for d in file_counts_by_month:
-            fmt_rec = OrderedDict()
-
-            fmt_rec['yyyy_mm'] = d['yyyy_mm'].strftime('%Y-%m')
-            fmt_rec['count'] = d['count']
-            fmt_rec['bytes'] = d['bytes']
-            fmt_rec['bytes_str'] = comma_sep_number(d['bytes'])
-
-            total_bytes += d['bytes']
-            # running total
-            running_total += d['count']
-            fmt_rec['running_total'] = running_total
-
-            # d['month_year'] = d['yyyy_mm'].strftime('%Y-%m')
-
-            # Add year and month numbers
-            fmt_rec['year_num'] = d['yyyy_mm'].year
-            fmt_rec['month_num'] = d['yyyy_mm'].month
+        bytes_column = [d['bytes'] for d in file_counts_by_month]
+        total_bytes = sum(bytes_column)
 
-            # Add month name
-            month_name_found, month_name_short = get_month_name_abbreviation(d['yyyy_mm'].month)
-            if month_name_found:
-                assume_month_name_found, fmt_rec['month_name'] = get_month_name(d['yyyy_mm'].month)
-                fmt_rec['month_name_short'] = month_name_short
-            else:
-                # Log it!!!!!!
-                pass
-
-            # Add formatted record
-            formatted_records.append(fmt_rec)
+        month_columns = MonthColumns(file_counts_by_month,\
+                            extra_columns=OrderedDict([\
+                                ('bytes', bytes_column),
+                                ('bytes_str', [comma_sep_number(x) for x in bytes_column])]))
 
         data_dict = OrderedDict()
-        data_dict['record_count'] = len(formatted_records)
-        data_dict['records'] = formatted_records
+        data_dict['record_count'] = len(month_columns)
         data_dict['total_bytes'] = total_bytes
         data_dict['total_bytes_str'] = comma_sep_number(total_bytes)
 
-        return StatsResult.build_success_result(data_dict, sql_query)
+        return StatsResult.build_success_result(data_dict, sql_query,\
+                        record_columns=month_columns.columns)
 
 
         #return True, formatted_records
@@ -564,53 +576,53 @@ print stats_files.get_total_file_downloads().result_data
         # Bin this data
 
 
-    def view_file_extensions_within_type(self, file_type=None):
-        """View extensions for files based on their "Filemetadata.contenttype" value"""
-
-        #file_type = 'data/various-formats'
-
-        if file_type is None:
-            # Retrieve list of **all** file names -- this could be too much!
-            l = FileMetadata.objects.distinct('datafile__id', 'label'\
-                    ).values_list('datafile__id', 'label')
-        else:
-            # Retrieve ids of Datafile filtered by "contenttype"
-            ids = Datafile.objects.filter(contenttype=file_type).values_list('dvobject__id', flat=True)
-
-            # Retrieve the names of these Datafiles via the FileMetadata object
-            l = FileMetadata.objects.filter(datafile__in=ids\
-                    ).distinct('datafile__id', 'label'\
-                    ).values_list('datafile__id', 'label')
-
-        # Convert the file names to file extensions
-        ext_list = [splitext(info[1])[-1] for info in l]
+    def view_file_extensions_within_type(self, file_type=None, max_extensions=None, use_extension_index=False):
+        """
+        View extensions for files based on their "Filemetadata.contenttype" value.
+        Extensions are counted in the database.
 
-        # Make a dict counting the extensions
-        extension_counts = {}   # {file extension : count, file ext : count, etc}
-        for ext in ext_list:
-            extension_counts[ext] = extension_counts.get(ext, 0) + 1
+        max_extensions - optional, only return the top extensions
+        use_extension_index - count the labels from the DatafileExtension
+            table, if it has been built.  Same counts as the live query,
+            as of the last "refresh_extension_index"
+        """
+        ext_info = None
+        if use_extension_index:
+            index_util = FileExtensionIndexUtil()
+            if index_util.is_index_available():
+                ext_info = index_util.get_extension_counts(file_type,\
+                                                max_extensions=max_extensions)
+
+        if ext_info is None:
+            if file_type is None:
+                # All file names
+                filemetadata_qs = FileMetadata.objects.all()
+            else:
+                # File names of Datafiles filtered by "contenttype"
+                filemetadata_qs = FileMetadata.objects.filter(\
+                                        datafile__datafile__contenttype=file_type)
 
-        # Sort the counts in descending order--highest count first
-        ext_pairs = extension_counts.items()
-        ext_pairs = sorted(ext_pairs, key=lambda k: k[1], reverse=True)
+            ext_info = get_extension_counts(filemetadata_qs,\
+                                            max_extensions=max_extensions)
 
+        # The counts are in descending order--highest count first
         ext_list = []
-        total_count = sum(x[1] for x in ext_pairs) + 0.000
-        for ext_pair in ext_pairs:
-            d = OrderedDict(extension=ext_pair[0])
-            d['count'] = ext_pair[1]
+        total_count = ext_info['total_count'] + 0.000
+        for ext, cnt in ext_info['extension_counts']:
+            d = OrderedDict(extension=ext)
+            d['count'] = cnt
             d['total_count'] = int(total_count)
-            d['percent_string'] = '{0:.3%}'.format(ext_pair[1] / total_count)
+            d['percent_string'] = '{0:.3%}'.format(cnt / total_count)
             ext_list.append(d)
 
-        data_dict = OrderedDict(number_unique_extensions=len(ext_pairs))
+        data_dict = OrderedDict(number_unique_extensions=ext_info['number_unique_extensions'])
         data_dict['total_file_count'] = int(total_count)
         data_dict['record_count'] = len(ext_list)
         data_dict['records'] = ext_list
         data_dict['all_dv_files'] = Datafile.objects.all().count()
         data_dict['percent_unknown'] = '{0:.3%}'.format(total_count/data_dict['all_dv_files'])
 
-        return StatsResult.build_success_result(data_dict)
+        return StatsResult.build_success_result(data_dict, ext_info['sql_query'])
 
         #return JsonResponse(d)
 """
@@ -1,25 +1,53 @@
 import json
 import csv
+import tempfile
+import time
 from collections import OrderedDict
 from datetime import datetime
 from StringIO import StringIO
+from wsgiref.util import FileWrapper
 #import pandas as pd
 
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse,\
+    HttpResponseNotModified
 from django.template.loader import render_to_string
 
 from django.views.generic import View
 
-# Apply API Key and page caching to API endpoints
+# Apply API Key to API endpoints.  (Results are cached in "get")
 #
-from django.views.decorators.cache import cache_page
 from django.utils.decorators import method_decorator
 from dv_apps.dataverse_auth.decorator import apikey_required
 from dv_apps.utils.metrics_cache_time import get_metrics_api_cache_time
 from dv_apps.utils.date_helper import get_timestamp_for_filename
 
 from dv_apps.metrics.stats_util_base import StatsMakerBase
+from dv_apps.metrics.stats_result_cache import get_stats_result_cache_key,\
+    get_cached_stats_result, set_cached_stats_result
+from dv_apps.metrics.stats_timing import StatsTiming, is_timing_requested,\
+    CACHE_HIT, CACHE_MISS
+from dv_apps.metrics.stats_etag import DataWatermark, WATERMARK_DVOBJECTS,\
+    is_etag_enabled, is_not_modified, add_etag_headers
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# "?format=columnar": the records as one list per column
+FORMAT_PARAM_NAME = 'format'
+FORMAT_COLUMNAR = 'columnar'
+
+
+def get_columnar_data(stats_result):
+    """
+    The result data with "columns" instead of "records":
+        { column name : list of values }
+    """
+    data = OrderedDict()
+    for key, value in stats_result.result_data.items():
+        if key != 'records':
+            data[key] = value
+    data['columns'] = stats_result.get_record_columns()
+    return data
 
 def send_cors_response(response):
     """Quick hack to allow CORS...."""
@@ -32,7 +60,6 @@ def send_cors_response(response):
     return response
 
 #@method_decorator(apikey_required, name='get')
-@method_decorator(cache_page(get_metrics_api_cache_time()), name='get')
 class StatsViewSwagger(View):
     """Used to help build the swagger docs"""
 
@@ -47,6 +74,8 @@ class StatsViewSwagger(View):
 
     PARAM_BIN_SIZE = ['binSize']  # bin_size
     PARAM_BIN_SIZE_BYTES = ['binSizeBytes']  # bin_size
+    PARAM_BIN_LOG_BASE = ['binLogBase']  # bin_log_base
+    PARAM_BIN_EDGES = ['binEdges']  # bin_edges
 
     PARAM_NUM_BINS = ['numBins']  # num_bins
     PARAM_SKIP_EMPTY_BINS = ['skipEmptyBins'] # skip_empty_bins
@@ -55,13 +84,14 @@ class StatsViewSwagger(View):
     PARAM_DATASET_PERSISTENT_ID = ['persistentId']
 
     PARAM_DATAVERSE_ALIAS = ['dataverseAlias']
+    PARAM_METRIC_NAMES = ['metricNamesParam']
 
     PUBLISH_PARAMS = ['publicationStateParam']
     PUB_STATE_PUBLISHED = 'published'
     PUB_STATE_UNPUBLISHED = 'unpublished'
     PUB_STATE_ALL = 'all'
 
-    PRETTY_JSON_PARAM = ['prettyJSONParam']
+    PRETTY_JSON_PARAM = ['prettyJSONParam', 'timingParam', 'formatParam']
     DV_TYPE_UNCATEGORIZED_PARAM = ['showUncategorizedParam']
     FILE_CONTENT_TYPE_PARAM = ['contentTypeParam']
 
@@ -78,6 +108,7 @@ class StatsViewSwagger(View):
     RESULT_NAME_DATASET_SUBJECT_COUNTS = 'DatasetSubjectCounts'
     RESULT_NAME_BIN_COUNTS = 'BinCounts'
     RESULT_NAME_BIN_COUNTS_SIZES = 'BinCountsSizes'
+    RESULT_NAME_BATCH_RESULTS = 'BatchResults'
 
     TAG_METRICS = 'metrics'
     TAG_DATAVERSES = 'metrics - dataverses'
@@ -104,6 +135,10 @@ class StatsViewSwagger(View):
     tags = [TAG_METRICS]
     # ---------------------------------------------
 
+    # Data the response depends on, for the ETag.  See stats_etag
+    #   - () = no ETag
+    etag_watermarks = (WATERMARK_DVOBJECTS,)
+
 
 
     def get_swagger_spec(self):
@@ -146,11 +181,127 @@ class StatsViewSwagger(View):
         raise Exception("This method must return a stats_result.StatsResult object")
 
 
-    def get(self, request, *args, **kwargs):
-        """Return a basic get request using the StatsResult object"""
+    def get_metric_name(self):
+        """
+        Name for the metric's query budget, e.g. "files/extensions".
+        See StatsMakerBase.run_with_query_budget.  None = no budget
+        """
+        return self.api_path.strip('/')
+
+
+    def get_view_name(self):
+        """e.g. "dv_apps.metrics.stats_views_files.FileTotalCountsView" """
+        return '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+
+
+    def get_data_watermark(self, request):
+        """Return a DataWatermark for the ETag--or None"""
+        if not (is_etag_enabled() and self.etag_watermarks):
+            return None
+        return DataWatermark(self.etag_watermarks)
+
+
+    def get_access_error(self, request):
+        """
+        Return a StatsResult error if the request may not see this
+        statistic--or None.  Called before checking the cache.
+        Overwrite this method for checks beyond the API key decorators
+        """
+        return None
+
+
+    def get_stats_result_with_cache(self, request, refresh=False, stats_timing=None, watermark=None):
+        """
+        Return (StatsResult, generation time).
+        Successful results are cached by their params, not the API key
+        or output format, so the JSON, CSV and Excel renderings share
+        one computation.
+            - refresh - recompute and replace the cached result
+            - stats_timing - optional StatsTiming to record the cache
+                status and the time to build the StatsResult
+            - watermark - the request's DataWatermark, if already read.
+                A cached result from an older watermark is recomputed
+        """
+        cache_key = get_stats_result_cache_key(self.get_view_name(), self.kwargs, request.GET)
+
+        if watermark is None:
+            watermark = self.get_data_watermark(request)
+        watermark_key = watermark.get_key() if watermark is not None else None
+
+        if not refresh:
+            cached_info = get_cached_stats_result(cache_key)
+            if cached_info is not None and\
+                getattr(cached_info[0], 'watermark_key', None) == watermark_key:
+                if stats_timing is not None:
+                    stats_timing.cache_status = CACHE_HIT
+                return cached_info
 
         # Get the StatsResult -- different for each subclass
-        stats_result = self.get_stats_result(request)
+        start_time = time.time()
+        if self.get_metric_name() is None:
+            stats_result = self.get_stats_result(request)
+        else:
+            stats_result = StatsMakerBase.run_with_query_budget(\
+                                self.get_metric_name(),\
+                                lambda: self.get_stats_result(request),\
+                                request.GET.dict())
+        generation_time = datetime.now()
+
+        if stats_timing is not None:
+            stats_timing.stats_seconds = time.time() - start_time
+            if get_metrics_api_cache_time() > 0:
+                stats_timing.cache_status = CACHE_MISS
+
+        if stats_result is not None:
+            stats_result.watermark_key = watermark_key
+        set_cached_stats_result(cache_key, stats_result, generation_time)
+
+        return stats_result, generation_time
+
+
+    def get(self, request, *args, **kwargs):
+        """
+        Return the response for the StatsResult object.
+        The query count and timing are logged for each request.
+
+        If the request's ETag matches the data watermark, a 304 is
+        returned without computing the StatsResult
+        """
+        stats_timing = StatsTiming()
+        format_start_time = None
+        status_code = 500
+        try:
+            generation_time = None
+            etag = None
+            stats_result = self.get_access_error(request)
+            if stats_result is None:
+                watermark = self.get_data_watermark(request)
+                if watermark is not None:
+                    etag = watermark.get_etag(self.get_view_name(), self.kwargs, request.GET)
+                    if is_not_modified(request, etag):
+                        response = add_etag_headers(HttpResponseNotModified(), etag)
+                        status_code = response.status_code
+                        return send_cors_response(response)
+
+                stats_result, generation_time = self.get_stats_result_with_cache(\
+                                    request, stats_timing=stats_timing, watermark=watermark)
+
+            format_start_time = time.time()
+            response = self.get_stats_response(request, stats_result,\
+                                               generation_time, stats_timing)
+            status_code = response.status_code
+            if etag is not None and status_code == 200:
+                add_etag_headers(response, etag)
+        finally:
+            stats_timing.finish(format_start_time)
+            stats_timing.log(self.__class__.__name__, status_code)
+
+        return response
+
+
+    def get_stats_response(self, request, stats_result, generation_time, stats_timing):
+        """Return the JSON, CSV or Excel response for the StatsResult object"""
+
         if stats_result is None:
             err_dict = dict(status="ERROR",\
                     message="Unknown processing error")
@@ -165,8 +316,26 @@ class StatsViewSwagger(View):
                 status_code = stats_result.bad_http_status_code
             else:
                 status_code = 400
-            return send_cors_response(JsonResponse(err_dict, status=status_code))
 
+            # e.g. a query timed out: when to try again
+            retry_after = stats_result.retry_after_seconds
+            if retry_after:
+                err_dict['retry_after_seconds'] = retry_after
+
+            response = JsonResponse(err_dict, status=status_code)
+            if retry_after:
+                response['Retry-After'] = retry_after
+            return send_cors_response(response)
+
+
+        # Exports stream the records, without building the JSON response
+        #
+        if not 'pretty' in request.GET:
+            if StatsMakerBase.is_param_value_true(request.GET.get('as_csv', None)):
+                return self.get_data_as_csv_response(request, stats_result)
+
+            if StatsMakerBase.is_param_value_true(request.GET.get('as_excel', None)):
+                return self.get_data_as_excel_response(request, stats_result)
 
         # Create the dict for the response
         #
@@ -182,40 +351,40 @@ class StatsViewSwagger(View):
 
         # Set a timestamp and params
         resp_dict['info'] = OrderedDict()
-        resp_dict['info']['generation_time'] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        resp_dict['info']['generation_time'] = generation_time.strftime("%Y-%m-%dT%H:%M:%S")
         if get_metrics_api_cache_time() > 0:
             resp_dict['info']['cache_time_seconds'] = get_metrics_api_cache_time()
         resp_dict['info']['params'] = request.GET
+        if is_timing_requested(request.GET):
+            resp_dict['info']['timing'] = stats_timing.as_dict()
 
         # Set the actual stats data
-        resp_dict['data'] = stats_result.result_data
+        if request.GET.get(FORMAT_PARAM_NAME, None) == FORMAT_COLUMNAR and\
+            stats_result.has_records():
+            resp_dict['data'] = get_columnar_data(stats_result)
+        else:
+            resp_dict['data'] = stats_result.get_result_data()
 
 
         # Is there a request to send the JSON formatted within HTML tags?
         if 'pretty' in request.GET:
             return HttpResponse('<pre>%s</pre>' % json.dumps(resp_dict, indent=4))
 
-        if StatsMakerBase.is_param_value_true(request.GET.get('as_csv', None)):
-            return self.get_data_as_csv_response(request, stats_result)
-
-        if StatsMakerBase.is_param_value_true(request.GET.get('as_excel', None)):
-            return self.get_data_as_excel_response(request, stats_result)
-
 
         # Return the actual response
         return send_cors_response(JsonResponse(resp_dict))
 
 
     def get_data_as_csv_response(self, request, stats_result):
-        """Hasty method, proof of concept for downloads by month"""
+        """
+        Stream the records as CSV, one line at a time.
+        """
         if stats_result is None or stats_result.result_data is None:
             return None
 
-
-        csv_content = stats_result.get_csv_content()
-
-        # Create the HttpResponse object with the appropriate CSV header.
-        response = HttpResponse(csv_content, content_type='text/csv')
+        # Create the response with the appropriate CSV header.
+        response = StreamingHttpResponse(stats_result.iter_csv_lines(),\
+                                         content_type='text/csv')
 
         csv_fname = 'metrics_%s.csv' % get_timestamp_for_filename()
         response['Content-Disposition'] = 'attachment; filename="%s"' % csv_fname
@@ -225,22 +394,30 @@ class StatsViewSwagger(View):
 
     def get_data_as_excel_response(self, request, stats_result):
         """
-        http://stackoverflow.com/questions/35267585/django-pandas-to-http-response-download-file
+        Write the records to a temp file, in XlsxWriter's "constant_memory"
+        mode, and stream the file.  (An .xlsx can't be sent until the
+        workbook is closed)
         """
         if stats_result is None or stats_result.result_data is None:
             return None
 
-        excel_workbook = stats_result.get_excel_workbook()
-        if excel_workbook is None:
-            # Ah, make a better error
-            return HttpResponse('Sorry! An error occurred trying to create an Excel spreadsheet.')
+        xlsx_file = tempfile.TemporaryFile()
+        try:
+            stats_result.write_excel_workbook(xlsx_file)
+        except:
+            xlsx_file.close()
+            raise
 
+        file_size = xlsx_file.tell()
+        xlsx_file.seek(0)
 
         xlsx_fname = 'metrics_%s.xlsx' % get_timestamp_for_filename()
 
-        response = HttpResponse(excel_workbook,\
+        # The response closes the temp file, which removes it
+        response = StreamingHttpResponse(FileWrapper(xlsx_file, EXPORT_CHUNK_SIZE),\
             content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
         response['Content-Disposition'] = 'attachment; filename=%s' % xlsx_fname
+        response['Content-Length'] = file_size
 
         return response
 
@@ -0,0 +1,63 @@
+from django.conf import settings
+
+from dv_apps.dataverse_auth.decorator import PARAM_NAME_KEY
+from dv_apps.dataverse_auth.util import is_apikey_valid_superuser
+from dv_apps.metrics.stats_view_base import StatsViewSwagger, StatsViewSwaggerKeyRequired
+from dv_apps.metrics.stats_util_batch import StatsMakerBatch
+from dv_apps.metrics.stats_result import StatsResult
+from dv_apps.metrics.stats_etag import WATERMARK_DVOBJECTS, WATERMARK_DOWNLOADS
+
+
+class MetricsBatchView(StatsViewSwaggerKeyRequired):
+    """API View - Several metrics evaluated with the same params"""
+
+    # Define the swagger attributes
+    # Note: api_path must match the path in urls.py
+    #
+    api_path = '/batch'
+    summary = ('Several metrics in one request')
+    description = ('Returns the results of several metrics which share'
+            ' the same parameters.  Metric names match the API paths.'
+            ' e.g. "datasets/count,files/count/monthly".'
+            ' "files/downloads/count/monthly" requires superuser access.')
+    description_200 = 'Results keyed by metric name'
+    param_names = StatsViewSwagger.PARAM_DV_API_KEY +\
+                StatsViewSwagger.PARAM_METRIC_NAMES +\
+                StatsViewSwagger.BASIC_DATE_PARAMS +\
+                StatsViewSwagger.PUBLISH_PARAMS +\
+                StatsViewSwagger.PARAM_SELECTED_DV_ALIASES +\
+                StatsViewSwagger.PARAM_INCLUDE_CHILD_DVS +\
+                StatsViewSwagger.DV_TYPE_UNCATEGORIZED_PARAM +\
+                StatsViewSwagger.PRETTY_JSON_PARAM
+    result_name = StatsViewSwagger.RESULT_NAME_BATCH_RESULTS
+    tags = [StatsViewSwagger.TAG_METRICS]
+    etag_watermarks = (WATERMARK_DVOBJECTS, WATERMARK_DOWNLOADS)
+
+    def get_metric_name(self):
+        """Each metric in the batch has its own query budget"""
+        return None
+
+    def get_access_error(self, request):
+        """
+        Same check as the single endpoints, e.g. file downloads.
+        (Runs before the cache is checked)
+        """
+        stats_batch = StatsMakerBatch(**request.GET.dict())
+        if stats_batch.was_error_found():
+            return stats_batch.get_error_msg_return()
+
+        if stats_batch.has_superuser_metrics() and settings.DEBUG is False:
+            api_key = request.GET.get(PARAM_NAME_KEY, '').strip()
+            success, err_msg_or_none = is_apikey_valid_superuser(api_key)
+            if not success:
+                return StatsResult.build_error_result(err_msg_or_none, 403)
+
+        return None
+
+    def get_stats_result(self, request):
+        """Return the StatsResult object for this statistic"""
+        stats_batch = StatsMakerBatch(**request.GET.dict())
+        if stats_batch.was_error_found():
+            return stats_batch.get_error_msg_return()
+
+        return stats_batch.get_batch_results()
@@ -24,6 +24,8 @@ class FilesPerDatasetStats(StatsViewSwaggerKeyRequired):
                 + StatsViewSwagger.PUBLISH_PARAMS\
                 + StatsViewSwagger.PRETTY_JSON_PARAM\
                 + StatsViewSwagger.PARAM_BIN_SIZE\
+                + StatsViewSwagger.PARAM_BIN_LOG_BASE\
+                + StatsViewSwagger.PARAM_BIN_EDGES\
                 + StatsViewSwagger.PARAM_SKIP_EMPTY_BINS\
                 + StatsViewSwagger.PARAM_AS_CSV
                 #+ StatsViewSwagger.PARAM_NUM_BINS\
@@ -66,6 +68,8 @@ class BytesPerDatasetStats(StatsViewSwaggerKeyRequired):
                 + StatsViewSwagger.PUBLISH_PARAMS\
                 + StatsViewSwagger.PRETTY_JSON_PARAM\
                 + StatsViewSwagger.PARAM_BIN_SIZE_BYTES\
+                + StatsViewSwagger.PARAM_BIN_LOG_BASE\
+                + StatsViewSwagger.PARAM_BIN_EDGES\
                 + StatsViewSwagger.PARAM_SKIP_EMPTY_BINS\
                 + StatsViewSwagger.PARAM_AS_CSV
 
@@ -1,10 +1,9 @@
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from dv_apps.dataverse_auth.decorator import superuser_apikey_required
-from dv_apps.utils.metrics_cache_time import get_metrics_api_cache_time
 
 from .stats_view_base import StatsViewSwagger, StatsViewSwaggerKeyRequired
 from .stats_util_files import StatsMakerFiles
+from .stats_etag import WATERMARK_DVOBJECTS, WATERMARK_DOWNLOADS
 
 class FileTotalCountsView(StatsViewSwaggerKeyRequired):
     """API View - Total count of all Files"""
@@ -75,7 +74,6 @@ class FileCountByMonthView(StatsViewSwaggerKeyRequired):
         return stats_result
 
 @method_decorator(superuser_apikey_required, name='get')
-@method_decorator(cache_page(get_metrics_api_cache_time()), name='get')
 class FilesDownloadedByMonthView(StatsViewSwaggerKeyRequired):
     """API View - Downloaded Files counts by Month."""
 
@@ -89,6 +87,7 @@ class FilesDownloadedByMonthView(StatsViewSwaggerKeyRequired):
             ' Superuser access required.')
     description_200 = 'A list of file download counts by month.'
     tags = [StatsViewSwagger.TAG_DATAFILES]
+    etag_watermarks = (WATERMARK_DVOBJECTS, WATERMARK_DOWNLOADS)
 
     param_names = StatsViewSwagger.PARAM_DV_API_KEY +\
                 StatsViewSwagger.BASIC_DATE_PARAMS +\
@@ -0,0 +1,117 @@
+"""
+Count Dataset subjects in a single query.
+
+The "subject" values of each Dataset's latest version are joined and
+counted in one statement:
+
+    WITH latest_versions AS (SELECT DISTINCT ON (dataset_id) id ...)
+    SELECT cvv.strvalue, COUNT(*), SUM(COUNT(*)) OVER ()
+    FROM latest_versions
+        JOIN datasetfield ...
+        JOIN datasetfield_controlledvocabularyvalue ...
+        JOIN controlledvocabularyvalue ...
+    WHERE datasetfield.datasetfieldtype_id = <subject id>
+    GROUP BY cvv.strvalue
+
+The "subject" DatasetFieldType id is cached for the life of the process.
+"""
+from decimal import Decimal
+
+from django.db import connections
+
+from dv_apps.datasetfields.models import DatasetField, DatasetFieldType,\
+    DatasetFieldControlledVocabularyValue, ControlledVocabularyValue
+from dv_apps.metrics.latest_version_util import LatestVersionIndex
+
+SUBJECT_FIELD_TYPE_ATTRS = dict(name='subject',\
+                                required=True,\
+                                metadatablock__name='citation')
+
+# { database alias : DatasetFieldType id }
+_SUBJECT_FIELD_TYPE_IDS = {}
+
+
+def get_subject_field_type_id():
+    """
+    Return the id of the citation "subject" DatasetFieldType, or None.
+    Only found ids are cached.
+    """
+    db_alias = DatasetFieldType.objects.db
+
+    field_type_id = _SUBJECT_FIELD_TYPE_IDS.get(db_alias)
+    if field_type_id is not None:
+        return field_type_id
+
+    field_type_id = DatasetFieldType.objects.filter(**SUBJECT_FIELD_TYPE_ATTRS\
+                        ).values_list('id', flat=True).first()
+    if field_type_id is not None:
+        _SUBJECT_FIELD_TYPE_IDS[db_alias] = field_type_id
+
+    return field_type_id
+
+
+def clear_subject_field_type_cache():
+    """Forget the cached DatasetFieldType id, e.g. after a metadata block reload"""
+    _SUBJECT_FIELD_TYPE_IDS.clear()
+
+
+def get_subject_counts(field_type_id, **dataset_filters):
+    """
+    Count the subjects of the latest version of each Dataset,
+    highest count first.
+        - "dataset_filters" narrow the Datasets, e.g. by publication state
+
+    Returns a dict:
+        subject_counts - list of (subject, count)
+        total_count
+        sql_query
+    """
+    latest_versions = LatestVersionIndex().get_latest_versions(**dataset_filters\
+                        ).values('id')
+    inner_sql, params = latest_versions.query.sql_with_params()
+
+    # Table and column names from the models
+    #
+    dsf_meta = DatasetField._meta
+    dcv_meta = DatasetFieldControlledVocabularyValue._meta
+    cvv_meta = ControlledVocabularyValue._meta
+    names = dict(\
+        latest_versions=inner_sql,
+        dsf_table=dsf_meta.db_table,
+        dsf_version=dsf_meta.get_field('datasetversion').column,
+        dsf_type=dsf_meta.get_field('datasetfieldtype').column,
+        dcv_table=dcv_meta.db_table,
+        dcv_field=dcv_meta.get_field('datasetfield').column,
+        dcv_value=dcv_meta.get_field('controlledvocabularyvalues').column,
+        cvv_table=cvv_meta.db_table)
+
+    sql = ('WITH latest_versions AS (%(latest_versions)s)'
+           ' SELECT cvv.strvalue AS subject, COUNT(*) AS cnt,'
+           ' SUM(COUNT(*)) OVER () AS total_count'
+           ' FROM latest_versions lv'
+           ' JOIN %(dsf_table)s dsf ON dsf.%(dsf_version)s = lv.id'
+           ' JOIN %(dcv_table)s dcv ON dcv.%(dcv_field)s = dsf.id'
+           ' JOIN %(cvv_table)s cvv ON cvv.id = dcv.%(dcv_value)s'
+           ' WHERE dsf.%(dsf_type)s = %%s'
+           ' GROUP BY cvv.strvalue'
+           ' ORDER BY cnt DESC, cvv.strvalue') % names
+    params = tuple(params) + (field_type_id,)
+
+    cursor = connections[latest_versions.db].cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    subject_counts = [(subject, cnt) for subject, cnt, _ in rows]
+    if len(rows) > 0:
+        total_count = rows[0][2]
+        if isinstance(total_count, Decimal):
+            total_count = int(total_count)
+    else:
+        total_count = 0
+
+    return dict(subject_counts=subject_counts,
+                total_count=total_count,
+                sql_query=sql % params)
@@ -0,0 +1,484 @@
+"""
+Generate a synthetic Dataverse database for benchmarking the metrics.
+
+Populates the "dvobject", "dataverse", "dataset", "datasetversion",
+"datafile", "filemetadata", "datasetfield*" and "guestbookresponse"
+tables.  The same seed and scale always produce the same rows.
+
+The scale is the number of Datafiles.  Other counts follow from it,
+with a long tail as in a production installation:
+
+    - ~1 Dataverse per 150 files, a few of them holding most Datasets
+    - ~1 Dataset per 6 files.  Most have a handful of files; a few
+        have thousands
+    - 1-5+ versions per published Dataset, each with a FileMetadata
+        row per file
+    - content types, subjects and download types weighted like
+        a production installation
+    - more objects created in recent months
+    - ~2 downloads per published file: most have none, a few are popular
+
+Run from the command line against an empty benchmark database--a
+DATABASES alias given explicitly:
+
+    python manage.py generate_metrics_data --database benchmark --files 100000 --seed 1
+
+The alias Dataverse tables are written to (e.g. "dataverse") is refused
+unless settings.ALLOW_SYNTHETIC_DATA is True.
+
+Rows are written with multi-row INSERTs, in batches, with ids assigned
+here.  The table sequences are reset afterwards.
+"""
+from __future__ import print_function
+
+import hashlib
+import random
+from bisect import bisect
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+
+from dv_apps.dvobjects.models import DvObject,\
+    DTYPE_DATAVERSE, DTYPE_DATASET, DTYPE_DATAFILE
+from dv_apps.dataverses.models import Dataverse, Dataverserole
+from dv_apps.datasets.models import Dataset, DatasetVersion,\
+    VERSION_STATE_RELEASED, VERSION_STATE_DRAFT, VERSION_STATE_DEACCESSIONED
+from dv_apps.datafiles.models import Datafile, FileMetadata
+from dv_apps.datasetfields.models import MetadataBlock, DatasetFieldType,\
+    DatasetField, ControlledVocabularyValue, DatasetFieldControlledVocabularyValue
+from dv_apps.guestbook.models import GuestBook, GuestBookResponse,\
+    RESPONSE_TYPE_DOWNLOAD, RESPONSE_TYPE_EXPLORE, RESPONSE_TYPE_SUBSET
+from dv_apps.metrics.subject_count_util import SUBJECT_FIELD_TYPE_ATTRS
+
+DEFAULT_SEED = 1
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_START_DATE = datetime(2012, 1, 1)
+DEFAULT_END_DATE = datetime(2017, 7, 31)    # fixed, so runs are comparable
+
+FILES_PER_DATAVERSE = 150
+MAX_FILES_PER_DATASET = 10000
+MAX_DOWNLOADS_PER_FILE = 5000
+
+# (value, weight)
+#
+DATAVERSE_TYPES = [('RESEARCHERS', 35), ('RESEARCH_PROJECTS', 25),\
+                   ('UNCATEGORIZED', 20), ('ORGANIZATIONS_INSTITUTIONS', 12),\
+                   ('JOURNALS', 5), ('TEACHING_COURSES', 3)]
+
+# (content type, extension, weight)
+#
+CONTENT_TYPES = [('application/octet-stream', '.dat', 30),\
+                 ('text/tab-separated-values', '.tab', 13),\
+                 ('image/jpeg', '.jpg', 12),\
+                 ('text/plain', '.txt', 10),\
+                 ('image/png', '.png', 9),\
+                 ('application/pdf', '.pdf', 8),\
+                 ('text/csv', '.csv', 5),\
+                 ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', '.docx', 3),\
+                 ('application/zip', '.zip', 2),\
+                 ('application/vnd.ms-excel', '.xls', 2),\
+                 ('application/x-stata', '.dta', 2),\
+                 ('application/msword', '.doc', 1),\
+                 ('image/gif', '.gif', 1),\
+                 ('text/xml', '.xml', 1),\
+                 ('application/zipped-shapefile', '.zip', 1)]
+
+# Files of unknown type may have any extension
+UNKNOWN_TYPE_EXTENSIONS = [('.dat', 30), ('', 15), ('.do', 10), ('.R', 10),\
+                           ('.sav', 8), ('.gz', 8), ('.nc', 5), ('.sps', 5),\
+                           ('.json', 4), ('.log', 3), ('.py', 2)]
+
+SUBJECTS = [('Social Sciences', 40), ('Medicine, Health and Life Sciences', 15),\
+            ('Earth and Environmental Sciences', 10), ('Other', 8),\
+            ('Computer and Information Science', 6), ('Physics', 5),\
+            ('Business and Management', 4), ('Arts and Humanities', 4),\
+            ('Agricultural Sciences', 3), ('Astronomy and Astrophysics', 2),\
+            ('Chemistry', 1), ('Engineering', 1), ('Law', 1)]
+
+DOWNLOAD_TYPES = [(RESPONSE_TYPE_DOWNLOAD, 62), (RESPONSE_TYPE_EXPLORE, 36),\
+                  (RESPONSE_TYPE_SUBSET, 2)]
+
+# Tables written, in foreign key order
+#
+MODELS_IN_INSERT_ORDER = [DvObject, Dataverse, Dataset, DatasetVersion,\
+                          Datafile, FileMetadata, DatasetField,\
+                          DatasetFieldControlledVocabularyValue, GuestBookResponse]
+
+
+class WeightedChoice(object):
+    """Choose values by weight, using the generator's random.Random"""
+
+    def __init__(self, rng, values, weights):
+        self.rng = rng
+        self.values = values
+        self.cumulative_weights = []
+        total = 0
+        for weight in weights:
+            total += weight
+            self.cumulative_weights.append(total)
+
+    @staticmethod
+    def from_pairs(rng, pairs):
+        """e.g. [('a', 10), ('b', 1)]"""
+        return WeightedChoice(rng, [x[0] for x in pairs], [x[1] for x in pairs])
+
+    def choose(self):
+        idx = bisect(self.cumulative_weights,\
+                     self.rng.random() * self.cumulative_weights[-1])
+        return self.values[min(idx, len(self.values) - 1)]
+
+
+class SyntheticDataError(Exception):
+    """The database may not be written to"""
+    pass
+
+
+def check_synthetic_data_alias(db_alias):
+    """
+    Raise a SyntheticDataError if "db_alias" isn't a configured database
+    or is the Dataverse database--unless settings.ALLOW_SYNTHETIC_DATA
+    """
+    if not db_alias in settings.DATABASES:
+        raise SyntheticDataError('Unknown database: %s' % db_alias)
+
+    if db_alias == router.db_for_write(DvObject) and\
+        not getattr(settings, 'ALLOW_SYNTHETIC_DATA', False):
+        raise SyntheticDataError(('"%s" is the Dataverse database.'
+                                  ' Set ALLOW_SYNTHETIC_DATA = True to'
+                                  ' write synthetic data to it.') % db_alias)
+
+
+class SyntheticDataGenerator(object):
+    """Write a deterministic, skewed Dataverse database"""
+
+    def __init__(self, num_files, db_alias, **kwargs):
+        """
+            db_alias - DATABASES alias to write to.  See check_synthetic_data_alias
+        """
+        check_synthetic_data_alias(db_alias)
+
+        self.num_files = num_files
+        self.seed = kwargs.get('seed', DEFAULT_SEED)
+        self.batch_size = kwargs.get('batch_size', DEFAULT_BATCH_SIZE)
+        self.start_date = kwargs.get('start_date', DEFAULT_START_DATE)
+        self.end_date = kwargs.get('end_date', DEFAULT_END_DATE)
+        self.verbose = kwargs.get('verbose', False)
+
+        self.rng = random.Random(self.seed)
+        self.db_alias = db_alias
+
+        self.pending = dict([(model, []) for model in MODELS_IN_INSERT_ORDER])
+        self.row_counts = dict([(model, 0) for model in MODELS_IN_INSERT_ORDER])
+        self.next_ids = {}
+
+    def msg(self, m):
+        if self.verbose:
+            print(m)
+
+    # ----------------------------
+    #  Writing rows
+    # ----------------------------
+    def get_next_id(self, model):
+        """Ids follow the current maximum id of each table"""
+        if not model in self.next_ids:
+            max_id = model.objects.using(self.db_alias).order_by('-pk'\
+                        ).values_list('pk', flat=True).first()
+            self.next_ids[model] = (max_id or 0) + 1
+
+        next_id = self.next_ids[model]
+        self.next_ids[model] += 1
+        return next_id
+
+    def add(self, obj):
+        """Queue an object; flush when a batch is full"""
+        pending = self.pending[obj.__class__]
+        pending.append(obj)
+        if len(pending) >= self.batch_size:
+            self.flush()
+
+    def insert_objects(self, cursor, model, objs):
+        """
+        Multi-row INSERT of every concrete field.  Unlike "bulk_create",
+        "auto_now_add" fields keep their generated dates
+        """
+        connection = connections[self.db_alias]
+        qn = connection.ops.quote_name
+        fields = model._meta.concrete_fields
+
+        columns = ', '.join([qn(f.column) for f in fields])
+        row_sql = '(%s)' % ', '.join(['%s'] * len(fields))
+
+        for start in range(0, len(objs), 1000):
+            chunk = objs[start:start+1000]
+            sql = 'INSERT INTO %s (%s) VALUES %s' %\
+                    (qn(model._meta.db_table), columns, ', '.join([row_sql] * len(chunk)))
+            params = [f.get_db_prep_save(getattr(obj, f.attname), connection)\
+                        for obj in chunk for f in fields]
+            cursor.execute(sql, params)
+
+    def flush(self):
+        """Write the queued rows, parents before children"""
+        with transaction.atomic(using=self.db_alias):
+            cursor = connections[self.db_alias].cursor()
+            try:
+                for model in MODELS_IN_INSERT_ORDER:
+                    objs = self.pending[model]
+                    if objs:
+                        self.insert_objects(cursor, model, objs)
+                        self.row_counts[model] += len(objs)
+                        self.pending[model] = []
+            finally:
+                cursor.close()
+
+        self.msg('rows written: %s' % ', '.join(['%s %s' % (m._meta.db_table, cnt)\
+                        for m, cnt in self.get_row_counts()]))
+
+    def reset_sequences(self):
+        """Point the id sequences past the generated ids"""
+        connection = connections[self.db_alias]
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(),\
+                            [model for model in MODELS_IN_INSERT_ORDER\
+                                if model._meta.auto_field is not None])
+        cursor = connection.cursor()
+        try:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+        finally:
+            cursor.close()
+
+    def get_row_counts(self):
+        """[(model, rows written)]"""
+        return [(model, self.row_counts[model]) for model in MODELS_IN_INSERT_ORDER]
+
+    # ----------------------------
+    #  Random values
+    # ----------------------------
+    def get_date(self, position, total):
+        """
+        Create date for the n-th of "total" objects.  Dates increase
+        with the id and are denser toward the end date
+        """
+        span = self.end_date - self.start_date
+        frac = ((position + self.rng.random()) / float(total)) ** 0.5
+        return self.start_date + timedelta(seconds=span.total_seconds() * min(frac, 1.0))
+
+    def get_later_date(self, start, max_days):
+        """A date after "start", no later than the end date"""
+        later_date = start + timedelta(seconds=self.rng.random() * max_days * 86400)
+        return min(later_date, self.end_date)
+
+    def get_long_tail_count(self, alpha, cap):
+        """0, 1, 2, ... with a Pareto tail"""
+        return min(int(self.rng.paretovariate(alpha)) - 1, cap)
+
+    # ----------------------------
+    #  Lookup rows
+    # ----------------------------
+    def get_lookup_objects(self):
+        """Role, guestbook and subject vocabulary needed by the generated rows"""
+        role = Dataverserole.objects.using(self.db_alias).order_by('id').first()
+        if role is None:
+            role = Dataverserole.objects.using(self.db_alias).create(\
+                        alias='contributor', name='Contributor')
+
+        guestbook = GuestBook.objects.using(self.db_alias).order_by('id').first()
+        if guestbook is None:
+            guestbook = GuestBook.objects.using(self.db_alias).create(\
+                        name='Default', createtime=self.start_date, enabled=True)
+
+        subject_type = DatasetFieldType.objects.using(self.db_alias).filter(\
+                            **SUBJECT_FIELD_TYPE_ATTRS).first()
+        if subject_type is None:
+            mblock, created = MetadataBlock.objects.using(self.db_alias).get_or_create(\
+                        name='citation', defaults=dict(displayname='Citation Metadata'))
+            subject_type = DatasetFieldType.objects.using(self.db_alias).create(\
+                        name='subject', title='Subject', required=True,\
+                        fieldtype='TEXT', metadatablock=mblock,\
+                        advancedsearchfieldtype=True, allowcontrolledvocabulary=True,\
+                        allowmultiples=True, displayoncreate=True, facetable=True)
+
+        vocab_lookup = dict(ControlledVocabularyValue.objects.using(self.db_alias\
+                        ).filter(datasetfieldtype=subject_type\
+                        ).values_list('strvalue', 'id'))
+        for idx, (subject, weight) in enumerate(SUBJECTS):
+            if not subject in vocab_lookup:
+                vocab_lookup[subject] = ControlledVocabularyValue.objects.using(\
+                        self.db_alias).create(strvalue=subject,\
+                        datasetfieldtype=subject_type, displayorder=idx).id
+
+        return role, guestbook, subject_type, vocab_lookup
+
+    # ----------------------------
+    #  Generate
+    # ----------------------------
+    def generate(self):
+        """Write every table.  Returns [(model, rows written)]"""
+        role, guestbook, subject_type, vocab_lookup = self.get_lookup_objects()
+
+        self.dataverse_type_choice = WeightedChoice.from_pairs(self.rng, DATAVERSE_TYPES)
+        self.content_type_choice = WeightedChoice(self.rng,\
+                    [(ctype, ext) for ctype, ext, _ in CONTENT_TYPES],\
+                    [weight for _, _, weight in CONTENT_TYPES])
+        self.unknown_ext_choice = WeightedChoice.from_pairs(self.rng, UNKNOWN_TYPE_EXTENSIONS)
+        self.download_type_choice = WeightedChoice.from_pairs(self.rng, DOWNLOAD_TYPES)
+        self.subject_choice = WeightedChoice.from_pairs(self.rng,\
+                    [(vocab_lookup[subject], weight) for subject, weight in SUBJECTS])
+
+        dataverses = self.generate_dataverses(role)
+
+        # a few Dataverses hold most Datasets: Zipf weights
+        dataverse_choice = WeightedChoice(self.rng, dataverses,\
+                    [1.0 / (idx + 1) ** 1.1 for idx in range(len(dataverses))])
+
+        expected_datasets = max(1, self.num_files // 6)
+        files_left = self.num_files
+        position = 0
+        while files_left > 0:
+            owner = dataverse_choice.choose()
+            if self.rng.random() < 0.1:
+                num_files = 0
+            else:
+                num_files = min(int(self.rng.paretovariate(1.2)),\
+                                MAX_FILES_PER_DATASET, files_left)
+            self.generate_dataset(owner, num_files, guestbook, subject_type,\
+                    self.get_date(min(position, expected_datasets - 1), expected_datasets))
+            files_left -= num_files
+            position += 1
+
+        self.flush()
+        self.reset_sequences()
+
+        return self.get_row_counts()
+
+    def generate_dataverses(self, role):
+        """Returns [(id, alias, publication date or None)]"""
+        num_dataverses = max(1, self.num_files // FILES_PER_DATAVERSE)
+        dataverses = []
+        for position in range(num_dataverses):
+            dv_id = self.get_next_id(DvObject)
+            createdate = self.get_date(position, num_dataverses)
+
+            if position == 0:
+                owner_id = None     # root
+            elif self.rng.random() < 0.8:
+                owner_id = dataverses[0][0]
+            else:
+                owner_id = self.rng.choice(dataverses)[0]
+
+            publicationdate = None
+            if position == 0 or self.rng.random() < 0.8:
+                publicationdate = self.get_later_date(createdate, 30)
+
+            alias = 'syn-dv-%s' % dv_id
+            self.add(DvObject(id=dv_id, dtype=DTYPE_DATAVERSE, owner_id=owner_id,\
+                        createdate=createdate, modificationtime=createdate,\
+                        publicationdate=publicationdate))
+            self.add(Dataverse(dvobject_id=dv_id, name='Synthetic Dataverse %s' % dv_id,\
+                        alias=alias, affiliation='University %s' % (dv_id % 50),\
+                        dataversetype=self.dataverse_type_choice.choose(),\
+                        facetroot=False, guestbookroot=False, metadatablockroot=False,\
+                        permissionroot=True, templateroot=False, themeroot=False,\
+                        defaultcontributorrole_id=role.id))
+            dataverses.append((dv_id, alias, publicationdate))
+
+        return dataverses
+
+    def generate_dataset(self, owner, num_files, guestbook, subject_type, createdate):
+        """A Dataset with its versions, files and downloads"""
+        owner_id, owner_alias, owner_publicationdate = owner
+
+        ds_id = self.get_next_id(DvObject)
+        publicationdate = None
+        if owner_publicationdate is not None and self.rng.random() < 0.65:
+            publicationdate = self.get_later_date(max(createdate, owner_publicationdate), 60)
+
+        self.add(DvObject(id=ds_id, dtype=DTYPE_DATASET, owner_id=owner_id,\
+                    createdate=createdate, modificationtime=createdate,\
+                    publicationdate=publicationdate))
+        self.add(Dataset(dvobject_id=ds_id, protocol='doi', authority='10.5072/FK2',\
+                    doiseparator='/', identifier='SYN%s' % ds_id,\
+                    globalidcreatetime=createdate, fileaccessrequest=False))
+
+        # Versions: RELEASED 1.0, 2.0, ..., maybe a DRAFT or DEACCESSIONED last
+        #
+        version_states = []
+        if publicationdate is None:
+            version_states.append(VERSION_STATE_DRAFT)
+        else:
+            num_released = 1
+            while num_released < 10 and self.rng.random() < 0.4:
+                num_released += 1
+            version_states += [VERSION_STATE_RELEASED] * num_released
+            if self.rng.random() < 0.03:
+                version_states[-1] = VERSION_STATE_DEACCESSIONED
+            elif self.rng.random() < 0.2:
+                version_states.append(VERSION_STATE_DRAFT)
+
+        # Files
+        #
+        files = []  # (id, extension)
+        for _ in range(num_files):
+            files.append(self.generate_datafile(ds_id, createdate, publicationdate))
+
+        # Version rows, their FileMetadata and subject
+        #
+        version_time = createdate
+        subject_vocab_id = self.subject_choice.choose()
+        for version_num, version_state in enumerate(version_states):
+            dsv_id = self.get_next_id(DatasetVersion)
+            is_released = version_state != VERSION_STATE_DRAFT
+            if version_num > 0:
+                version_time = self.get_later_date(version_time, 120)
+
+            self.add(DatasetVersion(id=dsv_id, dataset_id=ds_id, version=1,\
+                        versionstate=version_state,\
+                        versionnumber=(version_num + 1) if is_released else None,\
+                        minorversionnumber=0 if is_released else None,\
+                        createtime=version_time, lastupdatetime=version_time,\
+                        releasetime=version_time if is_released else None))
+
+            for df_id, extension in files:
+                label = 'file_%s%s' % (df_id, extension)
+                if version_num > 0 and self.rng.random() < 0.02:
+                    label = 'file_%s_renamed%s' % (df_id, extension)
+                self.add(FileMetadata(id=self.get_next_id(FileMetadata),\
+                            datafile_id=df_id, datasetversion_id=dsv_id,\
+                            label=label, restricted=False, version=1))
+
+            field_id = self.get_next_id(DatasetField)
+            self.add(DatasetField(id=field_id, datasetfieldtype_id=subject_type.id,\
+                        datasetversion_id=dsv_id))
+            self.add(DatasetFieldControlledVocabularyValue(datasetfield_id=field_id,\
+                        controlledvocabularyvalues_id=subject_vocab_id))
+
+        # Downloads
+        #
+        if publicationdate is not None:
+            for df_id, extension in files:
+                for _ in range(self.get_long_tail_count(1.5, MAX_DOWNLOADS_PER_FILE)):
+                    self.add(GuestBookResponse(id=self.get_next_id(GuestBookResponse),\
+                                datafile_id=df_id, dataset_id=ds_id, guestbook_id=guestbook.id,\
+                                downloadtype=self.download_type_choice.choose(),\
+                                responsetime=self.get_later_date(publicationdate, 720)))
+
+    def generate_datafile(self, ds_id, createdate, publicationdate):
+        """Returns (id, extension)"""
+        df_id = self.get_next_id(DvObject)
+        contenttype, extension = self.content_type_choice.choose()
+        if contenttype == 'application/octet-stream':
+            extension = self.unknown_ext_choice.choose()
+
+        self.add(DvObject(id=df_id, dtype=DTYPE_DATAFILE, owner_id=ds_id,\
+                    createdate=createdate, modificationtime=createdate,\
+                    publicationdate=publicationdate))
+        self.add(Datafile(dvobject_id=df_id, contenttype=contenttype,\
+                    filesize=min(int(self.rng.lognormvariate(11, 2.5)), 5 * 10**10),\
+                    ingeststatus='A' if extension == '.tab' else None,\
+                    rootdatafileid=-1,\
+                    checksumvalue=hashlib.md5(str(df_id)).hexdigest(),\
+                    checksumtype='MD5',\
+                    restricted=self.rng.random() < 0.05))
+
+        return df_id, extension
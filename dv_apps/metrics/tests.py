@@ -9,12 +9,66 @@ python manage.py test dv_apps.metrics.tests.MetricsCountTests.test_date_params
 from __future__ import print_function
 
 from collections import OrderedDict
-
+from datetime import date, datetime
+import fcntl
+import json
+import logging
+from os.path import join, splitext
+import tempfile
+import time
+
+from django.core import management
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connections
+from django.db.models import CharField, Value
+from django.core.urlresolvers import reverse
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
+
+from dv_apps.dvobjects.models import DvObject
+from dv_apps.datasets.models import Dataset, DatasetVersion
+from dv_apps.datafiles.models import Datafile, FileMetadata
+from dv_apps.datasetfields.models import MetadataBlock, DatasetFieldType,\
+    DatasetField, ControlledVocabularyValue, DatasetFieldControlledVocabularyValue
+from dv_apps.guestbook.models import GuestBookResponse
+from dv_apps.installations.models import Installation
+from dv_apps.installations.views import INSTALLATION_MAP_DATA
 from dv_apps.metrics.metrics_test_base import MetricsTestBase
 from dv_apps.metrics.stats_util_dataverses import StatsMakerDataverses
 from dv_apps.metrics.stats_util_datasets import StatsMakerDatasets
 from dv_apps.metrics.stats_util_files import StatsMakerFiles,\
     FILE_TYPE_OCTET_STREAM
+from dv_apps.metrics.download_rollup import DownloadRollupUtil
+from dv_apps.metrics.dataverse_tree_util import DataverseTreeUtil, DataverseSubtree
+from dv_apps.metrics.latest_version_util import LatestVersionIndex
+from dv_apps.metrics.stats_util_batch import StatsMakerBatch
+from dv_apps.metrics.stats_result import StatsResult
+from dv_apps.metrics.stats_result_cache import get_stats_result_cache_key
+from dv_apps.metrics.file_extension_util import FileExtension
+from dv_apps.metrics.file_extension_index import FileExtensionIndexUtil
+from dv_apps.metrics.forms import FixContentTypeForm
+from dv_apps.metrics.subject_count_util import clear_subject_field_type_cache
+from dv_apps.metrics.metrics_warmer import MetricsWarmer, WarmLockError
+from dv_apps.metrics.view_data_cache import get_view_data_cache_key
+from dv_apps.metrics.views_public_metrics import get_public_visualizations_data,\
+    PUBLIC_VISUALIZATIONS_PARAMS_DATA, PUBLIC_VISUALIZATION_METRICS
+from dv_apps.metrics.stats_timing import TIMING_LOGGER_NAME
+from dv_apps.metrics.stats_etag import DataWatermark, WATERMARK_DOWNLOADS
+from dv_apps.metrics.month_columns import MonthColumns
+from dv_apps.metrics.stats_util_base import StatsMakerBase, QUERY_TIMEOUT_LOGGER_NAME
+from dv_apps.metrics.synthetic_data_util import SyntheticDataGenerator, SyntheticDataError
+from dv_apps.metrics.benchmark_util import MetricsBenchmark, STATUS_OK,\
+    write_report, load_report, compare_reports
+from dv_apps.metrics.stats_views_datasets import DatasetCountByMonthView
+from dv_apps.dvobject_api.api_view_datasets import DatasetByIdView
+from dv_apps.metrics.stats_count_util import get_total_published_counts,\
+    TOTAL_PUBLISHED_COUNTS_DATA
+from dv_apps.metrics.models import DatafileExtension, MonthlySnapshotSet, MonthlySnapshot
+from dv_apps.metrics.stats_util_datasets_bins import StatsMakerDatasetBins
+from dv_apps.metrics.stats_util_dataset_size import StatsMakerDatasetSizes
+from dv_apps.utils.thread_pool_helper import run_in_thread_pool
+from dv_apps.dataverses.models import Dataverse
 
 
 
@@ -188,7 +242,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_dataverse_counts_by_month_published()
 
         # check number of months
-        self.assertEqual(len(r.result_data['records']), 7)
+        self.assertEqual(len(r.get_records()), 7)
 
         # check 1st month
         first_month = {'count': 5,
@@ -198,7 +252,7 @@ class MetricsCountTests(MetricsTestBase):
          'running_total': 131,
          'year_num': 2016,
          'yyyy_mm': '2016-01'}
-        self.assertEqual(dict(r.result_data['records'][0]), first_month)
+        self.assertEqual(dict(r.get_records()[0]), first_month)
 
         # check last month
         last_month = {'count': 4,
@@ -208,7 +262,7 @@ class MetricsCountTests(MetricsTestBase):
              'running_total': 187,
              'year_num': 2016,
              'yyyy_mm': '2016-07'}
-        self.assertEqual(dict(r.result_data['records'][-1]), last_month)
+        self.assertEqual(dict(r.get_records()[-1]), last_month)
 
 
 
@@ -221,7 +275,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_dataverse_counts_by_month_unpublished()
 
         # check number of months
-        self.assertEqual(len(r.result_data['records']), 16)
+        self.assertEqual(len(r.get_records()), 16)
 
         # check 1st month
         first_month = {'count': 13,
@@ -231,7 +285,7 @@ class MetricsCountTests(MetricsTestBase):
              'running_total': 13,
              'year_num': 2015,
              'yyyy_mm': '2015-04'}
-        self.assertEqual(dict(r.result_data['records'][0]), first_month)
+        self.assertEqual(dict(r.get_records()[0]), first_month)
 
         # check last month
         last_month = {'count': 6,
@@ -241,7 +295,7 @@ class MetricsCountTests(MetricsTestBase):
              'running_total': 169,
              'year_num': 2016,
              'yyyy_mm': '2016-07'}
-        self.assertEqual(dict(r.result_data['records'][-1]), last_month)
+        self.assertEqual(dict(r.get_records()[-1]), last_month)
 
 
     def test_04_dataverse_counts_by_month_all(self):
@@ -253,7 +307,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_dataverse_counts_by_month()
 
         # check number of months
-        self.assertEqual(len(r.result_data['records']), 16)
+        self.assertEqual(len(r.get_records()), 16)
 
         # check 1st month
         first_month = {'count': 39,
@@ -263,7 +317,7 @@ class MetricsCountTests(MetricsTestBase):
              'running_total': 39,
              'year_num': 2015,
              'yyyy_mm': '2015-04'}
-        self.assertEqual(dict(r.result_data['records'][0]), first_month)
+        self.assertEqual(dict(r.get_records()[0]), first_month)
 
         # check last month
         last_month = {'count': 10,
@@ -273,7 +327,7 @@ class MetricsCountTests(MetricsTestBase):
              'running_total': 356,
              'year_num': 2016,
              'yyyy_mm': '2016-07'}
-        self.assertEqual(dict(r.result_data['records'][-1]), last_month)
+        self.assertEqual(dict(r.get_records()[-1]), last_month)
 
     def test_05_dataset_total_counts(self):
         """05 - Count total datasets: published, unpublished, all"""
@@ -304,7 +358,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_dataset_counts_by_create_date_published()
 
         # check number of months
-        self.assertEqual(len(r.result_data['records']), 16)
+        self.assertEqual(len(r.get_records()), 16)
 
         # check 1st month
         first_month = {'count': 21,
@@ -314,7 +368,7 @@ class MetricsCountTests(MetricsTestBase):
          'running_total': 21,
          'year_num': 2015,
          'yyyy_mm': '2015-04'}
-        self.assertEqual(dict(r.result_data['records'][0]), first_month)
+        self.assertEqual(dict(r.get_records()[0]), first_month)
 
         # check last month
         last_month = {'count': 4,
@@ -324,7 +378,7 @@ class MetricsCountTests(MetricsTestBase):
          'running_total': 227,
          'year_num': 2016,
          'yyyy_mm': '2016-07'}
-        self.assertEqual(dict(r.result_data['records'][-1]), last_month)
+        self.assertEqual(dict(r.get_records()[-1]), last_month)
 
     def test_07_dataset_counts_unpublished(self):
         """07 - Test unpublished dataset counts by month"""
@@ -335,7 +389,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_dataset_counts_by_create_date_unpublished()
 
         # check number of months
-        self.assertEqual(len(r.result_data['records']), 16)
+        self.assertEqual(len(r.get_records()), 16)
 
         # check 1st month
         first_month = {'count': 15,
@@ -345,7 +399,7 @@ class MetricsCountTests(MetricsTestBase):
          'running_total': 15,
          'year_num': 2015,
          'yyyy_mm': '2015-04'}
-        self.assertEqual(dict(r.result_data['records'][0]), first_month)
+        self.assertEqual(dict(r.get_records()[0]), first_month)
 
         # check last month
         last_month = {'count': 94,
@@ -355,7 +409,7 @@ class MetricsCountTests(MetricsTestBase):
              'running_total': 343,
              'year_num': 2016,
              'yyyy_mm': '2016-07'}
-        self.assertEqual(dict(r.result_data['records'][-1]), last_month)
+        self.assertEqual(dict(r.get_records()[-1]), last_month)
 
     def test_08_dataset_counts_all(self):
         """08 - Test all dataset counts by month"""
@@ -366,7 +420,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_dataset_counts_by_create_date()
 
         # check number of months
-        self.assertEqual(len(r.result_data['records']), 16)
+        self.assertEqual(len(r.get_records()), 16)
 
         # check 1st month
         first_month = {'count': 36,
@@ -376,7 +430,7 @@ class MetricsCountTests(MetricsTestBase):
              'running_total': 36,
              'year_num': 2015,
              'yyyy_mm': '2015-04'}
-        self.assertEqual(dict(r.result_data['records'][0]), first_month)
+        self.assertEqual(dict(r.get_records()[0]), first_month)
 
         # check last month
         last_month = {'count': 98,
@@ -386,7 +440,7 @@ class MetricsCountTests(MetricsTestBase):
              'running_total': 570,
              'year_num': 2016,
              'yyyy_mm': '2016-07'}
-        self.assertEqual(dict(r.result_data['records'][-1]), last_month)
+        self.assertEqual(dict(r.get_records()[-1]), last_month)
 
 
     def test_09_file_total_counts(self):
@@ -418,7 +472,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_file_downloads_by_month_published()
 
         # check number of months
-        self.assertEqual(len(r.result_data['records']), 5)
+        self.assertEqual(len(r.get_records()), 5)
 
         # check last month
         last_month = {'count': 7,
@@ -428,7 +482,7 @@ class MetricsCountTests(MetricsTestBase):
              'running_total': 309,
              'year_num': 2015,
              'yyyy_mm': '2015-09'}
-        self.assertEqual(dict(r.result_data['records'][-1]), last_month)
+        self.assertEqual(dict(r.get_records()[-1]), last_month)
 
 
     def test_11_file_downloads_by_month_unpublished(self):
@@ -442,10 +496,10 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_file_downloads_by_month_unpublished()
 
         # check number of months
-        self.assertEqual(len(r.result_data['records']), 0)
+        self.assertEqual(len(r.get_records()), 0)
 
         # check data -- very rare to have downloaded "unpublished" files
-        self.assertEqual(r.result_data['records'], [])
+        self.assertEqual(r.get_records(), [])
 
     def test_12_file_downloads_by_month_all(self):
         """12 - File downloads by month: all"""
@@ -456,7 +510,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_file_downloads_by_month()
 
         # check number of months
-        self.assertEqual(len(r.result_data['records']), 9)
+        self.assertEqual(len(r.get_records()), 9)
 
         # check last month
         last_month = {'count': 31,
@@ -466,7 +520,7 @@ class MetricsCountTests(MetricsTestBase):
              'running_total': 465,
              'year_num': 2015,
              'yyyy_mm': '2015-12'}
-        self.assertEqual(dict(r.result_data['records'][-1]), last_month)
+        self.assertEqual(dict(r.get_records()[-1]), last_month)
 
     def test_13_file_content_types_published(self):
         """13 - Content types of published files"""
@@ -478,7 +532,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_datafile_content_type_counts_published()
 
         # check number of entries
-        self.assertEqual(len(r.result_data['records']), 18)
+        self.assertEqual(len(r.get_records()), 18)
 
         # check first listing
         first_listing = {'contenttype': u'application/octet-stream',
@@ -486,7 +540,7 @@ class MetricsCountTests(MetricsTestBase):
              'short_content_type': u'octet-stream',
              'total_count': 255,
              'type_count': 166}
-        self.assertEqual(dict(r.result_data['records'][0]), first_listing)
+        self.assertEqual(dict(r.get_records()[0]), first_listing)
 
         # check 3rd listing
         third_listing = {'contenttype': u'text/tab-separated-values',
@@ -494,7 +548,7 @@ class MetricsCountTests(MetricsTestBase):
          'short_content_type': u'tab-separated-values',
          'total_count': 255,
          'type_count': 23}
-        self.assertEqual(r.result_data['records'][2], third_listing)
+        self.assertEqual(r.get_records()[2], third_listing)
 
 
     def test_14_file_content_types_unpublished(self):
@@ -507,7 +561,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_datafile_content_type_counts_unpublished()
 
         # check number of entries
-        self.assertEqual(len(r.result_data['records']), 19)
+        self.assertEqual(len(r.get_records()), 19)
 
         # check first listing
         first_listing = {'contenttype': u'image/jpeg',
@@ -515,7 +569,7 @@ class MetricsCountTests(MetricsTestBase):
              'short_content_type': u'jpeg',
              'total_count': 126,
              'type_count': 57}
-        self.assertEqual(dict(r.result_data['records'][0]), first_listing)
+        self.assertEqual(dict(r.get_records()[0]), first_listing)
 
         # check 3rd listing
         third_listing = {'contenttype': u'text/plain',
@@ -523,7 +577,7 @@ class MetricsCountTests(MetricsTestBase):
              'short_content_type': u'plain',
              'total_count': 126,
              'type_count': 13}
-        self.assertEqual(r.result_data['records'][2], third_listing)
+        self.assertEqual(r.get_records()[2], third_listing)
 
     def test_15_file_content_types_all(self):
         """15 - Content types of all files"""
@@ -535,7 +589,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_datafile_content_type_counts()
 
         # check number of entries
-        self.assertEqual(len(r.result_data['records']), 25)
+        self.assertEqual(len(r.get_records()), 25)
 
         # check first listing
         first_listing = {'contenttype': u'application/octet-stream',
@@ -543,7 +597,7 @@ class MetricsCountTests(MetricsTestBase):
              'short_content_type': u'octet-stream',
              'total_count': 381,
              'type_count': 166}
-        self.assertEqual(dict(r.result_data['records'][0]), first_listing)
+        self.assertEqual(dict(r.get_records()[0]), first_listing)
 
         # check 3rd listing
         third_listing = {'contenttype': u'text/tab-separated-values',
@@ -552,7 +606,7 @@ class MetricsCountTests(MetricsTestBase):
              'total_count': 381,
              'type_count': 49}
 
-        self.assertEqual(dict(r.result_data['records'][2]), third_listing)
+        self.assertEqual(dict(r.get_records()[2]), third_listing)
 
 
 
@@ -565,7 +619,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_dataverse_counts_by_type_published()
 
         # check number of entries
-        self.assertEqual(len(r.result_data['records']), 6)
+        self.assertEqual(len(r.get_records()), 6)
 
         # check first listing
         first_listing = {'dataversetype': u'RESEARCHERS',
@@ -573,7 +627,7 @@ class MetricsCountTests(MetricsTestBase):
               'percent_string': '34.0%',
               'total_count': 153,
               'type_count': 52}
-        self.assertEqual(dict(r.result_data['records'][0]), first_listing)
+        self.assertEqual(dict(r.get_records()[0]), first_listing)
 
         # check last listing
         last_listing = {'dataversetype': u'RESEARCH_GROUP',
@@ -581,7 +635,7 @@ class MetricsCountTests(MetricsTestBase):
              'percent_string': '1.3%',
              'total_count': 153,
              'type_count': 2}
-        self.assertEqual(dict(r.result_data['records'][-1]), last_listing)
+        self.assertEqual(dict(r.get_records()[-1]), last_listing)
 
         # -------------------------
         # Include UNCATEGORIZED Dataverses
@@ -591,7 +645,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_dataverse_counts_by_type_published(exclude_uncategorized=False)
 
         # check number of entries
-        self.assertEqual(len(r.result_data['records']), 7)
+        self.assertEqual(len(r.get_records()), 7)
 
         # check UNCATEGORIZED listing
         uncat_listing = {'dataversetype': u'UNCATEGORIZED',
@@ -599,7 +653,7 @@ class MetricsCountTests(MetricsTestBase):
              'percent_string': '18.2%',
              'total_count': 187,
              'type_count': 34}
-        self.assertEqual(r.result_data['records'][3], uncat_listing)
+        self.assertEqual(r.get_records()[3], uncat_listing)
 
 
 
@@ -612,7 +666,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_dataverse_counts_by_type_unpublished()
 
         # check number of entries
-        self.assertEqual(len(r.result_data['records']), 6)
+        self.assertEqual(len(r.get_records()), 6)
 
         # check first listing
         first_listing = {'dataversetype': u'RESEARCHERS',
@@ -620,7 +674,7 @@ class MetricsCountTests(MetricsTestBase):
              'percent_string': '44.2%',
              'total_count': 138,
              'type_count': 61}
-        self.assertEqual(dict(r.result_data['records'][0]), first_listing)
+        self.assertEqual(dict(r.get_records()[0]), first_listing)
 
         # check last listing
         last_listing = {'dataversetype': u'LABORATORY',
@@ -629,7 +683,7 @@ class MetricsCountTests(MetricsTestBase):
              'total_count': 138,
              'type_count': 1}
 
-        self.assertEqual(dict(r.result_data['records'][-1]), last_listing)
+        self.assertEqual(dict(r.get_records()[-1]), last_listing)
 
         # -------------------------
         # Include UNCATEGORIZED Dataverses
@@ -639,7 +693,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_dataverse_counts_by_type_unpublished(exclude_uncategorized=False)
 
         # check number of entries
-        self.assertEqual(len(r.result_data['records']), 7)
+        self.assertEqual(len(r.get_records()), 7)
 
         # check UNCATEGORIZED listing
         uncat_listing =  {'dataversetype': u'UNCATEGORIZED',
@@ -647,7 +701,7 @@ class MetricsCountTests(MetricsTestBase):
               'percent_string': '18.3%',
               'total_count': 169,
               'type_count': 31}
-        self.assertEqual(r.result_data['records'][2], uncat_listing)
+        self.assertEqual(r.get_records()[2], uncat_listing)
 
     def test_18_dataverse_types_all(self):
         """18 - Affiliations of all dataverses types"""
@@ -658,7 +712,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_dataverse_counts_by_type()
 
         # check number of entries
-        self.assertEqual(len(r.result_data['records']), 7)
+        self.assertEqual(len(r.get_records()), 7)
 
         # check first listing
         first_listing = {'dataversetype': u'RESEARCHERS',
@@ -666,7 +720,7 @@ class MetricsCountTests(MetricsTestBase):
               'percent_string': '38.8%',
               'total_count': 291,
               'type_count': 113}
-        self.assertEqual(dict(r.result_data['records'][0]), first_listing)
+        self.assertEqual(dict(r.get_records()[0]), first_listing)
 
         # check last listing
         last_listing =  {'dataversetype': u'LABORATORY',
@@ -675,7 +729,7 @@ class MetricsCountTests(MetricsTestBase):
               'total_count': 291,
               'type_count': 1}
 
-        self.assertEqual(dict(r.result_data['records'][-1]), last_listing)
+        self.assertEqual(dict(r.get_records()[-1]), last_listing)
 
         # -------------------------
         # Include UNCATEGORIZED Dataverses
@@ -685,7 +739,7 @@ class MetricsCountTests(MetricsTestBase):
         r = stats_maker.get_dataverse_counts_by_type(exclude_uncategorized=False)
 
         # check number of entries
-        self.assertEqual(len(r.result_data['records']), 8)
+        self.assertEqual(len(r.get_records()), 8)
 
         # check UNCATEGORIZED listing
         uncat_listing =   {'dataversetype': u'UNCATEGORIZED',
@@ -693,7 +747,7 @@ class MetricsCountTests(MetricsTestBase):
           'percent_string': '18.3%',
           'total_count': 356,
           'type_count': 65}
-        self.assertEqual(dict(r.result_data['records'][2]), uncat_listing)
+        self.assertEqual(dict(r.get_records()[2]), uncat_listing)
 
 
     def test_19_file_extensions_within_type(self):
@@ -711,7 +765,7 @@ class MetricsCountTests(MetricsTestBase):
 
         # check that list length matches number of extensions
         #
-        ext_counts = r.result_data.get('records', [])
+        ext_counts = r.get_records()
         self.assertEqual(len(ext_counts), 67)
 
         print ('ext_counts', ext_counts[4])
@@ -720,3 +774,896 @@ class MetricsCountTests(MetricsTestBase):
         listing_5 = OrderedDict([('extension', u'.docx'), ('count', 15), ('total_count', 437), ('percent_string', '3.432%')])
 
         self.assertEqual(listing_5, ext_counts[4])
+
+
+    def test_20_file_downloads_by_month_rollup(self):
+        """20 - File downloads by month: rollup table matches the live query"""
+        print (self.test_20_file_downloads_by_month_rollup.__doc__)
+
+        kwargs = dict(selected_year=2015)
+
+        with self.settings(METRICS_USE_DOWNLOAD_ROLLUP=False):
+            live_result = StatsMakerFiles(**kwargs).get_file_downloads_by_month()
+
+        DownloadRollupUtil(batch_size=100).refresh(rebuild=True)
+
+        rollup_result = StatsMakerFiles(**kwargs).get_file_downloads_by_month()
+
+        self.assertTrue(len(live_result.get_records()) > 0)
+        self.assertEqual(rollup_result.get_records(),\
+                        live_result.get_records())
+        self.assertEqual(rollup_result.result_data['total_downloads'],\
+                        live_result.result_data['total_downloads'])
+
+
+    def test_21_running_total_start_point(self):
+        """21 - Running totals include records before the start date"""
+        print (self.test_21_running_total_start_point.__doc__)
+
+        stats_maker = StatsMakerDatasets(start_date='2016-01-01')
+
+        r = stats_maker.get_dataset_counts_by_create_date()
+        records = r.get_records()
+        self.assertTrue(len(records) > 0)
+
+        start_point = Dataset.objects.filter(\
+                        dvobject__createdate__lt=datetime(2016, 1, 1)).count()
+        self.assertTrue(start_point > 0)
+
+        # check 1st month
+        self.assertEqual(records[0]['running_total'],\
+                        start_point + records[0]['count'])
+
+        # check last month
+        self.assertEqual(records[-1]['running_total'],\
+                        start_point + sum([rec['count'] for rec in records]))
+
+
+    def test_22_batch_metrics(self):
+        """22 - Several metrics in one batch match the single metrics"""
+        print (self.test_22_batch_metrics.__doc__)
+
+        kwargs = dict(start_date='2015-06-01', pub_state='all')
+
+        with self.settings(METRICS_MAX_WORKERS=1):
+            stats_batch = StatsMakerBatch(\
+                    metrics='datasets/count,dataverses/count/monthly,files/count',
+                    **kwargs)
+            r = stats_batch.get_batch_results()
+
+        self.assertFalse(r.has_error())
+        self.assertEqual(r.result_data.keys(),\
+                ['datasets/count', 'dataverses/count/monthly', 'files/count'])
+
+        self.assertEqual(r.result_data['datasets/count']['status'], 'OK')
+        self.assertEqual(r.result_data['datasets/count']['data'],\
+                StatsMakerDatasets(**kwargs).get_dataset_count().get_result_data())
+
+        self.assertEqual(r.result_data['dataverses/count/monthly']['data'],\
+                StatsMakerDataverses(**kwargs).get_dataverse_counts_by_month().get_result_data())
+
+        self.assertEqual(r.result_data['files/count']['data'],\
+                StatsMakerFiles(**kwargs).get_datafile_count().get_result_data())
+
+        # unknown metric
+        r = StatsMakerBatch(metrics='datasets/count,no-such-metric').get_batch_results()
+        self.assertTrue(r.has_error())
+        self.assertEqual(r.bad_http_status_code, 400)
+
+
+    def test_23_thread_pool_timeout(self):
+        """23 - Thread pool keeps the order and skips calls which time out"""
+        print (self.test_23_thread_pool_timeout.__doc__)
+
+        stats_calls = OrderedDict()
+        stats_calls['slow'] = lambda: time.sleep(2) or 'slow'
+        stats_calls['fast'] = lambda: 'fast'
+
+        results = run_in_thread_pool(stats_calls, max_workers=2, timeout=0.5)
+        self.assertEqual(results.keys(), ['slow', 'fast'])
+        self.assertEqual(results['slow'], None)
+        self.assertEqual(results['fast'], 'fast')
+
+        # single thread
+        results = run_in_thread_pool(OrderedDict([('fast', lambda: 'fast')]))
+        self.assertEqual(results, OrderedDict([('fast', 'fast')]))
+
+
+    def test_24_dataverse_tree_index(self):
+        """24 - Dataverse tree index: subtrees match the tree"""
+        print (self.test_24_dataverse_tree_index.__doc__)
+
+        tree_util = DataverseTreeUtil()
+        tree_index = tree_util.get_tree_index()
+
+        # cached until the Dataverses change
+        self.assertTrue(tree_index is tree_util.get_tree_index())
+
+        full_tree = tree_util.get_dataverse_tree_dict(skip_flat_dataverses=False)
+        self.assertEqual(full_tree['id'], tree_index.root_id)
+
+        def gather_ids(tree_info):
+            id_list = [tree_info['id']]
+            for child_tree in tree_info.get('children', []):
+                id_list += gather_ids(child_tree)
+            return id_list
+
+        self.assertEqual(len(tree_index.get_subtree_ids(tree_index.root_id)),\
+                        len(gather_ids(full_tree)))
+
+        for child_tree in full_tree['children']:
+            subtree_ids = tree_index.get_subtree_ids(child_tree['id'])
+            self.assertEqual(sorted(subtree_ids), sorted(gather_ids(child_tree)))
+
+            for dv_id in subtree_ids:
+                self.assertTrue(tree_index.is_descendant(dv_id, child_tree['id']))
+                self.assertTrue(tree_index.is_descendant(dv_id, tree_index.root_id))
+            self.assertFalse(tree_index.is_descendant(tree_index.root_id, child_tree['id']))
+
+
+    def test_25_latest_dataset_versions(self):
+        """25 - Latest DatasetVersion of each Dataset, resolved in SQL"""
+        print (self.test_25_latest_dataset_versions.__doc__)
+
+        # latest version: highest id for each dataset
+        expected_ids = {}
+        for info in DatasetVersion.objects.values('id', 'dataset_id'):
+            expected_ids[info['dataset_id']] = max(info['id'],\
+                            expected_ids.get(info['dataset_id'], 0))
+
+        latest_ids = list(LatestVersionIndex().get_latest_version_ids())
+        self.assertTrue(len(latest_ids) > 0)
+        self.assertEqual(sorted(latest_ids), sorted(expected_ids.values()))
+
+        # narrowed to published datasets
+        published_ids = Dataset.objects.filter(\
+                            dvobject__publicationdate__isnull=False\
+                            ).values_list('dvobject__id', flat=True)
+        latest_ids = list(LatestVersionIndex().get_latest_version_ids(\
+                            dvobject__publicationdate__isnull=False))
+        self.assertEqual(sorted(latest_ids),\
+                sorted([expected_ids[x] for x in published_ids if x in expected_ids]))
+
+
+    def test_26_histogram_bins(self):
+        """26 - Files per dataset and bytes per dataset, binned in SQL"""
+        print (self.test_26_histogram_bins.__doc__)
+
+        # file count for each latest DatasetVersion
+        latest_ids = list(LatestVersionIndex().get_latest_version_ids())
+        file_counts = {}
+        for dsv_id in FileMetadata.objects.filter(datasetversion__id__in=latest_ids\
+                        ).values_list('datasetversion__id', flat=True):
+            file_counts[dsv_id] = file_counts.get(dsv_id, 0) + 1
+        self.assertTrue(len(file_counts) > 0)
+
+        def get_bin_counts(**params):
+            r = StatsMakerDatasetBins(**params).get_file_counts_per_dataset_latest_versions()
+            self.assertTrue(r.has_error() is False)
+            return [(x['bin_start_inclusive'], x['bin_end'], x['count'])\
+                        for x in r.get_records()]
+
+        def count_values(low, high):
+            return len([x for x in file_counts.values() if low < x <= high])
+
+        # fixed bins, running past the highest count
+        bins = get_bin_counts(bin_size=5)
+        self.assertEqual(len(bins), max(file_counts.values()) // 5 + 2)
+        for bin_start, bin_end, cnt in bins:
+            self.assertEqual(bin_end - bin_start, 5)
+            self.assertEqual(cnt, count_values(bin_start, bin_end))
+        self.assertEqual(sum([x[2] for x in bins]), len(file_counts))
+
+        bins = get_bin_counts(bin_size=5, skip_empty_bins='true')
+        self.assertTrue(len(bins) > 0)
+        self.assertTrue(0 not in [x[2] for x in bins])
+
+        # log bins: (0, 1], (1, 10], (10, 100], ...
+        bins = get_bin_counts(bin_log_base=10)
+        self.assertEqual(bins[0][:2], (0, 1))
+        self.assertEqual(bins[1][:2], (1, 10))
+        for bin_start, bin_end, cnt in bins:
+            self.assertEqual(cnt, count_values(bin_start, bin_end))
+        self.assertEqual(sum([x[2] for x in bins]), len(file_counts))
+
+        # custom edges: values outside the edges aren't counted
+        bins = get_bin_counts(bin_edges='1,3,10')
+        self.assertEqual(bins, [(1, 3, count_values(1, 3)), (3, 10, count_values(3, 10))])
+
+        r = StatsMakerDatasetBins(bin_edges='10,3').get_file_counts_per_dataset_latest_versions()
+        self.assertTrue(r.has_error())
+
+        # bytes per dataset
+        r = StatsMakerDatasetSizes(bin_size_bytes=10**6).get_dataset_size_counts()
+        self.assertTrue(r.has_error() is False)
+        self.assertEqual(r.result_data['dataset_count'],\
+                        sum([x['count'] for x in r.get_records()]))
+        self.assertEqual(r.result_data['total_bytes_used'],\
+                    sum(Datafile.objects.filter(filesize__isnull=False\
+                        ).values_list('filesize', flat=True)))
+
+
+    def test_27_streaming_exports(self):
+        """27 - CSV and Excel exports are streamed"""
+        print (self.test_27_streaming_exports.__doc__)
+
+        # one line per record; unicode as utf-8
+        records = [OrderedDict([('name', u'caf\xe9, etc'), ('count', x)])\
+                    for x in range(3)]
+        stats_result = StatsResult.build_success_result(dict(records=records))
+        self.assertEqual(list(stats_result.iter_csv_lines()),\
+                ['name,count\n'] +\
+                ['"caf\xc3\xa9, etc",%s\n' % x for x in range(3)])
+
+        stats_result = StatsResult.build_success_result(dict(records=[]))
+        self.assertEqual(stats_result.get_csv_content(), '')
+
+        # through the API
+        api_url = reverse('view_dataset_counts_by_month')
+        with self.settings(DEBUG=True):
+            json_resp = self.client.get(api_url, dict(start_date='2015-06-01'))
+            csv_resp = self.client.get(api_url, dict(start_date='2015-06-01', as_csv='true'))
+            xlsx_resp = self.client.get(api_url, dict(start_date='2015-06-01', as_excel='true'))
+
+        json_records = json_resp.json()['data']['records']
+        self.assertTrue(len(json_records) > 0)
+
+        self.assertTrue(csv_resp.streaming)
+        csv_lines = ''.join(csv_resp.streaming_content).splitlines()
+        self.assertEqual(sorted(csv_lines[0].split(',')), sorted(json_records[0].keys()))
+        self.assertEqual(len(csv_lines), len(json_records) + 1)
+
+        self.assertTrue(xlsx_resp.streaming)
+        xlsx_content = ''.join(xlsx_resp.streaming_content)
+        self.assertTrue(xlsx_content.startswith('PK'))
+        self.assertEqual(len(xlsx_content), int(xlsx_resp['Content-Length']))
+
+
+    def test_28_stats_result_cache(self):
+        """28 - Cached results ignore the API key, param order and output format"""
+        print (self.test_28_stats_result_cache.__doc__)
+
+        view_name = 'FileTotalCountsView'
+        cache_key = get_stats_result_cache_key(view_name, {},\
+                        QueryDict('start_date=2015-01-01&pub_state=all'))
+        for query_str in ['pub_state=all&start_date=2015-01-01',
+                          'start_date=2015-01-01&pub_state=all&key=abc-123',
+                          'pretty&key=xyz&pub_state=all&start_date=2015-01-01&as_csv=true']:
+            self.assertEqual(cache_key,\
+                    get_stats_result_cache_key(view_name, {}, QueryDict(query_str)))
+
+        self.assertNotEqual(cache_key, get_stats_result_cache_key(view_name, {},\
+                        QueryDict('start_date=2015-01-02&pub_state=all')))
+        self.assertNotEqual(cache_key, get_stats_result_cache_key('DatasetTotalCounts', {},\
+                        QueryDict('start_date=2015-01-01&pub_state=all')))
+        self.assertNotEqual(get_stats_result_cache_key(view_name, dict(dv_id='1'), QueryDict('')),\
+                        get_stats_result_cache_key(view_name, dict(dv_id='2'), QueryDict('')))
+
+        # through the API: the 2nd request is answered from the cache
+        api_url = reverse('view_dataset_counts_by_month')
+        cache.clear()
+        with self.settings(DEBUG=True, METRICS_CACHE_VIEW=True, METRICS_CACHE_API_TIME=60):
+            resp1 = self.client.get(api_url + '?start_date=2015-06-01&pub_state=all&key=abc')
+            time.sleep(1.1)
+            resp2 = self.client.get(api_url + '?pub_state=all&start_date=2015-06-01&key=xyz')
+            csv_resp = self.client.get(api_url + '?pub_state=all&start_date=2015-06-01&as_csv=true')
+
+        info1, info2 = resp1.json()['info'], resp2.json()['info']
+        self.assertEqual(info1['generation_time'], info2['generation_time'])
+        self.assertEqual(resp1.json()['data'], resp2.json()['data'])
+
+        csv_lines = ''.join(csv_resp.streaming_content).splitlines()
+        self.assertEqual(len(csv_lines), len(resp1.json()['data']['records']) + 1)
+        cache.clear()
+
+
+    def test_29_file_extensions_in_sql(self):
+        """29 - File extensions are found and counted in SQL"""
+        print (self.test_29_file_extensions_in_sql.__doc__)
+
+        fmeta_id = FileMetadata.objects.values_list('id', flat=True)[0]
+        for label in ['data.csv', 'data.tar.gz', 'README', '.bashrc', 'notes.',\
+                    'a..b', 'dir.d/file', u'caf\xe9.t\xe9xt']:
+            extension = FileMetadata.objects.filter(id=fmeta_id\
+                    ).annotate(lbl=Value(label, output_field=CharField())\
+                    ).annotate(ext=FileExtension('lbl')\
+                    ).values_list('ext', flat=True)[0]
+            self.assertEqual(extension, splitext(label)[1])
+
+        # top extensions only; the totals include all of them
+        stats_maker = StatsMakerFiles()
+        r_all = stats_maker.view_file_extensions_within_type(file_type=FILE_TYPE_OCTET_STREAM)
+        r_top = stats_maker.view_file_extensions_within_type(file_type=FILE_TYPE_OCTET_STREAM,\
+                                max_extensions=5)
+
+        self.assertEqual(r_top.result_data['record_count'], 5)
+        self.assertEqual(r_top.get_records(), r_all.get_records()[:5])
+        for key in ['number_unique_extensions', 'total_file_count', 'percent_unknown']:
+            self.assertEqual(r_top.result_data[key], r_all.result_data[key])
+
+
+    def test_30_file_extension_index(self):
+        """30 - Extension index counts match the live counts, also after changes"""
+        print (self.test_30_file_extension_index.__doc__)
+
+        def get_counts(file_type, use_extension_index):
+            r = StatsMakerFiles().view_file_extensions_within_type(\
+                            file_type, use_extension_index=use_extension_index)
+            return r.result_data
+
+        index_util = FileExtensionIndexUtil(batch_size=500)
+        self.assertFalse(index_util.is_index_available())
+
+        num_labeled = FileMetadata.objects.values('datafile__id').distinct().count()
+        self.assertEqual(index_util.refresh(), num_labeled)
+        self.assertTrue(index_util.is_index_available())
+        self.assertEqual(DatafileExtension.objects.count(),\
+                    FileMetadata.objects.values('datafile__id', 'label').distinct().count())
+
+        for file_type in (FILE_TYPE_OCTET_STREAM, None):
+            index_counts = get_counts(file_type, True)
+            self.assertTrue(index_counts['record_count'] > 0)
+            self.assertEqual(index_counts, get_counts(file_type, False))
+
+        # nothing changed
+        self.assertEqual(index_util.refresh(), 0)
+
+        # a relabeled file and a new content type are re-indexed
+        fmd = FileMetadata.objects.filter(datafile__datafile__contenttype=FILE_TYPE_OCTET_STREAM\
+                                ).order_by('id').first()
+        FileMetadata.objects.filter(id=fmd.id).update(label='relabeled.tar.gz')
+        retyped_id = Datafile.objects.filter(contenttype=FILE_TYPE_OCTET_STREAM\
+                                ).exclude(dvobject__id=fmd.datafile_id\
+                                ).order_by('dvobject__id').values_list('dvobject__id', flat=True)[0]
+        Datafile.objects.filter(dvobject__id=retyped_id).update(contenttype='text/csv')
+
+        self.assertEqual(index_util.refresh(), 2)
+        for file_type in (FILE_TYPE_OCTET_STREAM, 'text/csv', None):
+            self.assertEqual(get_counts(file_type, True), get_counts(file_type, False))
+
+        # start over
+        self.assertEqual(index_util.refresh(rebuild=True), num_labeled)
+        self.assertEqual(index_util.refresh(), 0)
+
+        # the fix-extension form checks the labels, e.g. multi-dot extensions
+        self.assertTrue(FixContentTypeForm(dict(file_extension='.tar.gz',\
+                                new_content_type='application/gzip')).is_valid())
+        self.assertFalse(FixContentTypeForm(dict(file_extension='.no-such-ext',\
+                                new_content_type='application/gzip')).is_valid())
+
+
+    def test_31_dataset_subject_counts(self):
+        """31 - Subjects of the latest versions are counted in one query"""
+        print (self.test_31_dataset_subject_counts.__doc__)
+
+        clear_subject_field_type_cache()
+        self.assertTrue(StatsMakerDatasets().get_dataset_subject_counts().has_error())
+
+        mblock = MetadataBlock.objects.create(name='citation', displayname='Citation')
+        field_type = DatasetFieldType.objects.create(name='subject',\
+                        required=True, fieldtype='TEXT', metadatablock=mblock,\
+                        advancedsearchfieldtype=False, allowcontrolledvocabulary=True,\
+                        allowmultiples=True, displayoncreate=True, facetable=True)
+        vocab_values = [ControlledVocabularyValue.objects.create(strvalue=subject,\
+                            datasetfieldtype=field_type, displayorder=idx)\
+                        for idx, subject in enumerate(['Chemistry', 'Law', 'Medicine'])]
+
+        # a subject for each version: only the latest versions count
+        expected_counts = {}
+        latest_version_ids = set(DatasetVersion.objects.order_by('dataset_id', '-id'\
+                                ).distinct('dataset_id').values_list('id', flat=True))
+        for cnt, dsv_id in enumerate(DatasetVersion.objects.values_list('id', flat=True)[:300]):
+            vocab_value = vocab_values[cnt % 5 % 3]
+            ds_field = DatasetField.objects.create(datasetfieldtype=field_type,\
+                                                   datasetversion_id=dsv_id)
+            DatasetFieldControlledVocabularyValue.objects.bulk_create(\
+                [DatasetFieldControlledVocabularyValue(datasetfield=ds_field,\
+                                controlledvocabularyvalues=vocab_value)])
+            if dsv_id in latest_version_ids:
+                expected_counts[vocab_value.strvalue] =\
+                    expected_counts.get(vocab_value.strvalue, 0) + 1
+
+        stats_maker = StatsMakerDatasets()
+        r = stats_maker.get_dataset_subject_counts()
+        records = r.get_records()
+        self.assertEqual(dict([(rec['subject'], rec['count']) for rec in records]),\
+                        expected_counts)
+        self.assertEqual(records[0]['count'], max(expected_counts.values()))
+        self.assertEqual(records[0]['total_count'], sum(expected_counts.values()))
+
+        # the DatasetFieldType id is cached
+        with self.assertNumQueries(1, using=DatasetFieldType.objects.db):
+            stats_maker.get_dataset_subject_counts()
+
+        clear_subject_field_type_cache()
+
+
+    def test_32_warm_metrics(self):
+        """32 - The cache warmer recomputes cached metrics"""
+        print (self.test_32_warm_metrics.__doc__)
+
+        lock_file_name = join(tempfile.gettempdir(), 'test_warm_metrics.lock')
+        warm_items = ['total_published_counts',
+                      ('view_dataset_counts_by_month', dict(pub_state='all', start_date='2015-06-01')),
+                      'installation_map',
+                      'no_such_item']
+        cache.clear()
+        with self.settings(METRICS_CACHE_VIEW=True, METRICS_CACHE_VIEW_TIME=60,\
+                           METRICS_CACHE_API_TIME=60):
+            warmer = MetricsWarmer(items=warm_items, lock_file_name=lock_file_name)
+            results = warmer.warm()
+
+            self.assertEqual([r.is_ok() for r in results], [True, True, True, False])
+            self.assertEqual(results[1].name,\
+                    'view_dataset_counts_by_month?pub_state=all&start_date=2015-06-01')
+
+            # page data and API results are read from the cache
+            cached_counts = cache.get(get_view_data_cache_key(TOTAL_PUBLISHED_COUNTS_DATA))
+            self.assertEqual(cached_counts, get_total_published_counts())
+
+            cached_map_data = cache.get(get_view_data_cache_key(INSTALLATION_MAP_DATA))
+            self.assertEqual(cached_map_data['installation_count'],\
+                             Installation.objects.filter(is_active=True).count())
+
+            api_cache_key = get_stats_result_cache_key(\
+                    'dv_apps.metrics.stats_views_datasets.DatasetCountByMonthView', {},\
+                    QueryDict('start_date=2015-06-01&pub_state=all'))
+            stats_result, generation_time = cache.get(api_cache_key)
+            self.assertTrue(len(stats_result.get_records()) > 0)
+            self.assertFalse('records' in stats_result.result_data)   # cached as columns
+
+            # only one run at a time
+            with open(lock_file_name, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.assertRaises(WarmLockError, warmer.warm)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        cache.clear()
+
+
+    def test_33_api_timing(self):
+        """33 - API requests report and log their queries and timing"""
+        print (self.test_33_api_timing.__doc__)
+
+        log_records = []
+        log_handler = logging.Handler()
+        log_handler.emit = log_records.append
+        timing_logger = logging.getLogger(TIMING_LOGGER_NAME)
+        timing_logger.addHandler(log_handler)
+
+        api_url = reverse('view_dataset_counts_by_month') + '?pub_state=all'
+        cache.clear()
+        try:
+            with self.settings(DEBUG=True, METRICS_CACHE_VIEW=True, METRICS_CACHE_API_TIME=60):
+                timing_miss = self.client.get(api_url + '&timing=1').json()['info']['timing']
+                timing_hit = self.client.get(api_url + '&timing=true').json()['info']['timing']
+                resp = self.client.get(api_url)
+        finally:
+            timing_logger.removeHandler(log_handler)
+            cache.clear()
+
+        self.assertEqual(timing_miss['cache'], 'miss')
+        self.assertTrue(timing_miss['query_count'] > 0)
+        self.assertTrue(timing_miss['db_ms'] <= timing_miss['total_ms'])
+
+        self.assertEqual(timing_hit['cache'], 'hit')
+        self.assertEqual(timing_hit['query_count'], 0)
+
+        self.assertFalse('timing' in resp.json()['info'])
+
+        # one log line per request
+        self.assertEqual(len(log_records), 3)
+        log_msg = log_records[0].getMessage()
+        self.assertTrue(log_msg.startswith('metrics_timing endpoint=DatasetCountByMonthView status=200 cache=miss'))
+        self.assertTrue(' query_count=%s ' % timing_miss['query_count'] in log_msg)
+
+        for conn in connections.all():
+            self.assertFalse(conn.force_debug_cursor)
+
+
+    def test_34_synthetic_data_and_benchmark(self):
+        """34 - Synthetic data is repeatable; the benchmark times each endpoint"""
+        print (self.test_34_synthetic_data_and_benchmark.__doc__)
+
+        def get_new_files(start_id):
+            return list(Datafile.objects.filter(dvobject__id__gte=start_id\
+                            ).order_by('dvobject__id'\
+                            ).values_list('contenttype', 'filesize', 'restricted'))
+
+        num_files = Datafile.objects.count()
+        num_responses = GuestBookResponse.objects.count()
+
+        # the Dataverse db is refused unless allowed; the alias is required
+        db_alias = DvObject.objects.db
+        self.assertRaises(SyntheticDataError, SyntheticDataGenerator, 400, db_alias)
+        self.assertRaises(SyntheticDataError, SyntheticDataGenerator, 400, 'no_such_db')
+        self.assertRaises(CommandError, management.call_command, 'generate_metrics_data',\
+                          '--database', db_alias, '--append', '--files', '1')
+        self.assertRaises(CommandError, management.call_command, 'generate_metrics_data',\
+                          '--append', '--files', '1')
+        self.assertEqual(Datafile.objects.count(), num_files)
+
+        # same seed, same rows--after the existing ids
+        with self.settings(ALLOW_SYNTHETIC_DATA=True):
+            first_id = DvObject.objects.order_by('-id').first().id + 1
+            row_counts = dict(SyntheticDataGenerator(400, db_alias, seed=5, batch_size=100).generate())
+            second_id = DvObject.objects.order_by('-id').first().id + 1
+            SyntheticDataGenerator(400, db_alias, seed=5, batch_size=100).generate()
+
+        self.assertEqual(row_counts[Datafile], 400)
+        self.assertEqual(Datafile.objects.count(), num_files + 800)
+        self.assertEqual(GuestBookResponse.objects.count(),\
+                         num_responses + 2 * row_counts[GuestBookResponse])
+        self.assertEqual(get_new_files(first_id)[:400], get_new_files(second_id))
+
+        # each new version has a subject and a FileMetadata per file
+        new_versions = DatasetVersion.objects.filter(dataset__dvobject__id__gte=first_id)
+        self.assertEqual(new_versions.count(), 2 * row_counts[DatasetVersion])
+        self.assertEqual(DatasetField.objects.filter(datasetversion__in=new_versions).count(),\
+                         new_versions.count())
+
+        # ids and create dates are written as generated
+        new_ds = Dataset.objects.filter(dvobject__id__gte=second_id).first()
+        self.assertEqual(new_ds.identifier, 'SYN%s' % new_ds.dvobject.id)
+        self.assertTrue(new_ds.dvobject.createdate.year < 2018)
+        self.assertEqual(DvObject.objects.create(dtype='Dataverse').id,\
+                         DvObject.objects.order_by('-id').first().id)
+
+        # benchmark
+        report = MetricsBenchmark(view_classes=[DatasetCountByMonthView, DatasetByIdView],\
+                                  repeat=2).run()
+        self.assertEqual(report['row_counts']['datafile'], num_files + 800)
+        self.assertEqual([(r['endpoint'], r['status']) for r in report['results']],\
+                         [('DatasetCountByMonthView', STATUS_OK),\
+                          ('DatasetCountByMonthView', STATUS_OK),\
+                          ('DatasetByIdView', STATUS_OK)])
+        self.assertEqual(report['results'][1]['params'], dict(pub_state='all'))
+        self.assertTrue(report['results'][1]['record_count'] > 0)
+        self.assertEqual(len(report['results'][0]['runs_ms']), 2)
+        self.assertTrue(report['results'][0]['query_count'] > 0)
+
+        report_file = tempfile.NamedTemporaryFile(suffix='.json')
+        write_report(report, report_file.name)
+        comparisons = compare_reports(load_report(report_file.name), report)
+        report_file.close()
+        self.assertEqual(len(comparisons), 3)
+        self.assertEqual(comparisons[0][2], comparisons[0][3])
+
+
+    def test_35_query_budget(self):
+        """35 - Metrics queries past their budget return a 503 with a retry hint"""
+        print (self.test_35_query_budget.__doc__)
+
+        def slow_stats():
+            cursor = connections[DvObject.objects.db].cursor()
+            try:
+                cursor.execute('SELECT pg_sleep(2)')
+            finally:
+                cursor.close()
+            return StatsResult.build_success_result(dict(records=[]))
+
+        log_records = []
+        log_handler = logging.Handler()
+        log_handler.emit = log_records.append
+        timeout_logger = logging.getLogger(QUERY_TIMEOUT_LOGGER_NAME)
+        timeout_logger.addHandler(log_handler)
+        try:
+            with self.settings(METRICS_QUERY_TIMEOUT=30,\
+                               METRICS_QUERY_TIMEOUTS={'slow/metric': 0.1},\
+                               METRICS_QUERY_RETRY_AFTER=90):
+                start_time = time.time()
+                stats_result = StatsMakerBase.run_with_query_budget('slow/metric',\
+                                    slow_stats, dict(start_date='2015-01-01', key='secret'))
+                self.assertTrue(time.time() - start_time < 1.5)
+
+                # other metrics get the default budget; lazy records are loaded
+                stats_files = StatsMakerFiles()
+                ok_result = StatsMakerBase.run_with_query_budget('files/count/by-type',\
+                                    stats_files.get_datafile_content_type_counts_published)
+        finally:
+            timeout_logger.removeHandler(log_handler)
+
+        self.assertTrue(stats_result.has_error())
+        self.assertEqual(stats_result.bad_http_status_code, 503)
+        self.assertEqual(stats_result.retry_after_seconds, 90)
+        self.assertFalse(ok_result.has_error())
+        self.assertTrue(isinstance(ok_result.get_records(), list))
+
+        self.assertEqual(len(log_records), 1)
+        self.assertEqual(log_records[0].getMessage(),\
+            'metrics_query_timeout metric=slow/metric timeout_seconds=0.1 params=start_date=2015-01-01')
+
+        # the API response
+        view = DatasetCountByMonthView()
+        request = self.client.get('/').wsgi_request
+        resp = view.get_stats_response(request, stats_result, None, None)
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp['Retry-After'], '90')
+        self.assertEqual(json.loads(resp.content)['retry_after_seconds'], 90)
+
+    def test_36_monthly_snapshots(self):
+        """36 - Frozen monthly counts match the live counts"""
+        print (self.test_36_monthly_snapshots.__doc__)
+
+        # settle everything from 2016-01 on
+        now = datetime.now()
+        settle_months = (now.year * 12 + now.month - 1) - (2016 * 12)
+
+        def get_records(**kwargs):
+            r = StatsMakerDatasets(**kwargs).get_dataset_counts_by_create_date()
+            self.assertFalse(r.has_error())
+            return [dict(rec) for rec in r.get_records()]
+
+        def get_file_records():
+            r = StatsMakerFiles().get_file_count_by_month()
+            self.assertFalse(r.has_error())
+            return [dict(rec) for rec in r.get_records()]
+
+        with self.settings(METRICS_USE_MONTHLY_SNAPSHOTS=False):
+            live_records = get_records()
+            live_desc_records = get_records(time_sort='d')
+            live_start_records = get_records(start_date='2015-09-01')
+            live_file_records = get_file_records()
+        self.assertEqual(MonthlySnapshotSet.objects.count(), 0)
+
+        with self.settings(METRICS_SNAPSHOT_SETTLE_MONTHS=settle_months):
+            # 1st call freezes, 2nd reads the frozen months
+            self.assertEqual(get_records(), live_records)
+            self.assertEqual(get_records(), live_records)
+            self.assertEqual(get_records(time_sort='d'), live_desc_records)
+            self.assertEqual(get_records(start_date='2015-09-01'), live_start_records)
+            self.assertEqual(get_records(start_date='2015-09-01'), live_start_records)
+            self.assertEqual(get_file_records(), live_file_records)
+            self.assertEqual(get_file_records(), live_file_records)
+
+        snapshot_sets = MonthlySnapshotSet.objects.filter(metric='datasets/count/monthly')
+        self.assertEqual(snapshot_sets.count(), 2)     # the sort order shares a set
+        for snapshot_set in snapshot_sets:
+            self.assertEqual(snapshot_set.frozen_before, date(2016, 1, 1))
+
+        frozen_months = [rec for rec in live_records if rec['yyyy_mm'] < '2016-01']
+        self.assertTrue(len(frozen_months) > 0)
+        snapshot_set = snapshot_sets.get(start_point_count=0)
+        self.assertEqual(MonthlySnapshot.objects.filter(metric='datasets/count/monthly',\
+                            filter_signature=snapshot_set.filter_signature).count(),\
+                         len(frozen_months))
+        self.assertTrue(MonthlySnapshot.objects.filter(metric='files/count/monthly').count() > 0)
+
+        # frozen months are read back, not recounted
+        first_snapshot = MonthlySnapshot.objects.get(metric='datasets/count/monthly',\
+                            filter_signature=snapshot_set.filter_signature,\
+                            yyyy_mm=date(2015, 4, 1))
+        MonthlySnapshot.objects.filter(id=first_snapshot.id).update(count=first_snapshot.count + 1000)
+        with self.settings(METRICS_SNAPSHOT_SETTLE_MONTHS=settle_months):
+            records = get_records()
+        self.assertEqual(records[0]['count'], live_records[0]['count'] + 1000)
+        self.assertEqual(records[-1]['running_total'], live_records[-1]['running_total'] + 1000)
+        MonthlySnapshot.objects.filter(id=first_snapshot.id).update(count=first_snapshot.count)
+
+        # later months settle; a start date after the cutoff isn't frozen
+        with self.settings(METRICS_SNAPSHOT_SETTLE_MONTHS=settle_months - 3):
+            self.assertEqual(get_records(), live_records)
+            self.assertEqual(get_records(), live_records)
+
+        with self.settings(METRICS_SNAPSHOT_SETTLE_MONTHS=settle_months):
+            self.assertEqual(get_records(start_date='2016-02-01'),\
+                             get_records(start_date='2016-02-01'))
+
+        self.assertEqual(sorted([x.frozen_before for x in snapshot_sets.all()]),\
+                         [date(2016, 1, 1), date(2016, 4, 1)])
+
+    def test_37_dataverse_subtree_filter(self):
+        """37 - Selected Dataverses and their children via a recursive subquery"""
+        print (self.test_37_dataverse_subtree_filter.__doc__)
+
+        tree_index = DataverseTreeUtil().get_tree_index()
+        sbdg_id = Dataverse.objects.get(alias='sbdg').dvobject_id
+        cdv_id = Dataverse.objects.get(alias='CDV').dvobject_id
+
+        # grandchild Dataverses are included
+        subtree = DataverseSubtree([cdv_id])
+        self.assertEqual(sorted(DvObject.objects.filter(id__in=subtree\
+                                ).values_list('id', flat=True)),\
+                         sorted(tree_index.get_subtree_ids(cdv_id)))
+        self.assertEqual(sorted(subtree.get_id_list()),\
+                         sorted(tree_index.get_subtree_ids(cdv_id)))
+
+        def get_download_info(**kwargs):
+            stats_maker = StatsMakerFiles(**kwargs)
+            total_result = stats_maker.get_total_file_downloads()
+            monthly_result = stats_maker.get_file_downloads_by_month()
+            self.assertFalse(total_result.has_error())
+            self.assertFalse(monthly_result.has_error())
+            return total_result, monthly_result.get_records()
+
+        total_result, monthly_records = get_download_info(\
+                            selected_dvs='sbdg,CDV', include_child_dvs=True)
+        self.assertTrue(total_result.sql_query.find('WITH RECURSIVE') > -1)
+
+        subtree_ids = tree_index.get_subtree_ids_for_list([sbdg_id, cdv_id])
+        expected_count = GuestBookResponse.objects.filter(\
+                            responsetime__isnull=False,\
+                            dataset__owner__in=subtree_ids).count()
+        self.assertTrue(expected_count > 0)
+        self.assertEqual(total_result.result_data['count'], expected_count)
+        self.assertEqual(monthly_records[-1]['running_total'], expected_count)
+
+        # without the child Dataverses
+        total_result, _ = get_download_info(selected_dvs='sbdg', include_child_dvs=False)
+        self.assertEqual(total_result.result_data['count'],\
+                         GuestBookResponse.objects.filter(responsetime__isnull=False,\
+                            dataset__owner=sbdg_id).count())
+
+        # closed months from the rollup match
+        DownloadRollupUtil(batch_size=100).refresh(rebuild=True)
+        _, rollup_records = get_download_info(selected_dvs='sbdg,CDV', include_child_dvs=True)
+        self.assertEqual(rollup_records, monthly_records)
+
+        # unknown alias
+        stats_maker = StatsMakerFiles(selected_dvs='not-an-alias', include_child_dvs=True)
+        self.assertTrue(stats_maker.get_total_file_downloads().has_error())
+
+    def test_38_etag_conditional_get(self):
+        """38 - ETags from the data watermark; unchanged data gets a 304"""
+        print (self.test_38_etag_conditional_get.__doc__)
+
+        api_url = reverse('view_dataset_counts_by_month')
+        ds_id = Dataset.objects.filter(dvobject__publicationdate__isnull=False\
+                    ).order_by('dvobject__id').first().dvobject_id
+        ds_url = reverse('view_dataset_by_id_api', kwargs=dict(ds_id=ds_id))
+
+        cache.clear()
+        with self.settings(DEBUG=True, METRICS_ETAG_WATERMARK_TIME=0):
+            resp = self.client.get(api_url, dict(pub_state='all', key='abc'))
+            self.assertEqual(resp.status_code, 200)
+            etag = resp['ETag']
+            self.assertFalse(resp.has_header('Last-Modified'))
+
+            # same data and params, another API key
+            resp = self.client.get(api_url, dict(pub_state='all', key='xyz'),\
+                                   HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp.content, '')
+            self.assertEqual(resp['ETag'], etag)
+
+            resp = self.client.get(api_url, dict(pub_state='all'),\
+                                   HTTP_IF_NONE_MATCH='"other", W/%s' % etag)
+            self.assertEqual(resp.status_code, 304)
+
+            # "If-Modified-Since" is ignored
+            resp = self.client.get(api_url, dict(pub_state='all'),\
+                                   HTTP_IF_MODIFIED_SINCE='Sat, 01 Jan 2050 00:00:00 GMT')
+            self.assertEqual(resp.status_code, 200)
+
+            # other params and formats have other ETags
+            for params in [dict(pub_state='published'), dict(pub_state='all', as_csv='true')]:
+                resp = self.client.get(api_url, params, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(resp.status_code, 200)
+                self.assertNotEqual(resp['ETag'], etag)
+
+            # the dvobject API
+            resp = self.client.get(ds_url)
+            self.assertEqual(resp.status_code, 200)
+            ds_etag = resp['ETag']
+            resp = self.client.get(ds_url, HTTP_IF_NONE_MATCH=ds_etag)
+            self.assertEqual(resp.status_code, 304)
+
+            # changed data
+            DvObject.objects.filter(id=ds_id).update(modificationtime=datetime.now())
+            resp = self.client.get(api_url, dict(pub_state='all'), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotEqual(resp['ETag'], etag)
+            resp = self.client.get(ds_url, HTTP_IF_NONE_MATCH=ds_etag)
+            self.assertEqual(resp.status_code, 200)
+
+            # errors don't have an ETag
+            resp = self.client.get(api_url, dict(start_date='bad-date'))
+            self.assertEqual(resp.status_code, 400)
+            self.assertFalse(resp.has_header('ETag'))
+
+            download_key = DataWatermark([WATERMARK_DOWNLOADS]).get_key()
+            new_response = GuestBookResponse.objects.order_by('id').first()
+            new_response.id = None
+            new_response.save()
+            self.assertNotEqual(DataWatermark([WATERMARK_DOWNLOADS]).get_key(), download_key)
+
+        with self.settings(DEBUG=True, METRICS_USE_ETAGS=False):
+            resp = self.client.get(api_url, dict(pub_state='all'), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 200)
+            self.assertFalse(resp.has_header('ETag'))
+        cache.clear()
+
+    def test_39_columnar_format(self):
+        """39 - "?format=columnar" sends one list per column"""
+        print (self.test_39_columnar_format.__doc__)
+
+        month_columns = MonthColumns([dict(yyyy_mm=datetime(2016, 2, 1), count=3, running_total=3),
+                                      dict(yyyy_mm=datetime(2016, 12, 1), count=4, running_total=7)],\
+                            extra_columns=OrderedDict([('bytes', [10, 20])]))
+        self.assertEqual(month_columns.columns.keys(),\
+                ['yyyy_mm', 'count', 'bytes', 'running_total', 'year_num',\
+                 'month_num', 'month_name', 'month_name_short'])
+        self.assertEqual(month_columns.columns['yyyy_mm'], ['2016-02', '2016-12'])
+        self.assertEqual(month_columns.columns['month_name'], ['February', 'December'])
+        self.assertEqual(month_columns.columns['month_name_short'], ['Feb', 'Dec'])
+
+        # only the columns are kept; records are made when asked for
+        r = StatsResult.build_success_result(OrderedDict(record_count=len(month_columns)),\
+                            record_columns=month_columns.columns)
+        self.assertFalse('records' in r.result_data)
+        self.assertEqual(r.get_records()[1]['bytes'], 20)
+        self.assertEqual(r.get_result_data()['records'], r.get_records())
+        self.assertEqual(list(r.iter_rows()),\
+                [month_columns.columns.keys()] + [rec.values() for rec in r.get_records()])
+        empty_r = StatsResult.build_success_result(OrderedDict(record_count=0),\
+                            record_columns=MonthColumns([]).columns)
+        self.assertEqual(empty_r.get_records(), [])
+        self.assertEqual(empty_r.get_csv_content(), '')
+
+        cache.clear()
+        with self.settings(DEBUG=True):
+            api_root = reverse('view_metrics_batch')[:-len('batch')]
+            for api_path in ['dataverses/count/monthly',
+                             'datasets/count/monthly',
+                             'files/count/monthly',
+                             'files/downloads/count/monthly',
+                             'files/count/by-type']:
+                api_url = api_root + api_path
+                resp = self.client.get(api_url, dict(pub_state='all'))
+                columnar_resp = self.client.get(api_url, dict(pub_state='all', format='columnar'))
+
+                data = resp.json()['data']
+                columnar_data = columnar_resp.json()['data']
+                records = data.pop('records')
+                columns = columnar_data.pop('columns')
+                self.assertTrue(len(records) > 0)
+                self.assertEqual(data, columnar_data)
+
+                # same values, in the same order
+                self.assertEqual(columns.keys(), records[0].keys())
+                for col_name, values in columns.items():
+                    self.assertEqual(values, [rec[col_name] for rec in records])
+
+                self.assertTrue(len(columnar_resp.content) < len(resp.content))
+
+            # no records to convert
+            resp = self.client.get(reverse('view_dataset_counts'), dict(format='columnar'))
+            self.assertTrue('count' in resp.json()['data'])
+        cache.clear()
+
+    def test_43_public_visualizations_cache(self):
+        """43 - "basic-viz" data has query budgets and is cached only when complete"""
+        print (self.test_43_public_visualizations_cache.__doc__)
+
+        stats_params = {u'start_date': u'2015-06-01'}     # as in request.GET
+        cache_key = get_view_data_cache_key(PUBLIC_VISUALIZATIONS_PARAMS_DATA, stats_params)
+        viz_url = reverse('view_public_visualizations')
+
+        cache.clear()
+        clear_subject_field_type_cache()
+        with self.settings(METRICS_CACHE_VIEW=True, METRICS_CACHE_VIEW_TIME=60,\
+                           METRICS_MAX_WORKERS=1, METRICS_QUERY_TIMEOUT=30):
+            # no subject DatasetFieldType: the subject chart fails
+            with CaptureQueriesContext(connections[DvObject.objects.db]) as ctx:
+                resp = self.client.get(viz_url, stats_params)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len([q for q in ctx.captured_queries\
+                                  if 'statement_timeout' in q['sql']]),\
+                             len(PUBLIC_VISUALIZATION_METRICS))
+            self.assertTrue('dataset_counts_by_month' in resp.context)
+            self.assertFalse('dataset_counts_by_subject' in resp.context)
+            self.assertEqual(cache.get(cache_key), None)
+
+            mblock = MetadataBlock.objects.create(name='citation', displayname='Citation')
+            DatasetFieldType.objects.create(name='subject',\
+                    required=True, fieldtype='TEXT', metadatablock=mblock,\
+                    advancedsearchfieldtype=False, allowcontrolledvocabulary=True,\
+                    allowmultiples=True, displayoncreate=True, facetable=True)
+
+            resp_dict, is_complete = get_public_visualizations_data(**stats_params)
+            self.assertTrue(is_complete)
+
+            resp = self.client.get(viz_url, stats_params)
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(cache.get(cache_key) == resp_dict)
+        clear_subject_field_type_cache()
+        cache.clear()
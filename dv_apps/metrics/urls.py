@@ -24,6 +24,9 @@ from dv_apps.metrics.stats_views_files import FileCountByMonthView,\
     FileCountsByContentTypeView,\
     FileExtensionsWithinContentType
 
+# Several metrics in one request
+from dv_apps.metrics.stats_views_batch import MetricsBatchView
+
 from dv_apps.dvobject_api.api_view_dataverses import DataverseByIdView,\
     DataverseByAliasView
 
@@ -130,6 +133,9 @@ urlpatterns += [
 
     url(r'^v1/files/extensions$', FileExtensionsWithinContentType.as_view(), name='view_file_extensions_within_type'),
 
+    # Batch
+    url(r'^v1/batch$', MetricsBatchView.as_view(), name='view_metrics_batch'),
+
     # Test: Dataverses
     url(r'^v1/dataverses/by-id/(?P<dv_id>\d+)$', DataverseByIdView.as_view(),
     name='view_dataverse_by_id_api'),
@@ -0,0 +1,56 @@
+"""
+Cache the data behind the public metrics pages.
+
+Pages such as "basic-viz/last12" and the "homepage-counts" iframe cache
+their template data, rather than the rendered page, so that:
+
+    - the data is the same for every host and URL showing it
+    - "python manage.py warm_metrics" can recompute it ahead of expiry
+        without visitors seeing a cold cache
+
+The cache time is "METRICS_CACHE_VIEW_TIME".  Nothing is cached when
+"METRICS_CACHE_VIEW" is False.
+"""
+import hashlib
+
+from django.core.cache import cache
+
+from dv_apps.utils.metrics_cache_time import get_metrics_cache_time
+
+VIEW_DATA_CACHE_PREFIX = 'metrics_view_data'
+
+
+def get_view_data_cache_key(name, params=None):
+    """Return a cache key for the named data and its params"""
+    key_info = repr((name, sorted((params or {}).items())))
+
+    return '%s:%s:%s' % (VIEW_DATA_CACHE_PREFIX, name,
+                         hashlib.md5(key_info).hexdigest())
+
+
+def get_cached_view_data(name, compute_func, params=None, refresh=False):
+    """
+    Return the cached data--or compute and cache it.
+
+        compute_func - called with "params" as kwargs.  Returns
+            (data, is_complete).  Incomplete data, e.g. a query
+            timed out, is not cached.
+        refresh - recompute and replace the cached data
+    """
+    if params is None:
+        params = {}
+
+    cache_time = get_metrics_cache_time()
+    cache_key = get_view_data_cache_key(name, params)
+
+    if cache_time > 0 and not refresh:
+        data = cache.get(cache_key)
+        if data is not None:
+            return data
+
+    data, is_complete = compute_func(**params)
+
+    if cache_time > 0 and is_complete:
+        cache.set(cache_key, data, cache_time)
+
+    return data
@@ -20,7 +20,8 @@ def view_all_file_extension_counts(request):
     """Reference table of all file extensions with counts"""
 
     stats_files = StatsMakerFiles()
-    all_counts = stats_files.view_file_extensions_within_type()
+    all_counts = stats_files.view_file_extensions_within_type(\
+                            use_extension_index=True)
     if all_counts and all_counts.result_data:
         d = dict(all_counts=all_counts.result_data['records'],
                 total_file_count=all_counts.result_data['total_file_count'],
@@ -40,7 +41,8 @@ def view_files_extensions_with_unknown_content_types(request):
     """Reference table of file extensions with unknown content type"""
 
     stats_files = StatsMakerFiles()
-    unknown_counts = stats_files.view_file_extensions_within_type(FILE_TYPE_OCTET_STREAM)
+    unknown_counts = stats_files.view_file_extensions_within_type(\
+                            FILE_TYPE_OCTET_STREAM, use_extension_index=True)
     if unknown_counts and unknown_counts.result_data:
         d = dict(unknown_counts=unknown_counts.result_data['records'],
                 total_file_count=unknown_counts.result_data['total_file_count'],
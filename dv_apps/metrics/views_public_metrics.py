@@ -3,24 +3,32 @@ Metric views, returning JSON repsonses
 """
 from collections import OrderedDict
 import json
-from os.path import splitext
 from datetime import datetime
+from functools import partial
 
 from django.shortcuts import render
 from django.http import JsonResponse, HttpResponseRedirect #, Http404
 from django.views.decorators.cache import cache_page
 from django.views.decorators.clickjacking import xframe_options_exempt
 
-from dv_apps.datafiles.models import Datafile, FileMetadata
+from dv_apps.datafiles.models import FileMetadata
+from dv_apps.metrics.stats_util_base import StatsMakerBase
 from dv_apps.metrics.stats_util_datasets import StatsMakerDatasets
 from dv_apps.metrics.stats_util_dataverses import StatsMakerDataverses
 from dv_apps.metrics.stats_util_files import StatsMakerFiles
+from dv_apps.metrics.file_extension_util import get_extension_counts
+from dv_apps.metrics.view_data_cache import get_cached_view_data
 
-from dv_apps.utils.metrics_cache_time import get_metrics_cache_time
+from dv_apps.utils.thread_pool_helper import run_in_thread_pool,\
+    get_metrics_call_timeout
 from dv_apps.utils.date_helper import get_one_year_ago
 
 FIVE_HOURS = 60 * 60 * 5
 
+# Names of the cached visualization data
+PUBLIC_VISUALIZATIONS_DATA = 'public_visualizations'
+PUBLIC_VISUALIZATIONS_PARAMS_DATA = 'public_visualizations_params'
+
 """
 from django.core.cache import cache
 cache.clear()
@@ -34,11 +42,9 @@ def view_homepage_placeholder(request):
     return render(request, 'metrics/index-placeholder.html', resp_dict)
 
 
-@xframe_options_exempt
-@cache_page(get_metrics_cache_time())
-def view_public_visualizations_last12(request):
+def get_last12_date_filters():
     """
-    Return visualizations covering the last 11-12 months.
+    Date filters covering the last 11-12 months.
 
     e.g. If it's July 23, 2016, it will start from June 1, 2015
     e.g. If it's June 2, 2016, it will start from May 1, 2015
@@ -49,26 +55,110 @@ def view_public_visualizations_last12(request):
 
     # start from the 1st day of last year's month
     #
-    date_filters = dict(start_date=one_year_ago.strftime('%Y-%m-01'))
+    return dict(start_date=one_year_ago.strftime('%Y-%m-01'))
+
+
+def get_public_visualizations_last12_data(refresh=False):
+    """
+    Visualization data for the last 11-12 months, from the cache.
+        - refresh - recompute the cached data
+    """
+    return get_cached_view_data(PUBLIC_VISUALIZATIONS_DATA,\
+                                get_public_visualizations_data,\
+                                get_last12_date_filters(),\
+                                refresh=refresh)
+
+
+@xframe_options_exempt
+def view_public_visualizations_last12(request):
+    """
+    Return visualizations covering the last 11-12 months.
+    The data is cached and may be refreshed by "manage.py warm_metrics"
+    """
+    resp_dict = get_public_visualizations_last12_data()
+
+    return render(request, 'metrics/metrics_public.html', resp_dict)
+
 
-    return view_public_visualizations(request, **date_filters)
+def is_stats_result_ok(stats_result):
+    """The StatsResult is None if the query timed out"""
+    return stats_result is not None and not stats_result.has_error()
 
 
-@cache_page(get_metrics_cache_time())
 def view_public_visualizations(request, **kwargs):
     """
-    Return HTML/D3Plus visualizations for a variety of public statistics
+    Return HTML/D3Plus visualizations for a variety of public statistics.
+    The data is cached by its params--unless a query failed or timed out
     """
 
     if kwargs and len(kwargs) > 0:
         # kwargs override GET parameters
-        stats_datasets = StatsMakerDatasets(**kwargs)
-        stats_dvs = StatsMakerDataverses(**kwargs)
-        stats_files = StatsMakerFiles(**kwargs)
+        stats_params = kwargs
     else:
-        stats_datasets = StatsMakerDatasets(**request.GET.dict())
-        stats_dvs = StatsMakerDataverses(**request.GET.dict())
-        stats_files = StatsMakerFiles(**request.GET.dict())
+        stats_params = request.GET.dict()
+
+    resp_dict = get_cached_view_data(PUBLIC_VISUALIZATIONS_PARAMS_DATA,\
+                                     get_public_visualizations_data,\
+                                     stats_params)
+
+    return render(request, 'metrics/metrics_public.html', resp_dict)
+
+
+# { visualization : metric name for its query budget }
+PUBLIC_VISUALIZATION_METRICS = dict(\
+        dv_counts='dataverses/count/monthly',\
+        dv_counts_by_type='dataverses/count/by-type',\
+        ds_counts='datasets/count/monthly',\
+        ds_counts_by_subject='datasets/count/by-subject',\
+        file_counts='files/count/monthly',\
+        file_downloads='files/downloads/count/monthly')
+
+
+def get_public_visualizations_data(**stats_params):
+    """
+    Return (template data, is_complete) for the public visualizations.
+    "is_complete" is False if any statistic failed or timed out
+    """
+    # -------------------------
+    # Run the (independent) queries concurrently
+    #   - each call has its own StatsMaker and, in a thread, db connection
+    #   - each call has its metric's query budget (statement_timeout)
+    # -------------------------
+    stats_calls = OrderedDict()
+
+    # Dataverses created each month
+    stats_calls['dv_counts'] = StatsMakerDataverses(**stats_params\
+                    ).get_dataverse_counts_by_month_published
+
+    # Dataverse counts by type
+    stats_calls['dv_counts_by_type'] = partial(\
+                    StatsMakerDataverses(**stats_params).get_dataverse_counts_by_type_published,
+                    exclude_uncategorized=True)
+
+    # Datasets created each month
+    stats_calls['ds_counts'] = StatsMakerDatasets(**stats_params\
+                    ).get_dataset_counts_by_create_date_published
+
+    # Dataset counts by subject
+    stats_calls['ds_counts_by_subject'] = StatsMakerDatasets(**stats_params\
+                    ).get_dataset_subject_counts_published
+
+    # Files created, by month
+    stats_calls['file_counts'] = StatsMakerFiles(**stats_params\
+                    ).get_file_count_by_month_published
+
+    # Files downloaded, by month
+    stats_calls['file_downloads'] = partial(\
+                    StatsMakerFiles(**stats_params).get_file_downloads_by_month_published,
+                    include_pre_dv4_downloads=True)
+
+    for name, stats_call in stats_calls.items():
+        stats_calls[name] = partial(StatsMakerBase.run_with_query_budget,\
+                                    PUBLIC_VISUALIZATION_METRICS[name],\
+                                    stats_call, stats_params)
+
+    stats_results = run_in_thread_pool(stats_calls,\
+                        timeout=get_metrics_call_timeout())
 
     # Start an OrderedDict
     resp_dict = OrderedDict()
@@ -76,18 +166,16 @@ def view_public_visualizations(request, **kwargs):
     # -------------------------
     # Dataverses created each month
     # -------------------------
-    stats_result_dv_counts = stats_dvs.get_dataverse_counts_by_month_published()
-    #import ipdb; ipdb.set_trace()
-    if not stats_result_dv_counts.has_error():
-        resp_dict['dataverse_counts_by_month'] = list(stats_result_dv_counts.result_data['records'])
+    stats_result_dv_counts = stats_results['dv_counts']
+    if is_stats_result_ok(stats_result_dv_counts):
+        resp_dict['dataverse_counts_by_month'] = stats_result_dv_counts.get_records()
         resp_dict['dataverse_counts_by_month_sql'] = stats_result_dv_counts.sql_query
 
     # -------------------------
     # Dataverse counts by type
     # -------------------------
-    stats_result_dv_counts_by_type =\
-        stats_dvs.get_dataverse_counts_by_type_published(exclude_uncategorized=True)
-    if not stats_result_dv_counts_by_type.has_error():
+    stats_result_dv_counts_by_type = stats_results['dv_counts_by_type']
+    if is_stats_result_ok(stats_result_dv_counts_by_type):
         resp_dict['dataverse_counts_by_type'] = stats_result_dv_counts_by_type.result_data['records']
         resp_dict['dv_counts_by_category_sql'] = stats_result_dv_counts_by_type.sql_query
 
@@ -95,31 +183,31 @@ def view_public_visualizations(request, **kwargs):
     # -------------------------
     # Datasets created each month
     # -------------------------
-    stats_monthly_ds_counts = stats_datasets.get_dataset_counts_by_create_date_published()
-    if not stats_monthly_ds_counts.has_error():
-        resp_dict['dataset_counts_by_month'] = list(stats_monthly_ds_counts.result_data['records'])
+    stats_monthly_ds_counts = stats_results['ds_counts']
+    if is_stats_result_ok(stats_monthly_ds_counts):
+        resp_dict['dataset_counts_by_month'] = stats_monthly_ds_counts.get_records()
         resp_dict['dataset_counts_by_month_sql'] = stats_monthly_ds_counts.sql_query
 
 
-    stats_ds_count_by_subject = stats_datasets.get_dataset_subject_counts_published()
-    if not stats_monthly_ds_counts.has_error():
+    stats_ds_count_by_subject = stats_results['ds_counts_by_subject']
+    if is_stats_result_ok(stats_ds_count_by_subject):
         resp_dict['dataset_counts_by_subject'] = stats_ds_count_by_subject.result_data['records']
         #resp_dict['dataset_counts_by_month_sql'] = stats_monthly_ds_counts.sql_query
 
     # -------------------------
     # Files created, by month
     # -------------------------
-    stats_monthly_file_counts = stats_files.get_file_count_by_month_published()
-    if not stats_monthly_file_counts.has_error():
-        resp_dict['file_counts_by_month'] = list(stats_monthly_file_counts.result_data['records'])
+    stats_monthly_file_counts = stats_results['file_counts']
+    if is_stats_result_ok(stats_monthly_file_counts):
+        resp_dict['file_counts_by_month'] = stats_monthly_file_counts.get_records()
         resp_dict['file_counts_by_month_sql'] = stats_monthly_file_counts.sql_query
 
     # -------------------------
     # Files downloaded, by month
     # -------------------------
-    stats_monthly_downloads = stats_files.get_file_downloads_by_month_published(include_pre_dv4_downloads=True)
-    if not stats_monthly_downloads.has_error():
-        resp_dict['file_downloads_by_month'] = list(stats_monthly_downloads.result_data['records'])
+    stats_monthly_downloads = stats_results['file_downloads']
+    if is_stats_result_ok(stats_monthly_downloads):
+        resp_dict['file_downloads_by_month'] = stats_monthly_downloads.get_records()
         resp_dict['file_downloads_by_month_sql'] = stats_monthly_downloads.sql_query
 
     # -------------------------
@@ -138,13 +226,13 @@ def view_public_visualizations(request, **kwargs):
     #if success:
     #    resp_dict['datafile_content_type_counts'] = datafile_content_type_counts[:15]
 
+    is_complete = all([is_stats_result_ok(stats_result)\
+                        for stats_result in stats_results.values()])
 
-
-    return render(request, 'metrics/metrics_public.html', resp_dict)
+    return resp_dict, is_complete
 
 
 
-@cache_page(get_metrics_cache_time())
 def view_public_visualizations_last12_dataverse_org(request):
     """
     Return visualizations covering the last 12 months+.
@@ -162,19 +250,11 @@ def view_file_extensions_within_type(request, file_type='application/octet-strea
     """Query as experiment.  View extensions for unidentified queries"""
 
     #file_type = 'data/various-formats'
-    ids = Datafile.objects.filter(contenttype=file_type).values_list('dvobject__id', flat=True)
-
-    #ids = Datafile.objects.all().values_list('dvobject__id', flat=True)
-    l = FileMetadata.objects.filter(datafile__in=ids).values_list('label', flat=True)
-
-    ext_list = [splitext(label)[-1] for label in l]
-
-    extension_counts = {}
-    for ext in ext_list:
-        extension_counts[ext] = extension_counts.get(ext, 0) + 1
+    filemetadata_qs = FileMetadata.objects.filter(datafile__datafile__contenttype=file_type)
 
-    ext_pairs = extension_counts.items()
-    ext_pairs = sorted(ext_pairs, key=lambda k: k[1], reverse=True)
+    # Count every label, grouped by extension in the database
+    ext_info = get_extension_counts(filemetadata_qs, distinct_labels=False)
+    ext_pairs = ext_info['extension_counts']
 
     d = dict(extension_counts=ext_pairs)
 
@@ -20,6 +20,8 @@ from dv_apps.metrics.stats_views_files import FileCountByMonthView,\
     FileCountsByContentTypeView,\
     FileExtensionsWithinContentType
 
+from dv_apps.metrics.stats_views_batch import MetricsBatchView
+
 from dv_apps.dvobject_api.api_view_dataverses import DataverseByIdView,\
     DataverseByAliasView
 
@@ -51,6 +53,8 @@ VIEW_CLASSES_FOR_SPEC = [\
             FilesDownloadedByMonthView,\
             FileCountsByContentTypeView,\
             FileExtensionsWithinContentType,\
+            # several metrics
+            MetricsBatchView,\
             # tests
             # dataverse JSON
             DataverseByIdView,\
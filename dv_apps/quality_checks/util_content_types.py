@@ -13,7 +13,10 @@ class ContentTypeStats(object):
     def get_basic_stats():
 
         stats_files = StatsMakerFiles()
-        stats_result = stats_files.view_file_extensions_within_type(FILE_TYPE_OCTET_STREAM)
+        # Only the totals are used
+        stats_result = stats_files.view_file_extensions_within_type(\
+                                FILE_TYPE_OCTET_STREAM, max_extensions=1,\
+                                use_extension_index=True)
         if not (stats_result and stats_result.result_data):
             raise ValueError('ContentTypeStats not calculated for content types')
 
@@ -0,0 +1,102 @@
+"""
+Run independent metrics queries concurrently.
+
+Each thread uses its own database connection.  Connections are
+closed when a task finishes so that threads don't leave them open.
+Reads pinned to a database by the caller stay pinned in each thread.
+
+The "timeout" only stops waiting for a result.  To stop the query
+itself, run the function with a query budget, e.g. via
+StatsMakerBase.run_with_query_budget.
+"""
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import connections
+
+from miniverse.db_routers.db_dataverse_router import get_pinned_read_db, pin_reads
+
+DEFAULT_MAX_WORKERS = 4
+POLL_SECONDS = 0.05
+
+
+def get_metrics_max_workers():
+    """Number of threads used for concurrent metrics queries"""
+    return getattr(settings, 'METRICS_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+
+
+def get_metrics_call_timeout():
+    """Seconds to wait for each concurrent metrics query.  None = no limit"""
+    return getattr(settings, 'METRICS_CALL_TIMEOUT', None)
+
+
+def run_task_in_thread(name, func, start_times, pinned_read_db=None):
+    """Call the function, closing this thread's db connections afterwards"""
+    start_times[name] = time.time()
+    try:
+        with pin_reads(pinned_read_db):
+            return func()
+    finally:
+        connections.close_all()
+
+
+def run_in_thread_pool(named_funcs, max_workers=None, timeout=None):
+    """
+    Call each function and return the results in the same order.
+
+        named_funcs - OrderedDict of { name : function with no args }
+        timeout - seconds to wait for each function, once it has started.
+
+    Returns: OrderedDict of { name : function result }
+        - The result is None for a function which timed out.  (The
+            function isn't stopped: its thread finishes in the background
+            and the pool is then joined.)
+
+    With "max_workers" of 1 (or a single function), everything
+    runs in the current thread and "timeout" is ignored.
+    """
+    if max_workers is None:
+        max_workers = get_metrics_max_workers()
+
+    num_threads = min(max_workers, len(named_funcs))
+    if num_threads <= 1:
+        return OrderedDict([(name, func()) for name, func in named_funcs.items()])
+
+    start_times = {}
+    pinned_read_db = get_pinned_read_db()
+    pool = ThreadPool(num_threads)
+
+    async_results = OrderedDict()
+    for name, func in named_funcs.items():
+        async_results[name] = pool.apply_async(run_task_in_thread,\
+                                    (name, func, start_times, pinned_read_db))
+    pool.close()
+
+    results = OrderedDict()
+    timed_out = False
+    for name, async_result in async_results.items():
+        while not async_result.ready():
+            async_result.wait(POLL_SECONDS)
+            if timeout is not None and name in start_times and\
+                (time.time() - start_times[name]) > timeout:
+                break
+
+        if async_result.ready():
+            results[name] = async_result.get()  # re-raises any exception
+        else:
+            results[name] = None
+            timed_out = True
+
+    # Don't wait for threads still running a timed out function:
+    # join the pool once they finish
+    if timed_out:
+        join_thread = threading.Thread(target=pool.join)
+        join_thread.daemon = True
+        join_thread.start()
+    else:
+        pool.join()
+
+    return results
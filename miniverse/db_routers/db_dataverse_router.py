@@ -6,17 +6,52 @@ For these circumstances:
     -  We don't want to add any django-specific tables to the existing dastabase.
 
 Based on: https://docs.djangoproject.com/en/1.9/topics/db/multi-db/#database-routers
+
+Dataverse reads may also be spread over read-only replicas:
+
+    DATAVERSE_READ_REPLICAS = [('dataverse_replica_1', 2),  # (alias, weight)
+                               ('dataverse_replica_2', 1)]
+
+    - Replicas are chosen by weighted round-robin
+    - Each replica is checked every DATAVERSE_REPLICA_CHECK_SECONDS.
+        One that can't be reached--or lags by more than
+        DATAVERSE_REPLICA_MAX_LAG_SECONDS--is skipped until it recovers
+    - With no healthy replica, reads go to "dataverse"
+    - Reads inside a "dataverse" transaction stay on "dataverse"
+
+Heavy reads may be pinned to an analytics replica:
+
+    DATAVERSE_ANALYTICS_DB = 'dataverse_analytics'
+
+    - Views in DATAVERSE_ANALYTICS_VIEW_MODULES are pinned by
+        AnalyticsReadsMiddleware
+    - Other code uses "with analytics_reads():"
+
+Set CONN_MAX_AGE on each alias in DATABASES to keep its connections open.
 """
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, DatabaseError
 
 # django core apps
 DJANGO_APP_NAMES = [ 'auth', 'contenttypes', 'sessions', 'sites', 'admin', 'migrations']
 # miniverse specific apps
-MINIVERSE_APP_NAMES = ['installations']
+MINIVERSE_APP_NAMES = ['installations', 'metrics', 'dataset_docs']
 
 # apps to route - all others are assumed to be Dataverse specific
 APPS_TO_ROUTE = DJANGO_APP_NAMES + MINIVERSE_APP_NAMES
 DB_REFERENCE_NAME = 'dataverse'
 
+DEFAULT_REPLICA_CHECK_SECONDS = 30
+DEFAULT_ANALYTICS_VIEW_MODULES = ['dv_apps.metrics', 'dv_apps.quality_checks']
+
+# Postgres: seconds since the last replayed transaction.  NULL on a primary
+REPLICA_LAG_SQL = ('SELECT EXTRACT(EPOCH FROM'
+                   ' (now() - pg_last_xact_replay_timestamp()))')
+
 def is_dataverse_app_to_route(app_label):
     """If the app is not in the list:
         - Assume it's a Dataverse app
@@ -26,6 +61,148 @@ def is_dataverse_app_to_route(app_label):
         return False
     return True
 
+def get_read_replicas():
+    """[(alias, weight)] from DATAVERSE_READ_REPLICAS"""
+    return [(alias, weight) for alias, weight in\
+            getattr(settings, 'DATAVERSE_READ_REPLICAS', [])\
+            if weight > 0]
+
+
+def get_analytics_db():
+    """Alias pinned by "analytics_reads"--or None"""
+    return getattr(settings, 'DATAVERSE_ANALYTICS_DB', None)
+
+
+def get_read_only_aliases():
+    """Replica aliases, never migrated or written to"""
+    aliases = [alias for alias, weight in getattr(settings, 'DATAVERSE_READ_REPLICAS', [])]
+    if get_analytics_db() is not None:
+        aliases.append(get_analytics_db())
+    return [alias for alias in aliases if alias != DB_REFERENCE_NAME]
+
+
+# ----------------------------
+#  Replica health
+# ----------------------------
+
+# { alias : (is_healthy, time checked) }
+_READ_DB_HEALTH = {}
+
+
+def record_read_db_health(alias, is_healthy):
+    """Save the result of a health check"""
+    _READ_DB_HEALTH[alias] = (is_healthy, time.time())
+
+
+def check_read_db(alias):
+    """Can the replica be reached, and is it caught up?"""
+    max_lag = getattr(settings, 'DATAVERSE_REPLICA_MAX_LAG_SECONDS', None)
+    try:
+        cursor = connections[alias].cursor()
+        try:
+            if max_lag is None:
+                cursor.execute('SELECT 1')
+                return True
+            cursor.execute(REPLICA_LAG_SQL)
+            lag_seconds = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+    except DatabaseError:
+        connections[alias].close()
+        return False
+
+    return lag_seconds is None or lag_seconds <= max_lag
+
+
+def is_read_db_healthy(alias):
+    """Use the last health check, unless it's out of date"""
+    if alias == DB_REFERENCE_NAME:
+        return True
+
+    check_seconds = getattr(settings, 'DATAVERSE_REPLICA_CHECK_SECONDS',\
+                            DEFAULT_REPLICA_CHECK_SECONDS)
+    health = _READ_DB_HEALTH.get(alias)
+    if health is not None and (time.time() - health[1]) < check_seconds:
+        return health[0]
+
+    is_healthy = check_read_db(alias)
+    record_read_db_health(alias, is_healthy)
+    return is_healthy
+
+
+class WeightedRoundRobin(object):
+    """
+    Smooth weighted round-robin: weights of 2 and 1 give a, b, a, a, b, a...
+    """
+
+    def __init__(self):
+        self.current_weights = {}
+        self.lock = threading.Lock()
+
+    def choose(self, weighted_aliases):
+        with self.lock:
+            total_weight = 0
+            chosen = None
+            for alias, weight in weighted_aliases:
+                total_weight += weight
+                self.current_weights[alias] = self.current_weights.get(alias, 0) + weight
+                if chosen is None or\
+                    self.current_weights[alias] > self.current_weights[chosen]:
+                    chosen = alias
+            self.current_weights[chosen] -= total_weight
+            return chosen
+
+_REPLICA_ROUND_ROBIN = WeightedRoundRobin()
+
+
+# ----------------------------
+#  Pinned reads
+# ----------------------------
+_PINNED = threading.local()
+
+
+def get_pinned_read_db():
+    """Alias pinned for this thread--or None"""
+    return getattr(_PINNED, 'alias', None)
+
+
+@contextmanager
+def pin_reads(alias):
+    """Send this thread's Dataverse reads to "alias", while it's healthy"""
+    previous_alias = get_pinned_read_db()
+    _PINNED.alias = alias
+    try:
+        yield
+    finally:
+        _PINNED.alias = previous_alias
+
+
+def analytics_reads():
+    """
+    e.g. "with analytics_reads():" around heavy metrics queries.
+    Without DATAVERSE_ANALYTICS_DB, reads use the replica pool
+    """
+    return pin_reads(get_analytics_db())
+
+
+def get_dataverse_read_db():
+    """Choose the alias for a Dataverse read"""
+    if DB_REFERENCE_NAME in connections.databases and\
+        connections[DB_REFERENCE_NAME].in_atomic_block:
+        return DB_REFERENCE_NAME
+
+    pinned_alias = get_pinned_read_db()
+    if pinned_alias is not None and is_read_db_healthy(pinned_alias):
+        return pinned_alias
+
+    replicas = [(alias, weight) for alias, weight in get_read_replicas()\
+                if is_read_db_healthy(alias)]
+    if len(replicas) == 0:
+        return DB_REFERENCE_NAME
+
+    return _REPLICA_ROUND_ROBIN.choose(replicas)
+
+
 '''def is_django_app_to_route(app_label):
     """Should we route this app?"""
     if app_label in APPS_TO_ROUTE:
@@ -43,7 +220,7 @@ class DataverseRouter(object):
         Attempts to read auth models go to auth_db.
         """
         if is_dataverse_app_to_route(model._meta.app_label):
-            return DB_REFERENCE_NAME
+            return get_dataverse_read_db()
         return None
 
     def db_for_write(self, model, **hints):
@@ -68,6 +245,8 @@ class DataverseRouter(object):
         Make sure the auth app only appears in the 'auth_db'
         database.
         """
+        if db in get_read_only_aliases():
+            return False
         if is_dataverse_app_to_route(app_label):
             return db == DB_REFERENCE_NAME
         return None
@@ -0,0 +1,52 @@
+"""
+Middleware to pin the Dataverse reads of heavy views to the analytics db
+"""
+from django.conf import settings
+
+from miniverse.db_routers.db_dataverse_router import get_analytics_db,\
+    pin_reads, DEFAULT_ANALYTICS_VIEW_MODULES
+
+
+def get_analytics_view_modules():
+    """Views in these modules (and their submodules) are pinned"""
+    return getattr(settings, 'DATAVERSE_ANALYTICS_VIEW_MODULES',\
+                   DEFAULT_ANALYTICS_VIEW_MODULES)
+
+
+def is_analytics_view(view_func):
+    """Is the view in one of DATAVERSE_ANALYTICS_VIEW_MODULES?"""
+    module_name = getattr(view_func, '__module__', None) or ''
+    for analytics_module in get_analytics_view_modules():
+        if module_name == analytics_module or\
+            module_name.startswith(analytics_module + '.'):
+            return True
+    return False
+
+
+class AnalyticsReadsMiddleware(object):
+    """
+    Send the Dataverse reads of metrics and quality check views to
+    DATAVERSE_ANALYTICS_DB.  Does nothing when it isn't set.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if get_analytics_db() is None or not is_analytics_view(view_func):
+            return None
+
+        request._analytics_reads = pin_reads(get_analytics_db())
+        request._analytics_reads.__enter__()
+        return None
+
+    def end_analytics_reads(self, request):
+        analytics_reads = getattr(request, '_analytics_reads', None)
+        if analytics_reads is not None:
+            request._analytics_reads = None
+            analytics_reads.__exit__(None, None, None)
+
+    def process_exception(self, request, exception):
+        self.end_analytics_reads(request)
+        return None
+
+    def process_response(self, request, response):
+        self.end_analytics_reads(request)
+        return response
@@ -0,0 +1,72 @@
+"""
+Tests for the Dataverse db router and the analytics reads middleware.
+These don't use the database.
+
+Example of calling a single test:
+python manage.py test miniverse.db_routers.tests.DataverseRouterTests.test_01_replica_reads
+
+"""
+from __future__ import print_function
+
+from collections import OrderedDict
+
+from django.test import SimpleTestCase
+
+from dv_apps.dataverses.models import Dataverse
+from dv_apps.dvobject_api.api_view_datasets import DatasetByIdView
+from dv_apps.metrics.models import DatafileExtension
+from dv_apps.metrics.stats_views_datasets import DatasetCountByMonthView
+from dv_apps.utils.thread_pool_helper import run_in_thread_pool
+from miniverse.db_routers.db_dataverse_router import DataverseRouter,\
+    record_read_db_health, analytics_reads, get_pinned_read_db,\
+    _READ_DB_HEALTH
+from miniverse.db_routers.middleware import is_analytics_view
+
+
+class DataverseRouterTests(SimpleTestCase):
+    """Dataverse reads spread over replicas"""
+
+    def tearDown(self):
+        _READ_DB_HEALTH.clear()
+
+    def test_01_replica_reads(self):
+        """01 - Weighted round-robin over healthy replicas; pinned analytics reads"""
+        print (self.test_01_replica_reads.__doc__)
+
+        router = DataverseRouter()
+        with self.settings(DATAVERSE_READ_REPLICAS=[('replica_a', 2), ('replica_b', 1)],\
+                           DATAVERSE_ANALYTICS_DB='analytics'):
+            for alias in ('replica_a', 'replica_b', 'analytics'):
+                record_read_db_health(alias, True)
+
+            read_dbs = [router.db_for_read(Dataverse) for _ in range(6)]
+            self.assertEqual(read_dbs.count('replica_a'), 4)
+            self.assertEqual(read_dbs.count('replica_b'), 2)
+            self.assertEqual(router.db_for_write(Dataverse), 'dataverse')
+            self.assertEqual(router.db_for_read(DatafileExtension), None)
+
+            # unhealthy replicas are skipped
+            record_read_db_health('replica_a', False)
+            self.assertEqual(set([router.db_for_read(Dataverse) for _ in range(3)]),\
+                             set(['replica_b']))
+            record_read_db_health('replica_b', False)
+            self.assertEqual(router.db_for_read(Dataverse), 'dataverse')
+
+            # pinned reads, also in worker threads
+            with analytics_reads():
+                self.assertEqual(router.db_for_read(Dataverse), 'analytics')
+                thread_results = run_in_thread_pool(OrderedDict([\
+                        ('a', get_pinned_read_db), ('b', get_pinned_read_db)]), max_workers=2)
+                self.assertEqual(thread_results.values(), ['analytics', 'analytics'])
+
+                record_read_db_health('analytics', False)
+                self.assertEqual(router.db_for_read(Dataverse), 'dataverse')
+            self.assertEqual(get_pinned_read_db(), None)
+
+            self.assertFalse(router.allow_migrate('replica_a', 'metrics'))
+            self.assertFalse(router.allow_migrate('analytics', 'dataverses'))
+            self.assertTrue(router.allow_migrate('dataverse', 'dataverses'))
+
+        # views pinned by the middleware
+        self.assertTrue(is_analytics_view(DatasetCountByMonthView.as_view()))
+        self.assertFalse(is_analytics_view(DatasetByIdView.as_view()))
@@ -34,6 +34,98 @@ METRICS_CACHE_VIEW = False
 METRICS_CACHE_VIEW_TIME = 60 * 60 * 2   # 2 HOURS
 METRICS_CACHE_API_TIME = 60 * 10    # 10 minutes
 
+# Read closed months of file downloads from the rollup table
+#   - populate with: python manage.py refresh_download_rollup
+METRICS_USE_DOWNLOAD_ROLLUP = True
+
+# Freeze the monthly counts of closed months and read them back
+#   - the current month and the previous METRICS_SNAPSHOT_SETTLE_MONTHS
+#       months are always counted live
+#   - delete the snapshots in the admin to recompute them
+METRICS_USE_MONTHLY_SNAPSHOTS = True
+METRICS_SNAPSHOT_SETTLE_MONTHS = 2
+
+# Serve the dataset JSON API and pages from stored DatasetDocs
+#   - populate with: python manage.py refresh_dataset_docs
+#   - a doc older than its Dataset's modificationtime is re-serialized on read
+USE_DATASET_DOCS = True
+
+# Threads used to run independent metrics queries concurrently
+#   - e.g. the /metrics/v1/batch endpoint.  1 = no threads
+METRICS_MAX_WORKERS = 4
+METRICS_CALL_TIMEOUT = 60 * 2   # seconds to wait for each query. None = no limit
+                                #   - queries are stopped by METRICS_QUERY_TIMEOUT
+
+# Postgres "statement_timeout" for each metric's queries, in seconds
+#   - a metric that runs out of time returns a 503 with a retry hint
+#   - timeouts are logged to "dv_apps.metrics.query_timeout"
+METRICS_QUERY_TIMEOUT = 60      # None = no limit
+METRICS_QUERY_TIMEOUTS = {      # by API path, e.g. 'files/extensions': 120
+}
+METRICS_QUERY_RETRY_AFTER = 60 * 5
+
+# ETags from a data watermark (e.g. max dvobject.modificationtime)
+#   - a matching "If-None-Match" gets a 304 without running the query
+METRICS_USE_ETAGS = True
+METRICS_ETAG_WATERMARK_TIME = 10    # seconds to reuse a watermark. 0 = no caching
+
+# In-process cache of API key lookups, in seconds.  0 = no caching
+#   - flush with dv_apps.dataverse_auth.apikey_cache.flush_apikey_cache()
+METRICS_APIKEY_CACHE_SIZE = 1000
+METRICS_APIKEY_CACHE_TIME = 60 * 5
+METRICS_APIKEY_NEGATIVE_CACHE_TIME = 60     # unknown keys
+
+# Cached metrics recomputed by: python manage.py warm_metrics
+#   - run from cron more often than METRICS_CACHE_VIEW_TIME
+#   - names of page data or (API url name, params[, url kwargs])
+METRICS_WARM_ITEMS = [
+    'public_visualizations_last12',
+    'total_published_counts',
+    'installation_map',
+    #('view_dataset_counts_by_month', dict(pub_state='published')),
+]
+METRICS_WARM_LOCK_FILE = None   # default: <temp dir>/miniverse_warm_metrics.lock
+
+# "generate_metrics_data" may write synthetic rows to the Dataverse db.
+#   - leave False outside of benchmark installations
+ALLOW_SYNTHETIC_DATA = False
+
+# Dataverse read replicas.  See miniverse/db_routers/db_dataverse_router.py
+#   - (DATABASES alias, weight) for weighted round-robin reads
+#   - unhealthy replicas are skipped; reads fall back to "dataverse"
+DATAVERSE_READ_REPLICAS = []
+DATAVERSE_REPLICA_CHECK_SECONDS = 30
+DATAVERSE_REPLICA_MAX_LAG_SECONDS = None    # None = don't check the lag
+
+# Replica for heavy metrics and quality check reads.  None = use the pool
+DATAVERSE_ANALYTICS_DB = None
+DATAVERSE_ANALYTICS_VIEW_MODULES = ['dv_apps.metrics', 'dv_apps.quality_checks']
+
+# One "metrics_timing key=value ..." line per metrics API request
+#   - query count, db time, cache hit/miss, etc.  See dv_apps/metrics/stats_timing.py
+#   - and one "metrics_query_timeout ..." line per metric that timed out
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'dv_apps.metrics.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'dv_apps.metrics.query_timeout': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 ALLOWED_HOSTS = []
 
 
@@ -73,7 +165,7 @@ INSTALLED_APPS = [
 
     # Experiments
     #'dv_apps.data_previewer',
-    #'dv_apps.dataset_docs',
+    'dv_apps.dataset_docs',
     'dv_apps.dvobject_api',
 ]
 
@@ -87,6 +179,7 @@ MIDDLEWARE_CLASSES = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'miniverse.db_routers.middleware.AnalyticsReadsMiddleware',
 ]
 # Restrict by IP address
 #'dv_apps.admin_restrict.middleware.RestrictAdminMiddleware',
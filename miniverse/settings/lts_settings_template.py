@@ -92,12 +92,33 @@ DATABASES = {
         'PASSWORD': 'the-password',
         'HOST': 'localhost',
         'PORT': '5432',
+        'CONN_MAX_AGE': 60 * 5,  # seconds to keep connections open. 0 = close after each request
         'TEST': {
             'MIRROR': 'default', # For running tests, only create 1 db
         },
-    }
+    },
+    # Optional read-only replicas of the Dataverse db
+    #'dataverse_replica_1': {
+    #    'ENGINE': 'django.db.backends.postgresql_psycopg2',
+    #    'NAME': 'dvndb',
+    #    'USER': 'miniverse_dv_user',
+    #    'PASSWORD': 'the-password',
+    #    'HOST': 'replica-1-host',
+    #    'PORT': '5432',
+    #    'CONN_MAX_AGE': 60 * 5,
+    #    'TEST': {'MIRROR': 'default'},
+    #},
 }
 
+# -----------------------------------
+# Dataverse read replicas
+#   - (alias, weight) -- reads are spread by weight
+#   - DATAVERSE_ANALYTICS_DB takes the metrics and quality check reads
+# -----------------------------------
+#DATAVERSE_READ_REPLICAS = [('dataverse_replica_1', 1)]
+#DATAVERSE_REPLICA_MAX_LAG_SECONDS = 60 * 5
+#DATAVERSE_ANALYTICS_DB = 'dataverse_replica_1'
+
 
 # -----------------------------------
 # A list of strings representing the
@@ -2,6 +2,9 @@
 Quick/Primitive dataset load to mongo
   - Output a JSON file for each Dataset
   - Load the files to Mongo
+
+For a full, resumable export to gzipped NDJSON shards, see:
+    python manage.py export_dataset_docs --output-dir <dir>
 """
 import os, sys
 from os.path import dirname, isdir, isfile, join, realpath
@@ -32,7 +35,7 @@ from django.db.models import F
 
 from dv_apps.datasets.models import Dataset
 from dv_apps.datasets.serializer import DatasetSerializer
-from dv_apps.datasets.util import get_latest_dataset_version
+from dv_apps.datasets.util import get_latest_dataset_version_ids
 from dv_apps.utils.msg_util import msg, msgt, msgx
 from mongo_rename_list import update_json_text
 from dv_apps.utils import query_helper
@@ -41,6 +44,9 @@ OUTPUT_DIR = join(SCRIPT_DIR, 'json_output')
 if not isdir(OUTPUT_DIR):
     os.makedirs(OUTPUT_DIR)
 
+# Datasets serialized together.  See DatasetSerializer.serialize_many
+BATCH_SIZE = 500
+
 class DatasetJSONCreator(object):
 
     def __init__(self, **kwargs):
@@ -49,6 +55,7 @@ class DatasetJSONCreator(object):
         self.overwrite_existing_files = kwargs.get('overwrite_existing_files', False)
         self.output_dir = kwargs.get('output_dir', OUTPUT_DIR)
         self.published_only = kwargs.get('published_only', True)
+        self.batch_size = kwargs.get('batch_size', BATCH_SIZE)
         assert isdir(self.output_dir),\
             "Output directory does not exist: %s" % self.output_dir
 
@@ -75,6 +82,9 @@ class DatasetJSONCreator(object):
         cnt = 0
         no_versions_found_list = [45900]
 
+        # { dataset id : full file name } -- waiting to be serialized
+        batch = OrderedDict()
+
         for ds_id in ds_id_query:
             cnt += 1
             msgt('(%d) Checking dataset id %s' % (cnt, ds_id))
@@ -93,26 +103,47 @@ class DatasetJSONCreator(object):
                 msg('skipping...file already exists')
                 continue
 
-            dataset_version = get_latest_dataset_version(ds_id)
+            batch[ds_id] = full_fname
+            if len(batch) >= self.batch_size:
+                no_versions_found_list += self.write_json_batch(batch)
+                batch = OrderedDict()
+                self.show_elapsed_time(start_time)
 
-            if dataset_version is None:
-                msg("Could not find dataset_version!")
-                no_versions_found_list.append(ds_id)
-                continue
+        no_versions_found_list += self.write_json_batch(batch)
 
-            dataset_as_json = DatasetSerializer(dataset_version).as_json()
+        self.show_elapsed_time(start_time)
+        print 'no_versions_found_list: %s' % no_versions_found_list
+
+    def write_json_batch(self, batch):
+        """
+        Serialize a batch of datasets and write the JSON files
+            batch - { dataset id : full file name }
+
+        Returns the dataset ids without a published version
+        """
+        if len(batch) == 0:
+            return []
+
+        version_id_lookup = get_latest_dataset_version_ids(batch.keys())
+
+        no_versions_found_list = [ds_id for ds_id in batch.keys()\
+                                    if ds_id not in version_id_lookup]
+        for ds_id in no_versions_found_list:
+            msg("Could not find dataset_version for dataset id: %s" % ds_id)
+
+        version_ids = [version_id_lookup[ds_id] for ds_id in batch.keys()\
+                                    if ds_id in version_id_lookup]
+        serialized = DatasetSerializer.serialize_many(version_ids)
+
+        for ds_id, full_fname in batch.items():
+            if ds_id not in version_id_lookup:
+                continue
+            dataset_as_json = serialized[version_id_lookup[ds_id]]
 
             open(full_fname, 'w').write(json.dumps(dataset_as_json, indent=4))
             msg('File written: %s' % full_fname)
 
-            if cnt % 500 == 0:
-                self.show_elapsed_time(start_time)
-            #if cnt > 10:
-            #    self.show_elapsed_time(start_time)
-            #    break
-
-        self.show_elapsed_time(start_time)
-        print 'no_versions_found_list: %s' % no_versions_found_list
+        return no_versions_found_list
 
     def show_elapsed_time(self, start_time):
         """From http://stackoverflow.com/questions/1345827/how-do-i-find-the-time-difference-between-two-datetime-objects-in-python"""